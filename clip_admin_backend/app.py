@@ -12,7 +12,6 @@ parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, current_dir)
 sys.path.insert(0, parent_dir)
 
-import redis
 from dotenv import load_dotenv
 from flask import Flask, render_template, request, flash
 from flask_cors import CORS
@@ -58,6 +57,10 @@ def create_app(config_name=None):
     print(f"📁 Static folder: {static_dir}")
     print(f"📁 Template folder exists: {os.path.exists(template_dir)}")
 
+    # Logging (niveles por módulo, formato text/json) antes de importar blueprints
+    from app.utils.logging_config import configure_logging
+    configure_logging()
+
     # Importar configuración de entorno
     from app.config import Config, print_environment_info
 
@@ -131,6 +134,7 @@ def create_app(config_name=None):
     redis_url = os.getenv("REDIS_URL")
     if redis_url:
         try:
+            import redis  # Solo si está configurado (evita el import en admin/CLI)
             redis_client = redis.from_url(redis_url, decode_responses=True)
             print("✅ Redis conectado correctamente")
         except Exception as e:
@@ -171,9 +175,23 @@ def create_app(config_name=None):
             return None
             return None
 
-    # Registrar blueprints
+    # Registrar blueprints (sin importar torch/transformers: los stacks de ML se cargan al primer uso)
+    from app.utils.lazy_imports import get_app_mode, APP_MODE_ADMIN
+    if get_app_mode() == APP_MODE_ADMIN:
+        print("🛠️ APP_MODE=admin: sin CLIP ni MiniLM (búsqueda deshabilitada)")
     register_blueprints(app)
 
+    # Invalidación de caches entre workers (LISTEN/NOTIFY de Postgres)
+    from app.core.change_notifier import init_change_notifier
+    init_change_notifier(app)
+
+    # Snapshots del índice de búsqueda: reconstrucción en segundo plano tras cambios de catálogo
+    # (también en modo admin: es el proceso que recibe las ediciones)
+    from app.core.index_snapshots import init_index_snapshots, is_enabled as index_snapshots_enabled
+    init_index_snapshots(app)
+    if index_snapshots_enabled():
+        print("📦 Snapshots del índice de búsqueda habilitados")
+
     # Headers anti-caché para desarrollo
     @app.before_request
     def before_request():
@@ -331,6 +349,14 @@ def register_blueprints(app):
     except ImportError as e:
         print(f"✗ Error importando api blueprint: {e}")
 
+    # Blueprint de métricas (Prometheus)
+    try:
+        from app.blueprints.metrics import bp as metrics_bp
+        app.register_blueprint(metrics_bp)
+        print("✓ Blueprint metrics registrado")
+    except ImportError as e:
+        print(f"✗ Error importando metrics blueprint: {e}")
+
     # Blueprint de embeddings CLIP
     try:
         from app.blueprints.embeddings import bp as embeddings_bp
@@ -397,8 +423,9 @@ if __name__ == "__main__":
     # Precarga condicional de CLIP: en Railway/producción se precarga; en local queda lazy
     try:
         from app.config import is_production
+        from app.utils.lazy_imports import is_admin_only
         preload_env = os.getenv("CLIP_PRELOAD", "auto").lower()  # 'auto' | 'true' | 'false'
-        should_preload = (
+        should_preload = not is_admin_only() and (
             (preload_env == "true") or
             (preload_env == "auto" and is_production())
         )
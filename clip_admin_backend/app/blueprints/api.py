@@ -7,7 +7,6 @@ import time
 from app.blueprints.embeddings import _get_idle_timeout_seconds
 import hashlib
 import numpy as np
-import torch
 import os
 from flask import Blueprint, request, jsonify, send_file
 from flask_login import login_required, current_user
@@ -23,20 +22,133 @@ from app.services.image_manager import image_manager
 from app.core.search_optimizer import SearchOptimizer
 from app.utils.system_config import system_config
 from app.core.modifier_expander import expand_color_modifiers
+from app.core.index_snapshots import get_snapshot
+from app.core.change_notifier import client_version
+from app.core.single_flight import SingleFlight
+from app.core.category_index import get_category_index
+from app.core.color_detection import Palette, detect_color, get_client_palette, palette_from_list
+from app.core.admission import admit, AdmissionRejected, PRIORITY_SEARCH
+from app.core.latency_budget import (
+    LatencyBudget, resolve_budget_ms, BUDGET_HEADER,
+    STAGE_TAG_FUSION, STAGE_OPTIMIZER, STAGE_COLOR_DETECTION
+)
+from app.core.stage_profiler import (
+    stage, profiled_stage, record_stage, set_profile_client,
+    start_request_profile, finish_request_profile, discard_request_profile
+)
 from app.utils.colors import normalize_color
 from app.utils.llm_query_normalizer import normalize_query
+from app.utils.logging_config import get_logger
+from app.utils.lazy_imports import lazy_import, is_admin_only
 from sqlalchemy import func, or_, text
-from googletrans import Translator
 
-# 🚀 IMPORTAR CLIP AL INICIO PARA CACHE GLOBAL
+# CLIP se carga al primer uso (get_clip_model); torch se importa en el primer acceso
 from app.blueprints.embeddings import get_clip_model
 
+torch = lazy_import('torch')
+
 bp = Blueprint("api", __name__)
 
+log = get_logger("search")
+
 # Habilitar CORS para este blueprint
 CORS(bp, origins=["*"],
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-     allow_headers=["Content-Type", "X-API-Key", "Authorization"])
+     allow_headers=["Content-Type", "X-API-Key", "Authorization", "X-Search-Budget-Ms"])
+
+# Endpoints con profiling por etapas (Server-Timing + captura opcional de cProfile)
+PROFILED_ENDPOINTS = ('api.visual_search', 'api.text_search')
+
+# Endpoints que necesitan CLIP/MiniLM (no disponibles con APP_MODE=admin)
+ML_ENDPOINTS = ('api.visual_search', 'api.text_search')
+
+# Búsquedas idénticas concurrentes se calculan una sola vez (search.coalesce_requests)
+COALESCED_HEADER = 'X-Search-Coalesced'
+COALESCE_WAIT_SECONDS = 30
+_visual_search_flight = SingleFlight('visual_search')
+_text_search_flight = SingleFlight('text_search')
+
+
+def _admitted(compute):
+    """
+    compute() con un cupo de admisión tomado solo mientras corre
+
+    Lo ejecuta el líder del single-flight: los seguidores que esperan su resultado
+    no ocupan cupo. Levanta AdmissionRejected (ver _overloaded_response).
+    """
+    def run():
+        with admit(PRIORITY_SEARCH) as waited:
+            if waited:
+                record_stage('admission_wait', waited)
+            return compute()
+    return run
+
+
+def _overloaded_response(error: AdmissionRejected):
+    """503 + Retry-After cuando no hay cupo CLIP"""
+    log.warning("🚦 %s rechazada por sobrecarga (%s), Retry-After=%ss", request.endpoint, error.reason, error.retry_after)
+    response = jsonify({
+        "success": False,
+        "error": "overloaded",
+        "message": "Servicio de búsqueda saturado, reintentar en unos segundos",
+        "retry_after": error.retry_after
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response, 503
+
+
+def _coalesce(flight, key, compute):
+    """
+    Ejecuta compute() coalesciendo requests concurrentes con la misma clave
+
+    El cómputo corre con un cupo de admisión (_admitted); una request que recibe
+    el resultado de otra no toma cupo.
+
+    Returns:
+        Tupla (resultado, compartido)
+
+    Raises:
+        AdmissionRejected: Sin cupo CLIP (también para los seguidores de ese líder)
+    """
+    compute = _admitted(compute)
+    search_config = system_config.get_section('search')
+    if not search_config.get('coalesce_requests', True):
+        return compute(), False
+    wait_seconds = float(search_config.get('coalesce_wait_seconds', COALESCE_WAIT_SECONDS))
+    waited_at = time.perf_counter()
+    result, shared = flight.do(key, compute, timeout=wait_seconds)
+    if shared:
+        record_stage('coalesced_wait', time.perf_counter() - waited_at)
+    return result, shared
+
+
+@bp.before_request
+def _reject_ml_in_admin_mode():
+    if request.endpoint in ML_ENDPOINTS and request.method != 'OPTIONS' and is_admin_only():
+        response = jsonify({
+            "success": False,
+            "error": "search_unavailable",
+            "message": "Búsqueda no disponible en esta instancia (APP_MODE=admin)"
+        })
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        return response, 503
+
+
+@bp.before_request
+def _start_stage_profile():
+    if request.endpoint in PROFILED_ENDPOINTS and request.method != 'OPTIONS':
+        start_request_profile(request.endpoint)
+
+
+@bp.after_request
+def _finish_stage_profile(response):
+    return finish_request_profile(response)
+
+
+@bp.teardown_request
+def _discard_stage_profile(exc=None):
+    discard_request_profile(exc)
 
 
 @bp.route("/image/<path:filename>")
@@ -377,7 +489,8 @@ def translate_text():
                 "error": "No se proporcionó texto para traducir"
             })
 
-        # Crear instancia del traductor
+        # Crear instancia del traductor (googletrans se importa solo al traducir)
+        from googletrans import Translator
         translator = Translator()
 
         # Obtener el contexto de la industria del cliente
@@ -466,10 +579,13 @@ def verify_api_key():
         return None, "API Key requerida en header X-API-Key"
 
     # Para testing, usar la API Key del cliente demo
-    client = Client.query.filter_by(api_key=api_key, is_active=True).first()
+    with stage('api_key'):
+        client = Client.query.filter_by(api_key=api_key, is_active=True).first()
     if not client:
         return None, "API Key inválida"
 
+    request.client = client  # Misma convención que require_api_key (métricas por cliente)
+    set_profile_client(client)
     return client, None
 
 
@@ -477,30 +593,20 @@ def verify_api_key():
 def process_image_for_search(image_data):
     """Procesar imagen y generar embedding para búsqueda"""
     try:
-        import logging
-        from datetime import datetime
-        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        logging.getLogger("clip_model").info(f"[REQUEST] Comparación recibida")
-
-        print("🔧 DEBUG: Iniciando procesamiento de imagen")
-
         # Importar PIL con alias para evitar conflictos
         from PIL import Image as PILImage
         import io
-        print("🔧 DEBUG: Importaciones exitosas")
 
         # Convertir bytes a imagen PIL
-        pil_image = PILImage.open(io.BytesIO(image_data))
-        print(f"🔧 DEBUG: Imagen PIL creada: {pil_image.size}")
+        with stage('decode'):
+            pil_image = PILImage.open(io.BytesIO(image_data))
+            pil_image.load()
+        log.debug("Imagen de consulta decodificada: %s", pil_image.size)
 
         # Obtener modelo CLIP directamente
         start_clip_time = time.time()
         model, processor = get_clip_model()
         clip_load_time = time.time() - start_clip_time
-        print(f"� CLIP MODEL: Obtenido en {clip_load_time:.3f}s")
-
-        # Generar embedding usando solo argumentos necesarios
-        print("🔧 DEBUG: Llamando al procesador CLIP...")
         start_process_time = time.time()
 
         # Llamada simplificada al procesador
@@ -509,11 +615,9 @@ def process_image_for_search(image_data):
                 images=pil_image,
                 return_tensors="pt"
             )
-            print("🔧 DEBUG: Inputs del procesador creados exitosamente")
 
             # Generar features de imagen
             image_features = model.get_image_features(**inputs)
-            print(f"🔧 DEBUG: Image features generadas: {image_features.shape}")
 
             # Normalizar embedding
             embedding = image_features / image_features.norm(dim=-1, keepdim=True)
@@ -521,16 +625,12 @@ def process_image_for_search(image_data):
             # Convertir a lista de Python
             embedding_list = embedding.squeeze().cpu().numpy().tolist()
 
-            process_time = time.time() - start_process_time
-            print(f"⚡ CLIP PROCESSING: Completado en {process_time:.3f}s")
-
-        print(f"🔧 DEBUG: Embedding generado exitosamente: {len(embedding_list)} dimensiones")
+        log.debug("Embedding de imagen: %d dims (modelo %.3fs, encode %.3fs)",
+                  len(embedding_list), clip_load_time, time.time() - start_process_time)
         return embedding_list, None
 
     except Exception as e:
-        print(f"❌ DEBUG: Error en process_image_for_search: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error en process_image_for_search: %s", e)
         return None, f"Error procesando imagen: {str(e)}"
 
 
@@ -590,7 +690,8 @@ def _process_image_data(image_file):
     threshold = float(request.form.get('threshold', 0.1))
 
     # Leer imagen
-    image_data = image_file.read()
+    with stage('image_read'):
+        image_data = image_file.read()
 
     # Validar tamaño (15MB máximo)
     if len(image_data) > 15 * 1024 * 1024:
@@ -602,117 +703,270 @@ def _process_image_data(image_file):
     return image_data, limit, threshold, None, None
 
 
-def _generate_query_embedding(image_data, detected_category=None):
+def _fuse_inferred_tags(query_embedding, image_data, detected_category=None):
+    """
+    Enriquece el embedding visual con tags inferidos de la imagen (80% visual + 20% tags)
+
+    Returns:
+        Embedding (lista) enriquecido, o el original si la fusión falla
+    """
+    try:
+        from PIL import Image
+        from io import BytesIO
+        from app.services.attribute_autofill_service import AttributeAutofillService
+        import torch
+
+        # Convertir bytes a PIL Image
+        pil_image = Image.open(BytesIO(image_data)).convert('RGB')
+        category_context = detected_category.name.lower() if detected_category else "producto"
+
+        # Inferir tags visuales de la imagen subida
+        from app.services.attribute_autofill_service import TAG_OPTIONS
+        inferred_tags = AttributeAutofillService._classify_tags(
+            pil_image,
+            TAG_OPTIONS,
+            threshold=0.15,
+            category_context=category_context
+        )
+
+        if inferred_tags and len(inferred_tags) > 0:
+            # Tomar top 5 tags más relevantes
+            top_tags = inferred_tags[:5]
+            tag_names = [tag for tag, _ in top_tags]
+
+            log.debug("Visual fusion: tags inferidos %s", top_tags)
+
+            # Generar embeddings de los tags
+            model, processor = get_clip_model()
+            tag_phrases = [f"a {tag} style {category_context}" for tag in tag_names]
+
+            with torch.no_grad():
+                tag_inputs = processor(text=tag_phrases, return_tensors="pt", padding=True)
+                tag_embeddings = model.get_text_features(**tag_inputs)
+                tag_embeddings = tag_embeddings / tag_embeddings.norm(dim=-1, keepdim=True)
+                tag_mean = tag_embeddings.mean(dim=0)
+                tag_mean = tag_mean / tag_mean.norm()
+
+                # Fusionar: 80% visual + 20% tags inferidos
+                q = torch.tensor(query_embedding).unsqueeze(0)
+                q = q / q.norm()
+
+                alpha = 0.8  # Peso del embedding visual original
+                beta = 0.2   # Peso de los tags inferidos
+
+                fused = alpha * q + beta * tag_mean
+                fused = fused / fused.norm()
+                query_embedding = fused.squeeze().cpu().numpy().tolist()
+
+                log.debug("Visual fusion: embedding enriquecido (alpha=%s, beta=%s)", alpha, beta)
+
+    except Exception as e:
+        # Si falla, continuar con embedding original
+        log.warning("Visual fusion omitida: %s", e)
+
+    return query_embedding
+
+
+def _generate_query_embedding(image_data, detected_category=None, budget=None):
     """
     Genera el embedding de la imagen de consulta con enriquecimiento opcional por tags
 
     Args:
         image_data: Bytes de la imagen
         detected_category: Categoría detectada (opcional, para contexto)
+        budget: LatencyBudget de la request (None = el enriquecimiento corre siempre)
 
     Returns:
         Tuple: (embedding_enriquecido, error_response, status_code)
     """
-    print(f"📷 DEBUG: Procesando imagen de {len(image_data)} bytes")
     query_embedding, error = process_image_for_search(image_data)
     if error:
-        print(f"❌ DEBUG: Error en procesamiento: {error}")
         return None, jsonify({
             "error": "processing_failed",
             "message": error
         }), 500
 
     if query_embedding is None:
-        print("❌ DEBUG: query_embedding es None")
         return None, jsonify({
             "error": "processing_failed",
             "message": "No se pudo generar embedding de la imagen"
         }), 500
 
-    print(f"🧠 DEBUG: Embedding generado - dimensiones: {len(query_embedding)}")
-    print(f"🧠 DEBUG: Primeros 5 valores: {query_embedding[:5]}")
-
-    # ✨ ENRIQUECIMIENTO CON TAGS INFERIDOS (para búsqueda visual)
+    # ✨ ENRIQUECIMIENTO CON TAGS INFERIDOS (para búsqueda visual, etapa opcional)
     fusion_enabled = system_config.get('search', 'enable_inferred_tags', False)
     if fusion_enabled:
-        try:
-            from PIL import Image
-            from io import BytesIO
-            from app.services.attribute_autofill_service import AttributeAutofillService
-            import torch
-
-            # Convertir bytes a PIL Image
-            pil_image = Image.open(BytesIO(image_data)).convert('RGB')
-            category_context = detected_category.name.lower() if detected_category else "producto"
-
-            # Inferir tags visuales de la imagen subida
-            from app.services.attribute_autofill_service import TAG_OPTIONS
-            inferred_tags = AttributeAutofillService._classify_tags(
-                pil_image,
-                TAG_OPTIONS,
-                threshold=0.15,
-                category_context=category_context
-            )
+        if budget is None:
+            query_embedding = _fuse_inferred_tags(query_embedding, image_data, detected_category)
+        elif budget.allow(STAGE_TAG_FUSION):
+            with budget.track(STAGE_TAG_FUSION):
+                query_embedding = _fuse_inferred_tags(query_embedding, image_data, detected_category)
+
+    return query_embedding, None, None
 
-            if inferred_tags and len(inferred_tags) > 0:
-                # Tomar top 5 tags más relevantes
-                top_tags = inferred_tags[:5]
-                tag_names = [tag for tag, _ in top_tags]
 
-                print(f"🔮 VISUAL FUSION: Tags inferidos de imagen: {', '.join([f'{t}({c:.2f})' for t, c in top_tags])}")
+# Filas por fetch del cursor de búsqueda (yield_per)
+SEARCH_YIELD_PER = 1000
 
-                # Generar embeddings de los tags
-                model, processor = get_clip_model()
-                tag_phrases = [f"a {tag} style {category_context}" for tag in tag_names]
+# Columnas que una query de búsqueda nunca debe seleccionar
+# (verificado por tools/diagnostics/check_search_projection.py)
+SEARCH_FORBIDDEN_COLUMNS = (
+    Image.base64_data,
+    Image.error_message,
+    Image.cloudinary_url,
+    Product.description,
+    Product.attributes,
+)
 
-                with torch.no_grad():
-                    tag_inputs = processor(text=tag_phrases, return_tensors="pt", padding=True)
-                    tag_embeddings = model.get_text_features(**tag_inputs)
-                    tag_embeddings = tag_embeddings / tag_embeddings.norm(dim=-1, keepdim=True)
-                    tag_mean = tag_embeddings.mean(dim=0)
-                    tag_mean = tag_mean / tag_mean.norm()
 
-                    # Fusionar: 80% visual + 20% tags inferidos
-                    q = torch.tensor(query_embedding).unsqueeze(0)
-                    q = q / q.norm()
+def _search_rows_query(client_id, category_id=None):
+    """
+    Proyección liviana para búsqueda visual
 
-                    alpha = 0.8  # Peso del embedding visual original
-                    beta = 0.2   # Peso de los tags inferidos
+    Solo selecciona (id, product_id, category_id, clip_embedding, is_primary) y se
+    itera con yield_per, sin materializar objetos Image/Product completos.
 
-                    fused = alpha * q + beta * tag_mean
-                    fused = fused / fused.norm()
-                    query_embedding = fused.squeeze().cpu().numpy().tolist()
+    Args:
+        client_id: Cliente dueño del catálogo
+        category_id: Si se indica, restringe a productos de esa categoría
 
-                    print(f"✨ VISUAL FUSION: Embedding enriquecido (α={alpha} visual + β={beta} tags)")
+    Returns:
+        Query iterable de filas con atributos id, product_id, category_id, clip_embedding, is_primary
+    """
+    query = (db.session.query(
+                Image.id,
+                Image.product_id,
+                Product.category_id,
+                Image.clip_embedding,
+                Image.is_primary)
+             .join(Product, Image.product_id == Product.id)
+             .filter(
+                 Image.client_id == client_id,
+                 Image.is_processed == True,
+                 Image.clip_embedding.isnot(None)
+             ))
+    if category_id:
+        query = query.filter(Product.category_id == category_id)
+    return query.execution_options(yield_per=SEARCH_YIELD_PER)
 
-        except Exception as e:
-            print(f"⚠️ VISUAL FUSION skip: {e}")
-            # Si falla, continuar con embedding original
-            pass
 
-    return query_embedding, None, None
+def _category_names(client_id):
+    """{category_id: nombre} del cliente en una sola query"""
+    return dict(db.session.query(Category.id, Category.name).filter(Category.client_id == client_id).all())
+
+
+def _snapshot_best_matches(snapshot, query_embedding, threshold, category_names,
+                           category_id=None, collect_categories=True):
+    """
+    Mismo agrupamiento que el loop de _find_similar_products, pero sobre el snapshot
+    en disco (una multiplicación matriz-vector en lugar de leer cada embedding de Postgres)
+
+    Con snapshot cuantizado (float16/int8) el umbral se aplica sobre la similitud
+    exacta de las candidatas re-puntuadas (IndexSnapshot.rerank).
+
+    Returns:
+        Tupla (product_best_match, category_similarities)
+    """
+    with stage('scoring'):
+        similarities = snapshot.scores(query_embedding)
+        mask = None
+        if category_id:
+            mask = snapshot.category_ids == str(category_id)
+            similarities = np.where(mask, similarities, -1.0)
+
+    reranked = 0
+    if snapshot.quantized:
+        with stage('rerank'):
+            similarities, reranked = snapshot.rerank(similarities, query_embedding, threshold)
+
+    with stage('scoring'):
+        category_similarities = {}
+        if collect_categories:
+            for cat_id in np.unique(snapshot.category_ids):
+                category_name = category_names.get(str(cat_id) or None, "Sin categoría")
+                values = similarities[snapshot.category_ids == cat_id].tolist()
+                category_similarities.setdefault(category_name, []).extend(values)
+
+        product_best_match = {}
+        for index in np.flatnonzero(similarities >= threshold):
+            similarity = float(similarities[index])
+            product_id = str(snapshot.product_ids[index])
+            if product_id not in product_best_match or similarity > product_best_match[product_id]['similarity']:
+                product_best_match[product_id] = {
+                    'image_id': str(snapshot.image_ids[index]),
+                    'similarity': similarity,
+                    'category': category_names.get(snapshot.category_id_at(index), "Sin categoría")
+                }
+
+    log.debug("Snapshot %s (%s): comparadas %d imágenes, %d re-puntuadas, %d productos sobre el umbral",
+              snapshot.version, snapshot.storage, len(snapshot) if mask is None else int(mask.sum()),
+              reranked, len(product_best_match))
+    return product_best_match, category_similarities
+
+
+@profiled_stage('hydration')
+def _hydrate_best_matches(product_best_match):
+    """
+    Carga Product (con categoría) e Image solo para los productos que superaron el umbral
+
+    Dos queries en total, en lugar de lazy loads por cada candidato. Agrega las claves
+    'product' e 'image' que esperan _apply_category_filter/_build_search_results.
+    """
+    if not product_best_match:
+        return product_best_match
+
+    from sqlalchemy.orm import joinedload, load_only
+
+    products = {
+        p.id: p for p in Product.query
+        .options(db.undefer(Product.description), joinedload(Product.category))
+        .filter(Product.id.in_(list(product_best_match.keys())))
+        .all()
+    }
+    images = {
+        img.id: img for img in Image.query
+        .options(load_only(Image.id, Image.client_id, Image.product_id, Image.cloudinary_url, Image.is_primary))
+        .filter(Image.id.in_([m['image_id'] for m in product_best_match.values()]))
+        .all()
+    }
+
+    for product_id in list(product_best_match.keys()):
+        product = products.get(product_id)
+        if product is None:
+            # Producto borrado entre la búsqueda y la hidratación
+            del product_best_match[product_id]
+            continue
+        match_data = product_best_match[product_id]
+        match_data['product'] = product
+        match_data['image'] = images.get(match_data['image_id'])
+
+    return product_best_match
 
 
 def _find_similar_products(client, query_embedding, threshold):
     """Encuentra productos similares y agrupa por mejor coincidencia"""
-    # Buscar imágenes similares en la base de datos
-    images = Image.query.filter_by(
-        client_id=client.id,
-        is_processed=True
-    ).filter(Image.clip_embedding.isnot(None)).all()
+    category_names = _category_names(client.id)
 
-    print(f"🔍 DEBUG: Encontradas {len(images)} imágenes para comparar")
+    # Snapshot en disco (si está habilitado y vigente): sin leer embeddings de Postgres
+    snapshot = get_snapshot(client.id)
+    if snapshot is not None:
+        product_best_match, category_similarities = _snapshot_best_matches(
+            snapshot, query_embedding, threshold, category_names)
+        return _finish_similar_products(product_best_match, category_similarities)
 
     # Calcular similitudes y agrupar por producto
     product_best_match = {}  # Dict para almacenar la mejor imagen de cada producto
     category_similarities = {}  # Para determinar categoría más probable
+    compared = 0
+    scoring_seconds = 0.0
+    loop_started = time.perf_counter()
 
-    for img in images:
+    for row in _search_rows_query(client.id):
+        compared += 1
         try:
-            similarity = calculate_similarity(query_embedding, img.clip_embedding)
-            category_name = img.product.category.name if img.product.category else "Sin categoría"
-
-            print(f"🔍 DEBUG: Similitud con {img.product.name[:30]} ({category_name}): {similarity:.4f}")
+            scored_at = time.perf_counter()
+            similarity = calculate_similarity(query_embedding, row.clip_embedding)
+            scoring_seconds += time.perf_counter() - scored_at
+            category_name = category_names.get(row.category_id, "Sin categoría")
 
             # Recopilar estadísticas por categoría
             if category_name not in category_similarities:
@@ -720,24 +974,35 @@ def _find_similar_products(client, query_embedding, threshold):
             category_similarities[category_name].append(similarity)
 
             if similarity >= threshold:
-                product_id = img.product.id
+                product_id = row.product_id
 
                 # Si es la primera imagen de este producto, o si tiene mayor similitud que la anterior
                 if product_id not in product_best_match or similarity > product_best_match[product_id]['similarity']:
                     product_best_match[product_id] = {
-                        'image': img,
+                        'image_id': row.id,
                         'similarity': similarity,
-                        'product': img.product,
                         'category': category_name
                     }
-                    print(f"✅ DEBUG: Mejor imagen para {img.product.name}: {similarity:.4f}")
 
         except Exception as e:
-            print(f"❌ Error calculando similitud para imagen {img.id}: {e}")
+            log.warning("Error calculando similitud para imagen %s: %s", row.id, e)
             continue
 
+    # Fetch del cursor vs. cálculo de similitud (el loop los intercala por yield_per)
+    loop_seconds = time.perf_counter() - loop_started
+    record_stage('candidate_fetch', loop_seconds - scoring_seconds)
+    record_stage('scoring', scoring_seconds)
+
+    log.debug("Comparadas %d imágenes, %d productos sobre el umbral", compared, len(product_best_match))
+
+    return _finish_similar_products(product_best_match, category_similarities)
+
+
+def _finish_similar_products(product_best_match, category_similarities):
+    """Hidrata los matches y aplica el boost de la categoría más probable"""
+    _hydrate_best_matches(product_best_match)
+
     # Determinar categoría más probable basada en mayor similitud promedio
-    print(f"\n📊 DEBUG: Análisis por categorías:")
     best_category = None
     best_avg_similarity = 0
 
@@ -745,13 +1010,13 @@ def _find_similar_products(client, query_embedding, threshold):
         avg_sim = sum(similarities) / len(similarities)
         max_sim = max(similarities)
         count = len(similarities)
-        print(f"   📂 {category}: {count} productos, promedio: {avg_sim:.4f}, máximo: {max_sim:.4f}")
+        log.detail("Categoría %s: %d imágenes, promedio=%.4f máximo=%.4f", category, count, avg_sim, max_sim)
 
         if max_sim > best_avg_similarity:  # Usar máximo en lugar de promedio para detectar categoría objetivo
             best_avg_similarity = max_sim
             best_category = category
 
-    print(f"🎯 DEBUG: Categoría más probable: '{best_category}' (similitud máxima: {best_avg_similarity:.4f})")
+    log.debug("Categoría más probable: %r (similitud máxima %.4f)", best_category, best_avg_similarity)
 
     # Aplicar boost de categoría: aumentar similitud para productos de la categoría más probable
     if best_category and best_category != "Sin categoría":
@@ -763,11 +1028,12 @@ def _find_similar_products(client, query_embedding, threshold):
                 boosted_similarity = min(1.0, original_similarity * 1.15)
                 match_data['similarity'] = boosted_similarity
                 match_data['category_boost'] = True
-                print(f"🚀 DEBUG: Boost aplicado a {match_data['product'].name}: {original_similarity:.4f} → {boosted_similarity:.4f}")
+                log.detail("Boost de categoría a %s: %.4f -> %.4f",
+                           match_data['product'].name, original_similarity, boosted_similarity)
             else:
                 match_data['category_boost'] = False
 
-    print(f"🎯 DEBUG: Productos únicos encontrados: {len(product_best_match)}")
+    log.debug("Productos únicos encontrados: %d", len(product_best_match))
     return product_best_match
 
 
@@ -784,47 +1050,59 @@ def _find_similar_products_in_category(client, query_embedding, threshold, categ
     Returns:
         dict: Diccionario con los mejores matches por producto
     """
-    # Buscar imágenes SOLO de la categoría específica
-    images = (Image.query
-              .join(Product)
-              .filter(
-                  Image.client_id == client.id,
-                  Image.is_processed == True,
-                  Image.clip_embedding.isnot(None),
-                  Product.category_id == category_id
-              ).all())
-
-    print(f"🔍 DEBUG: Encontradas {len(images)} imágenes en la categoría específica")
+    category_names = _category_names(client.id)
+    category_name = category_names.get(category_id, "Sin categoría")
+
+    snapshot = get_snapshot(client.id)
+    if snapshot is not None:
+        product_best_match, _ = _snapshot_best_matches(
+            snapshot, query_embedding, threshold, category_names,
+            category_id=category_id, collect_categories=False)
+        for match_data in product_best_match.values():
+            match_data['category_filtered'] = True  # Indicador de que se filtró por categoría
+        _hydrate_best_matches(product_best_match)
+        log.debug("Productos únicos encontrados en categoría: %d", len(product_best_match))
+        return product_best_match
 
     # Calcular similitudes y agrupar por producto
     product_best_match = {}  # Dict para almacenar la mejor imagen de cada producto
+    compared = 0
+    scoring_seconds = 0.0
+    loop_started = time.perf_counter()
 
-    for img in images:
+    for row in _search_rows_query(client.id, category_id=category_id):
+        compared += 1
         try:
-            similarity = calculate_similarity(query_embedding, img.clip_embedding)
-            category_name = img.product.category.name if img.product.category else "Sin categoría"
-
-            print(f"🔍 DEBUG: Similitud con {img.product.name[:30]} ({category_name}): {similarity:.4f}")
+            scored_at = time.perf_counter()
+            similarity = calculate_similarity(query_embedding, row.clip_embedding)
+            scoring_seconds += time.perf_counter() - scored_at
 
             if similarity >= threshold:
-                product_id = img.product.id
+                product_id = row.product_id
 
                 # Si es la primera imagen de este producto, o si tiene mayor similitud que la anterior
                 if product_id not in product_best_match or similarity > product_best_match[product_id]['similarity']:
                     product_best_match[product_id] = {
-                        'image': img,
+                        'image_id': row.id,
                         'similarity': similarity,
-                        'product': img.product,
                         'category': category_name,
                         'category_filtered': True  # Indicador de que se filtró por categoría
                     }
-                    print(f"✅ DEBUG: Mejor imagen para {img.product.name}: {similarity:.4f}")
 
         except Exception as e:
-            print(f"❌ Error calculando similitud para imagen {img.id}: {e}")
+            log.warning("Error calculando similitud para imagen %s: %s", row.id, e)
             continue
 
-    print(f"🎯 DEBUG: Total productos únicos encontrados en categoría: {len(product_best_match)}")
+    # Fetch del cursor vs. cálculo de similitud (el loop los intercala por yield_per)
+    loop_seconds = time.perf_counter() - loop_started
+    record_stage('candidate_fetch', loop_seconds - scoring_seconds)
+    record_stage('scoring', scoring_seconds)
+
+    log.debug("Comparadas %d imágenes en la categoría %r", compared, category_name)
+
+    _hydrate_best_matches(product_best_match)
+
+    log.debug("Productos únicos encontrados en categoría: %d", len(product_best_match))
     return product_best_match
 
 
@@ -832,7 +1110,7 @@ def _apply_category_filter(product_best_match, limit):
     """Aplica filtrado inteligente por categoría si es necesario"""
     # Filtrado inteligente por categoría (solo si hay suficientes productos)
     if len(product_best_match) <= limit * 2:  # Solo filtrar si hay muchos productos
-        print(f"🎯 DEBUG: Pocos productos encontrados ({len(product_best_match)}), no se aplica filtro de categoría")
+        log.debug("Pocos productos (%d), no se aplica filtro de categoría", len(product_best_match))
         return product_best_match
 
     # Obtener las categorías de los productos con mayor similitud
@@ -854,7 +1132,8 @@ def _apply_category_filter(product_best_match, limit):
 
     for category, similarities in top_categories.items():
         avg_similarity = sum(similarities) / len(similarities)
-        print(f"📂 DEBUG: Categoría '{category}': {len(similarities)} productos, similitud promedio: {avg_similarity:.4f}")
+        log.detail("Categoría %r: %d productos top, similitud promedio %.4f",
+                   category, len(similarities), avg_similarity)
 
         if avg_similarity > best_avg_similarity:
             best_avg_similarity = avg_similarity
@@ -862,43 +1141,37 @@ def _apply_category_filter(product_best_match, limit):
 
     # Solo aplicar filtro si la categoría dominante es muy clara (>60% similitud promedio)
     if not (best_category and best_avg_similarity > 0.6):
-        print(f"🎯 DEBUG: No se aplicó filtro de categoría (similitud promedio: {best_avg_similarity:.4f})")
+        log.debug("No se aplica filtro de categoría (similitud promedio %.4f)", best_avg_similarity)
         return product_best_match
 
-    print(f"🎯 DEBUG: Categoría dominante detectada: '{best_category}' (similitud promedio: {best_avg_similarity:.4f})")
+    log.debug("Categoría dominante: %r (similitud promedio %.4f)", best_category, best_avg_similarity)
 
     # Filtrar solo productos de la categoría dominante
     filtered_matches = {}
+    detail = log.detail_enabled
     for product_id, match_data in product_best_match.items():
         product_category = match_data['product'].category.name
 
         # Incluir productos de la categoría dominante
         if product_category == best_category:
             filtered_matches[product_id] = match_data
-            print(f"✅ DEBUG: Incluido por categoría exacta: {match_data['product'].name} ({product_category})")
-        else:
-            print(f"❌ DEBUG: Excluido por categoría: {match_data['product'].name} ({product_category} != {best_category})")
+        elif detail:
+            log.detail("Excluido por categoría: %s (%s != %s)",
+                       match_data['product'].name, product_category, best_category)
 
     # Solo usar el filtro si queda al menos el mínimo de productos
     if len(filtered_matches) >= limit:
-        print(f"🎯 DEBUG: Productos después del filtro de categoría: {len(filtered_matches)}")
+        log.debug("Productos después del filtro de categoría: %d", len(filtered_matches))
         return filtered_matches
     else:
-        print("⚠️ DEBUG: El filtro de categoría eliminó demasiados productos, manteniendo los originales")
+        log.debug("El filtro de categoría eliminó demasiados productos, se mantienen los originales")
         return product_best_match
 
 
 def _build_search_results(product_best_match, limit):
     """Construye la lista final de resultados"""
     results = []
-
-    # 🔍 DEBUG: Verificar contenido del dict recibido
-    print(f"🔍 DEBUG _build_search_results: Recibido dict con {len(product_best_match)} productos")
-    if product_best_match:
-        sample_id = list(product_best_match.keys())[0]
-        sample_match = product_best_match[sample_id]
-        print(f"🔍 DEBUG _build_search_results: Claves en sample_match: {list(sample_match.keys())}")
-        print(f"🔍 DEBUG _build_search_results: Tiene optimizer_scores: {'optimizer_scores' in sample_match}")
+    detail = log.detail_enabled
 
     # Intentar obtener configuración de atributos a exponer (si existe la tabla)
     exposed_keys_cache = None  # cache por request
@@ -946,7 +1219,7 @@ def _build_search_results(product_best_match, limit):
                         exposed_keys_cache = {r[0] for r in rows}
             except Exception as e:
                 # Si no existe la tabla o falla, seguimos sin filtrar (compatible hacia atrás)
-                print(f"⚠️ Error consultando product_attribute_config: {e}")
+                log.warning("Error consultando product_attribute_config: %s", e)
                 # CRITICAL: Hacer rollback para que queries posteriores funcionen
                 db.session.rollback()
                 exposed_keys_cache = None
@@ -969,7 +1242,7 @@ def _build_search_results(product_best_match, limit):
             # Retornar SIEMPRE la URL de Cloudinary (patrón unificado)
             image_url = primary_image.display_url if primary_image else None
         except Exception as e:
-            print(f"❌ Error obteniendo imagen primaria: {e}")
+            log.warning("Error obteniendo imagen primaria de %s: %s", product.id, e)
             # CRITICAL: Hacer rollback para que queries posteriores funcionen
             db.session.rollback()
             # Si falla, usar la imagen que hizo match
@@ -989,7 +1262,7 @@ def _build_search_results(product_best_match, limit):
                     else:
                         product_url_value = raw_url
                 except Exception as ie:
-                    print(f"⚠️ Error extrayendo url_producto para {product.id}: {ie}")
+                    log.warning("Error extrayendo url_producto para %s: %s", product.id, ie)
                     product_url_value = None
 
                 # 2) Aplicar filtros de exposición solo para el bloque de attributes
@@ -1002,7 +1275,7 @@ def _build_search_results(product_best_match, limit):
                     # Sin configuración, exponer todos los atributos (compatibilidad existente)
                     product_attrs = dict(product.attributes)
         except Exception as e:
-            print(f"⚠️ Error leyendo atributos de producto {product.id}: {e}")
+            log.warning("Error leyendo atributos de producto %s: %s", product.id, e)
             product_attrs = {}
 
         # 🚀 FASE 3: Incluir optimizer_scores si están disponibles
@@ -1038,12 +1311,11 @@ def _build_search_results(product_best_match, limit):
 
         results.append(result)
 
-        boost_indicator = "🚀" if category_boost else ""
-        color_indicator = "🎨" if color_boost else ""
-        optimizer_indicator = "🎯" if optimizer_scores else ""
-        print(f"📦 DEBUG: Producto final añadido: {product.name} (similitud: {similarity:.4f}) {boost_indicator}{color_indicator}{optimizer_indicator}")
+        if detail:
+            log.detail("Resultado %s sim=%.4f category_boost=%s color_boost=%s optimizer=%s",
+                       product.name, similarity, category_boost, color_boost, bool(optimizer_scores))
 
-    print(f"🎯 DEBUG: Total productos únicos procesados: {len(results)}")
+    log.debug("Productos únicos procesados: %d", len(results))
 
     # Ordenar por similitud y limitar resultados
     results.sort(key=lambda x: x['similarity'], reverse=True)
@@ -1064,8 +1336,9 @@ def _normalize_color_gender(color_str: str) -> str:
 
 def detect_dominant_color(image_data, client_id):
     """
-    Detecta el color dominante en la imagen usando CLIP
-    Usa los colores reales de los productos del cliente (dinámico)
+    Detecta el color dominante en la imagen entre los colores reales de los productos del cliente
+
+    Estadística de píxeles en CIELAB y CLIP solo si es ambiguo (app/core/color_detection.py).
 
     Args:
         image_data: Datos binarios de la imagen
@@ -1075,66 +1348,18 @@ def detect_dominant_color(image_data, client_id):
         tuple: (color_detectado, confidence_score)
     """
     try:
-        # Obtener colores únicos desde JSONB attributes->>'color' (preferido)
-        rows = db.session.execute(
-            text(
-                """
-                SELECT DISTINCT UPPER(TRIM(attributes->>'color')) AS color
-                FROM products
-                WHERE client_id = :client_id
-                  AND attributes ? 'color'
-                  AND NULLIF(TRIM(attributes->>'color'), '') IS NOT NULL
-                """
-            ),
-            {"client_id": client_id},
-        ).fetchall()
-
-        unique_colors = [r[0] for r in rows if r[0]]
-
-        if not unique_colors:
-            print("⚠️ No hay colores definidos en productos del cliente")
+        palette = get_client_palette(client_id)
+        if not len(palette):
+            log.debug("No hay colores definidos en productos del cliente %s", client_id)
             return "unknown", 0.0
 
-        print(f"🎨 Colores disponibles del cliente (JSONB): {unique_colors}")
-
-        # Crear prompts dinámicos basados en los colores del cliente
-        color_prompts = [f"a photo of {color.lower()} product" for color in unique_colors]
-
-        # Convertir a imagen PIL
-        from PIL import Image as PILImage
-        import io
-        pil_image = PILImage.open(io.BytesIO(image_data))
-
-        # Obtener modelo CLIP
-        model, processor = get_clip_model()
-
-        # Generar embedding de imagen
-        with torch.no_grad():
-            image_inputs = processor(images=pil_image, return_tensors="pt")
-            image_features = model.get_image_features(**image_inputs)
-            image_embedding = image_features / image_features.norm(dim=-1, keepdim=True)
+        log.detail("Colores disponibles del cliente: %s", palette.colors)
+        detected_color, confidence, tier = detect_color(image_data, palette)
+        log.debug("Color detectado: %s (confianza %.3f, nivel %s)", detected_color, confidence, tier)
+        return detected_color, confidence
 
-            # Generar embeddings de texto para colores
-            text_inputs = processor(text=color_prompts, return_tensors="pt", padding=True)
-            text_features = model.get_text_features(**text_inputs)
-            text_embeddings = text_features / text_features.norm(dim=-1, keepdim=True)
-
-            # Calcular similitudes
-            similarities = torch.cosine_similarity(image_embedding, text_embeddings, dim=1)
-
-            # Encontrar la mejor coincidencia
-            best_idx = similarities.argmax().item()
-            best_score = similarities[best_idx].item()
-            detected_color = unique_colors[best_idx]
-
-            print(f"🎨 DETECCIÓN COLOR: {detected_color} (confianza: {best_score:.3f})")
-
-            return detected_color, best_score
-
-    except Exception as e:
-        print(f"❌ Error en detección de color: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error en detección de color")
         return "unknown", 0.0
 
 
@@ -1144,152 +1369,36 @@ def detect_dominant_color_from_palette(image_data, colors_list):
 
     Args:
         image_data: bytes de la imagen
-        colors_list: lista de strings con colores disponibles para comparar
+        colors_list: lista de strings con colores disponibles, o Palette ya armada
 
     Returns:
         tuple: (color_detectado, confidence_score)
     """
     try:
-        unique_colors = [c.strip() for c in colors_list if c and str(c).strip()]
-
-        if not unique_colors:
-            print("⚠️ Paleta de colores vacía para la categoría")
+        palette = colors_list if isinstance(colors_list, Palette) else palette_from_list(colors_list)
+        if not len(palette):
+            log.debug("Paleta de colores vacía para la categoría")
             return "unknown", 0.0
 
-        print(f"🎨 Paleta de colores (categoría): {unique_colors}")
-
-        # Crear prompts dinámicos basados en los colores de la categoría
-        color_prompts = [f"a photo of {color.lower()} product" for color in unique_colors]
-
-        # Convertir a imagen PIL
-        from PIL import Image as PILImage
-        import io
-        pil_image = PILImage.open(io.BytesIO(image_data))
-
-        # Obtener modelo CLIP
-        model, processor = get_clip_model()
-
-        # Generar embedding de imagen
-        with torch.no_grad():
-            image_inputs = processor(images=pil_image, return_tensors="pt")
-            image_features = model.get_image_features(**image_inputs)
-            image_embedding = image_features / image_features.norm(dim=-1, keepdim=True)
-
-            # Generar embeddings de texto para colores
-            text_inputs = processor(text=color_prompts, return_tensors="pt", padding=True)
-            text_features = model.get_text_features(**text_inputs)
-            text_embeddings = text_features / text_features.norm(dim=-1, keepdim=True)
-
-            # Calcular similitudes
-            similarities = torch.cosine_similarity(image_embedding, text_embeddings, dim=1)
-
-            # Encontrar la mejor coincidencia
-            best_idx = similarities.argmax().item()
-            best_score = similarities[best_idx].item()
-            detected_color = unique_colors[best_idx]
-
-            print(f"🎨 DETECCIÓN COLOR (categoría): {detected_color} (confianza: {best_score:.3f})")
-
-            return detected_color, best_score
-
-    except Exception as e:
-        print(f"❌ Error en detección de color (paleta): {e}")
-        import traceback
-        traceback.print_exc()
-        return "unknown", 0.0
-
-
-def detect_general_object(image_data, client_id=None):
-    """
-    Detecta QUÉ es el objeto en la imagen usando CLIP
-    Si se proporciona client_id, usa las categorías del cliente
-    Si no, usa categorías generales ampliadas
-
-    Args:
-        image_data: Datos binarios de la imagen
-        client_id: ID del cliente (opcional, para usar sus categorías)
-
-    Returns:
-        tuple: (objeto_detectado, confidence_score)
-    """
-    try:
-        # Si hay client_id, usar las categorías del cliente
-        if client_id:
-            categories = Category.query.filter_by(
-                client_id=client_id,
-                is_active=True
-            ).all()
-
-            if categories:
-                # Usar name_en de las categorías como términos de detección
-                general_categories = []
-                for cat in categories:
-                    if cat.name_en:
-                        general_categories.append(f"a photo of {cat.name_en.lower()}")
-                    else:
-                        general_categories.append(f"a photo of {cat.name.lower()}")
-
-                print(f"🔍 Usando categorías del cliente para detección: {[c.split('of ')[1] for c in general_categories]}")
-            else:
-                print("⚠️ No hay categorías activas, usando detección genérica")
-                general_categories = ["product", "item", "object"]
-        else:
-            # Detección genérica amplia para cualquier tipo de producto
-            general_categories = [
-                "product", "item", "object", "merchandise",
-                "clothing", "apparel", "garment",
-                "accessory", "tool", "equipment",
-                "furniture", "decoration", "appliance"
-            ]
-
-        # Convertir a imagen PIL
-        from PIL import Image as PILImage
-        import io
-        pil_image = PILImage.open(io.BytesIO(image_data))
-
-        # Obtener modelo CLIP
-        model, processor = get_clip_model()
-
-        # Generar embedding de imagen
-        with torch.no_grad():
-            image_inputs = processor(images=pil_image, return_tensors="pt")
-            image_features = model.get_image_features(**image_inputs)
-            image_embedding = image_features / image_features.norm(dim=-1, keepdim=True)
-
-            # Generar embeddings de texto para categorías
-            text_inputs = processor(text=general_categories, return_tensors="pt", padding=True)
-            text_features = model.get_text_features(**text_inputs)
-            text_embeddings = text_features / text_features.norm(dim=-1, keepdim=True)
-
-            # Calcular similitudes
-            similarities = torch.cosine_similarity(image_embedding, text_embeddings, dim=1)
-
-            # Encontrar la mejor coincidencia
-            best_idx = similarities.argmax().item()
-            best_score = similarities[best_idx].item()
-            detected_object = general_categories[best_idx]
-
-            # Extraer solo el término del objeto (sin "a photo of")
-            if "a photo of" in detected_object:
-                detected_object = detected_object.replace("a photo of ", "").strip()
-
-            print(f"🔍 DETECCIÓN GENERAL: {detected_object} (confianza: {best_score:.3f})")
-
-            return detected_object, best_score
+        log.detail("Paleta de colores de la categoría: %s", palette.colors)
+        detected_color, confidence, tier = detect_color(image_data, palette)
+        log.debug("Color detectado (paleta de categoría): %s (confianza %.3f, nivel %s)",
+                  detected_color, confidence, tier)
+        return detected_color, confidence
 
-    except Exception as e:
-        print(f"❌ Error en detección general: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error en detección de color (paleta)")
         return "unknown", 0.0
 
 
 def detect_image_category_with_centroids(image_data, client_id, confidence_threshold=0.2):
     """
-    Detecta la categoría de una imagen usando centroides de embeddings reales
+    Detecta la categoría de una imagen usando el índice multi-prototipo de categorías
 
-    En lugar de prompts de texto, usa el promedio de embeddings de productos
-    existentes en cada categoría como "representante" de esa categoría.
+    Cada categoría se representa con su centroide, sub-centroides k-means de sus
+    imágenes y el embedding de texto de su prompt (app/core/category_index.py).
+    Detección y desempate salen de una sola multiplicación contra esa matriz,
+    sin llamadas extra al modelo.
 
     Args:
         image_data: Datos binarios de la imagen
@@ -1300,31 +1409,29 @@ def detect_image_category_with_centroids(image_data, client_id, confidence_thres
         tuple: (categoria_detectada, confidence_score) o (None, 0) si no detecta
     """
     try:
-        print(f"🚀 RAILWAY LOG: Iniciando detección centroides para cliente {client_id}")
+        # 1. Índice de categorías del cliente (cacheado)
+        with stage('category_index'):
+            index = get_category_index(client_id)
 
-        # 1. Obtener categorías activas del cliente
-        categories = Category.query.filter_by(
-            client_id=client_id,
-            is_active=True
-        ).all()
+        if index.missing:
+            log.warning("Categorías sin centroide en BD (cliente %s): %s", client_id, index.missing)
 
-        if not categories:
-            print(f"❌ RAILWAY LOG: No categorías para cliente {client_id}")
+        if not len(index):
+            log.info("Cliente %s sin centroides de categorías activas, no se detecta categoría", client_id)
             return None, 0
 
-        print(f"📋 RAILWAY LOG: {len(categories)} categorías encontradas")
+        log.debug("Detección por índice de categorías: %d categorías, %d prototipos",
+                  len(index), index.prototype_count)
 
         # 2. Generar embedding de la imagen nueva
         from PIL import Image as PILImage
         import io
-        pil_image = PILImage.open(io.BytesIO(image_data))
-        print(f"🖼️ DEBUG: Imagen preparada: {pil_image.size}")
+        with stage('decode'):
+            pil_image = PILImage.open(io.BytesIO(image_data))
+            pil_image.load()
 
-        # 3. Obtener modelo CLIP
         model, processor = get_clip_model()
-        print("🤖 DEBUG: Modelo CLIP obtenido")
 
-        # 4. Generar embedding de imagen nueva
         with torch.no_grad():
             image_inputs = processor(
                 images=pil_image,
@@ -1334,93 +1441,29 @@ def detect_image_category_with_centroids(image_data, client_id, confidence_thres
             image_features = image_features / image_features.norm(dim=-1, keepdim=True)
             new_embedding = image_features.squeeze(0).numpy()
 
-        print(f"🔍 DEBUG: Embedding generado: shape {new_embedding.shape}")
-
-        # 5. Calcular similitudes contra centroides de cada categoría
-        category_similarities = []
-
-        for category in categories:
-            # 🚀 USAR CENTROIDE DE BD DIRECTAMENTE
-            centroid = category.get_centroid_embedding(auto_calculate=False)
-            print(f"🔍 RAILWAY LOG: {category.name} - centroide {'OK' if centroid is not None else 'NULL'}")
-
-            if centroid is not None:
-                # Calcular similitud coseno
-                similarity = np.dot(new_embedding, centroid) / (np.linalg.norm(new_embedding) * np.linalg.norm(centroid))
-                category_similarities.append({
-                    'category': category,
-                    'similarity': float(similarity)
-                })
-                print(f"📊 RAILWAY LOG: {category.name}: similitud {similarity:.4f}")
-            else:
-                print(f"⚠️ RAILWAY LOG: {category.name} SIN CENTROIDE en BD")
-
-        if not category_similarities:
-            print(f"❌ RAILWAY LOG: NO HAY SIMILITUDES - sin centroides válidos")
+        # 3. Mejor categoría (con desempate por prompt de texto si el margen es chico)
+        position, best_score, info = index.detect(new_embedding)
+        log.detail("Índice de categorías: %s", info)
+        if position is None:
             return None, 0
 
-        # 6. Encontrar la mejor coincidencia con margen de victoria y desempate
-        # Ordenar por similitud descendente
-        category_similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        best_match = category_similarities[0]
-        best_category = best_match['category']
-        best_score = best_match['similarity']
-        second_score = category_similarities[1]['similarity'] if len(category_similarities) > 1 else -1.0
-
-        print(f"🎯 RAILWAY LOG: MEJOR: {best_category.name} = {best_score:.4f} | SEGUNDO = {second_score:.4f}")
-
-        # Margen de victoria mínimo para aceptar directamente la categoría ganadora
-        MARGIN_DELTA = 0.03  # 3 puntos de similitud coseno
-
-        # Si el margen es muy chico, usamos un desempate con la detección general
-        if second_score >= 0 and (best_score - second_score) < MARGIN_DELTA:
-            print(f"⚖️  RAILWAY LOG: MARGEN PEQUEÑO ({best_score - second_score:.4f} < {MARGIN_DELTA}), aplicando desempate por objeto general")
-            try:
-                detected_object, object_confidence = detect_general_object(image_data, client_id)
-                print(f"🔍 RAILWAY LOG: OBJETO GENERAL = {detected_object} (conf {object_confidence:.3f})")
-
-                if object_confidence >= 0.20:  # usar con umbral bajo, solo como desempate
-                    # Comparar el objeto detectado con los nombres de las categorías (name y name_en)
-                    top2 = category_similarities[:2]
-
-                    def cat_matches_object(cat, obj):
-                        """Verifica si el objeto detectado está relacionado con la categoría"""
-                        cat_name = (cat.name or '').lower()
-                        cat_name_en = (cat.name_en or '').lower()
-                        obj_lower = obj.lower()
-
-                        # Match directo o por inclusión
-                        return obj_lower in cat_name or obj_lower in cat_name_en or \
-                               cat_name in obj_lower or cat_name_en in obj_lower
-
-                    best_matches = cat_matches_object(best_category, detected_object)
-                    second_cat = top2[1]['category'] if len(top2) > 1 else None
-                    second_matches = cat_matches_object(second_cat, detected_object) if second_cat else False
-
-                    if not best_matches and second_matches:
-                        # Elegir la segunda si está en el grupo preferido
-                        print(f"✅ RAILWAY LOG: DESEMPATE → Preferimos '{second_cat.name}' por concordar con objeto '{detected_object}'")
-                        best_category = second_cat
-                        best_score = top2[1]['similarity']
-                    else:
-                        print(f"ℹ️  RAILWAY LOG: Desempate mantiene categoría original (best={best_matches}, second={second_matches})")
-                else:
-                    print("ℹ️  RAILWAY LOG: Desempate no aplicado (baja confianza del objeto)")
-            except Exception as e:
-                print(f"⚠️ RAILWAY LOG: Error en desempate por objeto general: {e}")
+        if info.get('tiebreak'):
+            log.debug("Desempate por texto: %r supera a %r (margen %.4f)",
+                      info['second'], info['best'], info['margin'])
 
-        # 7. Verificar umbral de confianza
-        if best_score >= confidence_threshold:
-            print(f"✅ RAILWAY LOG: DETECTADO - {best_category.name} (conf: {best_score:.4f})")
-            return best_category, best_score
-        else:
-            print(f"❌ RAILWAY LOG: RECHAZADO - {best_score:.4f} < {confidence_threshold}")
+        # 4. Verificar umbral de confianza
+        if best_score < confidence_threshold:
+            log.debug("Categoría rechazada: %.4f < %s", best_score, confidence_threshold)
             return None, best_score
 
-    except Exception as e:
-        print(f"❌ ERROR en detección por centroides: {e}")
-        import traceback
-        traceback.print_exc()
+        best_category = Category.query.get(index.category_ids[position])
+        if best_category is None:
+            return None, 0
+        log.debug("Categoría detectada: %s (confianza %.4f)", best_category.name, best_score)
+        return best_category, best_score
+
+    except Exception:
+        log.exception("Error en detección por centroides")
         return None, 0
 
 
@@ -1429,13 +1472,10 @@ def detect_image_category(image_data, client_id, confidence_threshold=0.2):
     Función de detección por prompts (obsoleta, usa centroides como fallback)
     """
     try:
-        print(f"🎯 DEBUG: Usando método de centroides en lugar de prompts")
         return detect_image_category_with_centroids(image_data, client_id, confidence_threshold)
 
-    except Exception as e:
-        print(f"❌ ERROR en detección de categoría: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error en detección de categoría")
         return None, 0
 
 
@@ -1452,8 +1492,6 @@ def detect_image_category(image_data, client_id, confidence_threshold=0.2):
         tuple: (categoria_detectada, confidence_score) o (None, 0) si no detecta
     """
     try:
-        print(f"🎯 DEBUG: Iniciando detección de categoría para cliente {client_id}")
-
         # 1. Obtener categorías activas del cliente
         categories = Category.query.filter_by(
             client_id=client_id,
@@ -1461,20 +1499,18 @@ def detect_image_category(image_data, client_id, confidence_threshold=0.2):
         ).all()
 
         if not categories:
-            print(f"❌ DEBUG: No se encontraron categorías para cliente {client_id}")
+            log.info("Cliente %s sin categorías activas, no se detecta categoría", client_id)
             return None, 0
 
-        print(f"📋 DEBUG: Encontradas {len(categories)} categorías activas")
+        log.debug("Detección por prompts: %d categorías", len(categories))
 
         # 2. Preparar imagen para CLIP
         from PIL import Image as PILImage
         import io
         pil_image = PILImage.open(io.BytesIO(image_data))
-        print(f"🖼️ DEBUG: Imagen preparada: {pil_image.size}")
 
         # 3. Obtener modelo CLIP
         model, processor = get_clip_model()
-        print("🤖 DEBUG: Modelo CLIP obtenido")
 
         # 4. Preparar prompts de categorías
         category_prompts = []
@@ -1491,7 +1527,7 @@ def detect_image_category(image_data, client_id, confidence_threshold=0.2):
 
             category_prompts.append(prompt)
             category_objects.append(category)
-            print(f"📝 DEBUG: Prompt para {category.name}: {prompt}")
+            log.detail("Prompt para %s: %s", category.name, prompt)
 
         # 5. Procesar imagen y textos con CLIP
         with torch.no_grad():
@@ -1516,529 +1552,490 @@ def detect_image_category(image_data, client_id, confidence_threshold=0.2):
             # Calcular similitudes
             similarities = (image_features @ text_features.T).squeeze(0)
 
-            print(f"🔍 DEBUG: Similitudes calculadas: {similarities.tolist()}")
-
         # 6. Encontrar la mejor coincidencia
         best_idx = similarities.argmax().item()
         best_score = similarities[best_idx].item()
         best_category = category_objects[best_idx]
 
-        print(f"🎯 DEBUG: Mejor coincidencia: {best_category.name} ({best_score:.4f})")
-
         # 7. Verificar umbral de confianza
         if best_score >= confidence_threshold:
-            print(f"✅ DEBUG: Categoría detectada con confianza suficiente")
+            log.debug("Categoría detectada: %s (confianza %.4f)", best_category.name, best_score)
             return best_category, best_score
         else:
-            print(f"❌ DEBUG: Confianza insuficiente ({best_score:.4f} < {confidence_threshold})")
+            log.debug("Categoría rechazada: %s %.4f < %s", best_category.name, best_score, confidence_threshold)
             return None, best_score
 
-    except Exception as e:
-        print(f"❌ ERROR en detección de categoría: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error en detección de categoría")
         return None, 0
 
 
-@bp.route("/search", methods=["POST", "OPTIONS"])
-def visual_search():
+def _detect_category_color(client, detected_category, image_data):
     """
-    Endpoint de búsqueda visual para el widget con detección automática de categoría
+    Color dominante de la imagen restringido a la paleta de la categoría (solo debug)
 
-    Headers:
-        X-API-Key: API Key del cliente
+    Returns:
+        tuple: (color, confianza) o ("unknown", 0.0) si la categoría no tiene colores
+    """
+    # Paleta con los colores (attributes->>'color') de los productos de la categoría, cacheada
+    palette = get_client_palette(client.id, detected_category.id)
+    if not len(palette):
+        log.debug("Categoría sin colores definidos; se omite detección de color")
+        return "unknown", 0.0
+    return detect_dominant_color_from_palette(image_data, palette)
 
-    Form Data:
-        image: Archivo de imagen
-        limit: Número de resultados (default: 3, max: 10)
-        threshold: Umbral de similitud (default: 0.1)
+
+def _visual_search_payload(client, image_data, limit, max_results, use_optimizer, start_time,
+                           budget_header=None, debug=False):
     """
-    # Manejar preflight OPTIONS request
-    if request.method == 'OPTIONS':
-        response = jsonify({'status': 'ok'})
-        response.headers['Access-Control-Allow-Origin'] = '*'
-        response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
-        return response
+    Cómputo de la búsqueda visual (detección de categoría, color, embedding y ranking)
 
-    start_time = time.time()
+    Devuelve datos planos para poder compartirlos entre requests coalescidas.
+    Las etapas opcionales (desempate, tags inferidos, optimizer, color de debug)
+    corren solo si entran en el presupuesto de latencia (app/core/latency_budget.py).
+
+    Returns:
+        Tupla (payload, status_code)
+    """
+    # Sensibilidad personalizada por cliente
+    category_confidence_threshold = (getattr(client, 'category_confidence_threshold', 70) or 70) / 100.0
+    product_similarity_threshold = (getattr(client, 'product_similarity_threshold', 30) or 30) / 100.0
+
+    # 🚀 FASE 3: Cargar configuración de SearchOptimizer (si existe)
+    store_config = None
+    search_optimizer = None
 
     try:
-        # Soportar también búsqueda textual vía JSON en el mismo endpoint
-        # Si el Content-Type es application/json y no hay archivo de imagen, delegar a text_search()
-        if request.method == 'POST' and (request.is_json or (request.content_type and 'application/json' in request.content_type)) and not request.files:
-            # Delegar al handler de búsqueda textual existente
-            resp = text_search()
+        store_config = StoreSearchConfig.query.get(client.id)
+    except Exception as e:
+        log.warning("Error cargando StoreSearchConfig: %s", e)
 
-            # Asegurar headers CORS consistentes con el endpoint unificado
-            if isinstance(resp, tuple):
-                resp_obj, status_code = resp
-                try:
-                    resp_obj.headers['Access-Control-Allow-Origin'] = '*'
-                    resp_obj.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-                    resp_obj.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
-                except Exception:
-                    pass
-                return resp_obj, status_code
+    # Presupuesto de latencia: header > StoreSearchConfig > default del sistema
+    budget = LatencyBudget(resolve_budget_ms(budget_header, store_config), started_at=start_time, debug=debug)
+
+    if use_optimizer:
+        try:
+            if store_config:
+                search_optimizer = SearchOptimizer(store_config)
+                log.debug("Optimizer activo (v=%s, m=%s, b=%s)", store_config.visual_weight,
+                          store_config.metadata_weight, store_config.business_weight)
             else:
-                try:
-                    resp.headers['Access-Control-Allow-Origin'] = '*'
-                    resp.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-                    resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
-                except Exception:
-                    pass
-                return resp
-
-        # Validar request
-        client, image_file, error_response = _validate_visual_search_request()
-        if error_response:
-            return error_response
-
-        # Procesar datos de imagen
-        image_data, limit, _, error_response, status_code = _process_image_data(image_file)
-        # Obtener configuración real del panel
-        max_results = system_config.get('search', 'max_results')
-        # Si el parámetro limit no está en el request, usar el del panel
-        if not limit:
-            limit = max_results
-        if error_response:
-            return error_response, status_code
-
-        # Sensibilidad personalizada por cliente
-        category_confidence_threshold = (getattr(client, 'category_confidence_threshold', 70) or 70) / 100.0
-        product_similarity_threshold = (getattr(client, 'product_similarity_threshold', 30) or 30) / 100.0
-
-        # 🚀 FASE 3: Cargar configuración de SearchOptimizer (si existe)
-        use_optimizer = request.form.get('use_optimizer', 'true').lower() == 'true'  # Feature flag
-        store_config = None
-        search_optimizer = None
-
-        if use_optimizer:
-            try:
-                store_config = StoreSearchConfig.query.get(client.id)
-                if store_config:
-                    search_optimizer = SearchOptimizer(store_config)
-                    print(f"🎯 OPTIMIZER: Activado para {client.name} (v={store_config.visual_weight}, m={store_config.metadata_weight}, b={store_config.business_weight})")
-                else:
-                    print(f"⚠️ OPTIMIZER: No config found for client {client.id}, usando búsqueda tradicional")
-            except Exception as e:
-                print(f"❌ OPTIMIZER: Error cargando config: {e}")
-                # Si falla, continuar sin optimizer
-                search_optimizer = None
-
-        # ===== PASO 1: DETECCIÓN DE CATEGORÍA ESPECÍFICA =====
-        print(f"🚀 RAILWAY LOG: INICIANDO DETECCIÓN DE CATEGORÍA ESPECÍFICA")
+                log.debug("Sin StoreSearchConfig para cliente %s, búsqueda tradicional", client.id)
+        except Exception as e:
+            log.warning("Error cargando config del optimizer: %s", e)
+            # Si falla, continuar sin optimizer
+            search_optimizer = None
 
+    # ===== PASO 1: DETECCIÓN DE CATEGORÍA ESPECÍFICA =====
+    with stage('category_detection'):
         detected_category, category_confidence = detect_image_category_with_centroids(
             image_data,
             client.id,
             confidence_threshold=category_confidence_threshold  # Sensibilidad por cliente
         )
 
-        print(f"🎯 RAILWAY LOG: Resultado detección = {detected_category.name if detected_category else 'NULL'} (conf: {category_confidence:.3f})")
-
-        if detected_category is None:
-            # No se pudo detectar una categoría válida
-            print(f"❌ RAILWAY LOG: CATEGORÍA NO DETECTADA - devolviendo error")
-            return jsonify({
-                "success": False,
-                "error": "category_not_detected",
-                "message": f"Esta imagen no corresponde a productos que comercializa {client.name}",
-                "details": f"La imagen no pudo identificarse dentro de nuestras categorías disponibles (confianza máxima: {category_confidence:.1%}). Por favor, intenta con una imagen de un producto de nuestro catálogo.",
-                "available_categories": [cat.name for cat in Category.query.filter_by(client_id=client.id, is_active=True).all()],
-                "processing_time": round(time.time() - start_time, 3)
-            }), 400
-
-        print(f"✅ RAILWAY LOG: CATEGORÍA OK: {detected_category.name} - procediendo a búsqueda")
-
-        # ===== PASO 2: DETECCIÓN DE COLOR RESTRINGIDO A LA CATEGORÍA =====
-        print(f"🎨 RAILWAY LOG: IDENTIFICANDO COLOR DOMINANTE (por categoría)...")
-
-        # Construir paleta de colores solo con los productos de la categoría
-        # Preferir colores desde JSONB attributes->>'color' para la categoría
-        rows = db.session.execute(
-            text(
-                """
-                SELECT DISTINCT UPPER(TRIM(p.attributes->>'color')) AS color
-                FROM products p
-                WHERE p.client_id = :client_id
-                  AND p.category_id = :category_id
-                  AND p.attributes ? 'color'
-                  AND NULLIF(TRIM(p.attributes->>'color'), '') IS NOT NULL
-                """
-            ),
-            {"client_id": client.id, "category_id": detected_category.id},
-        ).fetchall()
-
-        category_colors = [r[0] for r in rows if r[0]]
-
-        if category_colors:
-            detected_color, color_confidence = detect_dominant_color_from_palette(image_data, category_colors)
-            print(f"🎨 RAILWAY LOG: COLOR DETECTADO (cat) = {detected_color} (confianza: {color_confidence:.3f})")
-        else:
-            detected_color, color_confidence = ("unknown", 0.0)
-            print("⚠️ RAILWAY LOG: Categoría sin colores definidos; se omite boost/metadata por color")
-
-        # ===== GENERAR EMBEDDING DE LA IMAGEN (con enriquecimiento por tags) =====
+    if detected_category is None:
+        # No se pudo detectar una categoría válida
+        log.info("Búsqueda visual sin categoría detectada (confianza %.3f < %.2f)",
+                 category_confidence, category_confidence_threshold)
+        return {
+            "success": False,
+            "error": "category_not_detected",
+            "message": f"Esta imagen no corresponde a productos que comercializa {client.name}",
+            "details": f"La imagen no pudo identificarse dentro de nuestras categorías disponibles (confianza máxima: {category_confidence:.1%}). Por favor, intenta con una imagen de un producto de nuestro catálogo.",
+            "available_categories": [cat.name for cat in Category.query.filter_by(client_id=client.id, is_active=True).all()],
+            "processing_time": round(time.time() - start_time, 3),
+            "pipeline": budget.summary()
+        }, 400
+
+    # ===== PASO 2: DETECCIÓN DE COLOR RESTRINGIDO A LA CATEGORÍA (solo debug) =====
+    # El color no participa del ranking visual: solo se calcula si la request pide debug
+    detected_color, color_confidence = ("unknown", 0.0)
+    if budget.allow(STAGE_COLOR_DETECTION):
+        with stage('color_detection'), budget.track(STAGE_COLOR_DETECTION):
+            detected_color, color_confidence = _detect_category_color(client, detected_category, image_data)
+
+    # ===== GENERAR EMBEDDING DE LA IMAGEN (con enriquecimiento por tags) =====
+    with stage('embedding'):
         query_embedding, error_response, status_code = _generate_query_embedding(
             image_data,
-            detected_category=detected_category  # Pasar categoría para contexto
+            detected_category=detected_category,  # Pasar categoría para contexto
+            budget=budget
         )
-        if error_response:
-            print(f"❌ RAILWAY LOG: Error generando embedding")
-            return error_response, status_code
-
-        # ===== BUSCAR SOLO EN LA CATEGORÍA DETECTADA =====
-        print(f"🔍 RAILWAY LOG: Buscando productos en {detected_category.name}")
-
-        # Modificar la búsqueda para filtrar por categoría detectada
-        product_best_match = _find_similar_products_in_category(
-            client,
-            query_embedding,
-            product_similarity_threshold,
-            detected_category.id
-        )
-
-        print(f"🎯 DEBUG: Productos encontrados en categoría {detected_category.name}: {len(product_best_match)}")
-
-        # ===== NO APLICAR BOOST NI METADATA POR COLOR EN BÚSQUEDA VISUAL =====
-        # La detección de color solo se usa para logging/debug
-        # El ranking visual debe ser 100% basado en similitud CLIP pura
-        # Mantener paridad con producción (Railway)
-
-        # 🚀 FASE 3: APLICAR SEARCH OPTIMIZER (si está activado)
-        if search_optimizer and len(product_best_match) > 0:
-            print(f"🎯 OPTIMIZER: Aplicando ranking avanzado a {len(product_best_match)} productos")
-
-            # Preparar atributos detectados para metadata scoring
-            detected_attributes = {}
-            # NO usar color detectado en búsqueda visual para mantener paridad con producción
-            # El color solo se considera en búsqueda textual
-
-            # Convertir product_best_match a formato esperado por optimizer
-            raw_results = [
-                {
-                    'product': match_data['product'],
-                    'similarity': match_data['similarity']
-                }
-                for product_id, match_data in product_best_match.items()
-            ]
+    if error_response:
+        log.warning("Error generando embedding de la imagen de búsqueda")
+        return error_response.get_json(), status_code
+
+    # ===== BUSCAR SOLO EN LA CATEGORÍA DETECTADA =====
+    # Modificar la búsqueda para filtrar por categoría detectada
+    product_best_match = _find_similar_products_in_category(
+        client,
+        query_embedding,
+        product_similarity_threshold,
+        detected_category.id
+    )
+
+    # ===== NO APLICAR BOOST NI METADATA POR COLOR EN BÚSQUEDA VISUAL =====
+    # La detección de color solo se usa para logging/debug
+    # El ranking visual debe ser 100% basado en similitud CLIP pura
+    # Mantener paridad con producción (Railway)
+
+    # 🚀 FASE 3: APLICAR SEARCH OPTIMIZER (si está activado y entra en el presupuesto)
+    if search_optimizer and len(product_best_match) > 0 and budget.allow(STAGE_OPTIMIZER):
+        # Preparar atributos detectados para metadata scoring
+        detected_attributes = {}
+        # NO usar color detectado en búsqueda visual para mantener paridad con producción
+        # El color solo se considera en búsqueda textual
+
+        # Convertir product_best_match a formato esperado por optimizer
+        raw_results = [
+            {
+                'product': match_data['product'],
+                'similarity': match_data['similarity']
+            }
+            for product_id, match_data in product_best_match.items()
+        ]
 
-            # Aplicar ranking con SearchOptimizer
-            try:
+        # Aplicar ranking con SearchOptimizer
+        try:
+            with stage('optimizer'), budget.track(STAGE_OPTIMIZER):
                 ranked_results = search_optimizer.rank_results(raw_results, detected_attributes)
 
-                # Actualizar product_best_match con scores enriquecidos
-                for ranked in ranked_results:
-                    # ranked.product_id es string, pero las claves del dict son UUID objects
-                    # Buscar por el objeto Product directamente
-                    product_obj = ranked.product
-
-                    # Buscar la clave UUID en el diccionario que corresponde a este producto
-                    for dict_product_id, match_data in product_best_match.items():
-                        if str(dict_product_id) == ranked.product_id:
-                            product_best_match[dict_product_id]['optimizer_scores'] = {
-                                'visual_score': ranked.visual_score,
-                                'metadata_score': ranked.metadata_score,
-                                'business_score': ranked.business_score,
-                                'final_score': ranked.final_score,
-                                'debug_info': ranked.debug_info
-                            }
-                            # Actualizar similarity con final_score para que _build_search_results ordene correctamente
-                            product_best_match[dict_product_id]['similarity'] = ranked.final_score
-                            break
-
-                print(f"✅ OPTIMIZER: Ranking completado. Top 3 scores: " +
-                      ", ".join([f"{r.final_score:.3f}" for r in ranked_results[:3]]))
+            # Actualizar product_best_match con scores enriquecidos
+            for ranked in ranked_results:
+                # ranked.product_id es string, pero las claves del dict son UUID objects
+                # Buscar por el objeto Product directamente
+                product_obj = ranked.product
+
+                # Buscar la clave UUID en el diccionario que corresponde a este producto
+                for dict_product_id, match_data in product_best_match.items():
+                    if str(dict_product_id) == ranked.product_id:
+                        product_best_match[dict_product_id]['optimizer_scores'] = {
+                            'visual_score': ranked.visual_score,
+                            'metadata_score': ranked.metadata_score,
+                            'business_score': ranked.business_score,
+                            'final_score': ranked.final_score,
+                            'debug_info': ranked.debug_info
+                        }
+                        # Actualizar similarity con final_score para que _build_search_results ordene correctamente
+                        product_best_match[dict_product_id]['similarity'] = ranked.final_score
+                        break
 
-                # Debug: verificar que optimizer_scores se guardó
-                sample_id = list(product_best_match.keys())[0] if product_best_match else None
-                if sample_id:
-                    has_optimizer = 'optimizer_scores' in product_best_match[sample_id]
-                    print(f"🔍 DEBUG: Primer producto tiene optimizer_scores: {has_optimizer}")
+            log.debug("Optimizer: %d productos rankeados, top scores %s", len(ranked_results),
+                      [round(r.final_score, 3) for r in ranked_results[:3]])
 
-            except Exception as e:
-                print(f"❌ OPTIMIZER: Error durante ranking: {e}")
-                # Si falla, continuar con scores originales
-                import traceback
-                traceback.print_exc()
+        except Exception:
+            # Si falla, continuar con scores originales
+            log.exception("Error durante ranking del optimizer")
 
-        # Construir resultados finales (sin filtro adicional de categoría)
+    # Construir resultados finales (sin filtro adicional de categoría)
+    with stage('serialization'):
         results = _build_search_results(product_best_match, limit)
 
-        processing_time = time.time() - start_time
-
-        # Respuesta con información de categoría detectada y config real
-        response = {
-            "success": True,
-            "query_type": "image_with_category_detection",
-            "detected_category": {
-                "id": detected_category.id,
-                "name": detected_category.name,
-                "name_en": detected_category.name_en,
-                "confidence": round(category_confidence, 4)
-            },
-            "query_info": {
-                "method": "category_detection_with_clip",
-                "detected_category": detected_category.name,
-                "confidence": round(category_confidence, 4),
-                "category_filter": True
-            },
-            "results": results,
-            "total_results": len(results),
-            "processing_time": round(processing_time, 3),
-            "client_id": client.id,
-            "client_name": client.name,
-            "search_method": "category_filtered",
-            "timestamp": time.time(),
-            "timeout_minutes": round(_get_idle_timeout_seconds() / 60, 2),
-            "max_results_config": max_results
-        }
+    processing_time = time.time() - start_time
+    log.info("Búsqueda visual: categoría=%s (%.3f) color=%s (%.3f) candidatos=%d resultados=%d optimizer=%s %.3fs",
+             detected_category.name, category_confidence, detected_color, color_confidence,
+             len(product_best_match), len(results), search_optimizer is not None, processing_time)
 
-        # Headers CORS para widget
-        response_obj = jsonify(response)
-        response_obj.headers['Access-Control-Allow-Origin'] = '*'
-        response_obj.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response_obj.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
-
-        return response_obj
+    # Respuesta con información de categoría detectada y config real
+    response = {
+        "success": True,
+        "query_type": "image_with_category_detection",
+        "detected_category": {
+            "id": detected_category.id,
+            "name": detected_category.name,
+            "name_en": detected_category.name_en,
+            "confidence": round(category_confidence, 4)
+        },
+        "query_info": {
+            "method": "category_detection_with_clip",
+            "detected_category": detected_category.name,
+            "confidence": round(category_confidence, 4),
+            "category_filter": True
+        },
+        "results": results,
+        "total_results": len(results),
+        "processing_time": round(processing_time, 3),
+        "client_id": client.id,
+        "client_name": client.name,
+        "search_method": "category_filtered",
+        "timestamp": time.time(),
+        "timeout_minutes": round(_get_idle_timeout_seconds() / 60, 2),
+        "max_results_config": max_results,
+        "pipeline": budget.summary()
+    }
+    if STAGE_COLOR_DETECTION in budget.ran:
+        response["debug"] = {"detected_color": detected_color, "color_confidence": round(color_confidence, 4)}
 
-    except Exception as e:
-        processing_time = time.time() - start_time
-        return jsonify({
-            "error": "internal_error",
-            "message": f"Error interno: {str(e)}",
-            "processing_time": round(processing_time, 3)
-        }), 500
+    return response, 200
 
 
-@bp.route("/search/text", methods=["POST", "OPTIONS"])
-def text_search():
+@bp.route("/search", methods=["POST", "OPTIONS"])
+def visual_search():
     """
-    Endpoint de búsqueda textual híbrida (CLIP + Atributos + Tags)
+    Endpoint de búsqueda visual para el widget con detección automática de categoría
 
     Headers:
         X-API-Key: API Key del cliente
 
-    JSON Body:
-        query: Texto de búsqueda (ej: "camisa blanca", "delantal marrón")
-        limit: Número de resultados (default: 10, max: 50)
+    Form Data:
+        image: Archivo de imagen
+        limit: Número de resultados (default: 3, max: 10)
+        threshold: Umbral de similitud (default: 0.1)
+        debug: 'true' para correr etapas de debug (color dominante por paleta)
+
+    Headers opcionales:
+        X-Search-Budget-Ms: Presupuesto de latencia (pisa el de StoreSearchConfig)
     """
     # Manejar preflight OPTIONS request
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
         response.headers['Access-Control-Allow-Origin'] = '*'
         response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key, X-Search-Budget-Ms'
         return response
 
     start_time = time.time()
 
     try:
-        # Log temprano para verificar llegada de requests incluso si falla la API Key
-        print(
-            f"👉 TEXT SEARCH HIT: path={request.path} from={request.remote_addr} has_key={'X-API-Key' in request.headers}",
-            flush=True
-        )
-        # Validar API Key
-        api_key = request.headers.get('X-API-Key')
-        if not api_key:
-            return jsonify({
-                "success": False,
-                "error": "missing_api_key",
-                "message": "X-API-Key header requerido"
-            }), 401
-
-        # Buscar cliente por API Key
-        client = Client.query.filter_by(api_key=api_key).first()
-        if not client:
-            return jsonify({
-                "success": False,
-                "error": "invalid_api_key",
-                "message": "API Key inválido"
-            }), 401
+        # Soportar también búsqueda textual vía JSON en el mismo endpoint
+        # Si el Content-Type es application/json y no hay archivo de imagen, delegar a text_search()
+        if request.method == 'POST' and (request.is_json or (request.content_type and 'application/json' in request.content_type)) and not request.files:
+            # Delegar al handler de búsqueda textual existente
+            resp = text_search()
 
-        # Obtener parámetros del request
-        data = request.get_json()
-        if not data or 'query' not in data:
-            return jsonify({
-                "success": False,
-                "error": "missing_query",
-                "message": "Campo 'query' requerido en el body JSON"
-            }), 400
+            # Asegurar headers CORS consistentes con el endpoint unificado
+            if isinstance(resp, tuple):
+                resp_obj, status_code = resp
+                try:
+                    resp_obj.headers['Access-Control-Allow-Origin'] = '*'
+                    resp_obj.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+                    resp_obj.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
+                except Exception:
+                    pass
+                return resp_obj, status_code
+            else:
+                try:
+                    resp.headers['Access-Control-Allow-Origin'] = '*'
+                    resp.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+                    resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
+                except Exception:
+                    pass
+                return resp
 
-        query_text = data.get('query', '').strip()
-        if not query_text:
-            return jsonify({
-                "success": False,
-                "error": "empty_query",
-                "message": "La query no puede estar vacía"
-            }), 400
+        # Validar request
+        client, image_file, error_response = _validate_visual_search_request()
+        if error_response:
+            return error_response
 
+        # Procesar datos de imagen
+        image_data, limit, _, error_response, status_code = _process_image_data(image_file)
         # Obtener configuración real del panel
         max_results = system_config.get('search', 'max_results')
-        # Permitir tanto 'limit' como 'max_results' del request, pero respetar el límite del sistema
-        limit_value = data.get('limit', data.get('max_results', max_results))
-        try:
-            # Respetar el límite configurado en el sistema
-            limit = min(int(limit_value), max_results)
-        except Exception:
+        # Si el parámetro limit no está en el request, usar el del panel
+        if not limit:
             limit = max_results
+        if error_response:
+            return error_response, status_code
 
-        print(f"📝 TEXT SEARCH: Query='{query_text}' Client={client.name} Limit={limit}", flush=True)
-
-        # --- LLM Normalization (con vocabulario dinámico del cliente) ---
-        llm_norm = normalize_query(query_text, client_id=client.id)
-        # TODO: Mover a nivel de logs DEBUG
-        # print(f"🧠 LLM Normalizer: {llm_norm}")
-        print(f"🧠 LLM Normalizer: tipo={llm_norm.get('tipo')}, color={llm_norm.get('color')}, contexto={llm_norm.get('contexto')}")
-
-        # Extraer campos del normalizador para usar en boosts
-        detected_color = llm_norm.get('color', '').lower() if llm_norm.get('color') else None
-        detected_tipo = llm_norm.get('tipo', '').lower() if llm_norm.get('tipo') else None
+        use_optimizer = request.form.get('use_optimizer', 'true').lower() == 'true'  # Feature flag
+        debug = request.form.get('debug', 'false').lower() == 'true'
+        budget_header = request.headers.get(BUDGET_HEADER)
 
-        # Expandir modificadores de color con colores del cliente
-        expanded_query = expand_color_modifiers(query_text, client_id=str(client.id))
-        if expanded_query != query_text:
-            print(f"🔄 Query expandido: '{query_text}' -> '{expanded_query}'")
+        # Requests idénticas concurrentes (misma imagen y parámetros) comparten un solo cómputo
+        flight_key = ('image', str(client.id), hashlib.sha256(image_data).hexdigest(), limit, use_optimizer,
+                      debug, budget_header, client_version(client.id))
+        (response, status_code), shared = _coalesce(
+            _visual_search_flight, flight_key,
+            lambda: _visual_search_payload(client, image_data, limit, max_results, use_optimizer, start_time,
+                                           budget_header=budget_header, debug=debug))
 
-        # Generar embedding CLIP del texto de búsqueda (usar query expandido)
-        model, processor = get_clip_model()
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        # Headers CORS para widget
+        with stage('serialization'):
+            response_obj = jsonify(response)
+        response_obj.headers['Access-Control-Allow-Origin'] = '*'
+        response_obj.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response_obj.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
+        if shared:
+            response_obj.headers[COALESCED_HEADER] = '1'
 
-        with torch.no_grad():
-            text_inputs = processor(text=[expanded_query], return_tensors="pt", padding=True)
-            text_features = model.get_text_features(**text_inputs)
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-            query_embedding = text_features.cpu().numpy()[0]
+        if status_code != 200:
+            return response_obj, status_code
+        return response_obj
 
-        # Usar query expandido para matching de atributos también
-        query_lower = expanded_query.lower()
+    except AdmissionRejected as e:
+        return _overloaded_response(e)
+    except Exception as e:
+        log.exception("Error en búsqueda visual")
+        processing_time = time.time() - start_time
+        return jsonify({
+            "error": "internal_error",
+            "message": f"Error interno: {str(e)}",
+            "processing_time": round(processing_time, 3)
+        }), 500
 
-        # Intentar detectar categoría en el query mediante tokens normalizados
-        detected_category = None
-        categories = Category.query.filter_by(client_id=client.id, is_active=True).all()
 
-        import re, unicodedata
+def _text_search_payload(client, query_text, limit, start_time):
+    """
+    Cómputo de la búsqueda textual (normalización, embedding, scoring y fallbacks)
 
-        def _norm_token(t: str) -> str:
-            t = ''.join(c for c in unicodedata.normalize('NFD', t.lower()) if unicodedata.category(c) != 'Mn')
-            t = re.sub(r"[^a-z0-9]+", "", t)
-            # singularización naive: quitar 's' final si queda algo
-            if len(t) > 3 and t.endswith('s'):
-                t = t[:-1]
-            return t
+    Devuelve datos planos para poder compartirlos entre requests coalescidas.
+    """
+    # --- LLM Normalization (con vocabulario dinámico del cliente) ---
+    with stage('query_normalization'):
+        llm_norm = normalize_query(query_text, client_id=client.id)
+    log.debug("Normalizer: tipo=%s color=%s contexto=%s",
+              llm_norm.get('tipo'), llm_norm.get('color'), llm_norm.get('contexto'))
 
-        STOPWORDS = {
-            'hombre','hombres','dama','damas','mujer','mujeres','unisex',
-            'y','de','para','con','sin','del','la','el','los','las'
-        }
+    # Extraer campos del normalizador para usar en boosts
+    detected_color = llm_norm.get('color', '').lower() if llm_norm.get('color') else None
+    detected_tipo = llm_norm.get('tipo', '').lower() if llm_norm.get('tipo') else None
 
-        def tokenize(texto: str):
-            toks = re.split(r"[\s,./;:()\-–]+", texto or "")
-            return { _norm_token(t) for t in toks if _norm_token(t) and _norm_token(t) not in STOPWORDS }
+    # Expandir modificadores de color con colores del cliente
+    with stage('query_normalization'):
+        expanded_query = expand_color_modifiers(query_text, client_id=str(client.id))
+    if expanded_query != query_text:
+        log.debug("Query expandido: %r -> %r", query_text, expanded_query)
+
+    # Generar embedding CLIP del texto de búsqueda (usar query expandido)
+    model, processor = get_clip_model()
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    with stage('embedding'), torch.no_grad():
+        text_inputs = processor(text=[expanded_query], return_tensors="pt", padding=True)
+        text_features = model.get_text_features(**text_inputs)
+        text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+        query_embedding = text_features.cpu().numpy()[0]
+
+    # Usar query expandido para matching de atributos también
+    query_lower = expanded_query.lower()
+
+    # Intentar detectar categoría en el query mediante tokens normalizados
+    detected_category = None
+    categories = Category.query.filter_by(client_id=client.id, is_active=True).all()
+
+    import re, unicodedata
+
+    def _norm_token(t: str) -> str:
+        t = ''.join(c for c in unicodedata.normalize('NFD', t.lower()) if unicodedata.category(c) != 'Mn')
+        t = re.sub(r"[^a-z0-9]+", "", t)
+        # singularización naive: quitar 's' final si queda algo
+        if len(t) > 3 and t.endswith('s'):
+            t = t[:-1]
+        return t
+
+    STOPWORDS = {
+        'hombre','hombres','dama','damas','mujer','mujeres','unisex',
+        'y','de','para','con','sin','del','la','el','los','las'
+    }
 
-        query_tokens = tokenize(expanded_query)
-        print(f"🔍 Query tokens: {query_tokens}")
+    def tokenize(texto: str):
+        toks = re.split(r"[\s,./;:()\-–]+", texto or "")
+        return { _norm_token(t) for t in toks if _norm_token(t) and _norm_token(t) not in STOPWORDS }
 
-        # Construir tokens por categoría (nombre, name_en y alternative_terms si existe)
-        cat_tokens_list = []
-        for category in categories:
-            # Separar tokens del nombre (PESO ALTO) vs alternative_terms (PESO BAJO)
-            name_toks = set()
-            name_toks |= tokenize(category.name)
-            if category.name_en:
-                name_toks |= tokenize(category.name_en)
+    query_tokens = tokenize(expanded_query)
+    log.detail("Query tokens: %s", query_tokens)
 
-            alt_toks = set()
-            alt = getattr(category, 'alternative_terms', None)
-            if alt:
-                for term in str(alt).split(','):
-                    alt_toks |= tokenize(term.strip())
+    # Construir tokens por categoría (nombre, name_en y alternative_terms si existe)
+    cat_tokens_list = []
+    for category in categories:
+        # Separar tokens del nombre (PESO ALTO) vs alternative_terms (PESO BAJO)
+        name_toks = set()
+        name_toks |= tokenize(category.name)
+        if category.name_en:
+            name_toks |= tokenize(category.name_en)
 
-            cat_tokens_list.append((category, name_toks, alt_toks))
+        alt_toks = set()
+        alt = getattr(category, 'alternative_terms', None)
+        if alt:
+            for term in str(alt).split(','):
+                alt_toks |= tokenize(term.strip())
 
-        # Detección mejorada: evaluar TODAS las categorías y elegir la mejor coincidencia
-        # Buscar primero coincidencia exacta de frase completa (ej: "tiro bajo" completo)
-        best_category = None
-        best_score = 0
+        cat_tokens_list.append((category, name_toks, alt_toks))
 
-        # 1. Prioridad: Buscar coincidencia de frase completa en alternative_terms o nombre
-        query_normalized = expanded_query.lower().strip()
+    # Detección mejorada: evaluar TODAS las categorías y elegir la mejor coincidencia
+    # Buscar primero coincidencia exacta de frase completa (ej: "tiro bajo" completo)
+    best_category = None
+    best_score = 0
+
+    # 1. Prioridad: Buscar coincidencia de frase completa en alternative_terms o nombre
+    query_normalized = expanded_query.lower().strip()
+    for category in categories:
+        # Verificar en nombre (PRIORIDAD ALTA: nombre exacto de categoría)
+        if query_normalized in category.name.lower() or category.name.lower() in query_normalized:
+            detected_category = category
+            log.debug("Categoría detectada por nombre exacto: %s", category.name)
+            break
+        # Verificar en name_en también con alta prioridad
+        if category.name_en and (query_normalized in category.name_en.lower() or category.name_en.lower() in query_normalized):
+            detected_category = category
+            log.debug("Categoría detectada por name_en exacto: %s", category.name)
+            break
+
+    # Segundo pase: alternative_terms si no hubo match en nombre
+    if not detected_category:
         for category in categories:
-            # Verificar en nombre (PRIORIDAD ALTA: nombre exacto de categoría)
-            if query_normalized in category.name.lower() or category.name.lower() in query_normalized:
-                detected_category = category
-                print(f"📁 Categoría detectada por nombre exacto: {category.name}")
-                break
-            # Verificar en name_en también con alta prioridad
-            if category.name_en and (query_normalized in category.name_en.lower() or category.name_en.lower() in query_normalized):
-                detected_category = category
-                print(f"📁 Categoría detectada por name_en exacto: {category.name}")
-                break
-
-        # Segundo pase: alternative_terms si no hubo match en nombre
-        if not detected_category:
-            for category in categories:
-                alt = getattr(category, 'alternative_terms', None)
-                if alt:
-                    alt_terms = [t.strip().lower() for t in str(alt).split(',')]
-                    if query_normalized in alt_terms:
-                        detected_category = category
-                        print(f"📁 Categoría detectada por alternative_term exacto: {category.name}")
-                        break
-
-        # 2. Si no hay coincidencia exacta, usar scoring de tokens (máxima superposición)
-        if not detected_category:
-            candidates = []  # Para debugging
-            for category, name_toks, alt_toks in cat_tokens_list:
-                # Calcular intersección con tokens del nombre (PESO 1.0)
-                name_intersection = query_tokens & name_toks
-                # Calcular intersección con tokens de alternative_terms (PESO 0.5)
-                alt_intersection = query_tokens & alt_toks
-
-                if name_intersection or alt_intersection:
-                    # Score ponderado: tokens del nombre valen el doble
-                    score = (len(name_intersection) * 1.0 + len(alt_intersection) * 0.5) / max(len(query_tokens), 1)
-                    all_intersection = name_intersection | alt_intersection
-                    candidates.append((category.name, score, all_intersection, 'name' if name_intersection else 'alt'))
-                    if score > best_score:
-                        best_score = score
-                        best_category = category
-
-            if candidates:
-                print(f"🎯 Candidatos de categoría: {[(c[0], f'{c[1]:.2f}', c[2], c[3]) for c in sorted(candidates, key=lambda x: x[1], reverse=True)[:5]]}")
-
-            if best_category and best_score > 0:
-                detected_category = best_category
-                print(f"📁 Categoría detectada por tokens (score={best_score:.2f}): {detected_category.name}")
-
-
-        # Si NO detectamos categoría: decidir si es fuera de catálogo o si permitimos búsqueda global
-        if not detected_category:
-            all_cat_tokens = set()
-            for _, name_toks, alt_toks in cat_tokens_list:
-                all_cat_tokens |= name_toks
-                all_cat_tokens |= alt_toks
-
-            if query_tokens and query_tokens.isdisjoint(all_cat_tokens):
-                # Antes devolvíamos 400. Ahora permitimos BÚSQUEDA GLOBAL para casos como nombres de modelo (ej: "monaco").
-                print("ℹ️ TEXT SEARCH: tokens sin cruce con categorías → continuamos en búsqueda GLOBAL por nombre/SKU/tags")
-            else:
-                # Si hay alguna coincidencia débil (e.g., tokens genéricos), continuar sin filtrar por categoría
-                print("ℹ️ TEXT SEARCH: Sin categoría inequívoca, continuando sin filtro por categoría")
+            alt = getattr(category, 'alternative_terms', None)
+            if alt:
+                alt_terms = [t.strip().lower() for t in str(alt).split(',')]
+                if query_normalized in alt_terms:
+                    detected_category = category
+                    log.debug("Categoría detectada por alternative_term exacto: %s", category.name)
+                    break
+
+    # 2. Si no hay coincidencia exacta, usar scoring de tokens (máxima superposición)
+    if not detected_category:
+        candidates = []  # Para debugging
+        for category, name_toks, alt_toks in cat_tokens_list:
+            # Calcular intersección con tokens del nombre (PESO 1.0)
+            name_intersection = query_tokens & name_toks
+            # Calcular intersección con tokens de alternative_terms (PESO 0.5)
+            alt_intersection = query_tokens & alt_toks
+
+            if name_intersection or alt_intersection:
+                # Score ponderado: tokens del nombre valen el doble
+                score = (len(name_intersection) * 1.0 + len(alt_intersection) * 0.5) / max(len(query_tokens), 1)
+                all_intersection = name_intersection | alt_intersection
+                candidates.append((category.name, score, all_intersection, 'name' if name_intersection else 'alt'))
+                if score > best_score:
+                    best_score = score
+                    best_category = category
+
+        if candidates and log.detail_enabled:
+            log.detail("Candidatos de categoría: %s",
+                       sorted(candidates, key=lambda x: x[1], reverse=True)[:5])
+
+        if best_category and best_score > 0:
+            detected_category = best_category
+            log.debug("Categoría detectada por tokens (score=%.2f): %s", best_score, detected_category.name)
+
+
+    # Si NO detectamos categoría: decidir si es fuera de catálogo o si permitimos búsqueda global
+    if not detected_category:
+        all_cat_tokens = set()
+        for _, name_toks, alt_toks in cat_tokens_list:
+            all_cat_tokens |= name_toks
+            all_cat_tokens |= alt_toks
+
+        if query_tokens and query_tokens.isdisjoint(all_cat_tokens):
+            # Antes devolvíamos 400. Ahora permitimos BÚSQUEDA GLOBAL para casos como nombres de modelo (ej: "monaco").
+            log.debug("Tokens sin cruce con categorías, búsqueda global por nombre/SKU/tags")
+        else:
+            # Si hay alguna coincidencia débil (e.g., tokens genéricos), continuar sin filtrar por categoría
+            log.debug("Sin categoría inequívoca, búsqueda sin filtro por categoría")
 
-        # --- Enriquecimiento opcional de query con tags inferidos (feature flag) ---
-        try:
-            fusion_enabled = system_config.get('search', 'enable_inferred_tags', False)
-            if fusion_enabled:
-                from app.services.query_enrichment_service import QueryEnrichmentService
+    # --- Enriquecimiento opcional de query con tags inferidos (feature flag) ---
+    try:
+        fusion_enabled = system_config.get('search', 'enable_inferred_tags', False)
+        if fusion_enabled:
+            from app.services.query_enrichment_service import QueryEnrichmentService
 
-                fusion_cfg = system_config.get('search', 'clip_fusion', {}) or {}
-                alpha = float(fusion_cfg.get('alpha', 1.0))
-                beta_tag = float(fusion_cfg.get('beta_tag', 0.5))
+            fusion_cfg = system_config.get('search', 'clip_fusion', {}) or {}
+            alpha = float(fusion_cfg.get('alpha', 1.0))
+            beta_tag = float(fusion_cfg.get('beta_tag', 0.5))
 
-                # Usar servicio de enriquecimiento
+            # Usar servicio de enriquecimiento
+            with stage('query_enrichment'):
                 enrichment = QueryEnrichmentService.enrich_query(
                     query_text=expanded_query,
                     detected_category=detected_category.name if detected_category else None,
@@ -2049,31 +2046,64 @@ def text_search():
                     use_cache=True
                 )
 
-                tag_phrases = enrichment.get('tag_phrases', [])
+            tag_phrases = enrichment.get('tag_phrases', [])
 
-                if tag_phrases:
-                    with torch.no_grad():
-                        tag_inputs = processor(text=tag_phrases, return_tensors="pt", padding=True)
-                        tag_feats = model.get_text_features(**tag_inputs)
-                        tag_feats = tag_feats / tag_feats.norm(dim=-1, keepdim=True)
-                        tag_mean = tag_feats.mean(dim=0)
+            if tag_phrases:
+                with torch.no_grad():
+                    tag_inputs = processor(text=tag_phrases, return_tensors="pt", padding=True)
+                    tag_feats = model.get_text_features(**tag_inputs)
+                    tag_feats = tag_feats / tag_feats.norm(dim=-1, keepdim=True)
+                    tag_mean = tag_feats.mean(dim=0)
 
-                        q = torch.tensor(query_embedding, dtype=torch.float32)
-                        q = q / q.norm()
-                        fused = alpha * q + beta_tag * tag_mean
-                        fused = fused / fused.norm()
-                        query_embedding = fused.cpu().numpy()
+                    q = torch.tensor(query_embedding, dtype=torch.float32)
+                    q = q / q.norm()
+                    fused = alpha * q + beta_tag * tag_mean
+                    fused = fused / fused.norm()
+                    query_embedding = fused.cpu().numpy()
+
+                inferred_tags = enrichment.get('inferred_tags', [])
+                log.debug("Fusion: alpha=%s beta_tag=%s phrases=%d tags=%d",
+                          alpha, beta_tag, len(tag_phrases), len(inferred_tags))
+    except Exception:
+        # Fallback silencioso: si algo falla seguimos con embedding original
+        log.warning("Fusion omitida", exc_info=True)
+
+
+    # Consultar productos con embeddings (de imágenes principales), atributos y tags
+    products_query = db.session.query(
+        Product.id,
+        Product.name,
+        Product.sku,
+        Product.price,
+        Product.attributes,
+        Product.tags,
+        Category.name.label('category_name'),
+        Image.clip_embedding,
+        Image.cloudinary_url
+    ).join(
+        Category, Product.category_id == Category.id
+    ).join(
+        Image, db.and_(
+            Product.id == Image.product_id,
+            Image.is_primary == True
+        )
+    ).filter(
+        Product.client_id == client.id,
+        Image.clip_embedding.isnot(None)
+    )
 
-                    inferred_tags = enrichment.get('inferred_tags', [])
-                    print(f"🧪 FUSION: alpha={alpha} beta_tag={beta_tag} phrases={len(tag_phrases)} tags={len(inferred_tags)}")
-        except Exception as _e:
-            # Fallback silencioso: si algo falla seguimos con embedding original
-            print(f"⚠️ FUSION skip: {_e}")
-            import traceback
-            traceback.print_exc()
+    # FILTRAR por categoría si fue detectada
+    if detected_category:
+        products_query = products_query.filter(Product.category_id == detected_category.id)
 
+    with stage('candidate_fetch'):
+        products = products_query.all()
 
-        # Consultar productos con embeddings (de imágenes principales), atributos y tags
+    # Fallback 1: Si no hay productos en la categoría detectada, rehacer búsqueda global
+    if detected_category and len(products) == 0:
+        log.debug("0 productos en la categoría detectada, fallback a búsqueda global")
+        detected_category = None
+        # reconstruir query sin filtro de categoría
         products_query = db.session.query(
             Product.id,
             Product.name,
@@ -2095,93 +2125,139 @@ def text_search():
             Product.client_id == client.id,
             Image.clip_embedding.isnot(None)
         )
+        with stage('candidate_fetch'):
+            products = products_query.all()
 
-        # FILTRAR por categoría si fue detectada
-        if detected_category:
-            products_query = products_query.filter(Product.category_id == detected_category.id)
-            print(f"🔎 Filtrando productos por categoría: {detected_category.name}")
-        else:
-            print(f"🔎 Búsqueda SIN filtro de categoría (global)")
+    log.debug("Analizando %d productos", len(products))
 
-        products = products_query.all()
+    # Calcular scores híbridos
+    scoring_started = time.perf_counter()
+    detail = log.detail_enabled
+
+    results = []
+    for prod in products:
+        # Parse embedding (puede estar como string JSON)
+        embedding = prod.clip_embedding
+        if isinstance(embedding, str):
+            import json
+            try:
+                embedding = json.loads(embedding)
+            except:
+                continue  # Skip si no se puede parsear
+
+        # Score CLIP (similitud visual/semántica)
+        emb = np.array(embedding, dtype=np.float32)
+        clip_similarity = float(np.dot(query_embedding, emb) / (np.linalg.norm(query_embedding) * np.linalg.norm(emb)))
+
+        # Boost por atributos (incluye match de categoría y color del LLM)
+        attr_boost = _calculate_attribute_match(query_lower, prod.attributes, prod.category_name, detected_color, detected_tipo)
+        # Debug de atributos clave: color declarado vs color detectado
+        if detail and detected_color:
+            try:
+                prod_color_dbg = None
+                if isinstance(prod.attributes, dict):
+                    for k in ['color', 'colour', 'color_principal', 'color_secundario']:
+                        if k in prod.attributes and prod.attributes[k]:
+                            prod_color_dbg = prod.attributes[k]
+                            break
+                log.detail("Attr %s: color=%s detected_color=%s attr_boost=%.3f",
+                           prod.name, prod_color_dbg, detected_color, attr_boost)
+            except Exception:
+                pass
+
+        # Boost por nombre de producto y SKU (nuevo) + tags
+        name_boost = _calculate_name_match(query_lower, prod.name, getattr(prod, 'sku', None))
+        tag_boost = _calculate_tag_match(query_lower, prod.tags)
+        tag_name_boost = min(1.0, tag_boost + name_boost)
+
+        # Score final híbrido
+        # Ponderaciones: CLIP 50%, Atributos 40%, Tags+Nombre 10%
+        final_score = (
+            clip_similarity * 0.5 +
+            attr_boost * 0.4 +
+            tag_name_boost * 0.1
+        )
+
+        if detail:
+            log.detail("Producto %s: clip=%.3f attr=%.3f tag=%.3f name=%.3f score=%.3f",
+                       prod.name, clip_similarity, attr_boost, tag_boost, name_boost, final_score)
+
+        results.append({
+            'product_id': str(prod.id),
+            'name': prod.name,
+            'sku': prod.sku,
+            'price': float(prod.price) if prod.price else None,
+            'category': prod.category_name,
+            'attributes': prod.attributes,
+            'tags': prod.tags or "",
+            'image_url': prod.cloudinary_url,
+            'clip_similarity': round(clip_similarity, 4),
+            'attr_boost': round(attr_boost, 4),
+            'tag_boost': round(tag_boost, 4),
+            'name_boost': round(name_boost, 4),
+            'final_score': round(final_score, 4)
+        })
+
+    # Ordenar por score descendente
+    results.sort(key=lambda x: x['final_score'], reverse=True)
 
-        # Fallback 1: Si no hay productos en la categoría detectada, rehacer búsqueda global
-        if detected_category and len(products) == 0:
-            print("⚠️ TEXT SEARCH: 0 productos en categoría detectada → Fallback a búsqueda global")
-            detected_category = None
-            # reconstruir query sin filtro de categoría
-            products_query = db.session.query(
-                Product.id,
-                Product.name,
-                Product.sku,
-                Product.price,
-                Product.attributes,
-                Product.tags,
-                Category.name.label('category_name'),
-                Image.clip_embedding,
-                Image.cloudinary_url
-            ).join(
-                Category, Product.category_id == Category.id
-            ).join(
-                Image, db.and_(
-                    Product.id == Image.product_id,
-                    Image.is_primary == True
-                )
-            ).filter(
-                Product.client_id == client.id,
-                Image.clip_embedding.isnot(None)
-            )
-            products = products_query.all()
 
-        print(f"🔍 TEXT SEARCH: Analizando {len(products)} productos...")
+    # Limitar resultados
+    results = results[:limit]
+    record_stage('scoring', time.perf_counter() - scoring_started)
 
-        # Calcular scores híbridos
+    elapsed_time = time.time() - start_time
+
+    # Fallback 2: Si tras el scoring no hay resultados, intentar una búsqueda global sin categoría
+    if len(results) == 0 and detected_category is not None:
+        log.debug("0 resultados tras filtrar por categoría, reintentando global")
+        detected_category = None
+        # reconstruir query sin filtro de categoría
+        products_query = db.session.query(
+            Product.id,
+            Product.name,
+            Product.sku,
+            Product.price,
+            Product.attributes,
+            Product.tags,
+            Category.name.label('category_name'),
+            Image.clip_embedding,
+            Image.cloudinary_url
+        ).join(
+            Category, Product.category_id == Category.id
+        ).join(
+            Image, db.and_(
+                Product.id == Image.product_id,
+                Image.is_primary == True
+            )
+        ).filter(
+            Product.client_id == client.id,
+            Image.clip_embedding.isnot(None)
+        )
+        products = products_query.all()
+
+        log.debug("Fallback: analizando %d productos", len(products))
 
         results = []
         for prod in products:
-            # Parse embedding (puede estar como string JSON)
             embedding = prod.clip_embedding
             if isinstance(embedding, str):
                 import json
                 try:
                     embedding = json.loads(embedding)
                 except:
-                    continue  # Skip si no se puede parsear
-
-            # Score CLIP (similitud visual/semántica)
+                    continue
             emb = np.array(embedding, dtype=np.float32)
             clip_similarity = float(np.dot(query_embedding, emb) / (np.linalg.norm(query_embedding) * np.linalg.norm(emb)))
-
-            # Boost por atributos (incluye match de categoría y color del LLM)
             attr_boost = _calculate_attribute_match(query_lower, prod.attributes, prod.category_name, detected_color, detected_tipo)
-            # Debug de atributos clave: color declarado vs color detectado
-            try:
-                prod_color_dbg = None
-                if isinstance(prod.attributes, dict):
-                    for k in ['color', 'colour', 'color_principal', 'color_secundario']:
-                        if k in prod.attributes and prod.attributes[k]:
-                            prod_color_dbg = prod.attributes[k]
-                            break
-                if detected_color:
-                    print(f"  🔎 ATTR DEBUG: {prod.name} | attr.color={prod_color_dbg} | detected_color={detected_color} | attr_boost={attr_boost:.3f}")
-            except Exception:
-                pass
-
-            # Boost por nombre de producto y SKU (nuevo) + tags
             name_boost = _calculate_name_match(query_lower, prod.name, getattr(prod, 'sku', None))
             tag_boost = _calculate_tag_match(query_lower, prod.tags)
             tag_name_boost = min(1.0, tag_boost + name_boost)
-
-            # Score final híbrido
-            # Ponderaciones: CLIP 50%, Atributos 40%, Tags+Nombre 10%
             final_score = (
                 clip_similarity * 0.5 +
                 attr_boost * 0.4 +
                 tag_name_boost * 0.1
             )
-
-            print(f"Producto: {prod.name} | CLIP: {clip_similarity:.3f} | Attr: {attr_boost:.3f} | Tag: {tag_boost:.3f} | Name: {name_boost:.3f} | Score: {final_score:.3f}")
-
             results.append({
                 'product_id': str(prod.id),
                 'name': prod.name,
@@ -2198,121 +2274,135 @@ def text_search():
                 'final_score': round(final_score, 4)
             })
 
-        # Ordenar por score descendente
         results.sort(key=lambda x: x['final_score'], reverse=True)
+        results = results[:limit]
+        log.debug("Fallback: %d resultados", len(results))
 
+    log.info("Búsqueda textual: query=%r categoría=%s color=%s candidatos=%d resultados=%d %.3fs",
+             query_text, detected_category.name if detected_category else None, detected_color,
+             len(products), len(results), elapsed_time)
 
-        # Limitar resultados
-        results = results[:limit]
+    response = {
+        "success": True,
+        "query": query_text,
+        "detected_category": {
+            "id": str(detected_category.id),
+            "name": detected_category.name,
+            "name_en": detected_category.name_en
+        } if detected_category else None,
+        "results": results,
+        "total_products_analyzed": len(products),
+        "search_time_seconds": round(elapsed_time, 3)
+    }
 
-        elapsed_time = time.time() - start_time
-
-        # Fallback 2: Si tras el scoring no hay resultados, intentar una búsqueda global sin categoría
-        if len(results) == 0 and detected_category is not None:
-            print("⚠️ TEXT SEARCH: 0 resultados tras filtrar por categoría → Reintentando global")
-            detected_category = None
-            # reconstruir query sin filtro de categoría
-            products_query = db.session.query(
-                Product.id,
-                Product.name,
-                Product.sku,
-                Product.price,
-                Product.attributes,
-                Product.tags,
-                Category.name.label('category_name'),
-                Image.clip_embedding,
-                Image.cloudinary_url
-            ).join(
-                Category, Product.category_id == Category.id
-            ).join(
-                Image, db.and_(
-                    Product.id == Image.product_id,
-                    Image.is_primary == True
-                )
-            ).filter(
-                Product.client_id == client.id,
-                Image.clip_embedding.isnot(None)
-            )
-            products = products_query.all()
+    # Agregar sugerencias si la query es ambigua
+    if llm_norm.get('needs_refinement'):
+        response['needs_refinement'] = True
+        response['ambiguous_terms'] = llm_norm.get('ambiguous_terms', [])
+        response['suggestions'] = llm_norm.get('suggestions', {})
+        response['refinement_message'] = "Tu búsqueda es muy general. ¿Podrías ser más específico?"
 
-            print(f"🔍 TEXT SEARCH (fallback): Analizando {len(products)} productos...")
-
-            results = []
-            for prod in products:
-                embedding = prod.clip_embedding
-                if isinstance(embedding, str):
-                    import json
-                    try:
-                        embedding = json.loads(embedding)
-                    except:
-                        continue
-                emb = np.array(embedding, dtype=np.float32)
-                clip_similarity = float(np.dot(query_embedding, emb) / (np.linalg.norm(query_embedding) * np.linalg.norm(emb)))
-                attr_boost = _calculate_attribute_match(query_lower, prod.attributes, prod.category_name, detected_color, detected_tipo)
-                name_boost = _calculate_name_match(query_lower, prod.name, getattr(prod, 'sku', None))
-                tag_boost = _calculate_tag_match(query_lower, prod.tags)
-                tag_name_boost = min(1.0, tag_boost + name_boost)
-                final_score = (
-                    clip_similarity * 0.5 +
-                    attr_boost * 0.4 +
-                    tag_name_boost * 0.1
-                )
-                results.append({
-                    'product_id': str(prod.id),
-                    'name': prod.name,
-                    'sku': prod.sku,
-                    'price': float(prod.price) if prod.price else None,
-                    'category': prod.category_name,
-                    'attributes': prod.attributes,
-                    'tags': prod.tags or "",
-                    'image_url': prod.cloudinary_url,
-                    'clip_similarity': round(clip_similarity, 4),
-                    'attr_boost': round(attr_boost, 4),
-                    'tag_boost': round(tag_boost, 4),
-                    'name_boost': round(name_boost, 4),
-                    'final_score': round(final_score, 4)
-                })
-
-            results.sort(key=lambda x: x['final_score'], reverse=True)
-            results = results[:limit]
-            print(f"🔁 TEXT SEARCH Fallback: {len(results)} resultados")
-
-        print(f"✅ TEXT SEARCH: {len(results)} resultados en {elapsed_time:.3f}s")
-
-        response = {
-            "success": True,
-            "query": query_text,
-            "detected_category": {
-                "id": str(detected_category.id),
-                "name": detected_category.name,
-                "name_en": detected_category.name_en
-            } if detected_category else None,
-            "results": results,
-            "total_products_analyzed": len(products),
-            "search_time_seconds": round(elapsed_time, 3)
-        }
+    return response
+
+
+@bp.route("/search/text", methods=["POST", "OPTIONS"])
+def text_search():
+    """
+    Endpoint de búsqueda textual híbrida (CLIP + Atributos + Tags)
+
+    Headers:
+        X-API-Key: API Key del cliente
+
+    JSON Body:
+        query: Texto de búsqueda (ej: "camisa blanca", "delantal marrón")
+        limit: Número de resultados (default: 10, max: 50)
+    """
+    # Manejar preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
+        return response
+
+    start_time = time.time()
+
+    try:
+        # Log temprano para verificar llegada de requests incluso si falla la API Key
+        log.debug("Text search: path=%s from=%s has_key=%s",
+                  request.path, request.remote_addr, 'X-API-Key' in request.headers)
+        # Validar API Key
+        api_key = request.headers.get('X-API-Key')
+        if not api_key:
+            return jsonify({
+                "success": False,
+                "error": "missing_api_key",
+                "message": "X-API-Key header requerido"
+            }), 401
+
+        # Buscar cliente por API Key
+        with stage('api_key'):
+            client = Client.query.filter_by(api_key=api_key).first()
+        if not client:
+            return jsonify({
+                "success": False,
+                "error": "invalid_api_key",
+                "message": "API Key inválido"
+            }), 401
+        request.client = client
+        set_profile_client(client)
+
+        # Obtener parámetros del request
+        data = request.get_json()
+        if not data or 'query' not in data:
+            return jsonify({
+                "success": False,
+                "error": "missing_query",
+                "message": "Campo 'query' requerido en el body JSON"
+            }), 400
+
+        query_text = data.get('query', '').strip()
+        if not query_text:
+            return jsonify({
+                "success": False,
+                "error": "empty_query",
+                "message": "La query no puede estar vacía"
+            }), 400
+
+        # Obtener configuración real del panel
+        max_results = system_config.get('search', 'max_results')
+        # Permitir tanto 'limit' como 'max_results' del request, pero respetar el límite del sistema
+        limit_value = data.get('limit', data.get('max_results', max_results))
+        try:
+            # Respetar el límite configurado en el sistema
+            limit = min(int(limit_value), max_results)
+        except Exception:
+            limit = max_results
+
+        log.debug("Text search: query=%r limit=%d", query_text, limit)
 
-        # Agregar sugerencias si la query es ambigua
-        if llm_norm.get('needs_refinement'):
-            response['needs_refinement'] = True
-            response['ambiguous_terms'] = llm_norm.get('ambiguous_terms', [])
-            response['suggestions'] = llm_norm.get('suggestions', {})
-            response['refinement_message'] = "Tu búsqueda es muy general. ¿Podrías ser más específico?"
+        # Requests idénticas concurrentes comparten un solo cómputo
+        flight_key = ('text', str(client.id), query_text, limit, client_version(client.id))
+        response, shared = _coalesce(_text_search_flight, flight_key,
+                                     lambda: _text_search_payload(client, query_text, limit, start_time))
 
         # Añadir CORS para consistencia cuando este handler es invocado desde /api/search
-        resp = jsonify(response)
+        with stage('serialization'):
+            resp = jsonify(response)
         try:
             resp.headers['Access-Control-Allow-Origin'] = '*'
             resp.headers['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
             resp.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-API-Key'
+            if shared:
+                resp.headers[COALESCED_HEADER] = '1'
         except Exception:
             pass
         return resp
 
+    except AdmissionRejected as e:
+        return _overloaded_response(e)
     except Exception as e:
-        import traceback
-        print(f"❌ TEXT SEARCH ERROR: {e}")
-        print(traceback.format_exc())
+        log.exception("Error en búsqueda textual")
         return jsonify({
             "success": False,
             "error": "internal_error",
@@ -2411,7 +2501,7 @@ def _calculate_attribute_match(query_lower: str, attributes: dict, category: str
 
                         if product_color_norm and llm_color_norm and product_color_norm == llm_color_norm:
                             score += 0.50  # Boost fuerte por color del LLM
-                            print(f"  🎨 COLOR MATCH (LLM): '{detected_color}' == '{v}' (+0.50)")
+                            log.detail("Color match (normalizer): %r == %r (+0.50)", detected_color, v)
                             break
 
                     # FALLBACK: Match tradicional por query
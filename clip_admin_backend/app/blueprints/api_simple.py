@@ -5,7 +5,6 @@ Solo endpoints esenciales para el admin panel
 
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
-from googletrans import Translator
 
 bp = Blueprint("api", __name__)
 
@@ -25,7 +24,8 @@ def translate_text():
                 "error": "No se proporcionó texto para traducir"
             })
 
-        # Crear instancia del traductor
+        # Crear instancia del traductor (googletrans se importa solo al traducir)
+        from googletrans import Translator
         translator = Translator()
 
         # Obtener el contexto de la industria del cliente
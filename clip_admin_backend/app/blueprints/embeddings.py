@@ -1,12 +1,6 @@
 import logging
-# Configuración explícita del logger 'clip_model' para que los logs salgan por consola (Railway)
+# Los handlers/formato del logger 'clip_model' los define app.utils.logging_config (create_app)
 clip_logger = logging.getLogger("clip_model")
-clip_logger.setLevel(logging.INFO)
-if not clip_logger.hasHandlers():
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s')
-    handler.setFormatter(formatter)
-    clip_logger.addHandler(handler)
 """
 Blueprint de Embeddings CLIP
 Administración y generación de embeddings para búsqueda visual
@@ -23,50 +17,61 @@ os.environ['SSL_CERT_FILE'] = certifi.where()
 os.environ['CURL_CA_BUNDLE'] = certifi.where()
 
 import json
-import requests
-from io import BytesIO
 from datetime import datetime
 from PIL import Image as PILImage
-import torch
-from transformers import CLIPProcessor, CLIPModel
 import numpy as np
 import threading
 import time
+from collections import OrderedDict
 
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.models.image import Image
 from app.utils.system_config import system_config
+from app.core.clip_backends import get_configured_backend, load_clip_backend, BACKEND_PYTORCH, InstrumentedClipModel
+from app.core.metrics import CLIP_MODEL_EVENTS, CLIP_MODEL_LOAD_SECONDS
+from app.core.admission import admit, PRIORITY_BACKGROUND
+from app.core.model_versions import active_model_name, client_model_name, configured_model_name, model_scope
+from app.core.embedding_recipe import (
+    METHOD_SIMPLE, METHOD_CONTEXTUAL, recipe_id, text_features, fuse
+)
 from app.models.product import Product
 from app.models.client import Client
 from app.utils.permissions import requires_role, requires_client_scope, filter_by_client_scope
+from app.utils.lazy_imports import lazy_import, require_ml
+
+# torch/transformers se importan al cargar el modelo, no al registrar el blueprint
+torch = lazy_import('torch')
 
 bp = Blueprint('embeddings', __name__)
 
 def load_image_from_source(source):
-    """Cargar imagen desde URL de Cloudinary"""
+    """Cargar imagen desde URL de Cloudinary (vía cache local en disco) o usar una imagen PIL ya cargada"""
+    if isinstance(source, PILImage.Image):
+        return source.convert('RGB')
     try:
-        import logging
-        logging.getLogger("clip_model").info(f"🌐 Descargando imagen desde Cloudinary: {source[:80]}...")
-        response = requests.get(source, timeout=30)
-        response.raise_for_status()
-        image = PILImage.open(BytesIO(response.content)).convert('RGB')
-        logging.getLogger("clip_model").info(f"✅ Imagen descargada exitosamente desde Cloudinary")
-        return image
+        from app.services.image_cache import image_cache
+        clip_logger.debug("Cargando imagen desde Cloudinary/cache: %.80s", source)
+        return image_cache.get_thumbnail(source, timeout=30)
     except Exception as e:
-        import logging
-        logging.getLogger("clip_model").error(f"❌ Error cargando imagen desde Cloudinary {source}: {e}")
+        clip_logger.error("Error cargando imagen desde Cloudinary %s: %s", source, e)
         raise
 
 # Variables globales para el modelo CLIP
 _clip_model = None
 _clip_processor = None
 _clip_current_model_name = None  # Rastrear qué modelo está cargado
+_clip_backend = None  # Backend efectivo del modelo cargado (pytorch | pytorch_int8 | onnx | stub)
+_clip_requested_backend = None  # Backend pedido en configuración al cargar
 _clip_last_used_ts = None  # epoch seconds de último uso
 _clip_cleanup_thread_started = False
 _clip_lock = threading.Lock()
 _clip_idle_timeout_cache = None  # Cache del timeout en segundos
+# Modelos distintos del configurado que usan índices de clientes o índices sombra
+# (app/core/model_versions.py): {model_name: [model, processor, backend, último uso]}
+_clip_extra_models = OrderedDict()
+DEFAULT_MAX_EXTRA_MODELS = 1
 
 # Mapeo de nombres de modelo amigables a identificadores HuggingFace
 CLIP_MODEL_MAP = {
@@ -154,6 +159,11 @@ def _start_cleanup_thread_once():
                 check_every = 300  # 5 minutos fijo
                 time.sleep(check_every)
                 with _clip_lock:
+                    for extra_name, entry in list(_clip_extra_models.items()):
+                        if _now_ts() - entry[3] >= idle_timeout:
+                            del _clip_extra_models[extra_name]
+                            CLIP_MODEL_EVENTS.inc('unload', 'idle')
+                            clip_logger.info("[CLIP] Modelo adicional %s descargado por inactividad", extra_name)
                     if _clip_model is None:
                         continue
                     now = _now_ts()
@@ -172,6 +182,7 @@ def _start_cleanup_thread_once():
                             _clip_model = None
                             _clip_processor = None
                             _clip_current_model_name = None
+                            CLIP_MODEL_EVENTS.inc('unload', 'idle')
                             print(f"🧹 CLIP descargado por inactividad tras arranque (sin uso, timeout {idle_timeout}s)")
                             logging.getLogger("clip_model").info(f"[CLIP] Modelo descargado de memoria por inactividad tras arranque (timeout {idle_timeout}s)")
                         continue
@@ -185,10 +196,11 @@ def _start_cleanup_thread_once():
                         _clip_model = None
                         _clip_processor = None
                         _clip_current_model_name = None
+                        CLIP_MODEL_EVENTS.inc('unload', 'idle')
                         print(f"🧹 CLIP descargado por inactividad (idle {int(idle_for)}s ≥ {idle_timeout}s)")
                         logging.getLogger("clip_model").info(f"[CLIP] Modelo descargado de memoria por inactividad (idle {int(idle_for)}s ≥ {idle_timeout}s)")
                     else:
-                        print(f"[CLIP] Model NOT unloaded: inactivity {int(idle_for)}s < {idle_timeout}s threshold.")
+                        clip_logger.debug("[CLIP] Modelo en uso: inactividad %ds < %ds", int(idle_for), idle_timeout)
             except Exception as _e:
                 logging.getLogger("clip_model").error(f"[CLIP] Error en hilo de limpieza: {_e}")
                 continue
@@ -196,45 +208,87 @@ def _start_cleanup_thread_once():
     t = threading.Thread(target=_worker, name="clip-idle-cleanup", daemon=True)
     t.start()
 
-def get_clip_model():
-    """Cargar modelo CLIP una sola vez (singleton con auto-descarga por inactividad)."""
-    global _clip_model, _clip_processor, _clip_current_model_name
+def _load_model(model_name, backend):
+    """Carga un modelo CLIP con el backend pedido (GPU si hay, métricas de encode)"""
+    model_id = CLIP_MODEL_MAP.get(model_name, CLIP_MODEL_MAP['ViT-B/16'])
+    print(f"🔄 Cargando modelo CLIP {model_name} ({model_id}) con backend {backend}...")
+    load_started = time.time()
+    model, processor, effective_backend = load_clip_backend(model_id, backend)
+    model.loaded_at = time.time()
+
+    # Configurar para CPU/GPU (ONNX e int8 corren siempre en CPU)
+    if torch.cuda.is_available() and effective_backend == BACKEND_PYTORCH:
+        print("🔥 GPU disponible, usando CUDA")
+        model = model.cuda()
+    else:
+        print("💻 Usando CPU para CLIP")
+
+    # Métricas de encode (latencia y batch) sobre cualquier backend
+    model = InstrumentedClipModel(model)
+    CLIP_MODEL_EVENTS.inc('load', effective_backend)
+    CLIP_MODEL_LOAD_SECONDS.observe(time.time() - load_started)
+    print(f"✅ Modelo CLIP {model_name} cargado exitosamente")
+    return model, processor, effective_backend
+
+
+def _get_extra_model(model_name, backend):
+    """Modelo distinto del configurado (llamar con _clip_lock tomado); LRU acotado"""
+    entry = _clip_extra_models.get(model_name)
+    if entry is None:
+        max_extra = max(1, int(system_config.get_section('clip').get('max_extra_models', DEFAULT_MAX_EXTRA_MODELS)))
+        while len(_clip_extra_models) >= max_extra:
+            evicted, _ = _clip_extra_models.popitem(last=False)
+            CLIP_MODEL_EVENTS.inc('unload', 'evicted')
+            print(f"🧹 Modelo CLIP adicional {evicted} descargado (máximo {max_extra})")
+        model, processor, effective_backend = _load_model(model_name, backend)
+        entry = [model, processor, effective_backend, _now_ts()]
+        _clip_extra_models[model_name] = entry
+    _clip_extra_models.move_to_end(model_name)
+    entry[3] = _now_ts()
+    return entry[0], entry[1]
+
+
+def get_clip_model(model_name=None):
+    """
+    Cargar modelo CLIP una sola vez (singleton con auto-descarga por inactividad).
+
+    Args:
+        model_name: Modelo a usar (None = active_model_name(): el del índice del cliente
+                    de la request o el configurado). Los modelos distintos del configurado
+                    se mantienen aparte (clip.max_extra_models, default 1).
+    """
+    global _clip_model, _clip_processor, _clip_current_model_name, _clip_backend, _clip_requested_backend
+
+    # APP_MODE=admin: sin stacks de ML
+    require_ml('CLIP')
 
     # Asegurar hilo de limpieza iniciado una vez
     _start_cleanup_thread_once()
 
+    if model_name is None:
+        model_name = active_model_name()
+
     with _clip_lock:
-        # Obtener modelo desde configuración
-        model_name = system_config.get('clip', 'model_name', 'ViT-B/16')
-        model_id = CLIP_MODEL_MAP.get(model_name, CLIP_MODEL_MAP['ViT-B/16'])
+        backend = get_configured_backend()
+        if model_name != configured_model_name():
+            return _get_extra_model(model_name, backend)
 
-        # Si el modelo cambió en la configuración, descargar el actual y cargar el nuevo
-        if _clip_model is not None and _clip_current_model_name != model_name:
-            print(f"⚠️ Modelo cambió de {_clip_current_model_name} a {model_name}. Recargando...")
+        # Si el modelo o el backend cambiaron en la configuración, descargar el actual y cargar el nuevo
+        if _clip_model is not None and (_clip_current_model_name != model_name or _clip_requested_backend != backend):
+            print(f"⚠️ Modelo cambió de {_clip_current_model_name}/{_clip_requested_backend} a {model_name}/{backend}. Recargando...")
             _clip_model = None
             _clip_processor = None
             _clip_current_model_name = None
+            CLIP_MODEL_EVENTS.inc('unload', 'config_change')
             # Limpiar GPU si estaba en uso
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
 
         if _clip_model is None:
-            print(f"🔄 Cargando modelo CLIP {model_name} ({model_id})...")
             try:
-                _clip_model = CLIPModel.from_pretrained(model_id)
-                _clip_model.loaded_at = time.time()
-                _clip_processor = CLIPProcessor.from_pretrained(model_id)
+                _clip_model, _clip_processor, _clip_backend = _load_model(model_name, backend)
                 _clip_current_model_name = model_name
-
-                # Configurar para CPU/GPU
-                _clip_model.eval()
-                if torch.cuda.is_available():
-                    print("🔥 GPU disponible, usando CUDA")
-                    _clip_model = _clip_model.cuda()
-                else:
-                    print("💻 Usando CPU para CLIP")
-
-                print(f"✅ Modelo CLIP {model_name} cargado exitosamente")
+                _clip_requested_backend = backend
             except Exception as e:
                 print(f"❌ Error cargando CLIP: {e}")
                 raise
@@ -243,35 +297,66 @@ def get_clip_model():
         _touch_clip_last_used()
         return _clip_model, _clip_processor
 
-def generate_clip_embedding(image_path, image_obj=None):
-    """Generar embedding CLIP optimizado usando contexto del cliente y categoría"""
-    try:
-        import logging
-        logging.getLogger("clip_model").info(f"[REQUEST] Comparación recibida")
-
-        model, processor = get_clip_model()
-        _touch_clip_last_used()
 
-        # Obtener información contextual del producto/imagen
-        context_info = get_image_context(image_obj) if image_obj else {}
+def get_clip_backend_name():
+    """Backend efectivo del modelo cargado (None si CLIP no está en memoria)."""
+    return _clip_backend if _clip_model is not None else None
 
-        # Generar embedding optimizado
-        if context_info and context_info.get('enable_optimization', True):
-            embedding, metadata = generate_optimized_embedding(
-                image_path, model, processor, context_info
-            )
-            print(f"✅ Embedding optimizado generado: {len(embedding)} dimensiones")
-            print(f"📊 Métodos usados: {metadata.get('optimization_method')}")
-            return embedding, metadata
-        else:
-            # Fallback a embedding simple
-            embedding = generate_simple_embedding(image_path, model, processor)
-            metadata = {'optimization_method': 'simple', 'embedding_dim': len(embedding)}
-            print(f"✅ Embedding simple generado: {len(embedding)} dimensiones")
+def generate_clip_embedding(image_path, image_obj=None, model_name=None, store_components=True):
+    """
+    Generar embedding CLIP optimizado usando contexto del cliente y categoría
+
+    Args:
+        image_path: URL, ruta o imagen PIL
+        image_obj: Image (contexto del producto/categoría)
+        model_name: Modelo CLIP (None = el del índice activo del cliente de image_obj)
+        store_components: Si True y hay image_obj, guarda en él las features crudas
+                          (image_features), la receta (embedding_recipe) y el modelo
+                          (embedding_model); si False, las features quedan en
+                          metadata['image_features'] (índice sombra)
+
+    Returns:
+        tuple: (embedding, metadata) o (None, None) si falla
+    """
+    try:
+        if model_name is None:
+            model_name = client_model_name(image_obj.client_id) if image_obj is not None else active_model_name()
+
+        with model_scope(model_name):
+            model, processor = get_clip_model(model_name)
+            _touch_clip_last_used()
+
+            # Obtener información contextual del producto/imagen
+            context_info = get_image_context(image_obj) if image_obj else {}
+
+            # Generar embedding optimizado (cupo de fondo: la búsqueda del widget tiene prioridad)
+            if context_info and context_info.get('enable_optimization', True):
+                with admit(PRIORITY_BACKGROUND):
+                    embedding, metadata = generate_optimized_embedding(
+                        image_path, model, processor, context_info
+                    )
+                clip_logger.debug("Embedding optimizado generado: %d dimensiones (%s)",
+                                  len(embedding), metadata.get('optimization_method'))
+            else:
+                # Fallback a embedding simple
+                with admit(PRIORITY_BACKGROUND):
+                    embedding, metadata = generate_simple_embedding(image_path, model, processor)
+                clip_logger.debug("Embedding simple generado: %d dimensiones", len(embedding))
+
+        metadata['model_name'] = model_name
+        if not store_components:
             return embedding, metadata
 
-    except Exception as e:
-        print(f"❌ Error generando embedding: {e}")
+        # Componentes crudos para recalcular la fusión sin re-encode
+        image_features = metadata.pop('image_features')
+        if image_obj is not None:
+            image_obj.image_features = json.dumps(image_features.tolist())
+            image_obj.embedding_recipe = metadata['recipe']
+            image_obj.embedding_model = model_name
+        return embedding, metadata
+
+    except Exception:
+        clip_logger.exception("Error generando embedding")
         return None, None
 
 def get_image_context(image_obj):
@@ -291,104 +376,98 @@ def get_image_context(image_obj):
         if not product:
             return context
 
-        # Obtener cliente e industria
         client = Client.query.filter_by(id=product.client_id).first()
-        if client:
-            context['client_industry'] = client.industry or 'general'
-            context['client_name'] = client.name
-
-        # Obtener categoría y características
         category = Category.query.filter_by(id=product.category_id).first()
-        if category:
-            context['category_name'] = category.name_en or category.name
-            context['category_features'] = {
-                'clip_prompt': category.clip_prompt,
-                'visual_features': category.visual_features,
-                'confidence_threshold': category.confidence_threshold
-            }
-
-        # Obtener tags del producto
-        if hasattr(product, 'tags') and product.tags:
-            context['product_tags'] = [tag.strip() for tag in product.tags.split(',')]
-
-        context['enable_optimization'] = True
-        return context
+        return build_image_context(product, client, category)
 
     except Exception as e:
         print(f"⚠️ Error obteniendo contexto: {e}")
         return {'enable_optimization': False}
 
+def build_image_context(product, client, category):
+    """Contexto de optimización a partir de entidades ya cargadas (sin queries)"""
+    context = {}
+
+    # Cliente e industria
+    if client:
+        context['client_industry'] = client.industry or 'general'
+        context['client_name'] = client.name
+
+    # Categoría y características
+    if category:
+        context['category_name'] = category.name_en or category.name
+        context['category_features'] = {
+            'clip_prompt': category.clip_prompt,
+            'visual_features': category.visual_features,
+            'confidence_threshold': category.confidence_threshold
+        }
+
+    # Tags del producto
+    if hasattr(product, 'tags') and product.tags:
+        context['product_tags'] = [tag.strip() for tag in product.tags.split(',')]
+
+    context['enable_optimization'] = True
+    return context
+
 def generate_optimized_embedding(image_path_or_url, model, processor, context_info):
-    """Generar embedding optimizado usando múltiples técnicas"""
+    """
+    Generar embedding optimizado usando múltiples técnicas
+
+    La imagen pasa una sola vez por el vision tower; los prompts contextuales
+    aportan features de texto cacheadas por prompt.
+    """
 
     # Cargar imagen (local o URL)
     image = load_image_from_source(image_path_or_url)
 
-    embeddings_list = []
-    prompts_used = []
-
-    # 1. Embedding base (imagen sola)
-    base_embedding = generate_image_only_embedding(image, model, processor)
-    embeddings_list.append(base_embedding)
-    prompts_used.append("image_only")
+    # 1. Features base (imagen sola, sin normalizar)
+    image_features = generate_image_only_embedding(image, model, processor)
+    prompts_used = ["image_only"]
 
-    # 2. Embeddings contextuales si hay información disponible
-    if context_info.get('category_name'):
-        contextual_embeddings = generate_contextual_embeddings(
-            image, model, processor, context_info
-        )
-        embeddings_list.extend(contextual_embeddings['embeddings'])
-        prompts_used.extend(contextual_embeddings['prompts'])
-
-    # 3. Fusionar embeddings
-    if len(embeddings_list) > 1:
-        final_embedding = fuse_embeddings_weighted(embeddings_list, context_info)
-    else:
-        final_embedding = embeddings_list[0]
+    # 2. Prompts contextuales si hay información disponible
+    prompts = create_contextual_prompts(context_info) if context_info.get('category_name') else []
+    prompt_features = np.zeros((0, len(image_features)), dtype=np.float32)
+    if prompts:
+        try:
+            prompt_features = text_features(prompts, model, processor)
+            prompts_used.extend(prompts)
+        except Exception as e:
+            clip_logger.warning("Error con prompts contextuales %r: %s", prompts, e)
 
-    # 4. Normalizar embedding final
-    final_embedding = normalize_embedding(final_embedding)
+    # 3. Fusionar y normalizar
+    final_embedding, embeddings_list = fuse(image_features, prompt_features, context_info)
+    final_embedding = final_embedding.tolist()
 
-    # 5. Crear metadata
+    # 4. Crear metadata
     metadata = {
-        'optimization_method': 'contextual_fusion',
+        'optimization_method': METHOD_CONTEXTUAL,
+        'recipe': recipe_id(METHOD_CONTEXTUAL),
         'industry': context_info.get('client_industry', 'unknown'),
         'category': context_info.get('category_name', 'unknown'),
         'prompts_used': prompts_used,
         'num_embeddings_fused': len(embeddings_list),
         'embedding_dim': len(final_embedding),
-        'confidence_score': calculate_embedding_confidence(embeddings_list)
+        'confidence_score': calculate_embedding_confidence(embeddings_list),
+        'image_features': image_features
     }
 
     return final_embedding, metadata
 
 def generate_simple_embedding(image_path_or_url, model, processor):
-    """Generar embedding simple (fallback)"""
+    """Generar embedding simple (fallback): features de imagen normalizadas, sin contexto"""
 
     # Cargar y procesar imagen (local o URL)
     image = load_image_from_source(image_path_or_url)
+    image_features = generate_image_only_embedding(image, model, processor)
+    embedding = normalize_embedding(image_features)
 
-    # Procesar imagen con manejo de errores
-    try:
-        inputs = processor(images=image, return_tensors="pt")
-    except Exception as e:
-        print(f"🔧 DEBUG: Error en procesador embeddings (línea 173): {e}")
-        # Fallback: usar solo argumentos posicionales
-        inputs = processor(image, return_tensors="pt")
-
-    # Mover a GPU si está disponible
-    if torch.cuda.is_available():
-        inputs = {k: v.cuda() for k, v in inputs.items()}
-
-    # Generar embedding
-    with torch.no_grad():
-        image_features = model.get_image_features(**inputs)
-
-    # Normalizar y convertir
-    image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-    embedding = image_features.cpu().numpy().flatten().tolist()
-
-    return embedding
+    metadata = {
+        'optimization_method': METHOD_SIMPLE,
+        'recipe': recipe_id(METHOD_SIMPLE),
+        'embedding_dim': len(embedding),
+        'image_features': image_features
+    }
+    return embedding, metadata
 
 def generate_image_only_embedding(image, model, processor):
     """Generar embedding solo de imagen"""
@@ -397,7 +476,7 @@ def generate_image_only_embedding(image, model, processor):
     try:
         inputs = processor(images=image, return_tensors="pt")
     except Exception as e:
-        print(f"🔧 DEBUG: Error en procesador embeddings (línea 194): {e}")
+        clip_logger.debug("Procesador rechazó images=, reintentando posicional: %s", e)
         # Fallback: usar solo argumentos posicionales
         inputs = processor(image, return_tensors="pt")
 
@@ -409,46 +488,6 @@ def generate_image_only_embedding(image, model, processor):
 
     return image_features.cpu().numpy().flatten()
 
-def generate_contextual_embeddings(image, model, processor, context_info):
-    """Generar embeddings usando prompts contextuales"""
-
-    embeddings = []
-    prompts = []
-
-    # Obtener prompts basados en contexto
-    contextual_prompts = create_contextual_prompts(context_info)
-
-    for prompt in contextual_prompts:
-        try:
-            # Procesar imagen y texto juntos
-            inputs = processor(
-                text=[prompt],
-                images=image,
-                return_tensors="pt",
-                padding=True
-            )
-
-            if torch.cuda.is_available():
-                inputs = {k: v.cuda() for k, v in inputs.items()}
-
-            with torch.no_grad():
-                # Obtener features combinadas
-                image_features = model.get_image_features(pixel_values=inputs['pixel_values'])
-                text_features = model.get_text_features(input_ids=inputs['input_ids'])
-
-                # Combinar con pesos (más peso a imagen)
-                combined_features = 0.75 * image_features + 0.25 * text_features
-                embedding = combined_features.cpu().numpy().flatten()
-
-            embeddings.append(embedding)
-            prompts.append(prompt)
-
-        except Exception as e:
-            print(f"⚠️ Error con prompt '{prompt}': {e}")
-            continue
-
-    return {'embeddings': embeddings, 'prompts': prompts}
-
 def create_contextual_prompts(context_info):
     """Crear prompts contextuales basados en información disponible"""
 
@@ -492,38 +531,6 @@ def create_contextual_prompts(context_info):
 
     return prompts[:3]  # Máximo 3 prompts contextuales
 
-def fuse_embeddings_weighted(embeddings_list, context_info):
-    """Fusionar embeddings con pesos adaptativos"""
-
-    if len(embeddings_list) == 1:
-        return embeddings_list[0]
-
-    # Calcular pesos adaptativos
-    weights = [1.5]  # Peso mayor para embedding base
-
-    # Pesos menores para embeddings contextuales
-    for i in range(1, len(embeddings_list)):
-        weights.append(1.0)
-
-    # Ajustar según confianza de categoría
-    category_features = context_info.get('category_features', {})
-    confidence_threshold = category_features.get('confidence_threshold', 0.75)
-
-    if confidence_threshold > 0.8:
-        # Alta confianza -> más peso a contextuales
-        for i in range(1, len(weights)):
-            weights[i] *= 1.2
-
-    # Normalizar pesos
-    total_weight = sum(weights)
-    weights = [w / total_weight for w in weights]
-
-    # Fusionar con weighted average
-    stacked_embeddings = np.stack(embeddings_list)
-    fused_embedding = np.average(stacked_embeddings, axis=0, weights=weights)
-
-    return fused_embedding
-
 def normalize_embedding(embedding):
     """Normalizar embedding para comparación coseno"""
     embedding_array = np.array(embedding)
@@ -589,7 +596,8 @@ def index():
     # Obtener imágenes con detalles (aplicando filtro de cliente)
     images_detail_query = Image.query
     images_detail_query = filter_by_client_scope(images_detail_query)
-    images = images_detail_query.join(Product, Image.product_id == Product.id)\
+    images = images_detail_query.options(db.undefer(Image.error_message))\
+        .join(Product, Image.product_id == Product.id)\
         .add_columns(Product.name.label('product_name'))\
         .order_by(Image.created_at.desc()).all()
 
@@ -678,18 +686,15 @@ def process_pending():
 
             for image in batch:
                 try:
-                    print(f"🔄 Procesando {image.filename}...")
-
                     # SOLO usar Cloudinary - no hay fallback local
                     if not image.cloudinary_url:
-                        print(f"❌ Error: {image.filename} no tiene URL de Cloudinary")
+                        clip_logger.warning("%s no tiene URL de Cloudinary", image.filename)
                         # Mantener coherencia de estados: usar 'failed'
                         image.upload_status = 'failed'
                         image.error_message = "No hay URL de Cloudinary disponible"
                         continue
 
                     image_source = image.cloudinary_url
-                    print(f"🌐 Procesando desde Cloudinary: {image_source}")
 
                     # Generar embedding optimizado con CLIP
                     embedding, metadata = generate_clip_embedding(image_source, image)
@@ -712,7 +717,7 @@ def process_pending():
                     # Log de información de optimización
                     method = metadata.get('optimization_method', 'unknown') if metadata else 'unknown'
                     confidence = metadata.get('confidence_score', 0) if metadata else 0
-                    print(f"✅ {image.filename} procesado con {method} (confianza: {confidence:.3f})")
+                    clip_logger.debug("%s procesado con %s (confianza %.3f)", image.filename, method, confidence)
 
                     # ✨ NUEVO: Actualizar tags contextuales del producto
                     if image.product:
@@ -724,12 +729,12 @@ def process_pending():
                             )
                             if result['success'] and result['tags']:
                                 image.product.tags = result['tags']
-                                print(f"  ✓ Tags actualizados para {image.product.name}: {result['tags']}")
+                                clip_logger.debug("Tags actualizados para %s: %s", image.product.name, result['tags'])
                         except Exception as tag_error:
-                            print(f"⚠️ Error actualizando tags de {image.product.name}: {tag_error}")
+                            clip_logger.warning("Error actualizando tags de %s: %s", image.product.name, tag_error)
 
                 except Exception as e:
-                    print(f"❌ Error procesando {image.filename}: {e}")
+                    clip_logger.warning("Error procesando %s: %s", image.filename, e)
                     image.upload_status = 'failed'
                     image.error_message = str(e)
 
@@ -867,3 +872,84 @@ def reset_all():
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
+
+
+# ----------------------------------------------------------------------
+# Índice sombra y cambio de modelo CLIP (app/core/model_versions.py)
+# ----------------------------------------------------------------------
+
+@bp.route("/api/model-index/<client_id>", methods=["GET"])
+@login_required
+@requires_role('SUPER_ADMIN')
+def model_index_status(client_id):
+    """Modelo activo del cliente, cobertura del índice sombra y último job"""
+    from app.core.model_versions import client_model_name, shadow_coverage
+    from app.services.batch_job_service import BatchJobService, JOB_SHADOW_REINDEX
+
+    if not Client.query.get(client_id):
+        return jsonify({"success": False, "message": "Cliente no encontrado"}), 404
+
+    job = BatchJobService.get_latest_job(client_id, JOB_SHADOW_REINDEX)
+    model_name = request.args.get('model_name')
+    if not model_name and job:
+        model_name = (job.params or {}).get('model_name')
+    return jsonify({
+        "success": True,
+        "active_model": client_model_name(client_id),
+        "coverage": shadow_coverage(client_id, model_name) if model_name else None,
+        "job": job.to_dict() if job else None
+    })
+
+
+@bp.route("/api/model-index/<client_id>/shadow", methods=["POST"])
+@login_required
+@requires_role('SUPER_ADMIN')
+def start_model_shadow_index(client_id):
+    """Lanza/reanuda el índice sombra del cliente con otro modelo (job batch en segundo plano)"""
+    from app.services.batch_job_service import BatchJobService, DEFAULT_CHUNK_SIZE, DEFAULT_THROTTLE_MS
+
+    if not Client.query.get(client_id):
+        return jsonify({"success": False, "message": "Cliente no encontrado"}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        job, started = BatchJobService.start_shadow_reindex(
+            current_app._get_current_object(),
+            client_id,
+            data.get('model_name', ''),
+            user_id=current_user.id,
+            chunk_size=data.get('chunk_size', DEFAULT_CHUNK_SIZE),
+            throttle_ms=data.get('throttle_ms', DEFAULT_THROTTLE_MS),
+            auto_cutover=bool(data.get('auto_cutover', False)),
+            resume=data.get('resume', True)
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    return jsonify({
+        "success": True,
+        "started": started,
+        "message": "🚀 Índice sombra en curso" if started else "Ya hay un índice sombra en curso para este cliente",
+        "job": job.to_dict(),
+        "status_url": url_for("products.batch_job_status", job_id=job.id)
+    }), 202
+
+
+@bp.route("/api/model-index/<client_id>/cutover", methods=["POST"])
+@login_required
+@requires_role('SUPER_ADMIN')
+def model_index_cutover(client_id):
+    """Pasa el índice del cliente al modelo del índice sombra (requiere cobertura 100%)"""
+    from app.core.model_versions import cutover
+
+    data = request.get_json(silent=True) or {}
+    model_name = data.get('model_name')
+    if not model_name:
+        return jsonify({"success": False, "message": "model_name requerido"}), 400
+
+    try:
+        result = cutover(client_id, model_name)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 409
+
+    return jsonify({"success": True, "message": f"🔀 Cliente usando {model_name}", "result": result})
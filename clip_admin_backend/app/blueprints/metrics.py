@@ -0,0 +1,225 @@
+"""
+Blueprint de Métricas
+Endpoint /metrics en formato de exposición de Prometheus
+
+Incluye requests por endpoint/cliente, queries SQL por request, etapas de búsqueda,
+encode y carga/descarga de CLIP, caches, backlog de embeddings y RSS del proceso.
+El scrape no consulta la BD salvo el backlog, que se cachea (metrics.backlog_ttl_seconds).
+
+Protección opcional: si METRICS_TOKEN está definido se exige
+    Authorization: Bearer <METRICS_TOKEN>
+"""
+
+import os
+import time
+import threading
+
+from flask import Blueprint, Response, g, request, has_request_context
+from sqlalchemy import event, func, case
+from sqlalchemy.engine import Engine
+
+from app import db
+from app.core.metrics import (
+    metrics, CONTENT_TYPE, HTTP_REQUESTS, HTTP_LATENCY, DB_QUERIES_PER_REQUEST,
+    SEARCH_STAGE_LATENCY, CACHE_REQUESTS
+)
+from app.core.stage_profiler import register_stage_sink
+from app.core import change_notifier
+from app.core.single_flight import in_flight_counts
+from app.core.admission import controller as admission
+
+bp = Blueprint("metrics", __name__)
+
+# Endpoints que no se miden (ruido)
+IGNORED_ENDPOINTS = ('static', 'metrics.metrics_endpoint')
+
+BACKLOG_TTL_SECONDS = 60
+
+
+# ----------------------------------------------------------------------
+# Requests y queries SQL
+# ----------------------------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._metrics_db_queries = g.get('_metrics_db_queries', 0) + 1
+
+
+def _client_label() -> str:
+    """Cliente autenticado por API Key (request.client, misma convención que require_api_key)"""
+    client = getattr(request, 'client', None)
+    if client is None:
+        return ''
+    try:
+        from sqlalchemy import inspect
+        identity = inspect(client).identity  # Sin tocar la BD aunque la instancia esté expirada
+        return str(identity[0]) if identity else ''
+    except Exception:
+        return ''
+
+
+@bp.before_app_request
+def _start_request_metrics():
+    g._metrics_started = time.perf_counter()
+
+
+@bp.after_app_request
+def _record_request_metrics(response):
+    started = g.get('_metrics_started')
+    endpoint = request.endpoint or 'unmatched'
+    if started is None or endpoint in IGNORED_ENDPOINTS or request.method == 'OPTIONS':
+        return response
+
+    client = _client_label()
+    HTTP_REQUESTS.inc(endpoint, client, str(response.status_code))
+    HTTP_LATENCY.observe(time.perf_counter() - started, endpoint, client)
+    DB_QUERIES_PER_REQUEST.observe(g.get('_metrics_db_queries', 0), endpoint)
+    return response
+
+
+def _observe_search_stages(endpoint, client_id, stages, total_ms):
+    for name, data in stages.items():
+        SEARCH_STAGE_LATENCY.observe(data['wall_ms'] / 1000.0, endpoint, name)
+
+
+register_stage_sink(_observe_search_stages)
+
+
+# ----------------------------------------------------------------------
+# Gauges y contadores leídos en el scrape
+# ----------------------------------------------------------------------
+
+def _process_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+def _clip_model_loaded():
+    from app.blueprints import embeddings
+    return 1 if embeddings._clip_model is not None else 0
+
+
+def _clip_backend_info():
+    from app.blueprints import embeddings
+    backend = embeddings.get_clip_backend_name()
+    if backend is None:
+        return {}
+    return {(backend, embeddings._clip_current_model_name or ''): 1}
+
+
+def _image_cache_counts():
+    from app.services.image_cache import image_cache
+    return {
+        ('image_cache', 'hit'): image_cache.hits,
+        ('image_cache', 'miss'): image_cache.misses,
+        ('image_thumbnail', 'hit'): image_cache.thumbnail_hits,
+    }
+
+
+def _cache_entries():
+    from app.services.query_enrichment_service import QueryEnrichmentService
+    from app.utils import colors, llm_query_normalizer
+    from app.core import category_index, color_detection, embedding_recipe
+    return {
+        ('query_enrichment',): len(QueryEnrichmentService._cache),
+        ('llm_color',): len(colors._llm_color_cache),
+        ('color_embedding',): len(colors._color_embedding_cache),
+        ('query_vocab',): len(llm_query_normalizer._vocab_matrices),
+        ('client_vocabulary',): len(llm_query_normalizer._client_vocabularies),
+        ('color_palette',): len(color_detection._client_palettes) + len(color_detection._list_palettes),
+        ('color_prompt',): len(color_detection._prompt_embeddings),
+        ('category_index',): len(category_index._indexes),
+        ('category_prompt',): len(category_index._prompt_embeddings),
+        ('fusion_prompt',): len(embedding_recipe._text_features),
+    }
+
+
+def _index_snapshot_rows():
+    from app.core import index_snapshots
+    return {(client_id,): len(snapshot) for client_id, snapshot in list(index_snapshots._snapshots.items())}
+
+
+def _index_snapshot_scan_bytes():
+    from app.core import index_snapshots
+    return {(client_id, snapshot.storage): snapshot.scan_bytes
+            for client_id, snapshot in list(index_snapshots._snapshots.items())}
+
+
+class _EmbeddingBacklog:
+    """Conteo de imágenes pendientes/fallidas, cacheado para no consultar la BD en cada scrape"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._expires = 0.0
+
+    def _ttl(self) -> int:
+        try:
+            from app.utils.system_config import system_config
+            return int(system_config.get_section('metrics').get('backlog_ttl_seconds', BACKLOG_TTL_SECONDS))
+        except Exception:
+            return BACKLOG_TTL_SECONDS
+
+    def _refresh(self):
+        from app.models.image import Image
+        pending, failed = db.session.query(
+            func.count(case((db.and_(Image.is_processed == False, Image.upload_status != 'failed'), 1))),
+            func.count(case((Image.upload_status == 'failed', 1))),
+        ).one()
+        self._values = {('pending',): pending, ('failed',): failed}
+
+    def __call__(self):
+        now = time.monotonic()
+        # Un solo scrape refresca; los concurrentes devuelven el valor anterior
+        if now >= self._expires and self._lock.acquire(blocking=False):
+            try:
+                self._refresh()
+            except Exception:
+                db.session.rollback()
+            finally:
+                self._expires = now + self._ttl()
+                self._lock.release()
+        return self._values
+
+
+metrics.gauge('process_resident_memory_bytes', 'Memoria residente del proceso', callback=_process_rss_bytes)
+metrics.gauge('clip_model_loaded', 'Modelo CLIP en memoria (1) o descargado (0)', callback=_clip_model_loaded)
+metrics.gauge('clip_model_info', 'Backend y modelo CLIP cargados', ('backend', 'model'), callback=_clip_backend_info)
+metrics.gauge('clip_cache_entries', 'Entradas en caches en memoria', ('cache',), callback=_cache_entries)
+metrics.gauge('clip_single_flight_in_flight', 'Cómputos coalescidos en curso por grupo', ('flight',),
+              callback=lambda: {(name,): count for name, count in in_flight_counts().items()})
+metrics.gauge('clip_admission_in_use', 'Cupos CLIP ocupados por prioridad', ('priority',),
+              callback=lambda: {(p,): n for p, n in admission.stats()['in_use'].items()})
+metrics.gauge('clip_admission_queued', 'Requests esperando cupo CLIP por prioridad', ('priority',),
+              callback=lambda: {(p,): n for p, n in admission.stats()['queued'].items()})
+metrics.gauge('clip_change_listener_connected', 'Listener LISTEN/NOTIFY conectado (1) o caches por TTL (0)',
+              callback=lambda: 1 if change_notifier.is_listening() else 0)
+metrics.gauge('clip_index_snapshot_rows', 'Imágenes en el snapshot del índice abierto por cliente',
+              ('client',), callback=_index_snapshot_rows)
+metrics.gauge('clip_index_snapshot_scan_bytes', 'Bytes que recorre cada búsqueda en el snapshot abierto por cliente',
+              ('client', 'storage'), callback=_index_snapshot_scan_bytes)
+metrics.gauge('clip_embedding_backlog', 'Imágenes sin embedding (state=pending|failed), cacheado',
+              ('state',), callback=_EmbeddingBacklog())
+CACHE_REQUESTS.add_source(_image_cache_counts)
+
+
+# ----------------------------------------------------------------------
+# Endpoint
+# ----------------------------------------------------------------------
+
+@bp.route("/metrics")
+def metrics_endpoint():
+    """Métricas en formato de exposición de Prometheus"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response("unauthorized\n", status=401, mimetype='text/plain')
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
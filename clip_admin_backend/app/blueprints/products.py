@@ -6,9 +6,12 @@ Gestión de productos del catálogo con subida de imágenes por lotes
 import os
 import json
 import uuid
+from io import BytesIO
+from PIL import Image as PILImage
 from werkzeug.utils import secure_filename
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models.product import Product
 from app.models.category import Category
@@ -138,8 +141,8 @@ def index():
     # Obtener todas las categorías del cliente actual
     categories = Category.query.filter_by(client_id=current_user.client_id).all()
 
-    # Construir query base
-    query = Product.query.filter_by(client_id=current_user.client_id)
+    # Construir query base (description es diferida pero el listado la muestra)
+    query = Product.query.options(db.undefer(Product.description)).filter_by(client_id=current_user.client_id)
 
     # Filtro por categoría
     if category_id:
@@ -218,42 +221,46 @@ def _create_product_instance(name, description, category_id, sku, price, stock,
 
 
 def _process_uploaded_images(product, uploaded_files, primary_image_index):
-    """Procesa las imágenes subidas para el producto"""
-    images_processed = 0
+    """
+    Procesa las imágenes subidas para el producto (subida paralela, una sola transacción)
+
+    Returns:
+        Tupla (imágenes_procesadas, errores, mensaje_error, {image_id: bytes_originales})
+    """
     errors = []
 
     if not uploaded_files or not uploaded_files[0].filename:
-        return images_processed, errors, "No se subieron imágenes válidas"
+        return 0, errors, "No se subieron imágenes válidas", {}
 
+    valid_files = []
+    primary_position = None
     for index, file in enumerate(uploaded_files):
         if file and allowed_file(file.filename):
             # Validar tamaño del archivo
             if not validate_file_size(file):
                 errors.append(f"Archivo {file.filename} es demasiado grande (máximo 50MB)")
                 continue
+            if index == primary_image_index:
+                primary_position = len(valid_files)
+            valid_files.append(file)
 
-            try:
-                # ✅ USAR IMAGEMANAGER - Lógica centralizada
-                client = Client.query.get(current_user.client_id)
-                image = image_manager.upload_image(
-                    file=file,
-                    product_id=product.id,
-                    client_id=current_user.client_id,
-                    client_slug=client.slug,  # Dinámico desde BD
-                    is_primary=(index == primary_image_index)
-                )
-
-                if image:
-                    images_processed += 1
-                else:
-                    errors.append(f"No se pudo procesar {file.filename}")
-
-            except ValueError as ve:
-                errors.append(f"{file.filename}: {str(ve)}")
-            except Exception as e:
-                errors.append(f"Error procesando {file.filename}: {str(e)}")
+    try:
+        # ✅ USAR IMAGEMANAGER - Lógica centralizada
+        client = Client.query.get(current_user.client_id)
+        uploaded, upload_errors = image_manager.upload_images(
+            valid_files,
+            product_id=product.id,
+            client_id=current_user.client_id,
+            client_slug=client.slug,  # Dinámico desde BD
+            primary_index=primary_position
+        )
+        errors.extend(upload_errors)
+    except Exception as e:
+        errors.append(f"Error procesando imágenes: {str(e)}")
+        return 0, errors, None, {}
 
-    return images_processed, errors, None
+    original_bytes = {image.id: data for image, data in uploaded}
+    return len(uploaded), errors, None, original_bytes
 
 
 def _generate_success_message(images_processed, errors):
@@ -314,7 +321,9 @@ def create():
             uploaded_files = request.files.getlist("images")
             primary_image_index = request.form.get("primary_image", 0, type=int)
 
-            images_processed, errors, error_msg = _process_uploaded_images(product, uploaded_files, primary_image_index)
+            images_processed, errors, error_msg, original_bytes = _process_uploaded_images(
+                product, uploaded_files, primary_image_index
+            )
 
             if error_msg:
                 flash(error_msg, "warning")
@@ -327,9 +336,9 @@ def create():
 
             db.session.commit()
 
-            # Generar embeddings y actualizar centroide de la categoría del producto recién creado
+            # Generar embeddings (con los bytes ya en memoria) y actualizar centroide de la categoría
             try:
-                _process_embeddings_and_centroid_for_product(product)
+                _process_embeddings_and_centroid_for_product(product, original_bytes)
             except Exception as e:
                 # No bloquear la creación por un fallo en embeddings; mostrar aviso suave
                 flash(f"El producto se creó, pero hubo un problema generando el embedding: {str(e)}", "warning")
@@ -378,6 +387,13 @@ def create():
             return render_template("products/create.html",
                                  categories=categories,
                                  attribute_configs=attribute_configs)
+        except IntegrityError:
+            # uq_products_client_sku: el SKU ya existe (ej: lo creó una importación en paralelo)
+            db.session.rollback()
+            flash(f"Ya existe un producto con el SKU '{request.form.get('sku', '').strip()}'", "error")
+            return render_template("products/create.html",
+                                 categories=categories,
+                                 attribute_configs=attribute_configs)
         except Exception as e:
             db.session.rollback()
             flash(f"Error al crear el producto: {str(e)}", "error")
@@ -390,12 +406,16 @@ def create():
                          attribute_configs=attribute_configs)
 
 
-def _process_embeddings_and_centroid_for_product(product):
+def _process_embeddings_and_centroid_for_product(product, original_bytes=None):
     """Genera embeddings para las imágenes pendientes del producto y actualiza el centroide de su categoría.
 
     Nota: esta función es síncrona y se ejecuta al crear el producto para evitar que el
     usuario tenga que ir al menú de embeddings. Mantiene cambios mínimos y reutiliza
     la lógica existente de generación de embeddings.
+
+    Args:
+        product: Producto recién creado/actualizado
+        original_bytes: {image_id: bytes} de imágenes recién subidas (evita re-descargarlas)
     """
     from app.models.image import Image
     from app.blueprints.embeddings import generate_clip_embedding
@@ -418,8 +438,16 @@ def _process_embeddings_and_centroid_for_product(product):
             image.error_message = 'No hay URL de Cloudinary disponible'
             continue
 
+        # Usar los bytes originales si vienen del upload; si no, la URL (cache local / Cloudinary)
+        source = image.cloudinary_url
+        if original_bytes and image.id in original_bytes:
+            try:
+                source = PILImage.open(BytesIO(original_bytes[image.id])).convert('RGB')
+            except Exception:
+                source = image.cloudinary_url
+
         # Generar embedding con la lógica real (optimizada si hay contexto)
-        embedding, metadata = generate_clip_embedding(image.cloudinary_url, image)
+        embedding, metadata = generate_clip_embedding(source, image)
         if not embedding:
             image.upload_status = 'failed'
             image.error_message = 'No se generó el embedding'
@@ -571,6 +599,9 @@ def edit(product_id):
                                  product=product,
                                  categories=categories,
                                  attribute_configs=attribute_configs)
+        except IntegrityError:
+            db.session.rollback()
+            flash(f"Ya existe otro producto con el SKU '{request.form.get('sku', '').strip()}'", "error")
         except Exception as e:
             db.session.rollback()
             flash(f"Error al actualizar el producto: {str(e)}", "error")
@@ -714,43 +745,39 @@ def add_images(product_id):
         if not uploaded_files or not uploaded_files[0].filename:
             return jsonify({"success": False, "message": "No se recibieron archivos"})
 
-        images_processed = 0
-        errors = []
-
-        for file in uploaded_files:
-            if file and file.filename:
-                try:
-                    # ✅ USAR IMAGEMANAGER - Centralizado y limpio
-                    client = Client.query.get(current_user.client_id)
-                    image = image_manager.upload_image(
-                        file=file,
-                        product_id=product.id,
-                        client_id=current_user.client_id,
-                        client_slug=client.slug,  # Dinámico desde BD
-                        is_primary=False  # Nuevas imágenes no son principales
-                    )
-
-                    if image:
-                        images_processed += 1
-                    else:
-                        errors.append(f"No se pudo procesar {file.filename}")
-
-                except ValueError as ve:
-                    errors.append(f"{file.filename}: {str(ve)}")
-                except Exception as e:
-                    errors.append(f"Error con {file.filename}: {str(e)}")
+        # ✅ USAR IMAGEMANAGER - Subida paralela, una sola transacción
+        client = Client.query.get(current_user.client_id)
+        uploaded, errors = image_manager.upload_images(
+            uploaded_files,
+            product_id=product.id,
+            client_id=current_user.client_id,
+            client_slug=client.slug,  # Dinámico desde BD
+            primary_index=None  # Nuevas imágenes no son principales
+        )
+        images_processed = len(uploaded)
+        original_bytes = {image.id: data for image, data in uploaded}
 
         if images_processed > 0:
             db.session.commit()
 
-        # Generar embeddings y actualizar centroide si se agregaron imágenes
+        # Generar embeddings (sin re-descargar) y actualizar centroide si se agregaron imágenes
         if images_processed > 0:
             try:
-                _process_embeddings_and_centroid_for_product(product)
+                _process_embeddings_and_centroid_for_product(product, original_bytes)
             except Exception as e:
                 # Mantener respuesta exitosa aunque falle la generación; informar en mensaje
                 errors.append(f"Embeddings: {str(e)}")
 
+            # Tags contextuales de las nuevas imágenes (antes se calculaban imagen por imagen al subir)
+            try:
+                from app.services.attribute_autofill_service import AttributeAutofillService
+                result = AttributeAutofillService.autofill_product_attributes(product, overwrite=False)
+                if result['success'] and result['tags']:
+                    product.tags = result['tags']
+                    db.session.commit()
+            except Exception as e:
+                print(f"⚠️ Error autogenerando tags: {e}")
+
         # Preparar respuesta
         if images_processed > 0 and not errors:
             return jsonify({
@@ -920,60 +947,47 @@ def generate_embeddings():
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
 
 
-@bp.route("/api/regenerate-all-tags", methods=["POST"])
-@login_required
-def regenerate_all_tags():
-    """Regenerar tags contextuales para todos los productos con imágenes"""
-    try:
-        from app.services.attribute_autofill_service import AttributeAutofillService
-
-        # Obtener solo productos del cliente actual que tengan imágenes
-        products = Product.query.filter_by(
-            client_id=current_user.client_id
-        ).all()
-
-        products_with_images = [p for p in products if p.images.count() > 0]
-
-        if not products_with_images:
-            return jsonify({
-                "success": False,
-                "message": "No hay productos con imágenes para procesar"
-            })
+def _start_regenerate_tags_job(client_id):
+    """Lanza/reanuda el job batch de regeneración de tags y devuelve la respuesta JSON"""
+    from app.services.batch_job_service import BatchJobService, DEFAULT_CHUNK_SIZE, DEFAULT_THROTTLE_MS
 
-        updated = 0
-        failed = 0
+    data = request.get_json(silent=True) or {}
+    job, started = BatchJobService.start_regenerate_tags(
+        current_app._get_current_object(),
+        client_id,
+        user_id=current_user.id,
+        chunk_size=data.get('chunk_size', DEFAULT_CHUNK_SIZE),
+        throttle_ms=data.get('throttle_ms', DEFAULT_THROTTLE_MS),
+        overwrite=bool(data.get('overwrite', False)),
+        resume=data.get('resume', True)
+    )
 
-        for product in products_with_images:
-            try:
-                # Solo regenerar tags, no sobrescribir atributos existentes
-                result = AttributeAutofillService.autofill_product_attributes(
-                    product,
-                    overwrite=False
-                )
+    if not job.total and started:
+        message = "No hay productos con imágenes para procesar"
+    elif started:
+        message = f"🚀 Regeneración de tags en curso ({job.processed}/{job.total})"
+    else:
+        message = "Ya hay una regeneración de tags en curso para este cliente"
 
-                if result['success'] and result['tags']:
-                    # Actualizar tags (siempre sobrescribimos tags para obtener los nuevos contextuales)
-                    product.tags = result['tags']
-                    updated += 1
-                    print(f"✓ {product.name}: {result['tags']}")
-                else:
-                    failed += 1
+    return jsonify({
+        "success": True,
+        "started": started,
+        "message": message,
+        "job": job.to_dict(),
+        "status_url": url_for("products.batch_job_status", job_id=job.id)
+    }), 202
 
-            except Exception as e:
-                failed += 1
-                print(f"❌ Error en {product.name}: {e}")
-                continue
 
-        db.session.commit()
+def _can_access_job(job):
+    return job and (current_user.is_super_admin or job.client_id == current_user.client_id)
 
-        return jsonify({
-            "success": True,
-            "message": f"✨ Tags actualizados: {updated} productos exitosos, {failed} fallidos",
-            "updated": updated,
-            "failed": failed,
-            "total": len(products_with_images)
-        })
 
+@bp.route("/api/regenerate-all-tags", methods=["POST"])
+@login_required
+def regenerate_all_tags():
+    """Regenerar tags contextuales para todos los productos con imágenes (job batch en segundo plano)"""
+    try:
+        return _start_regenerate_tags_job(current_user.client_id)
     except Exception as e:
         db.session.rollback()
         import traceback
@@ -984,12 +998,12 @@ def regenerate_all_tags():
         })
 
 
-@bp.route("/api/regenerate-tags-by-client/<int:client_id>", methods=["POST"])
+@bp.route("/api/regenerate-tags-by-client/<client_id>", methods=["POST"])
 @login_required
 def regenerate_tags_by_client(client_id):
     """
     Regenerar tags contextuales para todos los productos de un cliente específico.
-    Solo accesible para super admins.
+    Solo accesible para super admins. Se ejecuta como job batch reanudable.
     """
     # Verificar que sea super admin
     if not current_user.is_super_admin:
@@ -999,7 +1013,6 @@ def regenerate_tags_by_client(client_id):
         }), 403
 
     try:
-        from app.services.attribute_autofill_service import AttributeAutofillService
         from app.models.client import Client
 
         # Validar que el cliente existe
@@ -1010,60 +1023,118 @@ def regenerate_tags_by_client(client_id):
                 "message": f"Cliente con ID {client_id} no encontrado"
             }), 404
 
-        # Obtener solo productos del cliente que tengan imágenes
-        products = Product.query.filter_by(client_id=client_id).all()
-        products_with_images = [p for p in products if p.images.count() > 0]
+        print(f"🔄 Regeneración de tags solicitada para el cliente '{client.name}'")
+        return _start_regenerate_tags_job(client.id)
 
-        if not products_with_images:
-            return jsonify({
-                "success": False,
-                "message": f"No hay productos con imágenes para el cliente '{client.name}'"
-            })
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        traceback.print_exc()
+        return jsonify({
+            "success": False,
+            "message": f"Error: {str(e)}"
+        })
 
-        print(f"🔄 Iniciando regeneración de tags para {len(products_with_images)} productos del cliente '{client.name}'")
 
-        updated = 0
-        failed = 0
+@bp.route("/api/batch-jobs/<job_id>", methods=["GET"])
+@login_required
+def batch_job_status(job_id):
+    """Progreso de un job batch (para polling desde el panel)"""
+    from app.services.batch_job_service import BatchJobService
 
-        for product in products_with_images:
-            try:
-                # Solo regenerar tags, no sobrescribir atributos existentes
-                result = AttributeAutofillService.autofill_product_attributes(
-                    product,
-                    overwrite=False
-                )
+    job = BatchJobService.get_job(job_id)
+    if not _can_access_job(job):
+        return jsonify({"success": False, "message": "Job no encontrado"}), 404
 
-                if result['success'] and result['tags']:
-                    # Actualizar tags (siempre sobrescribimos tags para obtener los nuevos contextuales)
-                    product.tags = result['tags']
-                    updated += 1
-                    print(f"✓ {product.name}: {result['tags']}")
-                else:
-                    failed += 1
+    return jsonify({"success": True, "job": job.to_dict()})
 
-            except Exception as e:
-                failed += 1
-                print(f"❌ Error en {product.name}: {e}")
-                continue
 
-        db.session.commit()
+@bp.route("/api/batch-jobs/<job_id>/cancel", methods=["POST"])
+@login_required
+def cancel_batch_job(job_id):
+    """Cancela un job batch; se detiene al terminar el lote en curso y puede reanudarse luego"""
+    from app.services.batch_job_service import BatchJobService
 
-        print(f"✅ Regeneración completada para '{client.name}': {updated} exitosos, {failed} fallidos")
+    job = BatchJobService.get_job(job_id)
+    if not _can_access_job(job):
+        return jsonify({"success": False, "message": "Job no encontrado"}), 404
+
+    job = BatchJobService.cancel(job_id)
+    return jsonify({"success": True, "job": job.to_dict()})
 
-        return jsonify({
-            "success": True,
-            "message": f"✨ Tags regenerados para '{client.name}'",
-            "updated": updated,
-            "failed": failed,
-            "total": len(products_with_images),
-            "client_name": client.name
-        })
 
+@bp.route("/api/import", methods=["POST"])
+@login_required
+def import_catalog():
+    """
+    Importación masiva de productos desde CSV o JSONL (upsert por SKU, job en segundo plano).
+    Super admins pueden indicar client_id en el formulario; el resto importa a su propio cliente.
+    """
+    from app.services.catalog_import_service import CatalogImportService
+
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({"success": False, "message": "No se recibió ningún archivo"}), 400
+
+    client_id = current_user.client_id
+    if current_user.is_super_admin and request.form.get('client_id'):
+        client_id = request.form.get('client_id')
+    if not client_id or not Client.query.get(client_id):
+        return jsonify({"success": False, "message": "Cliente no encontrado"}), 404
+
+    try:
+        # Un import activo por cliente: dos imports del mismo catálogo en paralelo
+        # se pisarían los mismos SKUs e imágenes
+        job = CatalogImportService.active_job(client_id)
+        started = False
+        if not job:
+            file_path = CatalogImportService.save_upload(file)
+            job, started = CatalogImportService.start_import(
+                current_app._get_current_object(),
+                client_id,
+                file_path,
+                file.filename,
+                user_id=current_user.id,
+                with_images=request.form.get('with_images', 'true').lower() != 'false'
+            )
+            if not started:
+                os.remove(file_path)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         db.session.rollback()
         import traceback
         traceback.print_exc()
+        return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
+
+    if not started:
         return jsonify({
             "success": False,
-            "message": f"Error: {str(e)}"
-        })
+            "message": "Ya hay una importación en curso para este cliente",
+            "job": job.to_dict(),
+            "status_url": url_for("products.batch_job_status", job_id=job.id)
+        }), 409
+
+    return jsonify({
+        "success": True,
+        "message": f"📥 Importación en curso ({job.total} filas)",
+        "job": job.to_dict(),
+        "status_url": url_for("products.batch_job_status", job_id=job.id),
+        "report_url": url_for("products.import_error_report", job_id=job.id)
+    }), 202
+
+
+@bp.route("/api/import/<job_id>/errors", methods=["GET"])
+@login_required
+def import_error_report(job_id):
+    """Descarga el reporte CSV de errores por fila de una importación"""
+    from flask import send_file
+    from app.services.batch_job_service import BatchJobService
+
+    job = BatchJobService.get_job(job_id)
+    report_path = (job.params or {}).get('report_path') if job else None
+    if not _can_access_job(job) or not report_path or not os.path.exists(report_path):
+        return jsonify({"success": False, "message": "Reporte no encontrado"}), 404
+
+    return send_file(report_path, mimetype='text/csv', as_attachment=True,
+                     download_name=f"import_{job.id[:8]}_errors.csv")
@@ -141,7 +141,8 @@ def api_update(client_id):
         {
             "visual_weight": 0.6,
             "metadata_weight": 0.3,
-            "business_weight": 0.1
+            "business_weight": 0.1,
+            "latency_budget_ms": 1500        (opcional, null = default del sistema)
         }
 
     Response JSON:
@@ -197,6 +198,17 @@ def api_update(client_id):
                 "error": error
             }), 400
 
+        # Presupuesto de latencia de la búsqueda visual (vacío = default del sistema)
+        if "latency_budget_ms" in data:
+            latency_budget = data.get("latency_budget_ms")
+            latency_budget = int(latency_budget) if latency_budget not in (None, "") else None
+            if latency_budget is not None and latency_budget <= 0:
+                return jsonify({
+                    "success": False,
+                    "error": "latency_budget_ms debe ser mayor a 0"
+                }), 400
+            config.latency_budget_ms = latency_budget
+
         # Actualizar thresholds en el cliente
         client.category_confidence_threshold = category_confidence
         client.product_similarity_threshold = product_similarity
@@ -211,6 +223,7 @@ def api_update(client_id):
                 "visual_weight": config.visual_weight,
                 "metadata_weight": config.metadata_weight,
                 "business_weight": config.business_weight,
+                "latency_budget_ms": config.latency_budget_ms,
                 "category_confidence_threshold": client.category_confidence_threshold,
                 "product_similarity_threshold": client.product_similarity_threshold
             }
@@ -7,6 +7,8 @@ from flask import Blueprint, render_template, request, jsonify, flash, redirect,
 from flask_login import login_required
 from app.utils.permissions import requires_role
 from app.utils.system_config import system_config
+from app.core.clip_backends import CONFIGURABLE_BACKENDS
+from app.utils.llm_query_normalizer import QUERY_ENCODERS
 
 bp = Blueprint('system_config_admin', __name__)
 
@@ -30,6 +32,8 @@ def update():
         clip_preload = request.form.get('clip_preload') == 'on'
         clip_idle_timeout = int(request.form.get('clip_idle_timeout_minutes', 120))
         clip_model = request.form.get('clip_model_name', 'openai/clip-vit-base-patch16')
+        clip_backend = request.form.get('clip_backend', 'pytorch')
+        query_encoder = request.form.get('query_encoder', 'minilm')
 
         max_results = int(request.form.get('search_max_results', 50))
         enable_category_detection = request.form.get('enable_category_detection') == 'on'
@@ -40,6 +44,15 @@ def update():
             flash('El timeout de CLIP debe estar entre 1 y 1440 minutos', 'danger')
             return redirect(url_for('system_config_admin.index'))
 
+        # stub (vectores falsos) solo se habilita con la variable de entorno CLIP_BACKEND
+        if clip_backend not in CONFIGURABLE_BACKENDS:
+            flash(f'Backend de CLIP inválido: {clip_backend}', 'danger')
+            return redirect(url_for('system_config_admin.index'))
+
+        if query_encoder not in QUERY_ENCODERS:
+            flash(f'Encoder de queries inválido: {query_encoder}', 'danger')
+            return redirect(url_for('system_config_admin.index'))
+
         if max_results < 1 or max_results > 10:
             flash('El máximo de resultados debe estar entre 1 y 10', 'danger')
             return redirect(url_for('system_config_admin.index'))
@@ -49,12 +62,14 @@ def update():
             'clip': {
                 'preload': clip_preload,
                 'idle_timeout_minutes': clip_idle_timeout,
-                'model_name': clip_model
+                'model_name': clip_model,
+                'backend': clip_backend
             },
             'search': {
                 'max_results': max_results,
                 'enable_category_detection': enable_category_detection,
-                'enable_visual_search': enable_visual_search
+                'enable_visual_search': enable_visual_search,
+                'query_encoder': query_encoder
             }
         }
 
@@ -139,7 +154,8 @@ def reset():
             "clip": {
                 "preload": False,
                 "idle_timeout_minutes": 120,
-                "model_name": "openai/clip-vit-base-patch16"
+                "model_name": "openai/clip-vit-base-patch16",
+                "backend": "pytorch"
             },
             "search": {
                 "max_results": 50,
@@ -0,0 +1,217 @@
+"""
+Control de admisión para el trabajo que usa CLIP (búsqueda y embeddings)
+
+Limita cuántos cómputos CLIP corren a la vez en el worker. Con todos los
+cupos ocupados, una búsqueda espera en una cola corta con deadline; si la cola
+está llena o el deadline vence, se rechaza enseguida con 503 + Retry-After en
+lugar de sumar otra request que hace lentas a todas (el widget corta por timeout).
+
+Prioridades:
+    search      búsquedas del widget: primero en la cola, deadline corto
+    background  embeddings disparados desde el admin (process_pending, importación,
+                jobs batch): nunca se rechazan, esperan sin deadline y solo pueden
+                ocupar background_max cupos para dejar lugar a la búsqueda
+
+Uso:
+    from app.core.admission import admit, PRIORITY_BACKGROUND
+
+    with admit(PRIORITY_BACKGROUND):
+        embedding = model.get_image_features(...)
+
+admit() es re-entrante por thread: un cómputo que ya tiene cupo (ej: una búsqueda
+que infiere tags con encode_images) no pide un segundo cupo. Si lo pidiera, con
+todos los cupos tomados por búsquedas o background_max agotado esperaría para
+siempre sosteniendo el suyo.
+
+Configuración en system_config.json (todas opcionales):
+    "admission": {"enabled": true, "max_concurrent": <núcleos>, "max_queue": <2 x cupos>,
+                  "queue_timeout_ms": 2000, "background_max": <cupos / 2>, "retry_after_seconds": 2}
+"""
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+from app.core.metrics import ADMISSION_WAIT, ADMISSION_REJECTED
+
+PRIORITY_SEARCH = 'search'
+PRIORITY_BACKGROUND = 'background'
+
+# Menor = se atiende primero
+_PRIORITY_ORDER = {PRIORITY_SEARCH: 0, PRIORITY_BACKGROUND: 1}
+
+DEFAULT_QUEUE_TIMEOUT_MS = 2000
+DEFAULT_RETRY_AFTER_SECONDS = 2
+
+# La config se relee cada CONFIG_TTL_SECONDS (system_config lee el JSON en cada get)
+CONFIG_TTL_SECONDS = 30
+
+
+class AdmissionRejected(Exception):
+    """No hay cupo ni lugar en la cola (o venció el deadline)"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Admisión rechazada: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('priority', 'granted', 'event')
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.granted = False
+        self.event = threading.Event()
+
+
+class AdmissionController:
+    """Semáforo con cola por prioridad, deadline y cupo máximo para trabajo de fondo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_use = {PRIORITY_SEARCH: 0, PRIORITY_BACKGROUND: 0}
+        self._queue = []  # heap de (orden de prioridad, secuencia, _Waiter)
+        self._seq = itertools.count()
+        self._config = {}
+        self._config_expires = 0.0
+
+    # ------------------------------------------------------------------
+    # Configuración
+    # ------------------------------------------------------------------
+
+    def config(self) -> dict:
+        now = time.monotonic()
+        if now >= self._config_expires:
+            try:
+                from app.utils.system_config import system_config
+                section = system_config.get_section('admission') or {}
+            except Exception:
+                section = {}
+            slots = max(1, int(section.get('max_concurrent') or os.cpu_count() or 1))
+            self._config = {
+                'enabled': bool(section.get('enabled', True)),
+                'slots': slots,
+                'max_queue': max(0, int(section.get('max_queue', 2 * slots))),
+                'queue_timeout': float(section.get('queue_timeout_ms', DEFAULT_QUEUE_TIMEOUT_MS)) / 1000.0,
+                'background_max': max(1, int(section.get('background_max') or max(1, slots // 2))),
+                'retry_after': int(section.get('retry_after_seconds', DEFAULT_RETRY_AFTER_SECONDS)),
+            }
+            self._config_expires = now + CONFIG_TTL_SECONDS
+        return self._config
+
+    # ------------------------------------------------------------------
+    # Cupos
+    # ------------------------------------------------------------------
+
+    def _can_run(self, priority: str, config: dict) -> bool:
+        if sum(self._in_use.values()) >= config['slots']:
+            return False
+        return priority != PRIORITY_BACKGROUND or self._in_use[PRIORITY_BACKGROUND] < config['background_max']
+
+    def acquire(self, priority: str = PRIORITY_SEARCH, timeout: float = None) -> float:
+        """
+        Toma un cupo (esperando en la cola si hace falta)
+
+        Args:
+            priority: PRIORITY_SEARCH | PRIORITY_BACKGROUND
+            timeout: Deadline de espera en segundos (None = queue_timeout_ms para búsqueda,
+                     sin límite para background)
+
+        Returns:
+            Segundos esperados en la cola
+
+        Raises:
+            AdmissionRejected: Cola llena o deadline vencido
+        """
+        config = self.config()
+        started = time.perf_counter()
+        with self._lock:
+            # Sin adelantarse a nadie de igual o mayor prioridad que ya esté esperando
+            ahead = any(order <= _PRIORITY_ORDER[priority] for order, _, _ in self._queue)
+            if not ahead and self._can_run(priority, config):
+                self._in_use[priority] += 1
+                ADMISSION_WAIT.observe(0.0, priority)
+                return 0.0
+
+            if priority == PRIORITY_SEARCH and sum(
+                    1 for _, _, w in self._queue if w.priority == PRIORITY_SEARCH) >= config['max_queue']:
+                ADMISSION_REJECTED.inc(priority, 'queue_full')
+                raise AdmissionRejected('queue_full', config['retry_after'])
+
+            waiter = _Waiter(priority)
+            heapq.heappush(self._queue, (_PRIORITY_ORDER[priority], next(self._seq), waiter))
+
+        if timeout is None and priority == PRIORITY_SEARCH:
+            timeout = config['queue_timeout']
+        waiter.event.wait(timeout)
+
+        with self._lock:
+            if not waiter.granted:
+                self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+                heapq.heapify(self._queue)
+                ADMISSION_REJECTED.inc(priority, 'deadline')
+                raise AdmissionRejected('deadline', config['retry_after'])
+
+        waited = time.perf_counter() - started
+        ADMISSION_WAIT.observe(waited, priority)
+        return waited
+
+    def release(self, priority: str = PRIORITY_SEARCH):
+        """Libera un cupo y se lo pasa al siguiente de la cola que pueda correr"""
+        config = self.config()
+        with self._lock:
+            self._in_use[priority] = max(0, self._in_use[priority] - 1)
+            skipped = []
+            while self._queue and sum(self._in_use.values()) < config['slots']:
+                entry = heapq.heappop(self._queue)
+                waiter = entry[2]
+                if not self._can_run(waiter.priority, config):
+                    skipped.append(entry)  # background sin cupo propio: sigue esperando
+                    continue
+                self._in_use[waiter.priority] += 1
+                waiter.granted = True
+                waiter.event.set()
+            for entry in skipped:
+                heapq.heappush(self._queue, entry)
+
+    def under_pressure(self) -> bool:
+        """True si hay búsquedas esperando cupo (las etapas opcionales se saltean)"""
+        if not self.config()['enabled']:
+            return False
+        with self._lock:
+            return any(waiter.priority == PRIORITY_SEARCH for _, _, waiter in self._queue)
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {PRIORITY_SEARCH: 0, PRIORITY_BACKGROUND: 0}
+            for _, _, waiter in self._queue:
+                queued[waiter.priority] += 1
+            return {'in_use': dict(self._in_use), 'queued': queued}
+
+
+controller = AdmissionController()
+
+# Cupos tomados por el thread actual (admit anidado no vuelve a pedir cupo)
+_held = threading.local()
+
+
+@contextmanager
+def admit(priority: str = PRIORITY_SEARCH, timeout: float = None):
+    """
+    Context manager: toma un cupo (o levanta AdmissionRejected) y lo libera al salir
+
+    Si el thread ya tiene un cupo tomado corre con ese, sin esperar ni contar otro.
+    """
+    if getattr(_held, 'depth', 0) or not controller.config()['enabled']:
+        yield 0.0
+        return
+    waited = controller.acquire(priority, timeout)
+    _held.depth = 1
+    try:
+        yield waited
+    finally:
+        _held.depth = 0
+        controller.release(priority)
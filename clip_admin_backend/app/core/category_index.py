@@ -0,0 +1,326 @@
+"""
+Índice multi-prototipo de categorías para la detección de categoría en búsqueda visual
+
+Cada categoría aporta varias filas a una matriz (prototipos x D) normalizada:
+    - el centroide (Category.centroid_embedding)
+    - sub-centroides k-means de los embeddings de sus imágenes (Category.prototype_embeddings),
+      calculados offline al recalcular centroides (compute_prototypes)
+    - el embedding de texto de su prompt (clip_prompt o "a photo of {name_en}")
+
+Detectar es una sola multiplicación matriz x embedding de la imagen:
+    score visual de la categoría = máximo entre sus prototipos de imagen
+    score de texto de la categoría = similitud con su prompt
+Cuando las dos mejores categorías quedan a menos de MARGIN_DELTA, el desempate
+usa el score de texto que ya salió de la misma multiplicación: no hay más
+llamadas al modelo (antes detect_general_object re-decodificaba la imagen y
+re-corría CLIP con los prompts de todas las categorías).
+
+El índice se arma una vez por cliente (los prompts de texto se cachean por
+modelo) y se invalida con los cambios de categorías (app/core/change_notifier.py).
+
+Configuración en system_config.json (todas opcionales):
+    "category_index": {"max_prototypes": 4, "min_images_per_prototype": 8,
+                       "text_prompts": true, "text_margin": 0.005}
+"""
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import CACHE_REQUESTS
+from app.core.single_flight import SingleFlight
+from app.core.change_notifier import (
+    ALL_CLIENTS, KIND_CATEGORY, cache_ttl, client_version, register_invalidator
+)
+
+logger = logging.getLogger("category_index")
+
+# Margen de victoria mínimo para aceptar la mejor categoría sin desempate
+MARGIN_DELTA = 0.03
+
+DEFAULT_MAX_PROTOTYPES = 4
+DEFAULT_MIN_IMAGES_PER_PROTOTYPE = 8
+# Diferencia mínima de score de texto para que el desempate cambie la categoría
+DEFAULT_TEXT_MARGIN = 0.005
+KMEANS_ITERATIONS = 20
+
+PROMPT_CACHE_MAX = 2048
+
+# La config se relee cada CONFIG_TTL_SECONDS (system_config lee el JSON en cada get)
+CONFIG_TTL_SECONDS = 30
+
+_config_lock = threading.Lock()
+_config_cache = None
+_config_expires = 0.0
+
+# Índices por cliente: {client_id: (expira_monotonic, CategoryIndex)}
+_indexes = {}
+_index_flight = SingleFlight('category_index')
+
+# Embeddings de texto de los prompts: {(modelo, prompt): vector normalizado}
+_prompt_embeddings = OrderedDict()
+_prompt_lock = threading.Lock()
+
+
+def _get_config() -> dict:
+    global _config_cache, _config_expires
+    now = time.monotonic()
+    if _config_cache is not None and now < _config_expires:
+        return _config_cache
+    with _config_lock:
+        if _config_cache is None or now >= _config_expires:
+            try:
+                from app.utils.system_config import system_config
+                _config_cache = system_config.get_section('category_index') or {}
+            except Exception:
+                _config_cache = {}
+            _config_expires = now + CONFIG_TTL_SECONDS
+    return _config_cache
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# ----------------------------------------------------------------------
+# Prototipos (offline, desde Category.update_centroid_embedding)
+# ----------------------------------------------------------------------
+
+def compute_prototypes(embeddings: np.ndarray, max_prototypes: Optional[int] = None,
+                       min_images_per_prototype: Optional[int] = None) -> np.ndarray:
+    """
+    Sub-centroides de una categoría con k-means esférico (coseno)
+
+    Args:
+        embeddings: Embeddings de las imágenes de la categoría (N x D)
+        max_prototypes: Máximo de sub-centroides
+        min_images_per_prototype: Imágenes mínimas por sub-centroide (k = N // este valor)
+
+    Returns:
+        Matriz (k x D) normalizada; k=1 (el centroide) si hay pocas imágenes
+    """
+    config = _get_config()
+    max_prototypes = int(max_prototypes or config.get('max_prototypes', DEFAULT_MAX_PROTOTYPES))
+    min_images = int(min_images_per_prototype or config.get('min_images_per_prototype',
+                                                            DEFAULT_MIN_IMAGES_PER_PROTOTYPE))
+
+    points = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    k = max(1, min(max_prototypes, len(points) // max(1, min_images)))
+    if k == 1:
+        return _normalize_rows(points.mean(axis=0, keepdims=True))
+
+    # Init k-means++ determinístico (mismo resultado en cada recálculo)
+    rng = np.random.default_rng(0)
+    centers = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        distances = 1.0 - (points @ np.array(centers).T).max(axis=1)
+        distances = np.clip(distances, 0.0, None).astype(np.float64)
+        if distances.sum() <= 0:
+            break
+        centers.append(points[rng.choice(len(points), p=distances / distances.sum())])
+    centers = np.array(centers, dtype=np.float32)
+
+    for _ in range(KMEANS_ITERATIONS):
+        labels = (points @ centers.T).argmax(axis=1)
+        updated = np.zeros_like(centers)
+        np.add.at(updated, labels, points)
+        counts = np.bincount(labels, minlength=len(centers))
+        updated[counts == 0] = centers[counts == 0]
+        updated = _normalize_rows(updated)
+        if np.allclose(updated, centers, atol=1e-5):
+            centers = updated
+            break
+        centers = updated
+
+    # Descartar sub-centroides sin imágenes
+    labels = (points @ centers.T).argmax(axis=1)
+    return centers[np.bincount(labels, minlength=len(centers)) > 0]
+
+
+# ----------------------------------------------------------------------
+# Prompts de texto
+# ----------------------------------------------------------------------
+
+def category_prompt(category) -> str:
+    return (category.clip_prompt or '').strip() or f"a photo of {(category.name_en or category.name).lower()}"
+
+
+def _prompt_matrix(prompts: List[str]) -> Optional[np.ndarray]:
+    """Embeddings de texto normalizados de los prompts (solo se codifican los que faltan)"""
+    from app.core.model_versions import active_model_name
+
+    model_name = active_model_name()
+    keys = [(model_name, prompt) for prompt in prompts]
+    with _prompt_lock:
+        missing = [key for key in keys if key not in _prompt_embeddings]
+    if missing:
+        from app.blueprints.embeddings import get_clip_model
+        from app.utils.lazy_imports import lazy_import
+        torch = lazy_import('torch')
+
+        CACHE_REQUESTS.inc('category_prompt', 'miss', amount=len(missing))
+        model, processor = get_clip_model()
+        with torch.no_grad():
+            inputs = processor(text=[prompt for _, prompt in missing], return_tensors="pt",
+                               padding=True, truncation=True)
+            features = model.get_text_features(**inputs)
+            features = features / features.norm(dim=-1, keepdim=True)
+        with _prompt_lock:
+            for key, vector in zip(missing, features.float().cpu().numpy()):
+                _prompt_embeddings[key] = vector
+            while len(_prompt_embeddings) > PROMPT_CACHE_MAX:
+                _prompt_embeddings.popitem(last=False)
+    if len(keys) > len(missing):
+        CACHE_REQUESTS.inc('category_prompt', 'hit', amount=len(keys) - len(missing))
+    with _prompt_lock:
+        return np.stack([_prompt_embeddings[key] for key in keys])
+
+
+# ----------------------------------------------------------------------
+# Índice
+# ----------------------------------------------------------------------
+
+class CategoryIndex:
+    """Matriz de prototipos de las categorías activas de un cliente"""
+
+    def __init__(self, category_ids: List[str], category_names: List[str], image_matrix: np.ndarray,
+                 image_owner: np.ndarray, text_matrix: Optional[np.ndarray], missing: List[str]):
+        self.category_ids = category_ids
+        self.category_names = category_names
+        self.missing = missing  # categorías activas sin centroide
+        self.prototype_count = len(image_owner)
+        self._image_owner = image_owner
+        # Prototipos de imagen y prompts de texto en una sola matriz
+        self._matrix = image_matrix if text_matrix is None else np.vstack([image_matrix, text_matrix])
+        self._has_text = text_matrix is not None
+
+    def __len__(self):
+        return len(self.category_ids)
+
+    def score(self, embedding: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Scores por categoría para un embedding de imagen normalizado
+
+        Returns:
+            Tupla (score visual (C,) = máximo entre prototipos de imagen, score de texto (C,) o None)
+        """
+        similarities = self._matrix @ np.asarray(embedding, dtype=np.float32)
+        visual = np.full(len(self.category_ids), -1.0, dtype=np.float32)
+        np.maximum.at(visual, self._image_owner, similarities[:self.prototype_count])
+        text = similarities[self.prototype_count:] if self._has_text else None
+        return visual, text
+
+    def detect(self, embedding: np.ndarray) -> Tuple[Optional[int], float, dict]:
+        """
+        Mejor categoría con desempate por texto cuando el margen es chico
+
+        Returns:
+            Tupla (posición de la categoría | None, score visual, info de debug)
+        """
+        if not len(self):
+            return None, 0.0, {}
+        visual, text = self.score(embedding)
+        order = np.argsort(-visual)
+        best = int(order[0])
+        info = {'best': self.category_names[best], 'best_score': float(visual[best])}
+        if len(order) < 2:
+            return best, float(visual[best]), info
+
+        second = int(order[1])
+        margin = float(visual[best] - visual[second])
+        info.update({'second': self.category_names[second], 'second_score': float(visual[second]),
+                     'margin': margin})
+        if margin < MARGIN_DELTA and text is not None:
+            text_margin = float(_get_config().get('text_margin', DEFAULT_TEXT_MARGIN))
+            info['text_scores'] = (float(text[best]), float(text[second]))
+            if text[second] - text[best] > text_margin:
+                info['tiebreak'] = 'text'
+                return second, float(visual[second]), info
+        return best, float(visual[best]), info
+
+
+def _build_index(client_id) -> CategoryIndex:
+    from app.models.category import Category
+    from app.core.model_versions import client_model_name, model_scope
+
+    categories = Category.query.filter_by(client_id=client_id, is_active=True).all()
+    config = _get_config()
+    model_name = client_model_name(client_id)
+
+    ids, names, rows, owner, prompts, missing = [], [], [], [], [], []
+    for category in categories:
+        centroid = category.get_centroid_embedding(auto_calculate=False)
+        if centroid is None or (category.centroid_model and category.centroid_model != model_name):
+            # Sin centroide o calculado con otro modelo (pendiente de recálculo)
+            missing.append(category.name)
+            continue
+        position = len(ids)
+        ids.append(category.id)
+        names.append(category.name)
+        prototypes = [np.asarray(centroid, dtype=np.float32)]
+        if category.prototype_embeddings:
+            try:
+                prototypes.extend(np.asarray(json.loads(category.prototype_embeddings), dtype=np.float32))
+            except Exception as e:
+                logger.warning("Prototipos inválidos para %s: %s", category.name, e)
+        rows.extend(prototypes)
+        owner.extend([position] * len(prototypes))
+        prompts.append(category_prompt(category))
+
+    if not ids:
+        return CategoryIndex([], [], np.zeros((0, 0), np.float32), np.zeros(0, np.int64), None, missing)
+
+    image_matrix = _normalize_rows(np.stack(rows))
+    text_matrix = None
+    if config.get('text_prompts', True):
+        try:
+            with model_scope(model_name):
+                text_matrix = _prompt_matrix(prompts)
+            if text_matrix.shape[1] != image_matrix.shape[1]:
+                logger.warning("Prompts de texto (%d) y centroides (%d) con distinta dimensión: sin desempate",
+                               text_matrix.shape[1], image_matrix.shape[1])
+                text_matrix = None
+        except Exception as e:
+            logger.warning("No se pudieron codificar los prompts de categorías: %s", e)
+
+    logger.info("Índice de categorías cliente %s: %d categorías, %d prototipos%s",
+                client_id, len(ids), len(owner), " + prompts" if text_matrix is not None else "")
+    return CategoryIndex(ids, names, image_matrix, np.asarray(owner, dtype=np.int64), text_matrix, missing)
+
+
+def get_category_index(client_id) -> CategoryIndex:
+    """
+    Índice de categorías del cliente, cacheado
+
+    Se invalida cuando cualquier worker commitea cambios en categorías del cliente
+    (incluye el recálculo de centroides y prototipos).
+    """
+    key = str(client_id)
+    entry = _indexes.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        CACHE_REQUESTS.inc('category_index', 'hit')
+        return entry[1]
+
+    CACHE_REQUESTS.inc('category_index', 'miss')
+    version = client_version(key)
+    index, _ = _index_flight.do((key, version), lambda: _build_index(client_id))
+    # Si llegó una invalidación mientras se armaba, no guardar un índice viejo
+    if client_version(key) == version:
+        _indexes[key] = (time.monotonic() + cache_ttl(), index)
+    return index
+
+
+def _invalidate_index(client_id: str, kind: str):
+    if client_id == ALL_CLIENTS:
+        _indexes.clear()
+    else:
+        _indexes.pop(client_id, None)
+
+
+register_invalidator(_invalidate_index, kinds=(KIND_CATEGORY,))
@@ -0,0 +1,298 @@
+"""
+Invalidación de caches entre workers con LISTEN/NOTIFY de Postgres
+
+Cuando un worker commitea cambios en Client, StoreSearchConfig, Category,
+Product o Image, emite (después del commit):
+
+    NOTIFY catalog_changed, '<client_id>:<kind>:<version>'
+
+Cada worker corre un thread que escucha el canal, sube la versión del
+cliente y llama a los invalidadores registrados para ese tipo de cambio.
+El worker que hizo el cambio invalida localmente en el momento.
+
+Tipos de cambio (kind):
+    client         datos del cliente (API Key, umbrales, estado)
+    search_config  StoreSearchConfig
+    category       categorías y centroides
+    catalog        productos e imágenes (embeddings)
+    index          nuevo snapshot del índice publicado (app/core/index_snapshots.py)
+
+Uso desde un cache:
+    from app.core.change_notifier import register_invalidator, cache_ttl
+
+    register_invalidator(_evict, kinds=('catalog', 'category'))   # _evict(client_id, kind); client_id '*' = todos
+    expires = time.monotonic() + cache_ttl()
+
+Si la conexión del listener se cae, se invalida todo y cache_ttl() pasa a
+devolver fallback_ttl_seconds hasta reconectar (se vuelve a cache por TTL).
+
+Configuración en system_config.json (todas opcionales):
+    "change_notifications": {"enabled": true, "channel": "catalog_changed",
+                             "ttl_seconds": 600, "fallback_ttl_seconds": 30}
+"""
+import time
+import select
+import logging
+import threading
+from typing import Callable, Iterable, Optional
+
+from app.core.metrics import CHANGE_NOTIFICATIONS
+
+logger = logging.getLogger("change_notifier")
+
+CHANNEL = 'catalog_changed'
+
+KIND_CLIENT = 'client'
+KIND_SEARCH_CONFIG = 'search_config'
+KIND_CATEGORY = 'category'
+KIND_CATALOG = 'catalog'
+KIND_INDEX = 'index'
+CHANGE_KINDS = (KIND_CLIENT, KIND_SEARCH_CONFIG, KIND_CATEGORY, KIND_CATALOG, KIND_INDEX)
+
+ALL_CLIENTS = '*'
+
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_FALLBACK_TTL_SECONDS = 30
+RECONNECT_SECONDS = 5
+KEEPALIVE_SECONDS = 30
+
+# Modelo -> (tipo de cambio, atributo con el client_id)
+MODEL_KINDS = {
+    'Client': (KIND_CLIENT, 'id'),
+    'StoreSearchConfig': (KIND_SEARCH_CONFIG, 'store_id'),
+    'Category': (KIND_CATEGORY, 'client_id'),
+    'Product': (KIND_CATALOG, 'client_id'),
+    'Image': (KIND_CATALOG, 'client_id'),
+}
+
+_invalidators = []          # [(kinds | None, callback)]
+_versions = {}              # {client_id: versión del último cambio visto}
+_versions_lock = threading.Lock()
+
+_engine = None
+_channel = CHANNEL
+_ttl_seconds = DEFAULT_TTL_SECONDS
+_fallback_ttl_seconds = DEFAULT_FALLBACK_TTL_SECONDS
+_listening = threading.Event()
+_listener_thread = None
+
+
+def register_invalidator(callback: Callable, kinds: Optional[Iterable[str]] = None):
+    """
+    Registra un callback(client_id, kind) que se llama ante cada cambio
+
+    Args:
+        callback: Recibe el client_id y el tipo de cambio ('*' en ambos = invalidar todo)
+        kinds: Tipos de cambio que le interesan (None = todos; '*' se entrega siempre)
+    """
+    entry = (tuple(kinds) if kinds else None, callback)
+    if entry not in _invalidators:
+        _invalidators.append(entry)
+
+
+def is_listening() -> bool:
+    """True si el listener está conectado (los caches pueden usar TTL largos)"""
+    return _listening.is_set()
+
+
+def cache_ttl(ttl: Optional[float] = None) -> float:
+    """TTL para entradas nuevas: largo con el listener conectado, corto si no"""
+    if is_listening():
+        return ttl if ttl is not None else _ttl_seconds
+    return min(ttl, _fallback_ttl_seconds) if ttl is not None else _fallback_ttl_seconds
+
+
+def client_version(client_id) -> int:
+    """Versión del último cambio visto para el cliente (0 = ninguno)"""
+    return _versions.get(str(client_id), 0)
+
+
+def _apply_change(client_id: str, kind: str, version: int):
+    """Sube la versión y corre los invalidadores (local o recibido por NOTIFY)"""
+    with _versions_lock:
+        if client_id == ALL_CLIENTS:
+            for key in _versions:
+                _versions[key] = max(_versions[key], version)
+        else:
+            _versions[client_id] = max(_versions.get(client_id, 0), version)
+
+    for kinds, callback in list(_invalidators):
+        if kind != ALL_CLIENTS and kinds is not None and kind not in kinds:
+            continue
+        try:
+            callback(client_id, kind)
+        except Exception as e:
+            logger.warning("Invalidador %s falló para %s:%s: %s",
+                           getattr(callback, '__name__', callback), client_id, kind, e)
+
+
+def _parse_payload(payload: str):
+    parts = (payload or '').split(':')
+    if len(parts) != 3 or not parts[0] or not parts[1]:
+        return None
+    try:
+        return parts[0], parts[1], int(parts[2])
+    except ValueError:
+        return None
+
+
+def notify_changes(changes: Iterable, bind=None):
+    """
+    Invalida localmente y publica los cambios para los demás workers
+
+    Args:
+        changes: Iterable de (client_id, kind)
+        bind: Engine/Connection a usar para el NOTIFY (None = engine de la app)
+    """
+    changes = {(str(client_id), kind) for client_id, kind in changes if client_id}
+    if not changes:
+        return
+
+    version = int(time.time() * 1000)
+    for client_id, kind in changes:
+        _apply_change(client_id, kind, version)
+
+    engine = bind if bind is not None else _engine
+    if engine is None or getattr(getattr(engine, 'dialect', None), 'name', None) != 'postgresql':
+        return
+
+    from sqlalchemy import text
+    try:
+        with engine.connect() as conn:
+            for client_id, kind in changes:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {'channel': _channel, 'payload': f"{client_id}:{kind}:{version}"})
+            conn.commit()
+        CHANGE_NOTIFICATIONS.inc('sent', amount=len(changes))
+    except Exception as e:
+        # Los demás workers se enteran por TTL
+        logger.warning("No se pudo emitir NOTIFY %s: %s", _channel, e)
+
+
+def notify_change(client_id, kind: str):
+    """Publica un cambio puntual (ej: snapshot del índice publicado)"""
+    notify_changes([(client_id, kind)])
+
+
+# ----------------------------------------------------------------------
+# Hooks de sesión (writers)
+# ----------------------------------------------------------------------
+
+def _collect_changes(session, flush_context=None, instances=None):
+    changes = session.info.setdefault('_change_notifier', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        mapping = MODEL_KINDS.get(type(obj).__name__)
+        if mapping is None:
+            continue
+        kind, attr = mapping
+        client_id = getattr(obj, attr, None)
+        if client_id:
+            changes.add((str(client_id), kind))
+
+
+def _publish_changes(session):
+    changes = session.info.pop('_change_notifier', None)
+    if changes:
+        notify_changes(changes)
+
+
+def _discard_changes(session):
+    session.info.pop('_change_notifier', None)
+
+
+# ----------------------------------------------------------------------
+# Listener (un thread por worker)
+# ----------------------------------------------------------------------
+
+def _listen_once():
+    """Abre una conexión dedicada, hace LISTEN y procesa notificaciones hasta que se corte"""
+    raw = _engine.raw_connection()
+    raw.detach()  # Conexión propia: no vuelve al pool
+    conn = raw.driver_connection
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{_channel}"')
+
+        _listening.set()
+        logger.info("📡 Escuchando %s", _channel)
+        # Pudimos perder cambios mientras no había listener
+        _apply_change(ALL_CLIENTS, ALL_CLIENTS, int(time.time() * 1000))
+
+        last_keepalive = time.monotonic()
+        while True:
+            readable, _, _ = select.select([conn], [], [], KEEPALIVE_SECONDS)
+            if readable:
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    parsed = _parse_payload(notification.payload)
+                    if parsed is None:
+                        logger.warning("Payload de %s inválido: %r", _channel, notification.payload)
+                        continue
+                    CHANGE_NOTIFICATIONS.inc('received')
+                    _apply_change(*parsed)
+            if time.monotonic() - last_keepalive >= KEEPALIVE_SECONDS:
+                # Detecta conexiones caídas sin tráfico
+                with conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                last_keepalive = time.monotonic()
+    finally:
+        _listening.clear()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _listener_loop():
+    while True:
+        try:
+            _listen_once()
+        except Exception as e:
+            was_listening = _listening.is_set()
+            _listening.clear()
+            logger.warning("Listener de %s desconectado (%s), reintento en %ss", _channel, e, RECONNECT_SECONDS)
+            if was_listening:
+                # Lo cacheado con TTL largo puede quedar viejo: vaciar y pasar a TTL corto
+                _apply_change(ALL_CLIENTS, ALL_CLIENTS, int(time.time() * 1000))
+        time.sleep(RECONNECT_SECONDS)
+
+
+def init_change_notifier(app):
+    """
+    Engancha los hooks de sesión y arranca el listener (llamar desde create_app)
+
+    Sin Postgres (o con enabled=false) solo se invalida en el worker local y los
+    caches usan fallback_ttl_seconds.
+    """
+    global _engine, _channel, _ttl_seconds, _fallback_ttl_seconds, _listener_thread
+    if _engine is not None:
+        return
+
+    try:
+        from app.utils.system_config import system_config
+        section = system_config.get_section('change_notifications') or {}
+    except Exception:
+        section = {}
+    _channel = section.get('channel', CHANNEL)
+    _ttl_seconds = float(section.get('ttl_seconds', DEFAULT_TTL_SECONDS))
+    _fallback_ttl_seconds = float(section.get('fallback_ttl_seconds', DEFAULT_FALLBACK_TTL_SECONDS))
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from app import db
+
+    with app.app_context():
+        _engine = db.engine
+
+    event.listen(Session, 'before_flush', _collect_changes)
+    event.listen(Session, 'after_commit', _publish_changes)
+    event.listen(Session, 'after_rollback', _discard_changes)
+
+    if not section.get('enabled', True) or _engine.dialect.name != 'postgresql':
+        logger.info("LISTEN/NOTIFY deshabilitado: caches con TTL de %ss", _fallback_ttl_seconds)
+        return
+
+    _listener_thread = threading.Thread(target=_listener_loop, name="change-notifier", daemon=True)
+    _listener_thread.start()
@@ -0,0 +1,325 @@
+"""
+Backends de inferencia CLIP
+
+Permite elegir cómo se ejecutan las torres de visión y texto de CLIP:
+1. pytorch: CLIPModel en fp32 (comportamiento histórico)
+2. pytorch_int8: CLIPModel con cuantización dinámica int8 de las capas Linear (solo CPU)
+3. onnx: torres exportadas a ONNX y ejecutadas con ONNX Runtime (CPU)
+4. stub: vectores deterministas por hash (tests, CI y benchmarks; sin descargar pesos)
+
+El backend se selecciona en system_config.json:
+    "clip": {"backend": "onnx", "onnx_dir": "models/clip_onnx", "onnx_threads": 2}
+
+stub solo se habilita con la variable de entorno CLIP_BACKEND=stub: desde
+system_config (panel de administración) escribiría vectores falsos en
+Image.clip_embedding sin nada que los distinga de los reales.
+
+Todos los backends exponen la misma interfaz que usa el resto del código
+(get_image_features, get_text_features y __call__ con image_embeds/text_embeds),
+por lo que los callers de get_clip_model() no necesitan cambios.
+
+Los artefactos ONNX se generan con tools/maintenance/clip_backend_tool.py.
+"""
+
+import os
+import json
+import logging
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+logger = logging.getLogger("clip_model")
+
+BACKEND_PYTORCH = 'pytorch'
+BACKEND_PYTORCH_INT8 = 'pytorch_int8'
+BACKEND_ONNX = 'onnx'
+BACKEND_STUB = 'stub'
+
+CLIP_BACKENDS = (BACKEND_PYTORCH, BACKEND_PYTORCH_INT8, BACKEND_ONNX, BACKEND_STUB)
+# Backends seleccionables desde system_config (stub solo por CLIP_BACKEND)
+CONFIGURABLE_BACKENDS = (BACKEND_PYTORCH, BACKEND_PYTORCH_INT8, BACKEND_ONNX)
+
+ONNX_MANIFEST_NAME = 'manifest.json'
+
+# Raíz del proyecto (misma convención que SystemConfig)
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+
+
+def get_configured_backend() -> str:
+    """
+    Obtiene el backend configurado en system_config['clip']['backend'].
+
+    Prioridad: variable de entorno CLIP_BACKEND > system_config > 'pytorch'
+    (stub solo por variable de entorno)
+    """
+    backend = os.getenv('CLIP_BACKEND')
+    allowed = CLIP_BACKENDS
+    if not backend:
+        allowed = CONFIGURABLE_BACKENDS
+        try:
+            from app.utils.system_config import system_config
+            backend = system_config.get_section('clip').get('backend', BACKEND_PYTORCH)
+        except Exception:
+            backend = BACKEND_PYTORCH
+
+    backend = (backend or BACKEND_PYTORCH).strip().lower()
+    if backend not in allowed:
+        logger.warning(f"⚠️ Backend CLIP '{backend}' no permitido o desconocido, usando '{BACKEND_PYTORCH}'")
+        return BACKEND_PYTORCH
+    return backend
+
+
+def is_stub_backend() -> bool:
+    """True si la app corre con encoders stub (CLIP y MiniLM)"""
+    return get_configured_backend() == BACKEND_STUB
+
+
+def model_slug(model_id: str) -> str:
+    """Convierte un id HuggingFace en nombre de carpeta (openai/clip-vit-base-patch16 -> openai__clip-vit-base-patch16)"""
+    return model_id.replace('/', '__')
+
+
+def get_onnx_dir(model_id: str, base_dir: Optional[str] = None) -> Path:
+    """
+    Carpeta donde viven los artefactos ONNX de un modelo.
+
+    Args:
+        model_id: Identificador HuggingFace del modelo
+        base_dir: Carpeta base (si es None se lee de system_config['clip']['onnx_dir'])
+
+    Returns:
+        Path a la carpeta del modelo
+    """
+    if base_dir is None:
+        try:
+            from app.utils.system_config import system_config
+            base_dir = system_config.get_section('clip').get('onnx_dir', 'models/clip_onnx')
+        except Exception:
+            base_dir = 'models/clip_onnx'
+
+    base_path = Path(base_dir)
+    if not base_path.is_absolute():
+        base_path = _PROJECT_ROOT / base_path
+    return base_path / model_slug(model_id)
+
+
+def read_onnx_manifest(onnx_dir: Path) -> Optional[dict]:
+    """Lee el manifest de una exportación ONNX (None si no existe)"""
+    manifest_path = Path(onnx_dir) / ONNX_MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class OnnxClipModel:
+    """
+    Adaptador de ONNX Runtime con la interfaz de CLIPModel que usa la app.
+
+    Devuelve tensores torch para que el código existente (.norm, .cpu().numpy(), @)
+    siga funcionando sin cambios.
+    """
+
+    def __init__(self, onnx_dir: Path, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        self.onnx_dir = Path(onnx_dir)
+        self.manifest = read_onnx_manifest(self.onnx_dir)
+        if not self.manifest:
+            raise FileNotFoundError(f"No existe {ONNX_MANIFEST_NAME} en {self.onnx_dir}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+
+        providers = ['CPUExecutionProvider']
+        self._vision = ort.InferenceSession(
+            str(self.onnx_dir / self.manifest['vision_file']), options, providers=providers
+        )
+        self._text = ort.InferenceSession(
+            str(self.onnx_dir / self.manifest['text_file']), options, providers=providers
+        )
+        self._text_inputs = {i.name for i in self._text.get_inputs()}
+        self.logit_scale = float(self.manifest.get('logit_scale', 100.0))
+        self.model_id = self.manifest.get('model_id')
+
+    # Compatibilidad con el uso de CLIPModel en la app
+    def eval(self):
+        return self
+
+    def cuda(self):
+        return self
+
+    def to(self, *args, **kwargs):
+        return self
+
+    @staticmethod
+    def _to_numpy(tensor, dtype):
+        import numpy as np
+        if hasattr(tensor, 'detach'):
+            tensor = tensor.detach().cpu().numpy()
+        return np.ascontiguousarray(tensor, dtype=dtype)
+
+    def get_image_features(self, pixel_values=None, **kwargs):
+        import numpy as np
+        import torch
+
+        feeds = {'pixel_values': self._to_numpy(pixel_values, np.float32)}
+        outputs = self._vision.run(None, feeds)
+        return torch.from_numpy(outputs[0])
+
+    def get_text_features(self, input_ids=None, attention_mask=None, **kwargs):
+        import numpy as np
+        import torch
+
+        ids = self._to_numpy(input_ids, np.int64)
+        feeds = {'input_ids': ids}
+        if 'attention_mask' in self._text_inputs:
+            mask = np.ones_like(ids) if attention_mask is None else self._to_numpy(attention_mask, np.int64)
+            feeds['attention_mask'] = mask
+        outputs = self._text.run(None, feeds)
+        return torch.from_numpy(outputs[0])
+
+    def __call__(self, input_ids=None, pixel_values=None, attention_mask=None, **kwargs):
+        """Equivalente a CLIPModel.forward: embeddings normalizados + logits"""
+        image_embeds = self.get_image_features(pixel_values=pixel_values)
+        text_embeds = self.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+        image_embeds = image_embeds / image_embeds.norm(dim=-1, keepdim=True)
+        text_embeds = text_embeds / text_embeds.norm(dim=-1, keepdim=True)
+
+        logits_per_text = (text_embeds @ image_embeds.T) * self.logit_scale
+        return SimpleNamespace(
+            image_embeds=image_embeds,
+            text_embeds=text_embeds,
+            logits_per_text=logits_per_text,
+            logits_per_image=logits_per_text.T,
+        )
+
+
+def _batch_size(tensor) -> int:
+    shape = getattr(tensor, 'shape', None)
+    return int(shape[0]) if shape is not None and len(shape) else 0
+
+
+class InstrumentedClipModel:
+    """
+    Envoltorio de cualquier backend que mide latencia y tamaño de batch de cada encode
+    (métricas clip_encode_duration_seconds / clip_encode_batch_size).
+
+    El resto de los atributos se delega al modelo real.
+    """
+
+    def __init__(self, model):
+        object.__setattr__(self, '_model', model)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._model, name, value)
+
+    @staticmethod
+    def _observe(kind: str, started: float, batch: int):
+        from app.core.metrics import CLIP_ENCODE_LATENCY, CLIP_ENCODE_BATCH
+        CLIP_ENCODE_LATENCY.observe(time.perf_counter() - started, kind)
+        if batch:
+            CLIP_ENCODE_BATCH.observe(batch, kind)
+
+    def get_image_features(self, pixel_values=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._model.get_image_features(pixel_values=pixel_values, **kwargs)
+        finally:
+            self._observe('image', started, _batch_size(pixel_values))
+
+    def get_text_features(self, input_ids=None, attention_mask=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._model.get_text_features(input_ids=input_ids, attention_mask=attention_mask, **kwargs)
+        finally:
+            self._observe('text', started, _batch_size(input_ids))
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._model(*args, **kwargs)
+        finally:
+            self._observe('image_text', started, _batch_size(kwargs.get('pixel_values')))
+
+
+def _load_pytorch(model_id: str):
+    from transformers import CLIPModel
+    model = CLIPModel.from_pretrained(model_id)
+    model.eval()
+    return model
+
+
+def _quantize_dynamic_int8(model):
+    """Cuantización dinámica int8 de las capas Linear (pesos int8, activaciones fp32)"""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_clip_backend(model_id: str, backend: Optional[str] = None) -> Tuple[object, object, str]:
+    """
+    Carga el modelo CLIP con el backend indicado.
+
+    Si el backend pedido no está disponible (sin onnxruntime, sin artefactos
+    exportados, o int8 en GPU) se cae al backend pytorch con un warning.
+
+    Args:
+        model_id: Identificador HuggingFace (ej: 'openai/clip-vit-base-patch16')
+        backend: 'pytorch' | 'pytorch_int8' | 'onnx' | 'stub' (None = configurado)
+
+    Returns:
+        Tupla (model, processor, backend_efectivo)
+    """
+    backend = backend or get_configured_backend()
+
+    if backend == BACKEND_STUB:
+        # Sin transformers ni pesos: arranque instantáneo
+        from app.core.stub_encoders import StubClipModel, StubClipProcessor, stub_dim_for
+        logger.warning("🧪 CLIP backend STUB activo: embeddings deterministas sin significado semántico")
+        return StubClipModel(stub_dim_for(model_id), model_id=model_id), StubClipProcessor(), BACKEND_STUB
+
+    from transformers import CLIPProcessor
+    import torch
+
+    started = time.time()
+    processor = CLIPProcessor.from_pretrained(model_id)
+
+    if backend == BACKEND_ONNX:
+        try:
+            threads = None
+            try:
+                from app.utils.system_config import system_config
+                threads = system_config.get_section('clip').get('onnx_threads')
+            except Exception:
+                pass
+            model = OnnxClipModel(get_onnx_dir(model_id), threads=threads)
+            if model.model_id and model.model_id != model_id:
+                raise ValueError(f"Artefactos ONNX son de {model.model_id}, se esperaba {model_id}")
+            logger.info(f"✅ CLIP backend ONNX cargado en {time.time() - started:.1f}s")
+            return model, processor, BACKEND_ONNX
+        except ImportError:
+            logger.warning("⚠️ onnxruntime no instalado (pip install -r requirements-onnx.txt), usando backend pytorch")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo cargar backend ONNX ({e}), usando backend pytorch")
+        backend = BACKEND_PYTORCH
+
+    model = _load_pytorch(model_id)
+
+    if backend == BACKEND_PYTORCH_INT8:
+        if torch.cuda.is_available():
+            # Los kernels cuantizados dinámicos son solo CPU
+            logger.warning("⚠️ pytorch_int8 solo aplica en CPU, usando fp32 en GPU")
+            backend = BACKEND_PYTORCH
+        else:
+            model = _quantize_dynamic_int8(model)
+            model.eval()
+
+    logger.info(f"✅ CLIP backend {backend} cargado en {time.time() - started:.1f}s")
+    return model, processor, backend
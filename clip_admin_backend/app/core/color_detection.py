@@ -0,0 +1,511 @@
+"""
+Detección de color dominante en dos niveles
+
+Nivel 1 (pixel): estadística de píxeles con NumPy, sin CLIP.
+    - Decodifica la imagen reducida (draft de JPEG + thumbnail de thumbnail_size px)
+    - Pondera los píxeles hacia el centro y baja el peso del fondo liso (borde uniforme)
+    - k-means ponderado en CIELAB y cada cluster se compara contra prototipos
+      Lab de los colores canónicos (AZUL, NEGRO, BEIGE, ...) de la paleta del cliente
+    Tarda unos pocos milisegundos y funciona también con APP_MODE=admin.
+
+Nivel 2 (clip): solo si el nivel 1 es ambiguo (dos colores muy parejos, poca
+cobertura, o colores de la paleta sin color canónico). Compara la imagen con
+los prompts "a photo of {color} product" de los candidatos; los embeddings de
+texto de la paleta se cachean por modelo, así que solo corre la torre de visión.
+
+La paleta sale de los colores de los productos (attributes->>'color'); cada color
+crudo se mapea a su canónico con ColorMapping (normalized_color/similarity_group)
+o normalize_color(). Se cachea por cliente/categoría y se invalida con los cambios
+de catálogo (app/core/change_notifier.py).
+
+Uso:
+    from app.core.color_detection import get_client_palette, detect_color
+
+    palette = get_client_palette(client_id, category_id)
+    color, confidence, tier = detect_color(image_data, palette)
+
+Configuración en system_config.json (todas opcionales):
+    "color_detection": {"engine": "auto", "thumbnail_size": 64, "clusters": 4,
+                        "ambiguity_margin": 0.15, "min_coverage": 0.25, "clip_fallback": true}
+    engine: auto (pixel y CLIP si es ambiguo) | pixel (nunca CLIP) | clip (siempre CLIP)
+"""
+import io
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import CACHE_REQUESTS, COLOR_DETECTIONS
+from app.core.stage_profiler import stage
+from app.core.change_notifier import (
+    ALL_CLIENTS, KIND_CATALOG, cache_ttl, client_version, register_invalidator
+)
+
+logger = logging.getLogger("color_detection")
+
+ENGINE_AUTO = 'auto'
+ENGINE_PIXEL = 'pixel'
+ENGINE_CLIP = 'clip'
+
+TIER_PIXEL = 'pixel'
+TIER_CLIP = 'clip'
+TIER_NONE = 'none'
+
+UNKNOWN_COLOR = 'unknown'
+
+DEFAULT_THUMBNAIL_SIZE = 64
+DEFAULT_CLUSTERS = 4
+DEFAULT_AMBIGUITY_MARGIN = 0.15
+DEFAULT_MIN_COVERAGE = 0.25
+KMEANS_ITERATIONS = 8
+
+# Dispersión (ΔE) de la afinidad cluster -> prototipo
+AFFINITY_SIGMA = 18.0
+# Borde con ΔE mediano menor a esto se considera fondo liso
+BACKGROUND_SPREAD = 8.0
+# Píxeles a menos de este ΔE del fondo pesan BACKGROUND_WEIGHT
+BACKGROUND_DELTA_E = 12.0
+BACKGROUND_WEIGHT = 0.05
+# Desvío de la campana de peso central (en unidades de medio ancho de la imagen)
+CENTER_SIGMA = 0.5
+
+PALETTE_CACHE_MAX = 512
+PROMPT_CACHE_MAX = 1024
+
+# Prototipos sRGB de los colores canónicos de normalize_color() (varios tonos por color)
+COLOR_PROTOTYPES_RGB = {
+    'NEGRO': [(20, 20, 20), (45, 45, 50)],
+    'BLANCO': [(245, 245, 245), (225, 225, 220)],
+    'GRIS': [(128, 128, 128), (90, 90, 95), (180, 180, 180)],
+    'PLATEADO': [(192, 192, 200)],
+    'AZUL': [(25, 45, 110), (40, 90, 180), (120, 170, 220), (70, 100, 140)],
+    'TURQUESA': [(64, 200, 200), (0, 128, 128)],
+    'VERDE': [(40, 140, 60), (100, 160, 80), (60, 80, 45)],
+    'ROJO': [(200, 30, 35), (130, 20, 30)],
+    'ROSA': [(240, 150, 180), (220, 60, 140)],
+    'MORADO': [(110, 50, 140), (180, 140, 210)],
+    'NARANJA': [(240, 130, 40)],
+    'AMARILLO': [(245, 215, 50), (200, 170, 50)],
+    'DORADO': [(200, 165, 70)],
+    'MARRON': [(110, 70, 40), (150, 100, 60), (70, 45, 30)],
+    'BEIGE': [(220, 200, 165), (200, 180, 140)],
+}
+
+# La config se relee cada CONFIG_TTL_SECONDS (system_config lee el JSON en cada get)
+CONFIG_TTL_SECONDS = 30
+
+_config_lock = threading.Lock()
+_config_cache = None
+_config_expires = 0.0
+
+# Paletas por (client_id, category_id): {clave: (expira_monotonic, Palette)}
+_client_palettes = {}
+# Paletas sin cliente (detect_dominant_color_from_palette con lista suelta)
+_list_palettes = OrderedDict()
+_palette_lock = threading.Lock()
+
+# Embeddings de texto de los prompts de color: {(modelo, prompt): vector normalizado}
+_prompt_embeddings = OrderedDict()
+_prompt_lock = threading.Lock()
+
+
+def _get_config() -> dict:
+    global _config_cache, _config_expires
+    now = time.monotonic()
+    if _config_cache is not None and now < _config_expires:
+        return _config_cache
+    with _config_lock:
+        if _config_cache is None or now >= _config_expires:
+            try:
+                from app.utils.system_config import system_config
+                _config_cache = system_config.get_section('color_detection') or {}
+            except Exception:
+                _config_cache = {}
+            _config_expires = now + CONFIG_TTL_SECONDS
+    return _config_cache
+
+
+# ----------------------------------------------------------------------
+# Espacio de color
+# ----------------------------------------------------------------------
+
+_SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+], dtype=np.float32)
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Convierte sRGB uint8 (..., 3) a CIELAB D65 (..., 3) float32"""
+    c = np.asarray(rgb, dtype=np.float32) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = (linear @ _SRGB_TO_XYZ.T) / _D65_WHITE
+    delta = 6.0 / 29.0
+    f = np.where(xyz > delta ** 3, np.cbrt(xyz), xyz / (3 * delta ** 2) + 4.0 / 29.0)
+    lab = np.empty_like(f)
+    lab[..., 0] = 116.0 * f[..., 1] - 16.0
+    lab[..., 1] = 500.0 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200.0 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+COLOR_PROTOTYPES_LAB = {
+    name: rgb_to_lab(np.array(values, dtype=np.uint8)) for name, values in COLOR_PROTOTYPES_RGB.items()
+}
+
+
+# ----------------------------------------------------------------------
+# Paleta del cliente
+# ----------------------------------------------------------------------
+
+class Palette:
+    """Colores crudos de una paleta y su agrupación por color canónico"""
+
+    __slots__ = ('colors', 'canonical', 'unmapped')
+
+    def __init__(self, colors: Iterable[str], mappings: Optional[dict] = None):
+        """
+        Args:
+            colors: Colores crudos (como están en los productos)
+            mappings: {RAW_COLOR: (normalized_color, similarity_group)} de ColorMapping
+        """
+        self.colors = list(dict.fromkeys(str(c).strip() for c in colors if c and str(c).strip()))
+        self.canonical = {}   # {canónico: [crudos]}
+        self.unmapped = []    # crudos sin prototipo (solo los puede resolver CLIP)
+        for raw in self.colors:
+            canonical = _canonical_color(raw, mappings)
+            if canonical in COLOR_PROTOTYPES_LAB:
+                self.canonical.setdefault(canonical, []).append(raw)
+            else:
+                self.unmapped.append(raw)
+
+    def __len__(self):
+        return len(self.colors)
+
+    def raw_for(self, canonical: str) -> str:
+        """Color crudo a devolver para un canónico (el que coincide exacto, o el primero)"""
+        raws = self.canonical[canonical]
+        for raw in raws:
+            if raw.upper() == canonical:
+                return raw
+        return raws[0]
+
+
+def _canonical_color(raw: str, mappings: Optional[dict]) -> Optional[str]:
+    from app.utils.colors import normalize_color
+
+    candidates = []
+    if mappings:
+        candidates.extend(c for c in mappings.get(raw.upper(), ()) if c)
+    candidates.append(raw)
+    for candidate in candidates:
+        # Sin LLM: la paleta se arma en el camino de la request
+        canonical = normalize_color(candidate, use_llm=False)
+        if canonical in COLOR_PROTOTYPES_LAB:
+            return canonical
+    return None
+
+
+def palette_from_list(colors: Iterable[str]) -> Palette:
+    """Paleta de una lista suelta de colores (cacheada por contenido)"""
+    key = tuple(sorted({str(c).strip() for c in colors if c and str(c).strip()}))
+    with _palette_lock:
+        palette = _list_palettes.get(key)
+        if palette is not None:
+            _list_palettes.move_to_end(key)
+            return palette
+    palette = Palette(key)
+    with _palette_lock:
+        _list_palettes[key] = palette
+        while len(_list_palettes) > PALETTE_CACHE_MAX:
+            _list_palettes.popitem(last=False)
+    return palette
+
+
+def _load_client_palette(client_id, category_id=None) -> Palette:
+    from sqlalchemy import text
+    from app import db
+    from app.models.color_mapping import ColorMapping
+
+    params = {"client_id": client_id}
+    category_filter = ""
+    if category_id is not None:
+        category_filter = "AND category_id = :category_id"
+        params["category_id"] = category_id
+    rows = db.session.execute(
+        text(
+            f"""
+            SELECT DISTINCT UPPER(TRIM(attributes->>'color')) AS color
+            FROM products
+            WHERE client_id = :client_id
+              {category_filter}
+              AND attributes ? 'color'
+              AND NULLIF(TRIM(attributes->>'color'), '') IS NOT NULL
+            """
+        ),
+        params,
+    ).fetchall()
+
+    mappings = {}
+    try:
+        for mapping in ColorMapping.query.filter_by(client_id=client_id).all():
+            mappings[(mapping.raw_color or '').strip().upper()] = (mapping.normalized_color, mapping.similarity_group)
+    except Exception as e:
+        logger.debug("Sin ColorMapping para cliente %s: %s", client_id, e)
+
+    return Palette((r[0] for r in rows if r[0]), mappings)
+
+
+def get_client_palette(client_id, category_id=None) -> Palette:
+    """
+    Paleta de colores del cliente (o de una categoría), cacheada
+
+    Se invalida cuando cualquier worker commitea cambios de productos/imágenes del cliente.
+    """
+    key = (str(client_id), str(category_id) if category_id is not None else None)
+    entry = _client_palettes.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        CACHE_REQUESTS.inc('color_palette', 'hit')
+        return entry[1]
+
+    CACHE_REQUESTS.inc('color_palette', 'miss')
+    version = client_version(key[0])
+    palette = _load_client_palette(client_id, category_id)
+    # Si llegó una invalidación mientras se consultaba, no guardar una paleta vieja
+    if client_version(key[0]) == version:
+        with _palette_lock:
+            _client_palettes[key] = (time.monotonic() + cache_ttl(), palette)
+            if len(_client_palettes) > PALETTE_CACHE_MAX:
+                _client_palettes.pop(next(iter(_client_palettes)))
+    return palette
+
+
+def _invalidate_client_palettes(client_id: str, kind: str):
+    with _palette_lock:
+        if client_id == ALL_CLIENTS:
+            _client_palettes.clear()
+        else:
+            for key in [key for key in _client_palettes if key[0] == client_id]:
+                _client_palettes.pop(key, None)
+
+
+register_invalidator(_invalidate_client_palettes, kinds=(KIND_CATALOG,))
+
+
+# ----------------------------------------------------------------------
+# Nivel 1: estadística de píxeles
+# ----------------------------------------------------------------------
+
+def _load_pixels(image_data: bytes, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Imagen reducida como (píxeles RGB uint8 (H, W, 3), alfa (H, W) en [0, 1])"""
+    from PIL import Image as PILImage
+
+    image = PILImage.open(io.BytesIO(image_data))
+    # JPEG: decodifica directamente a 1/2, 1/4 u 1/8 de la resolución
+    image.draft('RGB', (size * 2, size * 2))
+    if image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+    else:
+        image = image.convert('RGB')
+    image.thumbnail((size, size))
+
+    pixels = np.asarray(image, dtype=np.uint8)
+    if pixels.shape[-1] == 4:
+        return pixels[..., :3], pixels[..., 3].astype(np.float32) / 255.0
+    return pixels, np.ones(pixels.shape[:2], dtype=np.float32)
+
+
+def _pixel_weights(lab: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """Peso por píxel: campana central x alfa, con el fondo liso casi anulado"""
+    height, width = lab.shape[:2]
+    ys = np.linspace(-1.0, 1.0, height, dtype=np.float32)[:, None]
+    xs = np.linspace(-1.0, 1.0, width, dtype=np.float32)[None, :]
+    weights = np.exp(-(xs ** 2 + ys ** 2) / (2 * CENTER_SIGMA ** 2)) * alpha
+
+    # Fondo: mediana del borde, solo si el borde es parejo (foto de producto sobre fondo liso)
+    border = np.concatenate([lab[0], lab[-1], lab[1:-1, 0], lab[1:-1, -1]])
+    border = border[np.concatenate([alpha[0], alpha[-1], alpha[1:-1, 0], alpha[1:-1, -1]]) > 0.5]
+    if len(border):
+        background = np.median(border, axis=0)
+        if np.median(np.linalg.norm(border - background, axis=1)) < BACKGROUND_SPREAD:
+            is_background = np.linalg.norm(lab - background, axis=-1) < BACKGROUND_DELTA_E
+            foreground = np.where(is_background, weights * BACKGROUND_WEIGHT, weights)
+            # Producto del mismo color que el fondo: quedarse con la campana central
+            if foreground.sum() > 0.05 * weights.sum():
+                weights = foreground
+    return weights
+
+
+def _weighted_kmeans(points: np.ndarray, weights: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k-means ponderado (init k-means++ determinístico) -> (centros (k, 3), masa relativa (k))"""
+    k = max(1, min(k, len(points)))
+    rng = np.random.default_rng(0)
+    centers = [points[np.argmax(weights)]]
+    for _ in range(1, k):
+        distances = ((points[:, None, :] - np.array(centers)[None]) ** 2).sum(-1).min(axis=1)
+        probabilities = (distances * weights).astype(np.float64)
+        if probabilities.sum() <= 0:
+            break
+        centers.append(points[rng.choice(len(points), p=probabilities / probabilities.sum())])
+    centers = np.array(centers, dtype=np.float32)
+
+    for _ in range(KMEANS_ITERATIONS):
+        labels = ((points[:, None, :] - centers[None]) ** 2).sum(-1).argmin(axis=1)
+        mass = np.bincount(labels, weights=weights, minlength=len(centers))
+        sums = np.stack([np.bincount(labels, weights=points[:, c] * weights, minlength=len(centers))
+                         for c in range(3)], axis=1)
+        assigned = mass > 0
+        centers[assigned] = sums[assigned] / mass[assigned, None]
+
+    total = mass.sum()
+    return centers, (mass / total if total > 0 else mass)
+
+
+def pixel_color_scores(image_data: bytes, canonical_colors: Iterable[str], size: Optional[int] = None,
+                       clusters: Optional[int] = None) -> dict:
+    """
+    Afinidad de la imagen con cada color canónico (nivel 1)
+
+    Returns:
+        {canónico: fracción de la masa de la imagen cercana a ese color} (0..1, no suman 1)
+    """
+    config = _get_config()
+    size = int(size or config.get('thumbnail_size', DEFAULT_THUMBNAIL_SIZE))
+    clusters = int(clusters or config.get('clusters', DEFAULT_CLUSTERS))
+
+    rgb, alpha = _load_pixels(image_data, size)
+    lab = rgb_to_lab(rgb)
+    weights = _pixel_weights(lab, alpha)
+
+    flat_weights = weights.reshape(-1)
+    keep = flat_weights > 1e-4
+    centers, mass = _weighted_kmeans(lab.reshape(-1, 3)[keep], flat_weights[keep], clusters)
+
+    scores = {}
+    for canonical in canonical_colors:
+        prototypes = COLOR_PROTOTYPES_LAB[canonical]
+        distances = np.linalg.norm(centers[:, None, :] - prototypes[None], axis=-1).min(axis=1)
+        affinity = np.exp(-distances ** 2 / (2 * AFFINITY_SIGMA ** 2))
+        scores[canonical] = float((mass * affinity).sum())
+    return scores
+
+
+# ----------------------------------------------------------------------
+# Nivel 2: CLIP con prompts cacheados
+# ----------------------------------------------------------------------
+
+def _prompt(color: str) -> str:
+    return f"a photo of {color.lower()} product"
+
+
+def _prompt_matrix(colors: list, model, processor) -> np.ndarray:
+    """Embeddings de texto normalizados de los prompts (solo se codifican los que faltan)"""
+    from app.core.model_versions import active_model_name
+    from app.utils.lazy_imports import lazy_import
+    torch = lazy_import('torch')
+
+    model_name = active_model_name()
+    keys = [(model_name, _prompt(color)) for color in colors]
+    with _prompt_lock:
+        missing = [key for key in keys if key not in _prompt_embeddings]
+    if missing:
+        CACHE_REQUESTS.inc('color_prompt', 'miss', amount=len(missing))
+        with torch.no_grad():
+            inputs = processor(text=[prompt for _, prompt in missing], return_tensors="pt", padding=True)
+            features = model.get_text_features(**inputs)
+            features = features / features.norm(dim=-1, keepdim=True)
+        with _prompt_lock:
+            for key, vector in zip(missing, features.float().cpu().numpy()):
+                _prompt_embeddings[key] = vector
+            while len(_prompt_embeddings) > PROMPT_CACHE_MAX:
+                _prompt_embeddings.popitem(last=False)
+    if len(keys) > len(missing):
+        CACHE_REQUESTS.inc('color_prompt', 'hit', amount=len(keys) - len(missing))
+    with _prompt_lock:
+        return np.stack([_prompt_embeddings[key] for key in keys])
+
+
+def clip_color_scores(image_data: bytes, colors: list) -> dict:
+    """Similitud coseno imagen <-> "a photo of {color} product" para cada color crudo (nivel 2)"""
+    from PIL import Image as PILImage
+    from app.blueprints.embeddings import get_clip_model
+    from app.utils.lazy_imports import lazy_import
+    torch = lazy_import('torch')
+
+    model, processor = get_clip_model()
+    text_matrix = _prompt_matrix(colors, model, processor)
+
+    image = PILImage.open(io.BytesIO(image_data))
+    image.load()
+    with torch.no_grad():
+        features = model.get_image_features(**processor(images=image, return_tensors="pt"))
+        features = features / features.norm(dim=-1, keepdim=True)
+    similarities = text_matrix @ features[0].float().cpu().numpy()
+    return dict(zip(colors, (float(s) for s in similarities)))
+
+
+# ----------------------------------------------------------------------
+# Detección
+# ----------------------------------------------------------------------
+
+def detect_color(image_data: bytes, palette: Palette) -> Tuple[str, float, str]:
+    """
+    Color dominante de la imagen dentro de la paleta
+
+    Returns:
+        Tupla (color crudo de la paleta | 'unknown', confianza, nivel 'pixel'|'clip'|'none')
+        Confianza del nivel pixel: fracción de la afinidad total; del nivel clip: coseno.
+    """
+    if not len(palette):
+        COLOR_DETECTIONS.inc(TIER_NONE)
+        return UNKNOWN_COLOR, 0.0, TIER_NONE
+
+    config = _get_config()
+    engine = (config.get('engine') or ENGINE_AUTO).lower()
+    margin = float(config.get('ambiguity_margin', DEFAULT_AMBIGUITY_MARGIN))
+    min_coverage = float(config.get('min_coverage', DEFAULT_MIN_COVERAGE))
+
+    best = None           # (crudo, confianza) del nivel pixel
+    candidates = list(palette.colors)
+    if engine != ENGINE_CLIP and palette.canonical:
+        try:
+            with stage('color_pixel'):
+                scores = pixel_color_scores(image_data, palette.canonical.keys())
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            total = sum(score for _, score in ranked)
+            if total > 0:
+                top_color, top_score = ranked[0]
+                share = top_score / total
+                second_share = ranked[1][1] / total if len(ranked) > 1 else 0.0
+                best = (palette.raw_for(top_color), share)
+                logger.debug("Color pixel: %s share=%.3f segundo=%.3f cobertura=%.3f",
+                             top_color, share, second_share, top_score)
+                decisive = share - second_share >= margin and top_score >= min_coverage
+                if (decisive and not palette.unmapped) or engine == ENGINE_PIXEL:
+                    COLOR_DETECTIONS.inc(TIER_PIXEL)
+                    return best[0], round(share, 4), TIER_PIXEL
+                # Ambiguo: CLIP decide entre los mejores del nivel 1 y los colores sin prototipo
+                candidates = [palette.raw_for(color) for color, _ in ranked[:3]] + palette.unmapped
+        except Exception as e:
+            logger.warning("Detección de color por píxeles falló: %s", e)
+
+    if engine == ENGINE_PIXEL or (engine == ENGINE_AUTO and not config.get('clip_fallback', True)):
+        COLOR_DETECTIONS.inc(TIER_PIXEL if best else TIER_NONE)
+        return (best[0], round(best[1], 4), TIER_PIXEL) if best else (UNKNOWN_COLOR, 0.0, TIER_NONE)
+
+    try:
+        with stage('color_clip'):
+            similarities = clip_color_scores(image_data, candidates)
+        color, similarity = max(similarities.items(), key=lambda item: item[1])
+        COLOR_DETECTIONS.inc(TIER_CLIP)
+        return color, similarity, TIER_CLIP
+    except Exception as e:
+        # Sin CLIP (APP_MODE=admin, error de carga): quedarse con el nivel 1
+        logger.warning("Detección de color con CLIP falló: %s", e)
+        COLOR_DETECTIONS.inc(TIER_PIXEL if best else TIER_NONE)
+        return (best[0], round(best[1], 4), TIER_PIXEL) if best else (UNKNOWN_COLOR, 0.0, TIER_NONE)
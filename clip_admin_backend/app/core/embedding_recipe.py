@@ -0,0 +1,166 @@
+"""
+Receta de fusión de embeddings de imagen y componentes crudos
+
+El embedding buscable de una imagen (Image.clip_embedding) se arma a partir de:
+    - las features crudas de la imagen (vision tower, sin normalizar)
+    - las features de texto de hasta 3 prompts contextuales (industria, clip_prompt, tags)
+fusionadas como promedio ponderado de [imagen, 0.75*imagen + 0.25*texto_i, ...].
+
+Las features de la imagen se guardan aparte (Image.image_features), así un cambio
+de prompts, pesos o clip_prompt de una categoría se aplica a todo el catálogo
+con álgebra de vectores (tools/maintenance/refuse_embeddings.py), sin volver a
+descargar ni codificar imágenes. Las features de texto se cachean por
+(modelo, prompt): cada prompt distinto se codifica una sola vez.
+
+Cada embedding guarda la receta con la que se armó (Image.embedding_recipe,
+p.ej. "contextual_fusion/2"); RECIPE_VERSION se incrementa al cambiar prompts o
+pesos y los embeddings con otra versión quedan identificados como viejos.
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import CACHE_REQUESTS
+
+# Incrementar al cambiar create_contextual_prompts, los pesos o la fórmula de fusión
+RECIPE_VERSION = 2
+
+METHOD_SIMPLE = 'simple'
+METHOD_CONTEXTUAL = 'contextual_fusion'
+
+# Peso de la imagen dentro de cada embedding contextual (el resto es el texto)
+CONTEXT_IMAGE_WEIGHT = 0.75
+# Peso del embedding base frente a los contextuales (antes de normalizar)
+BASE_WEIGHT = 1.5
+CONTEXT_WEIGHT = 1.0
+HIGH_CONFIDENCE_THRESHOLD = 0.8
+HIGH_CONFIDENCE_BOOST = 1.2
+
+PROMPT_CACHE_MAX = 4096
+
+# Features de texto crudas: {(modelo, prompt): vector}
+_text_features = OrderedDict()
+_text_lock = threading.Lock()
+
+
+def recipe_id(method: str) -> str:
+    """Identificador de receta guardado en Image.embedding_recipe"""
+    return f"{method}/{RECIPE_VERSION}"
+
+
+def is_current(recipe: Optional[str]) -> bool:
+    """True si el embedding se armó con la receta vigente"""
+    if not recipe:
+        return False
+    method, _, version = recipe.partition('/')
+    return method in (METHOD_SIMPLE, METHOD_CONTEXTUAL) and version == str(RECIPE_VERSION)
+
+
+# ----------------------------------------------------------------------
+# Features de texto (cacheadas por prompt)
+# ----------------------------------------------------------------------
+
+def text_features(prompts: List[str], model=None, processor=None) -> np.ndarray:
+    """
+    Features de texto crudas (sin normalizar) de los prompts
+
+    Solo se codifican los prompts que no están en cache, todos en un batch.
+
+    Returns:
+        Matriz (len(prompts) x D)
+    """
+    from app.core.model_versions import active_model_name
+
+    if not prompts:
+        return np.zeros((0, 0), dtype=np.float32)
+    model_name = active_model_name()
+    keys = [(model_name, prompt) for prompt in prompts]
+    with _text_lock:
+        missing = list(OrderedDict.fromkeys(key for key in keys if key not in _text_features))
+
+    if missing:
+        if model is None or processor is None:
+            from app.blueprints.embeddings import get_clip_model
+            model, processor = get_clip_model()
+        from app.utils.lazy_imports import lazy_import
+        torch = lazy_import('torch')
+
+        CACHE_REQUESTS.inc('fusion_prompt', 'miss', amount=len(missing))
+        inputs = processor(text=[prompt for _, prompt in missing], return_tensors="pt",
+                           padding=True, truncation=True)
+        if torch.cuda.is_available():
+            inputs = {k: v.cuda() for k, v in inputs.items()}
+        with torch.no_grad():
+            features = model.get_text_features(input_ids=inputs['input_ids'],
+                                               attention_mask=inputs.get('attention_mask'))
+        with _text_lock:
+            for key, vector in zip(missing, features.float().cpu().numpy()):
+                _text_features[key] = vector
+            while len(_text_features) > PROMPT_CACHE_MAX:
+                _text_features.popitem(last=False)
+    if len(keys) > len(missing):
+        CACHE_REQUESTS.inc('fusion_prompt', 'hit', amount=len(keys) - len(missing))
+
+    with _text_lock:
+        return np.stack([_text_features[key] for key in keys])
+
+
+# ----------------------------------------------------------------------
+# Fusión (álgebra pura)
+# ----------------------------------------------------------------------
+
+def fusion_weights(count: int, context_info: dict) -> List[float]:
+    """Pesos normalizados de [base, contextual_1, ...]"""
+    weights = [BASE_WEIGHT] + [CONTEXT_WEIGHT] * (count - 1)
+
+    # Alta confianza de categoría -> más peso a los contextuales
+    category_features = context_info.get('category_features') or {}
+    if (category_features.get('confidence_threshold') or 0.75) > HIGH_CONFIDENCE_THRESHOLD:
+        weights = [weights[0]] + [w * HIGH_CONFIDENCE_BOOST for w in weights[1:]]
+
+    total = sum(weights)
+    return [w / total for w in weights]
+
+
+def contextual_components(image_features: np.ndarray, prompt_features: np.ndarray) -> List[np.ndarray]:
+    """[imagen, 0.75*imagen + 0.25*texto_i, ...] a partir de las features crudas"""
+    image_features = np.asarray(image_features, dtype=np.float32)
+    components = [image_features]
+    for text_vector in prompt_features:
+        components.append(CONTEXT_IMAGE_WEIGHT * image_features + (1.0 - CONTEXT_IMAGE_WEIGHT) * text_vector)
+    return components
+
+
+def fuse(image_features: np.ndarray, prompt_features: np.ndarray, context_info: dict) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    Embedding final normalizado a partir de los componentes crudos
+
+    Returns:
+        Tupla (embedding normalizado, componentes usados)
+    """
+    components = contextual_components(image_features, prompt_features)
+    if len(components) > 1:
+        fused = np.average(np.stack(components), axis=0, weights=fusion_weights(len(components), context_info))
+    else:
+        fused = components[0]
+    norm = np.linalg.norm(fused)
+    return (fused / norm if norm > 0 else fused), components
+
+
+def refuse(image_features: np.ndarray, prompts: List[str], context_info: dict) -> np.ndarray:
+    """
+    Recalcula el embedding de una imagen con la receta vigente sin pasar la imagen por CLIP
+
+    Args:
+        image_features: Features crudas guardadas (Image.image_features)
+        prompts: Prompts contextuales vigentes (create_contextual_prompts)
+        context_info: Contexto de la imagen (get_image_context / build_image_context)
+    """
+    if prompts:
+        prompt_features = text_features(prompts)
+    else:
+        prompt_features = np.zeros((0, len(image_features)), dtype=np.float32)
+    embedding, _ = fuse(image_features, prompt_features, context_info)
+    return embedding
@@ -0,0 +1,587 @@
+"""
+Snapshots en disco del índice de búsqueda visual (por cliente)
+
+Cada snapshot es una carpeta versionada con:
+    embeddings.npy    matriz float32 (N x D) normalizada, se abre con mmap
+    codes.npy         copia float16 o int8 de embeddings (solo storage float16/int8)
+    max_abs.npy       máximo |valor| por dimensión (solo storage float16/int8)
+    image_ids.npy     ids de imagen (N)
+    product_ids.npy   ids de producto (N)
+    category_ids.npy  ids de categoría (N, '' = sin categoría)
+    manifest.json     versión, versión del catálogo, modelo CLIP, storage, dimensiones
+
+Layout:
+    <dir>/<client_id>/v<version>/...
+    <dir>/<client_id>/CURRENT        nombre de la versión vigente (se reemplaza con os.replace)
+
+El builder escribe en una carpeta temporal y recién al final la renombra y
+actualiza CURRENT, así ningún worker ve un snapshot a medio escribir. Los
+workers releen CURRENT cada check_interval_seconds y cambian la referencia
+al snapshot nuevo; una búsqueda en curso sigue usando el que ya tenía.
+Con mmap, todos los workers de la máquina comparten las mismas páginas.
+
+Storage comprimido (float16 / int8 con escala por dimensión): cada búsqueda recorre
+codes.npy (1/2 o 1/4 de las páginas de float32) y solo algunas filas se
+re-puntúan exactas contra embeddings.npy (mmap: se leen solo esas filas):
+    - las rerank_candidates de mayor score aproximado (orden de los resultados)
+    - todas las que quedan a menos de la cota de error de cuantización del umbral
+      (ahí el score aproximado no alcanza para decidir)
+Las demás conservan el score aproximado (error <= cota): o están seguro por debajo
+del umbral o seguro por encima. Así la decisión sobre el umbral es la misma que
+con float32 para todas las filas y ninguna fila sobre el umbral se pierde.
+tools/benchmarks/snapshot_recall.py mide el recall contra la búsqueda exacta.
+
+Las reconstrucciones se programan solas al commitear cambios en Image,
+Product o Category (process_pending, recalculate_all_centroids, ediciones
+del catálogo) y corren en un thread de fondo con debounce.
+
+Configuración en system_config.json (todas opcionales):
+    "index_snapshots": {"enabled": false, "dir": "index_snapshots", "keep": 2,
+                        "check_interval_seconds": 10, "rebuild_delay_seconds": 5,
+                        "storage": "float32", "rerank_candidates": 300}
+
+Variables de entorno: INDEX_SNAPSHOTS=1 (habilita), INDEX_SNAPSHOT_DIR, INDEX_SNAPSHOT_STORAGE
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import INDEX_SNAPSHOT_EVENTS
+from app.core.change_notifier import ALL_CLIENTS, KIND_CLIENT, KIND_INDEX, notify_change, register_invalidator
+from app.core.model_versions import client_model_name
+
+logger = logging.getLogger("index_snapshots")
+
+MANIFEST_NAME = 'manifest.json'
+CURRENT_NAME = 'CURRENT'
+FORMAT_VERSION = 2
+
+STORAGE_FLOAT32 = 'float32'
+STORAGE_FLOAT16 = 'float16'
+STORAGE_INT8 = 'int8'
+STORAGES = (STORAGE_FLOAT32, STORAGE_FLOAT16, STORAGE_INT8)
+
+DEFAULT_RERANK_CANDIDATES = 300
+# Filas por bloque al puntuar codes (acota la copia temporal a float32)
+SCORE_CHUNK_ROWS = 4096
+INT8_LEVELS = 127
+# Error relativo máximo de redondeo a float16 (mantisa de 10 bits)
+FLOAT16_EPSILON = 2.0 ** -11
+# Margen para el redondeo de la acumulación en float32
+ACCUMULATION_EPSILON = 1e-5
+
+# La config se relee cada CONFIG_TTL_SECONDS (system_config lee el JSON en cada get)
+CONFIG_TTL_SECONDS = 30
+
+# Raíz del proyecto (misma convención que SystemConfig)
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+
+_config_lock = threading.Lock()
+_config_cache = None
+_config_expires = 0.0
+
+# Snapshots abiertos en este worker
+_snapshots = {}        # {client_id: IndexSnapshot}
+_last_check = {}       # {client_id: monotonic del último chequeo de CURRENT}
+_snapshots_lock = threading.Lock()
+
+# Builder de fondo
+_app = None
+_pending = {}          # {client_id: monotonic a partir del cual reconstruir}
+_pending_cond = threading.Condition()
+_builder_thread = None
+
+
+def _get_config() -> dict:
+    global _config_cache, _config_expires
+    now = time.monotonic()
+    if _config_cache is not None and now < _config_expires:
+        return _config_cache
+    with _config_lock:
+        if _config_cache is None or now >= _config_expires:
+            try:
+                from app.utils.system_config import system_config
+                _config_cache = system_config.get_section('index_snapshots') or {}
+            except Exception:
+                _config_cache = {}
+            _config_expires = now + CONFIG_TTL_SECONDS
+    return _config_cache
+
+
+def is_enabled() -> bool:
+    """Prioridad: variable de entorno INDEX_SNAPSHOTS > system_config > deshabilitado"""
+    env = os.getenv('INDEX_SNAPSHOTS')
+    if env is not None:
+        return env.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(_get_config().get('enabled', False))
+
+
+def snapshots_dir() -> Path:
+    path = Path(os.getenv('INDEX_SNAPSHOT_DIR') or _get_config().get('dir', 'index_snapshots'))
+    return path if path.is_absolute() else _PROJECT_ROOT / path
+
+
+def configured_storage() -> str:
+    """Prioridad: variable de entorno INDEX_SNAPSHOT_STORAGE > system_config > float32"""
+    storage = str(os.getenv('INDEX_SNAPSHOT_STORAGE') or _get_config().get('storage', STORAGE_FLOAT32)).lower()
+    if storage not in STORAGES:
+        logger.warning("index_snapshots.storage=%r inválido, se usa %s", storage, STORAGE_FLOAT32)
+        return STORAGE_FLOAT32
+    return storage
+
+
+def rerank_candidates() -> int:
+    return max(1, int(_get_config().get('rerank_candidates', DEFAULT_RERANK_CANDIDATES)))
+
+
+def _int8_scales(max_abs: np.ndarray) -> np.ndarray:
+    return np.where(max_abs > 0, max_abs / INT8_LEVELS, 1.0).astype(np.float32)
+
+
+def quantize(embeddings: np.ndarray, storage: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Copia comprimida de la matriz normalizada
+
+    Returns:
+        Tupla (codes float16|int8, máximo |valor| por dimensión)
+    """
+    max_abs = np.abs(embeddings).max(axis=0).astype(np.float32)
+    if storage == STORAGE_FLOAT16:
+        return embeddings.astype(np.float16), max_abs
+    codes = np.clip(np.rint(embeddings / _int8_scales(max_abs)), -INT8_LEVELS, INT8_LEVELS)
+    return codes.astype(np.int8), max_abs
+
+
+def _normalized_query(query_embedding) -> np.ndarray:
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(query)
+    return query / norm if norm > 0 else query
+
+
+def _client_dir(client_id) -> Path:
+    return snapshots_dir() / str(client_id)
+
+
+def catalog_version(client_id) -> str:
+    """
+    Huella barata del catálogo visual del cliente: cantidad de imágenes procesadas
+    y última modificación de imágenes y productos
+    """
+    from app import db
+    from app.models.image import Image
+    from app.models.product import Product
+
+    count, image_updated, product_updated = (
+        db.session.query(db.func.count(Image.id), db.func.max(Image.updated_at), db.func.max(Product.updated_at))
+        .join(Product, Image.product_id == Product.id)
+        .filter(Image.client_id == client_id, Image.is_processed == True, Image.clip_embedding.isnot(None))
+        .one()
+    )
+    stamps = [s.isoformat() if s else '-' for s in (image_updated, product_updated)]
+    return f"{count}:{stamps[0]}:{stamps[1]}"
+
+
+class IndexSnapshot:
+    """Snapshot abierto (arrays con mmap, solo lectura)"""
+
+    __slots__ = ('client_id', 'version', 'path', 'manifest', 'embeddings', 'storage', 'codes',
+                 'max_abs', 'scales', 'image_ids', 'product_ids', 'category_ids')
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.client_id = self.manifest['client_id']
+        self.version = self.manifest['version']
+        self.embeddings = np.load(self.path / 'embeddings.npy', mmap_mode='r')
+        # Snapshots de formato 1 no tienen storage: float32
+        self.storage = self.manifest.get('storage', STORAGE_FLOAT32)
+        self.codes = self.max_abs = self.scales = None
+        if self.storage != STORAGE_FLOAT32:
+            self.codes = np.load(self.path / 'codes.npy', mmap_mode='r')
+            self.max_abs = np.load(self.path / 'max_abs.npy')
+            if self.storage == STORAGE_INT8:
+                self.scales = _int8_scales(self.max_abs)
+        self.image_ids = np.load(self.path / 'image_ids.npy', mmap_mode='r')
+        self.product_ids = np.load(self.path / 'product_ids.npy', mmap_mode='r')
+        self.category_ids = np.load(self.path / 'category_ids.npy', mmap_mode='r')
+
+    def __len__(self):
+        return int(self.embeddings.shape[0])
+
+    @property
+    def quantized(self) -> bool:
+        return self.codes is not None
+
+    @property
+    def scan_bytes(self) -> int:
+        """Bytes que recorre cada búsqueda (codes si está cuantizado)"""
+        return int((self.codes if self.quantized else self.embeddings).nbytes)
+
+    def scores(self, query_embedding) -> np.ndarray:
+        """
+        Similitud coseno de la query contra todas las filas
+
+        Exacta con storage float32; aproximada con float16/int8 (ver rerank).
+        """
+        query = _normalized_query(query_embedding)
+        if not self.quantized:
+            return self.embeddings @ query
+
+        # int8: codes * escala por dimensión ~ embedding -> la escala se aplica a la query
+        weights = query * self.scales if self.scales is not None else query
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_CHUNK_ROWS):
+            block = self.codes[start:start + SCORE_CHUNK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ weights
+        return scores
+
+    def error_bound(self, query_embedding) -> float:
+        """Cota de |score aproximado - score exacto| para la query (0 con float32)"""
+        if not self.quantized:
+            return 0.0
+        query = np.abs(_normalized_query(query_embedding))
+        if self.scales is not None:
+            # Redondeo a entero: error <= escala / 2 por dimensión
+            bound = 0.5 * float(query @ self.scales)
+        else:
+            bound = FLOAT16_EPSILON * float(query @ self.max_abs)
+        return bound + ACCUMULATION_EPSILON
+
+    def rerank(self, similarities: np.ndarray, query_embedding, threshold: float,
+               max_candidates: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        """
+        Reemplaza los scores aproximados de las candidatas por la similitud exacta float32
+
+        Candidatas: las max_candidates filas de mayor score aproximado que pueden
+        superar threshold (>= threshold - error_bound), más todas las filas con score
+        aproximado a menos de error_bound de threshold. El resto conserva el score
+        aproximado: comparar contra threshold da lo mismo que con scores exactos.
+
+        Returns:
+            Tupla (scores, cantidad de filas re-puntuadas)
+        """
+        query = _normalized_query(query_embedding)
+        bound = self.error_bound(query)
+        floor = threshold - bound
+        if max_candidates is None:
+            max_candidates = rerank_candidates()
+
+        above = np.flatnonzero(similarities >= floor)
+        top = above
+        if len(above) > max_candidates:
+            top = above[np.argpartition(similarities[above], -max_candidates)[-max_candidates:]]
+        # Zona de duda alrededor del umbral: siempre exacta, sin tope
+        band = above[similarities[above] < threshold + bound]
+        # union1d ordena: lectura secuencial del mmap
+        candidates = np.union1d(top, band)
+
+        scores = np.array(similarities, dtype=np.float32)
+        if len(candidates):
+            scores[candidates] = self.embeddings[candidates] @ query
+        return scores, len(candidates)
+
+    def category_id_at(self, index: int) -> Optional[str]:
+        value = str(self.category_ids[index])
+        return value or None
+
+
+def _snapshot_rows_query(client_id):
+    """Misma proyección liviana que _search_rows_query (api.py)"""
+    from app import db
+    from app.models.image import Image
+    from app.models.product import Product
+
+    return (db.session.query(Image.id, Image.product_id, Product.category_id, Image.clip_embedding)
+            .join(Product, Image.product_id == Product.id)
+            .filter(
+                Image.client_id == client_id,
+                Image.is_processed == True,
+                Image.clip_embedding.isnot(None)
+            )
+            .order_by(Image.id)
+            .execution_options(yield_per=1000))
+
+
+def _write_atomic(path: Path, content: str):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def build_snapshot(client_id, storage: Optional[str] = None) -> Optional[Path]:
+    """
+    Construye un snapshot nuevo del cliente y lo publica en CURRENT
+
+    Args:
+        client_id: Cliente a indexar
+        storage: float32 | float16 | int8 (None = configured_storage())
+
+    Returns:
+        Path de la versión publicada (None si el cliente no tiene embeddings)
+    """
+    storage = storage or configured_storage()
+    if storage not in STORAGES:
+        raise ValueError(f"Storage inválido: {storage} (opciones: {', '.join(STORAGES)})")
+    started = time.time()
+    version_tag = catalog_version(client_id)
+
+    image_ids, product_ids, category_ids, vectors = [], [], [], []
+    for row in _snapshot_rows_query(client_id):
+        try:
+            vector = json.loads(row.clip_embedding) if isinstance(row.clip_embedding, str) else row.clip_embedding
+        except ValueError:
+            logger.warning("Embedding ilegible en imagen %s, se omite", row.id)
+            continue
+        image_ids.append(str(row.id))
+        product_ids.append(str(row.product_id))
+        category_ids.append(str(row.category_id) if row.category_id else '')
+        vectors.append(vector)
+
+    if not vectors:
+        logger.info("Cliente %s sin embeddings: no se genera snapshot", client_id)
+        return None
+
+    embeddings = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings /= np.where(norms > 0, norms, 1.0)
+
+    client_dir = _client_dir(client_id)
+    client_dir.mkdir(parents=True, exist_ok=True)
+    version = f"v{int(time.time() * 1000)}"
+    tmp_dir = client_dir / f".tmp-{version}-{os.getpid()}"
+    tmp_dir.mkdir()
+    try:
+        np.save(tmp_dir / 'embeddings.npy', embeddings)
+        if storage != STORAGE_FLOAT32:
+            codes, max_abs = quantize(embeddings, storage)
+            np.save(tmp_dir / 'codes.npy', codes)
+            np.save(tmp_dir / 'max_abs.npy', max_abs)
+        np.save(tmp_dir / 'image_ids.npy', np.asarray(image_ids))
+        np.save(tmp_dir / 'product_ids.npy', np.asarray(product_ids))
+        np.save(tmp_dir / 'category_ids.npy', np.asarray(category_ids))
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': version,
+            'client_id': str(client_id),
+            'catalog_version': version_tag,
+            'model_name': client_model_name(client_id),
+            'storage': storage,
+            'count': int(embeddings.shape[0]),
+            'dim': int(embeddings.shape[1]),
+            'created_at': datetime.utcnow().isoformat(),
+        }
+        with open(tmp_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        final_dir = client_dir / version
+        os.rename(tmp_dir, final_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _write_atomic(client_dir / CURRENT_NAME, version)
+    _prune_versions(client_dir, version)
+    INDEX_SNAPSHOT_EVENTS.inc('build')
+    # Los demás workers releen CURRENT en la próxima búsqueda (sin esperar check_interval_seconds)
+    notify_change(client_id, KIND_INDEX)
+    logger.info("📦 Snapshot %s de cliente %s: %d imágenes (%s) en %.1fs",
+                version, client_id, manifest['count'], storage, time.time() - started)
+    return final_dir
+
+
+def _prune_versions(client_dir: Path, current: str):
+    """Borra versiones viejas (los workers que todavía las tengan en mmap siguen leyendo el inode)"""
+    keep = max(1, int(_get_config().get('keep', 2)))
+    versions = sorted((p for p in client_dir.glob('v*') if p.is_dir()), key=lambda p: p.name)
+    for old in versions[:max(0, len(versions) - keep)]:
+        if old.name != current:
+            shutil.rmtree(old, ignore_errors=True)
+    for stale in client_dir.glob('.tmp-*'):
+        if time.time() - stale.stat().st_mtime > 3600:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def _read_current(client_id) -> Optional[str]:
+    try:
+        return (_client_dir(client_id) / CURRENT_NAME).read_text(encoding='utf-8').strip() or None
+    except OSError:
+        return None
+
+
+def get_snapshot(client_id) -> Optional[IndexSnapshot]:
+    """
+    Snapshot vigente del cliente para este worker (None = buscar en Postgres)
+
+    Relee CURRENT como máximo cada check_interval_seconds; si cambió, abre la
+    versión nueva y reemplaza la referencia (swap atómico para los lectores).
+    """
+    if not is_enabled() or not client_id:
+        return None
+
+    client_id = str(client_id)
+    now = time.monotonic()
+    interval = float(_get_config().get('check_interval_seconds', 10))
+    snapshot = _snapshots.get(client_id)
+    if now - _last_check.get(client_id, 0.0) < interval:
+        return snapshot
+
+    with _snapshots_lock:
+        snapshot = _snapshots.get(client_id)
+        if now - _last_check.get(client_id, 0.0) < interval:
+            return snapshot
+        _last_check[client_id] = now
+
+        version = _read_current(client_id)
+        if version is None:
+            # Nunca se construyó: arrancar el builder y buscar en Postgres mientras tanto
+            schedule_rebuild(client_id, delay=0)
+            _snapshots.pop(client_id, None)
+            return None
+        # Un snapshot de otro modelo no sirve (cutover de modelo del cliente)
+        model_name = client_model_name(client_id)
+        if snapshot is not None and snapshot.version == version and snapshot.manifest.get('model_name') == model_name:
+            _check_storage(snapshot)
+            return snapshot
+
+        try:
+            loaded = IndexSnapshot(_client_dir(client_id) / version)
+        except Exception as e:
+            logger.warning("No se pudo abrir snapshot %s de cliente %s: %s", version, client_id, e)
+            INDEX_SNAPSHOT_EVENTS.inc('error')
+            return snapshot
+
+        if loaded.manifest.get('model_name') != model_name:
+            logger.info("Snapshot %s de cliente %s es de otro modelo CLIP, se reconstruye", version, client_id)
+            schedule_rebuild(client_id, delay=0)
+            _snapshots.pop(client_id, None)
+            return None
+
+        if snapshot is None and loaded.manifest.get('catalog_version') != catalog_version(client_id):
+            # Arranque en frío con un snapshot viejo (el catálogo cambió con el worker caído)
+            logger.info("Snapshot %s de cliente %s desactualizado, se reconstruye", version, client_id)
+            schedule_rebuild(client_id, delay=0)
+            return None
+
+        _snapshots[client_id] = loaded
+        _check_storage(loaded)
+        INDEX_SNAPSHOT_EVENTS.inc('swap')
+        logger.info("🔁 Cliente %s usando snapshot %s (%d imágenes)", client_id, version, len(loaded))
+        return loaded
+
+
+def _check_storage(snapshot: IndexSnapshot):
+    """Cambió index_snapshots.storage: reconstruir (el snapshot actual sigue sirviendo)"""
+    if snapshot.storage != configured_storage():
+        schedule_rebuild(snapshot.client_id)
+
+
+def _recheck_current(client_id: str, kind: str):
+    if client_id == ALL_CLIENTS:
+        _last_check.clear()
+    else:
+        _last_check.pop(client_id, None)
+
+
+register_invalidator(_recheck_current, kinds=(KIND_INDEX, KIND_CLIENT))
+
+
+def loaded_snapshots() -> dict:
+    """{client_id: versión} de los snapshots abiertos en este worker"""
+    return {client_id: snapshot.version for client_id, snapshot in list(_snapshots.items())}
+
+
+# ----------------------------------------------------------------------
+# Builder de fondo
+# ----------------------------------------------------------------------
+
+def schedule_rebuild(client_id, delay: Optional[float] = None):
+    """Programa la reconstrucción del snapshot del cliente (con debounce)"""
+    if _app is None or not client_id or not is_enabled():
+        return
+    if delay is None:
+        delay = float(_get_config().get('rebuild_delay_seconds', 5))
+    due = time.monotonic() + delay
+    with _pending_cond:
+        # Un cambio nuevo posterga la reconstrucción (ráfagas de commits de process_pending)
+        _pending[str(client_id)] = due
+        _pending_cond.notify()
+
+
+def _builder_loop():
+    from app import db
+
+    while True:
+        with _pending_cond:
+            while True:
+                now = time.monotonic()
+                ready = [cid for cid, due in _pending.items() if due <= now]
+                if ready:
+                    for cid in ready:
+                        del _pending[cid]
+                    break
+                timeout = min(_pending.values()) - now if _pending else None
+                _pending_cond.wait(timeout)
+
+        for client_id in ready:
+            with _app.app_context():
+                try:
+                    build_snapshot(client_id)
+                except Exception as e:
+                    INDEX_SNAPSHOT_EVENTS.inc('error')
+                    logger.warning("Error construyendo snapshot de cliente %s: %s", client_id, e)
+                finally:
+                    db.session.remove()
+
+
+def _collect_dirty_clients(session, flush_context=None, instances=None):
+    from app.models.image import Image
+    from app.models.product import Product
+    from app.models.category import Category
+
+    if not is_enabled():
+        return
+    dirty = session.info.setdefault('_index_snapshot_clients', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Image, Product, Category)) and getattr(obj, 'client_id', None):
+            dirty.add(str(obj.client_id))
+
+
+def _schedule_dirty_clients(session):
+    for client_id in session.info.pop('_index_snapshot_clients', ()):
+        schedule_rebuild(client_id)
+
+
+def _discard_dirty_clients(session):
+    session.info.pop('_index_snapshot_clients', None)
+
+
+def init_index_snapshots(app):
+    """
+    Engancha el builder a la app: marca clientes con cambios de catálogo en cada
+    flush y programa la reconstrucción al commitear (llamar desde create_app)
+    """
+    global _app, _builder_thread
+    if _app is not None:
+        return
+    _app = app
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    event.listen(Session, 'before_flush', _collect_dirty_clients)
+    event.listen(Session, 'after_commit', _schedule_dirty_clients)
+    event.listen(Session, 'after_rollback', _discard_dirty_clients)
+
+    _builder_thread = threading.Thread(target=_builder_loop, name="index-snapshot-builder", daemon=True)
+    _builder_thread.start()
@@ -0,0 +1,215 @@
+"""
+Presupuesto de latencia por request con degradación de etapas opcionales
+
+La búsqueda visual tiene etapas obligatorias (detección de categoría, embedding,
+ranking) y etapas opcionales que mejoran el resultado pero no son imprescindibles.
+Cada etapa opcional declara un costo estimado; antes de correrla se pregunta al
+presupuesto si alcanza el tiempo que queda. Si no alcanza, o el worker está bajo
+presión (cola de admisión con espera), se saltea y la respuesta lo informa.
+
+Etapas opcionales:
+    tag_fusion         enriquecimiento del embedding con tags inferidos (_classify_tags sobre TAG_OPTIONS)
+    optimizer          ranking de SearchOptimizer (metadata + negocio)
+    color_detection    color dominante por paleta: solo debug (el resultado solo se loguea),
+                       corre únicamente si la request lo pide con debug=true
+
+Presupuesto (en orden de precedencia):
+    header X-Search-Budget-Ms > StoreSearchConfig.latency_budget_ms > latency_budget.default_ms
+    Sin presupuesto (None/0) las etapas opcionales corren siempre, salvo bajo presión.
+
+Uso:
+    budget = LatencyBudget(budget_ms, started_at=start_time, debug=debug)
+    if budget.allow('tag_fusion'):
+        with budget.track('tag_fusion'):
+            ...
+    response['pipeline'] = budget.summary()
+
+Los costos estimados arrancan en stage_costs_ms y se ajustan con lo observado
+(promedio móvil exponencial por worker).
+
+Configuración en system_config.json (todas opcionales):
+    "latency_budget": {"default_ms": null, "min_ms": 200, "max_ms": 10000, "reserve_ms": 200,
+                       "skip_under_pressure": true,
+                       "stage_costs_ms": {"tag_fusion": 400, "optimizer": 30,
+                                          "color_detection": 80}}
+"""
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from app.core.metrics import OPTIONAL_STAGES
+
+BUDGET_HEADER = 'X-Search-Budget-Ms'
+
+STAGE_TAG_FUSION = 'tag_fusion'
+STAGE_OPTIMIZER = 'optimizer'
+STAGE_COLOR_DETECTION = 'color_detection'
+
+# Costo estimado inicial (ms) de cada etapa opcional
+DEFAULT_STAGE_COSTS_MS = {
+    STAGE_TAG_FUSION: 400.0,
+    STAGE_OPTIMIZER: 30.0,
+    STAGE_COLOR_DETECTION: 80.0,
+}
+
+# Etapas que solo sirven para debug: corren únicamente si la request lo pide
+DEBUG_STAGES = (STAGE_COLOR_DETECTION,)
+
+DEFAULT_MIN_MS = 200
+DEFAULT_MAX_MS = 10000
+DEFAULT_RESERVE_MS = 200
+
+# Peso de cada observación nueva en el costo estimado
+EWMA_ALPHA = 0.2
+
+# Motivos por los que se saltea una etapa
+SKIP_BUDGET = 'budget'
+SKIP_PRESSURE = 'pressure'
+SKIP_DEBUG_ONLY = 'debug_only'
+
+# La config se relee cada CONFIG_TTL_SECONDS (system_config lee el JSON en cada get)
+CONFIG_TTL_SECONDS = 30
+
+_config_lock = threading.Lock()
+_config_cache = None
+_config_expires = 0.0
+
+_costs_lock = threading.Lock()
+_observed_costs_ms = {}
+
+
+def _get_config() -> dict:
+    global _config_cache, _config_expires
+    now = time.monotonic()
+    if _config_cache is not None and now < _config_expires:
+        return _config_cache
+    with _config_lock:
+        if _config_cache is None or now >= _config_expires:
+            try:
+                from app.utils.system_config import system_config
+                _config_cache = system_config.get_section('latency_budget') or {}
+            except Exception:
+                _config_cache = {}
+            _config_expires = now + CONFIG_TTL_SECONDS
+    return _config_cache
+
+
+def estimated_cost_ms(stage_name: str) -> float:
+    """Costo estimado de una etapa: lo observado en este worker o el declarado en config"""
+    with _costs_lock:
+        observed = _observed_costs_ms.get(stage_name)
+    if observed is not None:
+        return observed
+    declared = _get_config().get('stage_costs_ms') or {}
+    return float(declared.get(stage_name, DEFAULT_STAGE_COSTS_MS.get(stage_name, 0.0)))
+
+
+def _observe_cost(stage_name: str, elapsed_ms: float):
+    with _costs_lock:
+        previous = _observed_costs_ms.get(stage_name)
+        if previous is None:
+            _observed_costs_ms[stage_name] = elapsed_ms
+        else:
+            _observed_costs_ms[stage_name] = previous + EWMA_ALPHA * (elapsed_ms - previous)
+
+
+def resolve_budget_ms(header_value: Optional[str] = None, store_config=None) -> Optional[int]:
+    """
+    Presupuesto de la request: header > StoreSearchConfig > default de config
+
+    Returns:
+        Milisegundos (acotados a [min_ms, max_ms]) o None si no hay presupuesto
+    """
+    config = _get_config()
+    budget = None
+    if header_value:
+        try:
+            budget = int(float(header_value))
+        except (TypeError, ValueError):
+            budget = None
+    if not budget and store_config is not None:
+        budget = getattr(store_config, 'latency_budget_ms', None)
+    if not budget:
+        budget = config.get('default_ms')
+    if not budget:
+        return None
+    min_ms = int(config.get('min_ms', DEFAULT_MIN_MS))
+    max_ms = int(config.get('max_ms', DEFAULT_MAX_MS))
+    return max(min_ms, min(max_ms, int(budget)))
+
+
+class LatencyBudget:
+    """Deadline de una request y registro de qué etapas opcionales corrieron"""
+
+    def __init__(self, budget_ms: Optional[int] = None, started_at: Optional[float] = None,
+                 debug: bool = False, under_pressure: Optional[bool] = None):
+        """
+        Args:
+            budget_ms: Presupuesto total de la request (None = sin límite)
+            started_at: Inicio de la request (time.time()); default ahora
+            debug: Habilita las etapas de DEBUG_STAGES
+            under_pressure: Forzar el estado de presión (None = consultar la cola de admisión)
+        """
+        config = _get_config()
+        self.budget_ms = budget_ms
+        self.started_at = started_at if started_at is not None else time.time()
+        self.debug = debug
+        self.reserve_ms = float(config.get('reserve_ms', DEFAULT_RESERVE_MS))
+        if under_pressure is None:
+            under_pressure = False
+            if config.get('skip_under_pressure', True):
+                from app.core.admission import controller
+                under_pressure = controller.under_pressure()
+        self.under_pressure = under_pressure
+        self.ran = []
+        self.skipped = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.time() - self.started_at) * 1000.0
+
+    def remaining_ms(self) -> Optional[float]:
+        if not self.budget_ms:
+            return None
+        return self.budget_ms - self.elapsed_ms()
+
+    def allow(self, stage_name: str) -> bool:
+        """Decide si una etapa opcional entra en lo que queda del presupuesto"""
+        reason = None
+        if stage_name in DEBUG_STAGES and not self.debug:
+            reason = SKIP_DEBUG_ONLY
+        elif self.under_pressure and stage_name not in DEBUG_STAGES:
+            reason = SKIP_PRESSURE
+        else:
+            remaining = self.remaining_ms()
+            if remaining is not None and remaining - estimated_cost_ms(stage_name) < self.reserve_ms:
+                reason = SKIP_BUDGET
+
+        if reason is None:
+            return True
+        self.skipped[stage_name] = reason
+        OPTIONAL_STAGES.inc(stage_name, reason)
+        return False
+
+    @contextmanager
+    def track(self, stage_name: str):
+        """Marca la etapa como ejecutada y ajusta su costo estimado con lo que tardó"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            _observe_cost(stage_name, (time.perf_counter() - started) * 1000.0)
+            if stage_name not in self.ran:
+                self.ran.append(stage_name)
+                OPTIONAL_STAGES.inc(stage_name, 'ran')
+
+    def summary(self) -> dict:
+        """Resumen para la respuesta JSON"""
+        remaining = self.remaining_ms()
+        return {
+            "budget_ms": self.budget_ms,
+            "remaining_ms": round(remaining, 1) if remaining is not None else None,
+            "under_pressure": self.under_pressure,
+            "ran": list(self.ran),
+            "skipped": dict(self.skipped),
+        }
@@ -0,0 +1,302 @@
+"""
+Registro de métricas en formato de exposición de Prometheus (sin dependencias)
+
+Counters e histogramas sin locks: cada thread escribe en su propio shard (dict)
+y el scrape suma los shards. Los gauges guardan el último valor asignado o se
+calculan con un callback al momento del scrape (deben ser baratos: nada de
+queries, salvo el gauge de backlog que cachea su resultado).
+
+Uso:
+    from app.core.metrics import metrics
+
+    SEARCHES = metrics.counter('clip_searches_total', 'Búsquedas', ('endpoint',))
+    SEARCHES.inc('visual')
+
+    LATENCY = metrics.histogram('clip_encode_seconds', 'Encode CLIP', ('kind',))
+    LATENCY.observe(0.042, 'image')
+
+    metrics.render()  # texto para GET /metrics
+"""
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets por defecto (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _sort_key(item):
+    return tuple(str(v) for v in item[0])
+
+
+class _Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        """Iterable de (sufijo, labels_str, valor)"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class _ShardedMetric(_Metric):
+    """Valores por thread: escribir no toma locks, leer suma los shards"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._local = threading.local()
+        self._shards = []
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = {}
+            self._local.values = shard
+            self._shards.append(shard)  # list.append es atómico bajo el GIL
+        return shard
+
+    def _items(self):
+        for shard in list(self._shards):
+            # dict.items() copiado en una sola operación C (seguro frente a escrituras concurrentes)
+            yield from list(shard.items())
+
+
+class Counter(_ShardedMetric):
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._sources = []
+
+    def inc(self, *labelvalues, amount: float = 1):
+        shard = self._shard()
+        shard[labelvalues] = shard.get(labelvalues, 0) + amount
+
+    def add_source(self, source: Callable[[], Dict[Tuple, float]]):
+        """Suma valores de un contador externo (ej: image_cache.hits) leídos en el scrape"""
+        self._sources.append(source)
+
+    def values(self) -> Dict[Tuple, float]:
+        totals = {}
+        for labels, value in self._items():
+            totals[labels] = totals.get(labels, 0) + value
+        for source in self._sources:
+            try:
+                for labels, value in (source() or {}).items():
+                    totals[labels] = totals.get(labels, 0) + value
+            except Exception:
+                continue
+        return totals
+
+    def samples(self):
+        suffix = '' if self.name.endswith('_total') else '_total'
+        for labels, value in sorted(self.values().items(), key=_sort_key):
+            yield suffix, _format_labels(self.labelnames, labels), value
+
+
+class Histogram(_ShardedMetric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labelvalues):
+        shard = self._shard()
+        entry = shard.get(labelvalues)
+        if entry is None:
+            # [conteo por bucket..., conteo +Inf, suma]
+            entry = [0] * (len(self.buckets) + 1) + [0.0]
+            shard[labelvalues] = entry
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self):
+        merged = {}
+        for labels, entry in self._items():
+            total = merged.get(labels)
+            if total is None:
+                merged[labels] = list(entry)
+            else:
+                for i, v in enumerate(entry):
+                    total[i] += v
+
+        for labels, entry in sorted(merged.items(), key=_sort_key):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry[:-1]):
+                cumulative += count
+                yield '_bucket', _format_labels(self.labelnames, labels, ('le', _format_value(bound))), cumulative
+            yield '_sum', _format_labels(self.labelnames, labels), round(entry[-1], 6)
+            yield '_count', _format_labels(self.labelnames, labels), cumulative
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback: Optional[Callable] = None):
+        """
+        Args:
+            callback: Si se indica, se llama en cada scrape y devuelve un número
+                      (sin labels) o {labels_tuple: valor}
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._callback = callback
+
+    def set(self, value: float, *labelvalues):
+        self._values[labelvalues] = value
+
+    def values(self) -> Dict[Tuple, float]:
+        if self._callback is None:
+            return dict(self._values)
+        result = self._callback()
+        if result is None:
+            return {}
+        if isinstance(result, dict):
+            return result
+        return {(): result}
+
+    def samples(self):
+        try:
+            values = self.values()
+        except Exception:
+            return
+        for labels, value in sorted(values.items(), key=_sort_key):
+            if value is not None:
+                yield '', _format_labels(self.labelnames, labels), value
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_cls, name, *args, **kwargs):
+        # Idempotente: re-importar un módulo devuelve la misma métrica
+        with self._lock:
+            existing = self._metrics.get(name)
+            if existing is not None:
+                if not isinstance(existing, metric_cls):
+                    raise ValueError(f"Métrica {name} ya registrada como {existing.type_name}")
+                return existing
+            metric = metric_cls(name, *args, **kwargs)
+            self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+              callback: Optional[Callable] = None) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames, callback=callback)
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        blocks = [metric.render() for _, metric in sorted(self._metrics.items())]
+        return '\n'.join(blocks) + '\n'
+
+
+# Instancia global
+metrics = MetricsRegistry()
+
+
+# ----------------------------------------------------------------------
+# Métricas de la app (definidas acá para importarlas sin ciclos)
+# ----------------------------------------------------------------------
+
+HTTP_REQUESTS = metrics.counter(
+    'clip_http_requests_total', 'Requests HTTP por endpoint, cliente y status',
+    ('endpoint', 'client', 'status'))
+HTTP_LATENCY = metrics.histogram(
+    'clip_http_request_duration_seconds', 'Latencia de requests HTTP por endpoint y cliente',
+    ('endpoint', 'client'))
+DB_QUERIES_PER_REQUEST = metrics.histogram(
+    'clip_db_queries_per_request', 'Queries SQL ejecutadas por request',
+    ('endpoint',), buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250, 500))
+SEARCH_STAGE_LATENCY = metrics.histogram(
+    'clip_search_stage_duration_seconds', 'Tiempo por etapa de las búsquedas (stage_profiler)',
+    ('endpoint', 'stage'))
+
+CLIP_ENCODE_LATENCY = metrics.histogram(
+    'clip_encode_duration_seconds', 'Latencia de encode CLIP por tipo (image | text | image_text)',
+    ('kind',))
+CLIP_ENCODE_BATCH = metrics.histogram(
+    'clip_encode_batch_size', 'Tamaño de batch de encode CLIP por tipo',
+    ('kind',), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+CLIP_MODEL_EVENTS = metrics.counter(
+    'clip_model_events_total', 'Cargas y descargas del modelo CLIP (event=load|unload, reason)',
+    ('event', 'reason'))
+CLIP_MODEL_LOAD_SECONDS = metrics.histogram(
+    'clip_model_load_duration_seconds', 'Tiempo de carga del modelo CLIP',
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0))
+
+CACHE_REQUESTS = metrics.counter(
+    'clip_cache_requests_total', 'Consultas a caches internos (result=hit|miss)',
+    ('cache', 'result'))
+
+SINGLE_FLIGHT_CALLS = metrics.counter(
+    'clip_single_flight_calls_total', 'Cómputos coalescidos (role=leader|follower|timeout)',
+    ('flight', 'role'))
+
+CHANGE_NOTIFICATIONS = metrics.counter(
+    'clip_change_notifications_total', 'Notificaciones de cambios entre workers (direction=sent|received)',
+    ('direction',))
+
+ADMISSION_WAIT = metrics.histogram(
+    'clip_admission_wait_seconds', 'Espera en la cola de admisión de trabajo CLIP (priority=search|background)',
+    ('priority',))
+
+ADMISSION_REJECTED = metrics.counter(
+    'clip_admission_rejected_total', 'Requests rechazadas por sobrecarga (reason=queue_full|deadline)',
+    ('priority', 'reason'))
+
+COLOR_DETECTIONS = metrics.counter(
+    'clip_color_detections_total', 'Detecciones de color dominante por nivel (tier=pixel|clip|none)',
+    ('tier',))
+
+OPTIONAL_STAGES = metrics.counter(
+    'clip_optional_stage_total', 'Etapas opcionales de búsqueda (outcome=ran|budget|pressure|debug_only)',
+    ('stage', 'outcome'))
+
+INDEX_SNAPSHOT_EVENTS = metrics.counter(
+    'clip_index_snapshot_events_total', 'Snapshots del índice de búsqueda (event=build|swap|error)',
+    ('event',))
@@ -0,0 +1,212 @@
+"""
+Versionado del modelo CLIP de los embeddings y cambio de modelo sin corte
+
+Los vectores guardados (Image.clip_embedding, centroides y prototipos de
+Category) solo sirven con el modelo que los generó; ViT-L/14 ni siquiera tiene
+la misma dimensión. Por eso cada cliente tiene su modelo de índice
+(Client.embedding_model) y las búsquedas codifican la query con ese modelo,
+no con el configurado en system_config:
+
+    clip.model_name          modelo por defecto (clientes sin modelo fijado y
+                             tareas que no comparan contra vectores guardados)
+    Client.embedding_model   modelo del índice activo del cliente
+
+Cambio de modelo de un cliente:
+    1. start_shadow_reindex (BatchJobService, job 'shadow_reindex') codifica en
+       segundo plano todas las imágenes procesadas con el modelo nuevo y guarda
+       los vectores en shadow_embeddings; el índice activo sigue sirviendo.
+    2. shadow_coverage informa el avance (imágenes con vector sombra / total).
+    3. cutover, con cobertura 100%, en una sola transacción: copia los vectores
+       sombra a images, cambia Client.embedding_model, recalcula centroides y
+       borra las filas sombra. Las requests siguientes ya usan el modelo nuevo.
+
+Selección del modelo (active_model_name):
+    model_scope(modelo) > cliente autenticado de la request (request.client) > clip.model_name
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger("model_versions")
+
+DEFAULT_MODEL_NAME = 'ViT-B/16'
+
+_scoped_model = ContextVar('clip_model_scope', default=None)
+_cutover_lock = threading.Lock()
+
+
+def normalize_model_name(model_name: Optional[str]) -> Optional[str]:
+    """Nombre amigable del modelo (ViT-B/16) aunque venga el id de HuggingFace"""
+    from app.blueprints.embeddings import CLIP_MODEL_MAP
+    for friendly, model_id in CLIP_MODEL_MAP.items():
+        if model_name == model_id:
+            return friendly
+    return model_name
+
+
+def configured_model_name() -> str:
+    """Modelo por defecto de system_config (clip.model_name)"""
+    try:
+        from app.utils.system_config import system_config
+        return normalize_model_name(system_config.get('clip', 'model_name', DEFAULT_MODEL_NAME))
+    except Exception:
+        return DEFAULT_MODEL_NAME
+
+
+def model_of_client(client) -> str:
+    """Modelo del índice activo de un Client ya cargado"""
+    return getattr(client, 'embedding_model', None) or configured_model_name()
+
+
+def client_model_name(client_id) -> str:
+    """Modelo del índice activo del cliente (lectura de BD)"""
+    if not client_id:
+        return configured_model_name()
+    from app import db
+    from app.models.client import Client
+
+    model_name = db.session.query(Client.embedding_model).filter(Client.id == str(client_id)).scalar()
+    return model_name or configured_model_name()
+
+
+def active_model_name() -> str:
+    """Modelo para codificar en el contexto actual (ver prioridad en el docstring del módulo)"""
+    scoped = _scoped_model.get()
+    if scoped:
+        return scoped
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            client = getattr(request, 'client', None)
+            if client is not None:
+                return model_of_client(client)
+    except Exception:
+        pass
+    return configured_model_name()
+
+
+@contextmanager
+def model_scope(model_name: Optional[str]):
+    """Fija el modelo de get_clip_model()/active_model_name() dentro del bloque (thread actual)"""
+    token = _scoped_model.set(model_name)
+    try:
+        yield model_name
+    finally:
+        _scoped_model.reset(token)
+
+
+# ----------------------------------------------------------------------
+# Índice sombra
+# ----------------------------------------------------------------------
+
+def _searchable_images(client_id):
+    from app.models.image import Image
+    return Image.query.filter(
+        Image.client_id == str(client_id),
+        Image.is_processed.is_(True),
+        Image.clip_embedding.isnot(None)
+    )
+
+
+def missing_shadow_images(client_id, model_name: str):
+    """Query de imágenes buscables del cliente sin vector sombra del modelo"""
+    from app import db
+    from app.models.image import Image
+    from app.models.shadow_embedding import ShadowEmbedding
+
+    covered = db.session.query(ShadowEmbedding.image_id).filter(ShadowEmbedding.model_name == model_name)
+    return _searchable_images(client_id).filter(~Image.id.in_(covered))
+
+
+def shadow_coverage(client_id, model_name: str) -> dict:
+    """Avance del índice sombra del cliente para el modelo"""
+    total = _searchable_images(client_id).count()
+    missing = missing_shadow_images(client_id, model_name).count()
+    covered = total - missing
+    return {
+        'client_id': str(client_id),
+        'active_model': client_model_name(client_id),
+        'shadow_model': model_name,
+        'total': total,
+        'covered': covered,
+        'percent': round(covered * 100.0 / total, 1) if total else 100.0,
+        'ready': missing == 0,
+    }
+
+
+def discard_shadow(client_id, model_name: Optional[str] = None) -> int:
+    """Borra vectores sombra del cliente (de un modelo o de todos)"""
+    from app import db
+    from app.models.shadow_embedding import ShadowEmbedding
+
+    query = ShadowEmbedding.query.filter(ShadowEmbedding.client_id == str(client_id))
+    if model_name:
+        query = query.filter(ShadowEmbedding.model_name == model_name)
+    deleted = query.delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def cutover(client_id, model_name: str) -> dict:
+    """
+    Pasa el índice del cliente al modelo del índice sombra (una sola transacción)
+
+    Raises:
+        ValueError: Cobertura incompleta (imágenes sin vector sombra) o cliente inexistente
+    """
+    from sqlalchemy import text
+    from app import db
+    from app.models.client import Client
+    from app.models.category import Category
+    from app.models.shadow_embedding import ShadowEmbedding
+    from app.core.change_notifier import KIND_CATALOG, notify_change
+
+    client_id = str(client_id)
+    with _cutover_lock:
+        try:
+            # Bloquea el cliente: dos cutovers concurrentes se serializan
+            client = Client.query.filter_by(id=client_id).with_for_update().first()
+            if client is None:
+                raise ValueError(f"Cliente {client_id} inexistente")
+
+            previous = model_of_client(client)
+            missing = missing_shadow_images(client_id, model_name).count()
+            if missing:
+                raise ValueError(f"Índice sombra incompleto: {missing} imágenes sin vector de {model_name}")
+
+            swapped = db.session.execute(text("""
+                UPDATE images AS i
+                SET clip_embedding = s.clip_embedding,
+                    image_features = s.image_features,
+                    embedding_recipe = s.embedding_recipe,
+                    embedding_model = s.model_name,
+                    updated_at = NOW()
+                FROM shadow_embeddings AS s
+                WHERE s.image_id = i.id AND s.model_name = :model_name AND i.client_id = :client_id
+            """), {'model_name': model_name, 'client_id': client_id}).rowcount
+
+            client.embedding_model = model_name
+            db.session.flush()
+            # El UPDATE masivo no pasa por el ORM: releer imágenes para los centroides
+            db.session.expire_all()
+
+            categories = Category.query.filter_by(client_id=client_id, is_active=True).all()
+            for category in categories:
+                category.update_centroid_embedding(force_recalculate=True)
+
+            ShadowEmbedding.query.filter(
+                ShadowEmbedding.client_id == client_id, ShadowEmbedding.model_name == model_name
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    # Las imágenes cambiaron por SQL directo: avisar a los caches de catálogo
+    notify_change(client_id, KIND_CATALOG)
+    logger.info("🔀 Cliente %s pasó de %s a %s (%d embeddings, %d centroides)",
+                client_id, previous, model_name, swapped, len(categories))
+    return {'client_id': client_id, 'previous_model': previous, 'model': model_name,
+            'embeddings': swapped, 'categories': len(categories)}
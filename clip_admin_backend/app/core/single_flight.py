@@ -0,0 +1,99 @@
+"""
+Single-flight: coalescencia de cómputos idénticos concurrentes
+
+Si varias requests piden lo mismo al mismo tiempo (misma query de texto, la misma
+imagen subida dos veces, el mismo vocabulario de cliente), solo la primera
+ejecuta el cómputo; las demás esperan y reciben el mismo resultado (o la misma
+excepción). No es un cache: cuando el cómputo termina la clave se libera.
+
+Uso:
+    from app.core.single_flight import SingleFlight
+    _search_flight = SingleFlight('text_search')
+
+    result, shared = _search_flight.do(key, lambda: compute(...))
+
+El resultado se comparte entre threads: devolver datos planos (dicts, listas,
+arrays de solo lectura), nunca objetos ORM ligados a la sesión del líder.
+"""
+import logging
+import threading
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from app.core.metrics import SINGLE_FLIGHT_CALLS
+
+logger = logging.getLogger("single_flight")
+
+_flights = []
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Grupo de cómputos coalescidos por clave"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        _flights.append(self)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Ejecuta fn() una sola vez por clave entre los callers concurrentes
+
+        Args:
+            key: Clave del cómputo (debe incluir todo lo que cambia el resultado)
+            fn: Cómputo a ejecutar
+            timeout: Espera máxima de un seguidor; si se agota, calcula por su cuenta
+
+        Returns:
+            Tupla (resultado, compartido) - compartido=True si lo calculó otro caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if leader:
+            SINGLE_FLIGHT_CALLS.inc(self.name, 'leader')
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+                if call.waiters:
+                    logger.debug("%s: %d caller(s) compartieron el resultado de %r", self.name, call.waiters, key)
+
+        if not call.done.wait(timeout):
+            SINGLE_FLIGHT_CALLS.inc(self.name, 'timeout')
+            logger.warning("%s: espera agotada (%ss), se calcula sin coalescer", self.name, timeout)
+            return fn(), False
+
+        SINGLE_FLIGHT_CALLS.inc(self.name, 'follower')
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+
+def in_flight_counts() -> dict:
+    """{nombre: cómputos en curso} de todos los grupos (métricas)"""
+    return {flight.name: flight.in_flight() for flight in _flights}
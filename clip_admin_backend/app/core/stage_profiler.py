@@ -0,0 +1,333 @@
+"""
+Profiler por etapas de las requests de búsqueda
+
+Registra tiempo de pared y de CPU (del thread) de etapas con nombre dentro de una
+request y los publica:
+- Header `Server-Timing` de la respuesta (visible en DevTools del widget)
+- Log "search_profiler" (una línea por request)
+- Sinks registrados con register_stage_sink (métricas, etc.)
+
+Uso en el código de búsqueda:
+    with stage('category_detection'):
+        ...
+
+    @profiled_stage('hydration')
+    def _hydrate(...): ...
+
+Fuera de una request perfilada (tools, threads de fondo) las etapas no registran nada.
+
+Captura opcional de cProfile/pyinstrument a disco: la dispara el header
+`X-Search-Profile: 1` enviado con una API Key de admin, o un muestreo aleatorio.
+
+Configuración en system_config.json (todas opcionales):
+    "profiling": {"server_timing": true, "admin_api_keys": [], "sample_rate": 0.0,
+                  "dir": "profiles", "engine": "cprofile", "max_files": 200}
+"""
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Optional
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger("search_profiler")
+
+PROFILE_HEADER = 'X-Search-Profile'
+PROFILE_FILE_HEADER = 'X-Search-Profile-File'
+
+ENGINE_CPROFILE = 'cprofile'
+ENGINE_PYINSTRUMENT = 'pyinstrument'
+
+# La config se relee cada CONFIG_TTL_SECONDS (system_config lee el JSON en cada get)
+CONFIG_TTL_SECONDS = 30
+
+# Raíz del proyecto (misma convención que SystemConfig)
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+
+_config_lock = threading.Lock()
+_config_cache = None
+_config_expires = 0.0
+
+# Solo un profiler activo a la vez (cProfile usa un hook global desde Python 3.12)
+_capture_lock = threading.Lock()
+
+_sinks = []
+
+
+def _get_config() -> dict:
+    global _config_cache, _config_expires
+    now = time.monotonic()
+    if _config_cache is not None and now < _config_expires:
+        return _config_cache
+    with _config_lock:
+        if _config_cache is None or now >= _config_expires:
+            try:
+                from app.utils.system_config import system_config
+                _config_cache = system_config.get_section('profiling') or {}
+            except Exception:
+                _config_cache = {}
+            _config_expires = now + CONFIG_TTL_SECONDS
+    return _config_cache
+
+
+def _admin_api_keys() -> set:
+    keys = set(_get_config().get('admin_api_keys') or [])
+    keys.update(k.strip() for k in os.getenv('PROFILING_API_KEYS', '').split(',') if k.strip())
+    return keys
+
+
+def is_admin_api_key(api_key: Optional[str]) -> bool:
+    """True si la API Key puede pedir diagnósticos (profiling, logs de detalle)"""
+    return bool(api_key) and api_key in _admin_api_keys()
+
+
+def register_stage_sink(callback: Callable):
+    """
+    Registra un consumidor de los tiempos de cada request perfilada
+
+    Args:
+        callback: callable(endpoint, client_id, stages, total_ms) donde stages es
+                  {nombre: {'wall_ms': float, 'cpu_ms': float | None, 'count': int}}
+    """
+    if callback not in _sinks:
+        _sinks.append(callback)
+
+
+class RequestProfile:
+    """Tiempos acumulados por etapa de una request"""
+
+    __slots__ = ('endpoint', 'client_id', 'started', 'stages', 'capture', 'capture_engine')
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.client_id = None
+        self.started = time.perf_counter()
+        self.stages = {}  # nombre -> [wall_ms, cpu_ms | None, count] (orden de primera aparición)
+        self.capture = None
+        self.capture_engine = None
+
+    def add(self, name: str, wall_ms: float, cpu_ms: Optional[float] = None):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [wall_ms, cpu_ms, 1]
+            return
+        entry[0] += wall_ms
+        if cpu_ms is not None:
+            entry[1] = (entry[1] or 0.0) + cpu_ms
+        entry[2] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            name: {
+                'wall_ms': round(wall, 3),
+                'cpu_ms': round(cpu, 3) if cpu is not None else None,
+                'count': count,
+            }
+            for name, (wall, cpu, count) in self.stages.items()
+        }
+
+    def server_timing(self, total_ms: float) -> str:
+        entries = []
+        for name, (wall, cpu, count) in self.stages.items():
+            entry = f"{name};dur={wall:.1f}"
+            if cpu is not None:
+                entry += f';desc="cpu {cpu:.1f}ms"'
+            entries.append(entry)
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ', '.join(entries)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    """Perfil de la request en curso (None fuera de una request perfilada)"""
+    if not has_request_context():
+        return None
+    return g.get('_search_profile')
+
+
+@contextmanager
+def stage(name: str):
+    """Mide una etapa (pared + CPU del thread) de la request en curso"""
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        profile.add(name, (time.perf_counter() - wall_start) * 1000.0,
+                    (time.thread_time() - cpu_start) * 1000.0)
+
+
+def profiled_stage(name: str):
+    """Decorador equivalente a `with stage(name)` sobre toda la función"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_stage(name: str, wall_seconds: float, cpu_seconds: Optional[float] = None):
+    """Registra una etapa medida a mano (ej: tiempo acumulado dentro de un loop)"""
+    profile = current_profile()
+    if profile is not None:
+        profile.add(name, wall_seconds * 1000.0, cpu_seconds * 1000.0 if cpu_seconds is not None else None)
+
+
+def set_profile_client(client):
+    """Asocia el cliente autenticado al perfil (para logs y sinks)"""
+    profile = current_profile()
+    if profile is not None and client is not None:
+        profile.client_id = str(client.id)
+
+
+def _should_capture(config: dict) -> bool:
+    if request.headers.get(PROFILE_HEADER, '').lower() in ('1', 'true', 'yes'):
+        if is_admin_api_key(request.headers.get('X-API-Key')):
+            return True
+        logger.warning(f"⚠️ {PROFILE_HEADER} ignorado: API Key sin permiso de profiling")
+    sample_rate = float(config.get('sample_rate', 0.0) or 0.0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _start_capture(profile: RequestProfile, config: dict):
+    if not _capture_lock.acquire(blocking=False):
+        logger.info("⏭️ Captura de profile omitida: ya hay otra en curso")
+        return
+
+    engine = (config.get('engine') or ENGINE_CPROFILE).lower()
+    try:
+        if engine == ENGINE_PYINSTRUMENT:
+            try:
+                from pyinstrument import Profiler
+                profile.capture = Profiler()
+            except ImportError:
+                logger.warning("⚠️ pyinstrument no instalado, usando cProfile")
+                engine = ENGINE_CPROFILE
+        if engine != ENGINE_PYINSTRUMENT:
+            import cProfile
+            profile.capture = cProfile.Profile()
+            engine = ENGINE_CPROFILE
+        profile.capture_engine = engine
+        if engine == ENGINE_PYINSTRUMENT:
+            profile.capture.start()
+        else:
+            profile.capture.enable()
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo iniciar el profiler: {e}")
+        profile.capture = None
+        _capture_lock.release()
+
+
+def _stop_capture(profile: RequestProfile):
+    if profile.capture is None:
+        return
+    try:
+        if profile.capture_engine == ENGINE_PYINSTRUMENT:
+            profile.capture.stop()
+        else:
+            profile.capture.disable()
+    finally:
+        _capture_lock.release()
+
+
+def _profiles_dir(config: dict) -> Path:
+    path = Path(os.getenv('PROFILING_DIR') or config.get('dir', 'profiles'))
+    return path if path.is_absolute() else _PROJECT_ROOT / path
+
+
+def _prune_profiles(directory: Path, max_files: int):
+    files = sorted(directory.glob('*.*'), key=lambda p: p.stat().st_mtime)
+    for old in files[:max(0, len(files) - max_files)]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+
+
+def _dump_capture(profile: RequestProfile, config: dict) -> Optional[str]:
+    """Escribe la captura a disco y devuelve el nombre del archivo"""
+    directory = _profiles_dir(config)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+    endpoint = (profile.endpoint or 'request').replace('.', '_')
+    client = (profile.client_id or 'anon')[:8]
+    if profile.capture_engine == ENGINE_PYINSTRUMENT:
+        filename = f"{stamp}_{endpoint}_{client}.html"
+        (directory / filename).write_text(profile.capture.output_html(), encoding='utf-8')
+    else:
+        filename = f"{stamp}_{endpoint}_{client}.prof"
+        profile.capture.dump_stats(str(directory / filename))
+
+    _prune_profiles(directory, int(config.get('max_files', 200)))
+    return filename
+
+
+def start_request_profile(endpoint: str):
+    """Abre el perfil de la request (llamar desde before_request)"""
+    config = _get_config()
+    profile = RequestProfile(endpoint)
+    g._search_profile = profile
+    if _should_capture(config):
+        _start_capture(profile, config)
+
+
+def finish_request_profile(response):
+    """Cierra el perfil, agrega Server-Timing y publica los tiempos (llamar desde after_request)"""
+    profile = current_profile()
+    if profile is None:
+        return response
+    g._search_profile = None
+
+    total_ms = (time.perf_counter() - profile.started) * 1000.0
+    config = _get_config()
+
+    if profile.capture is not None:
+        _stop_capture(profile)
+        try:
+            filename = _dump_capture(profile, config)
+            response.headers[PROFILE_FILE_HEADER] = filename
+            logger.info(f"🔬 Profile guardado: {filename}")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el profile: {e}")
+
+    if config.get('server_timing', True):
+        response.headers['Server-Timing'] = profile.server_timing(total_ms)
+        # Permite leer los tiempos desde el widget embebido en otro dominio
+        response.headers['Timing-Allow-Origin'] = '*'
+
+    stages = profile.as_dict()
+    if logger.isEnabledFor(logging.INFO):
+        summary = ' '.join(f"{name}={data['wall_ms']:.1f}" for name, data in stages.items())
+        logger.info(f"⏱️ {profile.endpoint} client={profile.client_id} status={response.status_code} "
+                    f"total={total_ms:.1f}ms {summary}")
+
+    for sink in _sinks:
+        try:
+            sink(profile.endpoint, profile.client_id, stages, total_ms)
+        except Exception as e:
+            logger.warning(f"⚠️ Sink de profiling falló: {e}")
+
+    return response
+
+
+def discard_request_profile(exc=None):
+    """Libera un profiler que quedó activo si la request terminó con excepción (teardown_request)"""
+    if not has_request_context():
+        return
+    profile = g.get('_search_profile')
+    if profile is not None:
+        g._search_profile = None
+        if profile.capture is not None:
+            _stop_capture(profile)
@@ -0,0 +1,122 @@
+"""
+Encoders stub deterministas (CLIP y MiniLM) para tests, CI y pruebas de carga
+
+Cada imagen o texto se convierte en un vector unitario sembrado por el hash de su
+contenido: misma entrada -> mismo vector, en microsegundos y sin descargar pesos.
+Imitan las formas de CLIPProcessor / CLIPModel (get_image_features,
+get_text_features, __call__) y de SentenceTransformer.encode.
+
+Se activan con el backend 'stub':
+    CLIP_BACKEND=stub   o   system_config.json -> "clip": {"backend": "stub"}
+
+NUNCA usar en producción: los vectores no tienen significado semántico.
+"""
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+
+CLIP_DIM = 512      # ViT-B/16 / ViT-B/32
+CLIP_LARGE_DIM = 768  # ViT-L/14
+MINILM_DIM = 384    # paraphrase-multilingual-MiniLM-L12-v2
+
+# Lado de la miniatura que se hashea (el vector no depende del tamaño original)
+_IMAGE_HASH_SIZE = 16
+
+
+def content_seed(data: bytes) -> int:
+    """Semilla de 63 bits a partir del contenido"""
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], 'little') & 0x7FFFFFFFFFFFFFFF
+
+
+def seeded_unit_vector(seed: int, dim: int) -> np.ndarray:
+    """Vector unitario float32 determinista para una semilla"""
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def image_seed(image) -> int:
+    """Semilla de una imagen PIL"""
+    return content_seed(image.convert('RGB').resize((_IMAGE_HASH_SIZE, _IMAGE_HASH_SIZE)).tobytes())
+
+
+def text_seed(text: str) -> int:
+    return content_seed(text.encode('utf-8'))
+
+
+def stub_dim_for(model_id: str) -> int:
+    """Dimensión de embedding del modelo real que se imita"""
+    return CLIP_LARGE_DIM if 'large' in (model_id or '') else CLIP_DIM
+
+
+class StubClipProcessor:
+    """Reemplazo de CLIPProcessor: codifica cada entrada como su semilla"""
+
+    def __call__(self, images=None, text=None, return_tensors='pt', padding=True, truncation=True, **kwargs):
+        import torch
+
+        # processor(image, return_tensors="pt") -> la imagen llega como primer posicional
+        inputs = {}
+        if images is not None:
+            images = images if isinstance(images, (list, tuple)) else [images]
+            inputs['pixel_values'] = torch.tensor([[image_seed(img)] for img in images], dtype=torch.int64)
+        if text is not None:
+            text = [text] if isinstance(text, str) else list(text)
+            inputs['input_ids'] = torch.tensor([[text_seed(t)] for t in text], dtype=torch.int64)
+            inputs['attention_mask'] = torch.ones((len(text), 1), dtype=torch.int64)
+        return inputs
+
+
+class StubClipModel:
+    """Reemplazo de CLIPModel con vectores deterministas"""
+
+    def __init__(self, dim: int = CLIP_DIM, model_id: str = None):
+        self.dim = dim
+        self.model_id = model_id
+        self.config = SimpleNamespace(projection_dim=dim)
+
+    def _features(self, seeds):
+        import torch
+        return torch.from_numpy(np.stack([seeded_unit_vector(int(s), self.dim) for s in seeds[:, 0].tolist()]))
+
+    def get_image_features(self, pixel_values=None, **kwargs):
+        return self._features(pixel_values)
+
+    def get_text_features(self, input_ids=None, attention_mask=None, **kwargs):
+        return self._features(input_ids)
+
+    def __call__(self, input_ids=None, pixel_values=None, attention_mask=None, **kwargs):
+        """Equivalente a CLIPModel.forward: embeddings normalizados + logits"""
+        image_embeds = self.get_image_features(pixel_values) if pixel_values is not None else None
+        text_embeds = self.get_text_features(input_ids) if input_ids is not None else None
+        logits_per_image = logits_per_text = None
+        if image_embeds is not None and text_embeds is not None:
+            logits_per_image = 100.0 * image_embeds @ text_embeds.T
+            logits_per_text = logits_per_image.T
+        return SimpleNamespace(image_embeds=image_embeds, text_embeds=text_embeds,
+                               logits_per_image=logits_per_image, logits_per_text=logits_per_text)
+
+    # Compatibilidad con el uso de CLIPModel en la app
+    def eval(self):
+        return self
+
+    def to(self, *args, **kwargs):
+        return self
+
+    def cuda(self):
+        return self
+
+
+class StubSentenceModel:
+    """Reemplazo de SentenceTransformer (MiniLM) para llm_query_normalizer"""
+
+    def __init__(self, dim: int = MINILM_DIM):
+        self.dim = dim
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        items = [sentences] if single else list(sentences)
+        if not items:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = np.stack([seeded_unit_vector(text_seed(s), self.dim) for s in items])
+        return vectors[0] if single else vectors
@@ -12,3 +12,5 @@ from .image import Image
 from .search_log import SearchLog
 from .store_search_config import StoreSearchConfig
 from .color_mapping import ColorMapping
+from .batch_job import BatchJob
+from .shadow_embedding import ShadowEmbedding
@@ -0,0 +1,94 @@
+"""
+Modelo BatchJob para CLIP Comparador V2
+Checkpoint y progreso de trabajos batch largos (ej: regeneración de tags)
+"""
+from datetime import datetime
+from .. import db
+import uuid
+
+
+class BatchJob(db.Model):
+    """
+    Trabajo batch reanudable.
+
+    El job recorre productos por keyset (id > last_product_id ORDER BY id) y
+    hace commit del checkpoint después de cada lote, así un fallo o un reinicio
+    del worker solo pierde el lote en curso.
+    """
+    __tablename__ = 'batch_jobs'
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_CANCELLING = 'cancelling'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING, STATUS_CANCELLING)
+    RESUMABLE_STATUSES = (STATUS_FAILED, STATUS_CANCELLED)
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    client_id = db.Column(db.String(36), db.ForeignKey('clients.id', ondelete='CASCADE'), nullable=False)
+    job_type = db.Column(db.String(50), nullable=False)  # 'regenerate_tags'
+    status = db.Column(db.String(20), nullable=False, default=STATUS_PENDING)
+
+    # Parámetros del job (chunk_size, throttle_ms, overwrite, ...)
+    params = db.Column(db.JSON, default=dict)
+
+    # Progreso
+    total = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    updated = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+
+    # Checkpoint: último producto procesado (cursor keyset)
+    last_product_id = db.Column(db.String(36))
+
+    error_message = db.Column(db.Text)
+    created_by = db.Column(db.String(36))
+
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    client = db.relationship('Client', backref=db.backref('batch_jobs', lazy='dynamic', cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        db.Index('idx_batch_jobs_client_type', 'client_id', 'job_type', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f'<BatchJob {self.job_type} {self.status} {self.processed}/{self.total}>'
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def progress(self):
+        """Porcentaje de avance (0-100)"""
+        if not self.total:
+            return 100.0 if self.status == self.STATUS_COMPLETED else 0.0
+        return round(min(self.processed, self.total) * 100.0 / self.total, 1)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'client_id': self.client_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'params': self.params or {},
+            'total': self.total,
+            'processed': self.processed,
+            'updated': self.updated,
+            'failed': self.failed,
+            'progress': self.progress,
+            'last_product_id': self.last_product_id,
+            'error_message': self.error_message,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
@@ -1,9 +1,12 @@
 """
 Modelo Category para CLIP Comparador V2
 """
+import logging
 from datetime import datetime
 from .. import db
 
+logger = logging.getLogger("categories")
+
 class Category(db.Model):
     """Modelo para categorías de productos con soporte bilingüe para CLIP"""
     __tablename__ = 'categories'
@@ -27,6 +30,8 @@ class Category(db.Model):
     centroid_embedding = db.Column(db.Text)  # Embedding centroide precalculado de la categoría
     centroid_updated_at = db.Column(db.DateTime)  # Última actualización del centroide
     centroid_image_count = db.Column(db.Integer, default=0)  # Número de imágenes usadas en el centroide
+    prototype_embeddings = db.Column(db.Text)  # JSON [[...], ...] sub-centroides k-means (índice multi-prototipo)
+    centroid_model = db.Column(db.String(50))  # Modelo CLIP de los embeddings del centroide y prototipos
 
     # Campos de interfaz
     color = db.Column(db.String(7), default='#007bff')  # Color hex para la UI
@@ -68,6 +73,7 @@ class Category(db.Model):
         import json
         import numpy as np
         from datetime import datetime
+        from app.core.model_versions import client_model_name
 
         try:
             # Si ya existe centroide y no se fuerza recálculo, mantener existente
@@ -77,11 +83,14 @@ class Category(db.Model):
 
             print(f"🔄 Calculando centroide para categoría {self.name}...")
 
-            # Obtener todas las imágenes procesadas de esta categoría
+            # Obtener todas las imágenes procesadas de esta categoría (solo del modelo activo del cliente)
+            model_name = client_model_name(self.client_id)
             category_embeddings = []
 
             for product in self.products:
                 for image in product.images:
+                    if image.embedding_model and image.embedding_model != model_name:
+                        continue
                     if image.clip_embedding and image.is_processed:
                         try:
                             embedding_data = json.loads(image.clip_embedding)
@@ -98,6 +107,7 @@ class Category(db.Model):
                 self.centroid_embedding = None
                 self.centroid_updated_at = None
                 self.centroid_image_count = 0
+                self.prototype_embeddings = None
                 return False
 
             # Calcular centroide (promedio) y normalizar
@@ -109,8 +119,15 @@ class Category(db.Model):
             self.centroid_embedding = json.dumps(centroid.tolist())
             self.centroid_updated_at = datetime.utcnow()
             self.centroid_image_count = len(category_embeddings)
+            self.centroid_model = model_name
+
+            # Sub-centroides para el índice multi-prototipo (app/core/category_index.py)
+            from app.core.category_index import compute_prototypes
+            prototypes = compute_prototypes(category_embeddings)
+            self.prototype_embeddings = json.dumps(prototypes.tolist()) if len(prototypes) > 1 else None
 
-            print(f"✅ Centroide actualizado para {self.name}: {len(category_embeddings)} imágenes")
+            print(f"✅ Centroide actualizado para {self.name}: {len(category_embeddings)} imágenes, "
+                  f"{len(prototypes)} prototipos")
             return True
 
         except Exception as e:
@@ -136,10 +153,9 @@ class Category(db.Model):
         if self.centroid_embedding:
             try:
                 centroid_array = np.array(json.loads(self.centroid_embedding))
-                print(f"⚡ Centroide cargado desde BD para {self.name} ({self.centroid_image_count} imágenes)")
                 return centroid_array
             except Exception as e:
-                print(f"⚠️ Error deserializando centroide para {self.name}: {e}")
+                logger.warning("Error deserializando centroide para %s: %s", self.name, e)
                 # Si hay error, limpiar centroide corrupto
                 self.centroid_embedding = None
                 self.centroid_updated_at = None
@@ -147,22 +163,22 @@ class Category(db.Model):
 
         # Si no existe y auto_calculate está habilitado, calcularlo
         if auto_calculate:
-            print(f"🔄 Centroide no existe para {self.name}, calculando...")
+            logger.info("Centroide no existe para %s, calculando...", self.name)
             if self.update_centroid_embedding():
                 # Commit inmediato para persistir en BD
                 from .. import db
                 try:
                     db.session.commit()
-                    print(f"💾 Centroide guardado en BD para {self.name}")
+                    logger.info("Centroide guardado en BD para %s", self.name)
                 except Exception as e:
-                    print(f"⚠️ Error guardando centroide en BD: {e}")
+                    logger.warning("Error guardando centroide en BD: %s", e)
                     db.session.rollback()
 
                 # Retornar centroide recién calculado
                 if self.centroid_embedding:
                     return np.array(json.loads(self.centroid_embedding))
 
-        print(f"❌ No se pudo obtener centroide para {self.name}")
+        logger.debug("No se pudo obtener centroide para %s", self.name)
         return None
 
     def needs_centroid_update(self):
@@ -23,6 +23,9 @@ class Client(db.Model):
     category_confidence_threshold = db.Column(db.Integer, default=70)  # Confianza mínima para detectar categoría (70%)
     product_similarity_threshold = db.Column(db.Integer, default=30)   # Similitud mínima para matching de productos (30%)
 
+    # Modelo CLIP del índice activo (NULL = clip.model_name); se cambia con cutover (app/core/model_versions.py)
+    embedding_model = db.Column(db.String(50))
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -15,7 +15,8 @@ class Image(db.Model):
     original_filename = db.Column(db.String(500))  # Nombre del archivo original al subir
     cloudinary_url = db.Column(db.String(500))  # URL completa de Cloudinary
     cloudinary_public_id = db.Column(db.String(255))  # ID público de Cloudinary
-    base64_data = db.Column(db.Text)  # Imagen en base64 para API (generado una sola vez)
+    # Columnas pesadas: diferidas (no se cargan salvo acceso explícito o undefer())
+    base64_data = db.deferred(db.Column(db.Text))  # Imagen en base64 para API (generado una sola vez)
     width = db.Column(db.Integer)
     height = db.Column(db.Integer)
     file_size = db.Column(db.Integer)  # Tamaño en bytes
@@ -25,14 +26,27 @@ class Image(db.Model):
     is_primary = db.Column(db.Boolean, default=False)  # Imagen principal del producto
     is_processed = db.Column(db.Boolean, default=False)  # Si ya se generó el embedding
     clip_embedding = db.Column(db.Text)  # Embedding CLIP serializado como JSON
+    # Componentes crudos para recalcular la fusión sin re-encode (app/core/embedding_recipe.py)
+    image_features = db.deferred(db.Column(db.Text))  # Features de imagen sin normalizar (JSON)
+    embedding_recipe = db.Column(db.String(50))  # Receta del embedding, p.ej. "contextual_fusion/2" (NULL = anterior)
+    embedding_model = db.Column(db.String(50))  # Modelo CLIP que generó clip_embedding ('ViT-B/16')
     upload_status = db.Column(db.String(50), default='pending')  # pending, processing, completed, failed
-    error_message = db.Column(db.Text)  # Mensaje de error si falló el procesamiento
+    error_message = db.deferred(db.Column(db.Text))  # Mensaje de error si falló el procesamiento (diferida)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relaciones
     client = db.relationship('Client', backref='images')
 
+    # Índices de queries calientes (migrations/2025-11-04_hot_query_indexes.sql)
+    __table_args__ = (
+        db.Index('idx_images_client_searchable', 'client_id', 'product_id',
+                 postgresql_where=db.text('is_processed = TRUE AND clip_embedding IS NOT NULL')),
+        db.Index('idx_images_client_processed', 'client_id', 'is_processed'),
+        db.Index('idx_images_product_primary', 'product_id', 'is_primary'),
+        db.Index('idx_images_filename', 'filename'),
+    )
+
     def __init__(self, **kwargs):
         if 'id' not in kwargs:
             import uuid
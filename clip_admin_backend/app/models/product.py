@@ -12,7 +12,7 @@ class Product(db.Model):
     client_id = db.Column(db.String(36), db.ForeignKey('clients.id'), nullable=False)
     category_id = db.Column(db.String(36), db.ForeignKey('categories.id'), nullable=False)
     name = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text)
+    description = db.deferred(db.Column(db.Text))  # Diferida: la búsqueda visual no la necesita
     brand = db.Column(db.String(100))  # Marca del producto
     sku = db.Column(db.String(100))  # Código único del producto
     price = db.Column(db.Numeric(10, 2), nullable=True)
@@ -27,6 +27,12 @@ class Product(db.Model):
     client = db.relationship('Client', backref='products')
     images = db.relationship('Image', backref='product', lazy='dynamic', cascade='all, delete-orphan')
 
+    # Índices de queries calientes (migrations/2025-11-04_hot_query_indexes.sql y 2025-11-08_products_client_sku_unique.sql)
+    __table_args__ = (
+        db.Index('idx_products_client_category', 'client_id', 'category_id'),
+        db.Index('uq_products_client_sku', 'client_id', 'sku', unique=True),  # Upsert de la importación masiva
+    )
+
     def __init__(self, **kwargs):
         if 'id' not in kwargs:
             import uuid
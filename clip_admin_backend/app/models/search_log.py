@@ -17,6 +17,10 @@ class SearchLog(db.Model):
     # Relación con client
     client = db.relationship('Client', backref='search_logs')
 
+    __table_args__ = (
+        db.Index('idx_search_logs_client_created', 'client_id', 'created_at'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -0,0 +1,33 @@
+"""
+Modelo ShadowEmbedding para CLIP Comparador V2
+Vectores de un índice sombra: embeddings de imágenes con un modelo CLIP que todavía no es el activo
+"""
+from datetime import datetime
+from .. import db
+
+
+class ShadowEmbedding(db.Model):
+    """
+    Embedding de una imagen con el modelo de un índice sombra.
+
+    Lo llena el job 'shadow_reindex' mientras el cliente sigue buscando con su
+    modelo activo; el cutover (app/core/model_versions.py) copia estos vectores
+    a images en una sola transacción y borra las filas.
+    """
+    __tablename__ = 'shadow_embeddings'
+
+    image_id = db.Column(db.String(36), db.ForeignKey('images.id', ondelete='CASCADE'), primary_key=True)
+    model_name = db.Column(db.String(50), primary_key=True)  # 'ViT-L/14'
+    client_id = db.Column(db.String(36), db.ForeignKey('clients.id', ondelete='CASCADE'), nullable=False)
+
+    clip_embedding = db.Column(db.Text, nullable=False)  # Embedding final normalizado (JSON)
+    image_features = db.deferred(db.Column(db.Text))  # Features crudas de imagen (JSON)
+    embedding_recipe = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_shadow_embeddings_client_model', 'client_id', 'model_name'),
+    )
+
+    def __repr__(self):
+        return f'<ShadowEmbedding {self.image_id} {self.model_name}>'
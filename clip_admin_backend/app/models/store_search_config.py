@@ -79,6 +79,16 @@ class StoreSearchConfig(db.Model):
         comment='Configuración de atributos de metadata y sus pesos'
     )
 
+    # ===================================================================
+    # PRESUPUESTO DE LATENCIA (app/core/latency_budget.py)
+    # ===================================================================
+
+    latency_budget_ms = db.Column(
+        db.Integer,
+        nullable=True,
+        comment='Presupuesto de latencia de la búsqueda visual en ms (NULL = default del sistema)'
+    )
+
     # ===================================================================
     # METADATOS DEL MODELO
     # ===================================================================
@@ -273,6 +283,7 @@ class StoreSearchConfig(db.Model):
             'metadata_weight': self.metadata_weight,
             'business_weight': self.business_weight,
             'metadata_config': self.metadata_config,
+            'latency_budget_ms': self.latency_budget_ms,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
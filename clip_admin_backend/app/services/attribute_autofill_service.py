@@ -2,16 +2,21 @@
 Servicio para auto-completar atributos de productos usando CLIP
 Analiza las imágenes y detecta atributos visuales automáticamente
 """
-import torch
 from PIL import Image
-import requests
-from io import BytesIO
 import json
+import threading
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Optional
 from app.models import Product, Image as ProductImage, ProductAttributeConfig
 from app import db
+from app.services.image_cache import image_cache
 from app.blueprints.embeddings import get_clip_model  # Reutilizar modelo compartido
+from app.core.admission import admit, PRIORITY_BACKGROUND
+from app.utils.lazy_imports import lazy_import
+
+torch = lazy_import('torch')
 
 # Tags contextuales expandidos para búsquedas conceptuales
 # Categorizados por ocasión, funcionalidad y características visuales
@@ -68,8 +73,32 @@ ATTRIBUTE_PROMPT_TEMPLATES = {
 }
 
 
+# Límite de bloques de features de texto cacheados (por cliente/atributo/categoría)
+TEXT_FEATURE_CACHE_SIZE = 512
+
+# Imágenes por lote al pasar por la torre de visión
+IMAGE_BATCH_SIZE = 16
+
+# Descargas de imágenes concurrentes por lote
+DOWNLOAD_WORKERS = 8
+
+# Clave de bloque para los tags contextuales dentro del banco de prompts
+TAGS_BLOCK = "_tags"
+
+
 class AttributeAutofillService:
-    """Servicio para auto-completar atributos usando análisis CLIP"""
+    """
+    Servicio para auto-completar atributos usando análisis CLIP
+
+    Trabaja con primitivas "encode-once":
+    - Cada imagen pasa UNA vez por la torre de visión (en lotes)
+    - Las features de texto de los prompts se cachean por (cliente, atributo, categoría)
+    - Los scores de todos los atributos y tags salen de una sola multiplicación de matrices
+    """
+
+    # Cache LRU de features de texto normalizadas {clave: tensor (M, D) en CPU}
+    _text_cache = OrderedDict()
+    _text_cache_lock = threading.Lock()
 
     @classmethod
     def _ensure_model_loaded(cls):
@@ -84,101 +113,201 @@ class AttributeAutofillService:
         return ATTRIBUTE_PROMPT_TEMPLATES.get(key_lower, ATTRIBUTE_PROMPT_TEMPLATES["_default"])
 
     @classmethod
-    def _classify_attribute(cls, image: Image.Image, attribute_name: str,
-                          options: List[str], category_context: str) -> Tuple[str, float]:
+    def _build_attribute_prompts(cls, attribute_name: str, options: List[str], category_context: str) -> List[str]:
+        """Prompts textuales de cada opción de un atributo"""
+        prompt_template = cls._get_prompt_template(attribute_name)
+        return [
+            prompt_template.replace("{value}", option).replace("{category}", category_context)
+            for option in options
+        ]
+
+    @classmethod
+    def _build_tag_prompts(cls, tag_options: List[str], category_context: str) -> List[str]:
+        """Prompts textuales de cada tag contextual"""
+        return [f"a {tag} style {category_context}" for tag in tag_options]
+
+    @staticmethod
+    def _model_device(model):
+        """Device donde vive el modelo (ONNX / int8 siempre CPU)"""
+        try:
+            return next(model.parameters()).device
+        except Exception:
+            return torch.device("cpu")
+
+    # ------------------------------------------------------------------
+    # Primitivas encode-once
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def encode_images(cls, images: List[Image.Image], batch_size: int = IMAGE_BATCH_SIZE) -> "torch.Tensor":
         """
-        Clasifica un atributo usando CLIP comparando la imagen con opciones textuales
+        Pasa imágenes por la torre de visión en lotes
 
         Args:
-            image: Imagen PIL a analizar
-            attribute_name: Nombre del atributo (ej: 'color', 'material')
-            options: Lista de valores posibles (ej: ['ROJO', 'AZUL', 'VERDE'])
-            category_context: Contexto de categoría (ej: 'camisa', 'delantal')
+            images: Lista de imágenes PIL
+            batch_size: Imágenes por lote
 
         Returns:
-            Tupla (mejor_opción, confianza)
+            Tensor (N, D) L2-normalizado en CPU
         """
         model, processor = cls._ensure_model_loaded()
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = cls._model_device(model)
 
-        # Obtener template de prompt adecuado
-        prompt_template = cls._get_prompt_template(attribute_name)
+        chunks = []
+        for start in range(0, len(images), batch_size):
+            inputs = processor(images=images[start:start + batch_size], return_tensors="pt")
+            # Cupo de fondo por lote: la búsqueda del widget puede colarse entre lotes
+            with admit(PRIORITY_BACKGROUND), torch.no_grad():
+                feats = model.get_image_features(pixel_values=inputs["pixel_values"].to(device))
+            feats = feats / feats.norm(dim=-1, keepdim=True)
+            chunks.append(feats.float().cpu())
 
-        # Crear prompts textuales para cada opción
-        text_prompts = [
-            prompt_template.replace("{value}", option).replace("{category}", category_context)
-            for option in options
-        ]
+        return torch.cat(chunks, dim=0)
 
-        # Preprocesar imagen y textos
-        inputs = processor(
-            text=text_prompts,
-            images=image,
-            return_tensors="pt",
-            padding=True
-        ).to(device)
+    @classmethod
+    def _encode_texts(cls, prompts: List[str]) -> "torch.Tensor":
+        """Pasa prompts por la torre de texto; devuelve tensor (M, D) L2-normalizado en CPU"""
+        model, processor = cls._ensure_model_loaded()
+        device = cls._model_device(model)
 
-        # Generar embeddings
+        inputs = processor(text=prompts, return_tensors="pt", padding=True)
         with torch.no_grad():
-            outputs = model(**inputs)
+            feats = model.get_text_features(
+                input_ids=inputs["input_ids"].to(device),
+                attention_mask=inputs["attention_mask"].to(device)
+            )
+        feats = feats / feats.norm(dim=-1, keepdim=True)
+        return feats.float().cpu()
 
-            # Normalizar embeddings
-            image_embeds = outputs.image_embeds / outputs.image_embeds.norm(dim=-1, keepdim=True)
-            text_embeds = outputs.text_embeds / outputs.text_embeds.norm(dim=-1, keepdim=True)
+    @classmethod
+    def get_text_features(cls, client_id, attribute_name: str, category_context: str,
+                          prompts: List[str]) -> "torch.Tensor":
+        """
+        Features de texto de un bloque de prompts, cacheadas por (modelo, cliente, atributo, categoría)
 
-            # Calcular similitudes (imagen con cada texto)
-            similarities = (image_embeds @ text_embeds.T).cpu().numpy()[0]
+        La clave incluye los propios prompts para que un cambio en las opciones
+        del atributo invalide la entrada automáticamente, y el modelo CLIP activo
+        (model_versions.active_model_name) para que clientes con modelos distintos
+        convivan en la cache sin vaciarla (igual que embedding_recipe y category_index).
 
-        # Encontrar la opción con mayor similitud
-        best_idx = similarities.argmax()
-        best_option = options[best_idx]
-        confidence = float(similarities[best_idx])
+        Returns:
+            Tensor (M, D) L2-normalizado en CPU
+        """
+        from app.core.model_versions import active_model_name
+
+        key = (active_model_name(), str(client_id), attribute_name, category_context, tuple(prompts))
 
-        return best_option, confidence
+        with cls._text_cache_lock:
+            cached = cls._text_cache.get(key)
+            if cached is not None:
+                cls._text_cache.move_to_end(key)
+                return cached
+
+        feats = cls._encode_texts(prompts)
+
+        with cls._text_cache_lock:
+            cls._text_cache[key] = feats
+            while len(cls._text_cache) > TEXT_FEATURE_CACHE_SIZE:
+                cls._text_cache.popitem(last=False)
+
+        return feats
 
     @classmethod
-    def _classify_tags(cls, image: Image.Image, tag_options: List[str],
-                      threshold: float = 0.25, category_context: str = "garment") -> List[Tuple[str, float]]:
+    def clear_text_cache(cls):
+        """Vacía la cache de features de texto (ej: tras editar opciones de atributos)"""
+        with cls._text_cache_lock:
+            cls._text_cache.clear()
+
+    @classmethod
+    def _build_prompt_bank(cls, client_id, attribute_options: Dict[str, List[str]],
+                           category_context: str, include_tags: bool = True):
         """
-        Clasifica múltiples tags que aplican a la imagen
+        Apila las features de texto de todos los atributos (y tags) en una sola matriz
 
         Returns:
-            Lista de tuplas (tag, confianza) con confianza superior al umbral
+            Tupla (bloques, matriz) donde bloques = [(nombre, opciones, inicio, fin)]
+            y matriz es un tensor (sum(M), D)
         """
-        model, processor = cls._ensure_model_loaded()
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        blocks = []
+        feats = []
+        offset = 0
 
-        # Crear prompts textuales para cada tag
-        text_prompts = [f"a {tag} style {category_context}" for tag in tag_options]
+        for attr_name, options in attribute_options.items():
+            prompts = cls._build_attribute_prompts(attr_name, options, category_context)
+            block = cls.get_text_features(client_id, attr_name, category_context, prompts)
+            blocks.append((attr_name, options, offset, offset + len(options)))
+            feats.append(block)
+            offset += len(options)
 
-        # Preprocesar imagen y textos
-        inputs = processor(
-            text=text_prompts,
-            images=image,
-            return_tensors="pt",
-            padding=True
-        ).to(device)
+        if include_tags:
+            prompts = cls._build_tag_prompts(TAG_OPTIONS, category_context)
+            block = cls.get_text_features(None, TAGS_BLOCK, category_context, prompts)
+            blocks.append((TAGS_BLOCK, TAG_OPTIONS, offset, offset + len(TAG_OPTIONS)))
+            feats.append(block)
 
-        # Generar embeddings
-        with torch.no_grad():
-            outputs = model(**inputs)
+        return blocks, torch.cat(feats, dim=0)
 
-            # Normalizar embeddings
-            image_embeds = outputs.image_embeds / outputs.image_embeds.norm(dim=-1, keepdim=True)
-            text_embeds = outputs.text_embeds / outputs.text_embeds.norm(dim=-1, keepdim=True)
+    # ------------------------------------------------------------------
+    # API de clasificación (compatibles con los callers existentes)
+    # ------------------------------------------------------------------
 
-            # Calcular similitudes
-            similarities = (image_embeds @ text_embeds.T).cpu().numpy()[0]
+    @classmethod
+    def _classify_attribute(cls, image: Image.Image, attribute_name: str,
+                          options: List[str], category_context: str,
+                          image_features: Optional["torch.Tensor"] = None) -> Tuple[str, float]:
+        """
+        Clasifica un atributo usando CLIP comparando la imagen con opciones textuales
 
-        # Filtrar tags con confianza superior al umbral
-        relevant_tags = []
-        for i, tag in enumerate(tag_options):
-            if similarities[i] > threshold:
-                relevant_tags.append((tag, float(similarities[i])))
+        Args:
+            image: Imagen PIL a analizar
+            attribute_name: Nombre del atributo (ej: 'color', 'material')
+            options: Lista de valores posibles (ej: ['ROJO', 'AZUL', 'VERDE'])
+            category_context: Contexto de categoría (ej: 'camisa', 'delantal')
+            image_features: Features ya calculadas de la imagen (1, D), evita re-encodear
 
-        # Ordenar por confianza descendente
-        relevant_tags.sort(key=lambda x: x[1], reverse=True)
+        Returns:
+            Tupla (mejor_opción, confianza)
+        """
+        if image_features is None:
+            image_features = cls.encode_images([image])
+
+        prompts = cls._build_attribute_prompts(attribute_name, options, category_context)
+        text_features = cls.get_text_features(None, attribute_name, category_context, prompts)
+
+        similarities = (image_features[:1] @ text_features.T).numpy()[0]
 
+        # Encontrar la opción con mayor similitud
+        best_idx = similarities.argmax()
+        return options[best_idx], float(similarities[best_idx])
+
+    @classmethod
+    def _classify_tags(cls, image: Image.Image, tag_options: List[str],
+                      threshold: float = 0.25, category_context: str = "garment",
+                      image_features: Optional["torch.Tensor"] = None) -> List[Tuple[str, float]]:
+        """
+        Clasifica múltiples tags que aplican a la imagen
+
+        Returns:
+            Lista de tuplas (tag, confianza) con confianza superior al umbral
+        """
+        if image_features is None:
+            image_features = cls.encode_images([image])
+
+        prompts = cls._build_tag_prompts(tag_options, category_context)
+        text_features = cls.get_text_features(None, TAGS_BLOCK, category_context, prompts)
+
+        similarities = (image_features[:1] @ text_features.T).numpy()[0]
+        return cls._select_tags(tag_options, similarities, threshold)
+
+    @staticmethod
+    def _select_tags(tag_options: List[str], similarities, threshold: float) -> List[Tuple[str, float]]:
+        """Tags con similitud superior al umbral, ordenados por confianza descendente"""
+        relevant_tags = [
+            (tag, float(similarities[i]))
+            for i, tag in enumerate(tag_options)
+            if similarities[i] > threshold
+        ]
+        relevant_tags.sort(key=lambda x: x[1], reverse=True)
         return relevant_tags
 
     @classmethod
@@ -189,13 +318,136 @@ class AttributeAutofillService:
             if "/upload/" in url:
                 url = url.replace("/upload/", "/upload/c_fill,g_auto,w_800,h_800/")
 
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            return Image.open(BytesIO(response.content)).convert('RGB')
+            return image_cache.get_thumbnail(url, timeout=10)
         except Exception as e:
             print(f"⚠️ Error descargando imagen {url}: {e}")
             return None
 
+    @classmethod
+    def _download_images(cls, urls: List[str], max_workers: int = DOWNLOAD_WORKERS) -> List[Optional[Image.Image]]:
+        """Descarga varias imágenes en paralelo; conserva el orden (None en las que fallan)"""
+        if len(urls) <= 1:
+            return [cls._download_image(url) for url in urls]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            return list(executor.map(cls._download_image, urls))
+
+    # ------------------------------------------------------------------
+    # Autofill
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _get_attribute_options(cls, client_id) -> Dict[str, List[str]]:
+        """Atributos tipo lista con valores configurados para el cliente {key: [valores]}"""
+        attribute_configs = ProductAttributeConfig.query.filter_by(
+            client_id=client_id,
+            type='list'
+        ).all()
+
+        attribute_options = {}
+        for config in attribute_configs:
+            if config.options and isinstance(config.options, dict) and 'values' in config.options:
+                values = config.options['values']
+                if values:
+                    attribute_options[config.key] = values
+        return attribute_options
+
+    @staticmethod
+    def _empty_result(message: str) -> Dict[str, any]:
+        return {
+            'success': False,
+            'message': message,
+            'attributes': {},
+            'tags': ''
+        }
+
+    @classmethod
+    def _consolidate_product(cls, product: Product, weights: List[float], scores: np.ndarray,
+                             blocks, overwrite: bool) -> Dict[str, any]:
+        """
+        Convierte la matriz de scores (imágenes x prompts) de un producto en atributos y tags
+
+        Args:
+            product: Producto analizado
+            weights: Peso de cada imagen (primaria 1.5, resto 1.0)
+            scores: Matriz (N_imágenes, sum(M)) de similitudes
+            blocks: Bloques del banco de prompts [(nombre, opciones, inicio, fin)]
+            overwrite: Si True, sobrescribe atributos existentes
+        """
+        all_attributes = {}
+        all_tags = {}
+
+        for name, options, start, end in blocks:
+            block_scores = scores[:, start:end]
+
+            if name == TAGS_BLOCK:
+                # Threshold MÁS BAJO para capturar más contexto semántico
+                for row, weight in zip(block_scores, weights):
+                    for tag, confidence in cls._select_tags(options, row, threshold=0.15):
+                        all_tags[tag] = all_tags.get(tag, 0) + confidence * weight
+                continue
+
+            votes = all_attributes.setdefault(name, {})
+            best_idx = block_scores.argmax(axis=1)
+            for row_idx, (idx, weight) in enumerate(zip(best_idx, weights)):
+                confidence = float(block_scores[row_idx, idx])
+                # Acumular votos ponderados por confianza
+                if confidence > 0.2:
+                    best_option = options[idx]
+                    votes[best_option] = votes.get(best_option, 0) + confidence * weight
+
+        # Consolidar atributos finales
+        detected_attributes = {}
+        current_attributes = product.attributes or {}
+
+        for attr_name, votes in all_attributes.items():
+            if votes:
+                # Elegir el atributo con mayor peso acumulado
+                best_option = max(votes.items(), key=lambda x: x[1])
+
+                # Solo agregar si:
+                # 1. overwrite=True, O
+                # 2. El atributo no existe en el producto, O
+                # 3. El atributo existe pero está vacío
+                if overwrite or attr_name not in current_attributes or not current_attributes.get(attr_name):
+                    detected_attributes[attr_name] = best_option[0]
+                    print(f"  ✓ {attr_name}: {best_option[0]} (conf: {best_option[1]:.2f})")
+                else:
+                    print(f"  ⊘ {attr_name}: Ya tiene valor '{current_attributes[attr_name]}' (detectado: {best_option[0]})")
+
+        # Consolidar tags contextuales (mezclar existentes + nuevos)
+        detected_tags = ""
+        if all_tags:
+            sorted_tags = sorted(all_tags.items(), key=lambda x: x[1], reverse=True)[:8]
+            new_tag_names = [tag for tag, _ in sorted_tags]
+
+            # Mezclar con tags existentes (evitar duplicados)
+            existing_tags = []
+            if product.tags:
+                existing_tags = [t.strip() for t in product.tags.split(',') if t.strip()]
+
+            # Combinar: primero los nuevos (más relevantes), luego los viejos no duplicados
+            combined_tags = new_tag_names.copy()
+            for old_tag in existing_tags:
+                if old_tag not in combined_tags:
+                    combined_tags.append(old_tag)
+
+            # Limitar a 12 tags totales para no saturar
+            final_tags = combined_tags[:12]
+            detected_tags = ", ".join(final_tags)
+
+            # Mostrar tags con confianza para debugging
+            tags_debug = ", ".join([f"{tag}({conf:.2f})" for tag, conf in sorted_tags])
+            print(f"  ✓ Tags nuevos detectados: {tags_debug}")
+            if existing_tags:
+                print(f"  ℹ️ Tags existentes preservados: {', '.join([t for t in existing_tags if t in final_tags])}")
+
+        return {
+            'success': True,
+            'message': f'Detectados {len(detected_attributes)} atributos',
+            'attributes': detected_attributes,
+            'tags': detected_tags
+        }
+
     @classmethod
     def autofill_product_attributes(cls, product: Product, overwrite: bool = False) -> Dict[str, any]:
         """
@@ -208,146 +460,108 @@ class AttributeAutofillService:
         Returns:
             Dict con resultados: {'attributes': {...}, 'tags': str, 'success': bool, 'message': str}
         """
+        results = cls.autofill_products_batch([product], overwrite=overwrite)
+        return results.get(product.id) or cls._empty_result('Producto sin resultados de autofill')
+
+    @classmethod
+    def autofill_products_batch(cls, products: List[Product], overwrite: bool = False,
+                                batch_size: int = IMAGE_BATCH_SIZE) -> Dict[str, Dict[str, any]]:
+        """
+        Auto-completa atributos y tags de varios productos compartiendo inferencia
+
+        - Una sola query de imágenes para todos los productos
+        - Todas las imágenes pasan por la torre de visión en lotes de `batch_size`
+        - Un banco de prompts por (cliente, categoría), reutilizado entre productos
+        - Scores de cada producto = features_imágenes @ banco.T (una multiplicación)
+
+        Args:
+            products: Productos a analizar (pueden ser de distintos clientes)
+            overwrite: Si True, sobrescribe atributos existentes
+            batch_size: Imágenes por lote de inferencia
+
+        Returns:
+            Dict {product_id: resultado} con el mismo formato que autofill_product_attributes
+        """
+        results = {}
+        if not products:
+            return results
+
         try:
-            # Validar que el producto tenga imágenes
-            images = ProductImage.query.filter_by(product_id=product.id).all()
-            if not images:
-                return {
-                    'success': False,
-                    'message': 'Producto sin imágenes para analizar',
-                    'attributes': {},
-                    'tags': ''
-                }
-
-            # Obtener configuración de atributos del cliente
-            attribute_configs = ProductAttributeConfig.query.filter_by(
-                client_id=product.client_id,
-                type='list'
-            ).all()
-
-            if not attribute_configs:
-                return {
-                    'success': False,
-                    'message': 'Cliente sin atributos configurados para autofill',
-                    'attributes': {},
-                    'tags': ''
-                }
-
-            # Preparar opciones de atributos
-            attribute_options = {}
-            for config in attribute_configs:
-                if config.options and isinstance(config.options, dict) and 'values' in config.options:
-                    values = config.options['values']
-                    if values:
-                        attribute_options[config.key] = values
-
-            if not attribute_options:
-                return {
-                    'success': False,
-                    'message': 'No hay atributos tipo lista con valores configurados',
-                    'attributes': {},
-                    'tags': ''
-                }
-
-            # Contexto de categoría para prompts
-            category_ctx = product.category.name.lower() if product.category else "producto"
-
-            # Acumuladores de resultados por imagen
-            all_attributes = {attr: {} for attr in attribute_options.keys()}
-            all_tags = {}
-
-            print(f"🔍 Analizando {len(images)} imagen(es) del producto {product.name}...")
-
-            # Analizar cada imagen
-            for img in images:
-                # Descargar imagen
-                pil_image = cls._download_image(img.display_url)
-                if not pil_image:
+            # Imágenes de todos los productos en una sola query
+            product_ids = [p.id for p in products]
+            images_by_product = {}
+            for img in ProductImage.query.filter(ProductImage.product_id.in_(product_ids)).all():
+                images_by_product.setdefault(img.product_id, []).append(img)
+
+            # Opciones de atributos por cliente (una query por cliente)
+            options_by_client = {}
+            for product in products:
+                if product.client_id not in options_by_client:
+                    options_by_client[product.client_id] = cls._get_attribute_options(product.client_id)
+
+            # Descargar imágenes de los productos analizables
+            pending = []  # (product, [imágenes]) -> luego (product, [pesos], [PIL])
+            for product in products:
+                images = images_by_product.get(product.id, [])
+                if not images:
+                    results[product.id] = cls._empty_result('Producto sin imágenes para analizar')
+                    continue
+                if not options_by_client.get(product.client_id):
+                    results[product.id] = cls._empty_result('No hay atributos tipo lista con valores configurados')
                     continue
 
-                # Peso de la imagen (primaria tiene más peso)
-                weight = 1.5 if img.is_primary else 1.0
+                print(f"🔍 Analizando {len(images)} imagen(es) del producto {product.name}...")
+                pending.append((product, images))
+
+            # Descargas en paralelo para todas las imágenes del lote
+            downloaded = cls._download_images([img.display_url for _, images in pending for img in images])
+
+            cursor = 0
+            for idx, (product, images) in enumerate(pending):
+                weights, pil_images = [], []
+                for img in images:
+                    pil_image = downloaded[cursor]
+                    cursor += 1
+                    if not pil_image:
+                        continue
+                    pil_images.append(pil_image)
+                    # Peso de la imagen (primaria tiene más peso)
+                    weights.append(1.5 if img.is_primary else 1.0)
+                pending[idx] = (product, weights, pil_images)
+
+            # Torre de visión: todas las imágenes juntas, en lotes
+            flat_images = [pil for _, _, pils in pending for pil in pils]
+            image_features = cls.encode_images(flat_images, batch_size=batch_size) if flat_images else None
+
+            offset = 0
+            banks = {}
+            for product, weights, pil_images in pending:
+                feats = image_features[offset:offset + len(pil_images)] if pil_images else None
+                offset += len(pil_images)
+
+                if feats is None or len(feats) == 0:
+                    # Sin imágenes descargables: mismo resultado que antes (sin votos)
+                    results[product.id] = cls._consolidate_product(product, [], np.zeros((0, 0)), [], overwrite)
+                    continue
 
-                # Clasificar cada atributo
-                for attr_name, options in attribute_options.items():
-                    best_option, confidence = cls._classify_attribute(
-                        pil_image, attr_name, options, category_ctx
+                # Contexto de categoría para prompts
+                category_ctx = product.category.name.lower() if product.category else "producto"
+                bank_key = (product.client_id, category_ctx)
+                if bank_key not in banks:
+                    banks[bank_key] = cls._build_prompt_bank(
+                        product.client_id, options_by_client[product.client_id], category_ctx
                     )
+                blocks, text_matrix = banks[bank_key]
+
+                scores = (feats @ text_matrix.T).numpy()
+                results[product.id] = cls._consolidate_product(product, weights, scores, blocks, overwrite)
 
-                    # Acumular votos ponderados por confianza
-                    if confidence > 0.2:
-                        if best_option not in all_attributes[attr_name]:
-                            all_attributes[attr_name][best_option] = 0
-                        all_attributes[attr_name][best_option] += confidence * weight
-
-                # Clasificar tags relevantes (threshold MÁS BAJO para capturar más contexto semántico)
-                relevant_tags = cls._classify_tags(pil_image, TAG_OPTIONS,
-                                                  threshold=0.15, category_context=category_ctx)
-                for tag, confidence in relevant_tags:
-                    if tag not in all_tags:
-                        all_tags[tag] = 0
-                    all_tags[tag] += confidence * weight
-
-            # Consolidar atributos finales
-            detected_attributes = {}
-            current_attributes = product.attributes or {}
-
-            for attr_name, votes in all_attributes.items():
-                if votes:
-                    # Elegir el atributo con mayor peso acumulado
-                    best_option = max(votes.items(), key=lambda x: x[1])
-
-                    # Solo agregar si:
-                    # 1. overwrite=True, O
-                    # 2. El atributo no existe en el producto, O
-                    # 3. El atributo existe pero está vacío
-                    if overwrite or attr_name not in current_attributes or not current_attributes.get(attr_name):
-                        detected_attributes[attr_name] = best_option[0]
-                        print(f"  ✓ {attr_name}: {best_option[0]} (conf: {best_option[1]:.2f})")
-                    else:
-                        print(f"  ⊘ {attr_name}: Ya tiene valor '{current_attributes[attr_name]}' (detectado: {best_option[0]})")
-
-            # Consolidar tags contextuales (mezclar existentes + nuevos)
-            detected_tags = ""
-            if all_tags:
-                sorted_tags = sorted(all_tags.items(), key=lambda x: x[1], reverse=True)[:8]
-                new_tag_names = [tag for tag, _ in sorted_tags]
-
-                # Mezclar con tags existentes (evitar duplicados)
-                existing_tags = []
-                if product.tags:
-                    existing_tags = [t.strip() for t in product.tags.split(',') if t.strip()]
-
-                # Combinar: primero los nuevos (más relevantes), luego los viejos no duplicados
-                combined_tags = new_tag_names.copy()
-                for old_tag in existing_tags:
-                    if old_tag not in combined_tags:
-                        combined_tags.append(old_tag)
-
-                # Limitar a 12 tags totales para no saturar
-                final_tags = combined_tags[:12]
-                detected_tags = ", ".join(final_tags)
-
-                # Mostrar tags con confianza para debugging
-                tags_debug = ", ".join([f"{tag}({conf:.2f})" for tag, conf in sorted_tags])
-                print(f"  ✓ Tags nuevos detectados: {tags_debug}")
-                if existing_tags:
-                    print(f"  ℹ️ Tags existentes preservados: {', '.join([t for t in existing_tags if t in final_tags])}")
-
-            return {
-                'success': True,
-                'message': f'Detectados {len(detected_attributes)} atributos',
-                'attributes': detected_attributes,
-                'tags': detected_tags
-            }
+            return results
 
         except Exception as e:
             print(f"❌ Error en autofill de atributos: {e}")
             import traceback
             traceback.print_exc()
-            return {
-                'success': False,
-                'message': f'Error: {str(e)}',
-                'attributes': {},
-                'tags': ''
-            }
+            for product in products:
+                results.setdefault(product.id, cls._empty_result(f'Error: {str(e)}'))
+            return results
@@ -0,0 +1,459 @@
+"""
+Servicio de trabajos batch reanudables
+Regeneración de tags/atributos e índice sombra de embeddings (cambio de modelo CLIP)
+por lotes en segundo plano con checkpoint en BD
+"""
+import json
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from app import db
+from app.models.batch_job import BatchJob
+from app.models.product import Product
+from app.models.image import Image
+
+JOB_REGENERATE_TAGS = 'regenerate_tags'
+JOB_SHADOW_REINDEX = 'shadow_reindex'
+
+# Defaults de los jobs (se pueden sobrescribir por request)
+DEFAULT_CHUNK_SIZE = 32       # Productos por lote (una inferencia CLIP + un commit por lote)
+DEFAULT_THROTTLE_MS = 250     # Pausa entre lotes para no saturar CPU/BD del servidor web
+MAX_CHUNK_SIZE = 256
+
+# Un job 'running' sin heartbeat en este tiempo se considera muerto (worker reiniciado)
+STALE_AFTER = timedelta(minutes=10)
+
+# Pasadas del índice sombra: las imágenes subidas durante una pasada se toman en la siguiente
+MAX_SHADOW_PASSES = 3
+
+
+def products_with_images_query(client_id):
+    """Productos del cliente que tienen al menos una imagen (sin contar imágenes producto por producto)"""
+    return Product.query.filter(
+        Product.client_id == client_id,
+        Product.id.in_(db.session.query(Image.product_id).distinct())
+    )
+
+
+class BatchJobService:
+    """Orquesta jobs batch en threads daemon con progreso persistido en batch_jobs"""
+
+    _threads = {}  # {job_id: Thread} jobs corriendo en este proceso
+    _threads_lock = threading.Lock()
+
+    @classmethod
+    def get_job(cls, job_id: str) -> Optional[BatchJob]:
+        return BatchJob.query.get(job_id)
+
+    @classmethod
+    def get_latest_job(cls, client_id: str, job_type: str = JOB_REGENERATE_TAGS) -> Optional[BatchJob]:
+        return BatchJob.query.filter_by(
+            client_id=client_id, job_type=job_type
+        ).order_by(BatchJob.created_at.desc()).first()
+
+    @classmethod
+    def _is_stale(cls, job: BatchJob) -> bool:
+        """Job activo cuyo worker ya no existe (sin thread local y sin heartbeat reciente)"""
+        with cls._threads_lock:
+            thread = cls._threads.get(job.id)
+            if thread is not None and thread.is_alive():
+                return False
+        last_beat = job.heartbeat_at or job.created_at
+        return last_beat is None or datetime.utcnow() - last_beat > STALE_AFTER
+
+    @classmethod
+    def _latest_job_state(cls, client_id: str, job_type: str) -> Tuple[Optional[BatchJob], Optional[BatchJob]]:
+        """
+        Último job del tipo para el cliente
+
+        Returns:
+            Tupla (job activo | None, último job) - un job activo sin worker queda como fallido
+        """
+        latest = cls.get_latest_job(client_id, job_type)
+        if latest and latest.is_active:
+            if not cls._is_stale(latest):
+                return latest, latest
+            # Worker muerto: dejarlo como fallido para poder reanudarlo
+            latest.status = BatchJob.STATUS_FAILED
+            latest.error_message = 'Worker interrumpido (sin heartbeat)'
+            db.session.commit()
+        return None, latest
+
+    @classmethod
+    def start_regenerate_tags(cls, app, client_id: str, user_id: Optional[str] = None,
+                              chunk_size: int = DEFAULT_CHUNK_SIZE, throttle_ms: int = DEFAULT_THROTTLE_MS,
+                              overwrite: bool = False, resume: bool = True) -> Tuple[BatchJob, bool]:
+        """
+        Lanza (o reanuda) la regeneración de tags de un cliente en segundo plano
+
+        Args:
+            app: Instancia Flask (para abrir app_context en el thread)
+            client_id: Cliente a procesar
+            user_id: Usuario que lanza el job
+            chunk_size: Productos por lote
+            throttle_ms: Pausa entre lotes en milisegundos
+            overwrite: Si True, sobrescribe atributos existentes además de tags
+            resume: Si True, continúa el último job fallido/cancelado desde su checkpoint
+
+        Returns:
+            Tupla (job, lanzado) - lanzado=False si ya había un job activo para el cliente
+        """
+        chunk_size = max(1, min(int(chunk_size), MAX_CHUNK_SIZE))
+        throttle_ms = max(0, int(throttle_ms))
+
+        active, latest = cls._latest_job_state(client_id, JOB_REGENERATE_TAGS)
+        if active:
+            return active, False
+
+        if resume and latest and latest.status in BatchJob.RESUMABLE_STATUSES:
+            job = latest
+            job.status = BatchJob.STATUS_PENDING
+            job.error_message = None
+            job.finished_at = None
+            job.params = dict(job.params or {}, chunk_size=chunk_size, throttle_ms=throttle_ms)
+            print(f"🔁 Reanudando job {job.id} desde producto {job.last_product_id} ({job.processed}/{job.total})")
+        else:
+            job = BatchJob(
+                client_id=client_id,
+                job_type=JOB_REGENERATE_TAGS,
+                status=BatchJob.STATUS_PENDING,
+                params={'chunk_size': chunk_size, 'throttle_ms': throttle_ms, 'overwrite': overwrite},
+                total=products_with_images_query(client_id).count(),
+                created_by=user_id
+            )
+            db.session.add(job)
+
+        db.session.commit()
+        cls._spawn(app, job.id, cls._run_regenerate_tags)
+        return job, True
+
+    @classmethod
+    def start_shadow_reindex(cls, app, client_id: str, model_name: str, user_id: Optional[str] = None,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE, throttle_ms: int = DEFAULT_THROTTLE_MS,
+                             auto_cutover: bool = False, resume: bool = True,
+                             background: bool = True) -> Tuple[BatchJob, bool]:
+        """
+        Lanza (o reanuda) el índice sombra de un cliente con otro modelo CLIP
+
+        Codifica todas las imágenes buscables con model_name y guarda los vectores
+        en shadow_embeddings; el índice activo sigue sirviendo las búsquedas.
+        Con auto_cutover, al llegar a cobertura 100% hace el cutover
+        (app/core/model_versions.py).
+
+        Args:
+            app: Instancia Flask (para abrir app_context en el thread)
+            client_id: Cliente a procesar
+            model_name: Modelo del índice sombra ('ViT-L/14')
+            user_id: Usuario que lanza el job
+            chunk_size: Productos por lote
+            throttle_ms: Pausa entre lotes en milisegundos
+            auto_cutover: Pasar al modelo nuevo apenas la cobertura sea completa
+            resume: Si True, continúa el último job fallido/cancelado del mismo modelo
+            background: Si False corre en el thread actual (herramientas de consola)
+
+        Returns:
+            Tupla (job, lanzado) - lanzado=False si ya había un índice sombra en curso
+
+        Raises:
+            ValueError: Modelo desconocido o igual al activo del cliente
+        """
+        from app.blueprints.embeddings import CLIP_MODEL_MAP
+        from app.core.model_versions import client_model_name
+
+        if model_name not in CLIP_MODEL_MAP:
+            raise ValueError(f"Modelo CLIP desconocido: {model_name}")
+        if model_name == client_model_name(client_id):
+            raise ValueError(f"{model_name} ya es el modelo activo del cliente")
+
+        chunk_size = max(1, min(int(chunk_size), MAX_CHUNK_SIZE))
+        throttle_ms = max(0, int(throttle_ms))
+
+        active, latest = cls._latest_job_state(client_id, JOB_SHADOW_REINDEX)
+        if active:
+            return active, False
+
+        same_model = latest is not None and (latest.params or {}).get('model_name') == model_name
+        if resume and same_model and latest.status in BatchJob.RESUMABLE_STATUSES:
+            job = latest
+            job.status = BatchJob.STATUS_PENDING
+            job.error_message = None
+            job.finished_at = None
+            job.params = dict(job.params or {}, chunk_size=chunk_size, throttle_ms=throttle_ms,
+                              auto_cutover=auto_cutover)
+            print(f"🔁 Reanudando índice sombra {job.id} ({model_name}) desde producto {job.last_product_id}")
+        else:
+            job = BatchJob(
+                client_id=client_id,
+                job_type=JOB_SHADOW_REINDEX,
+                status=BatchJob.STATUS_PENDING,
+                params={'model_name': model_name, 'chunk_size': chunk_size, 'throttle_ms': throttle_ms,
+                        'auto_cutover': auto_cutover, 'passes': 1},
+                total=products_with_images_query(client_id).count(),
+                created_by=user_id
+            )
+            db.session.add(job)
+
+        db.session.commit()
+        job_id = job.id
+        if background:
+            cls._spawn(app, job_id, cls._run_shadow_reindex)
+        else:
+            cls._run_shadow_reindex(app, job_id)
+            job = cls.get_job(job_id)
+        return job, True
+
+    @classmethod
+    def cancel(cls, job_id: str) -> Optional[BatchJob]:
+        """Pide cancelar un job; el worker se detiene al terminar el lote en curso"""
+        job = cls.get_job(job_id)
+        if not job:
+            return None
+        if job.is_active:
+            job.status = BatchJob.STATUS_CANCELLING if not cls._is_stale(job) else BatchJob.STATUS_CANCELLED
+            db.session.commit()
+        return job
+
+    @classmethod
+    def _spawn(cls, app, job_id: str, target):
+        thread = threading.Thread(
+            target=target,
+            args=(app, job_id),
+            name=f"batch-job-{job_id[:8]}",
+            daemon=True
+        )
+        with cls._threads_lock:
+            cls._threads[job_id] = thread
+        thread.start()
+
+    @classmethod
+    def _run_regenerate_tags(cls, app, job_id: str):
+        """Loop del worker: keyset por products.id, un commit de checkpoint por lote"""
+        from app.services.attribute_autofill_service import AttributeAutofillService
+
+        with app.app_context():
+            try:
+                job = BatchJob.query.get(job_id)
+                job.status = BatchJob.STATUS_RUNNING
+                job.started_at = job.started_at or datetime.utcnow()
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+
+                client_id = job.client_id
+                params = job.params or {}
+                chunk_size = params.get('chunk_size', DEFAULT_CHUNK_SIZE)
+                throttle = params.get('throttle_ms', DEFAULT_THROTTLE_MS) / 1000.0
+                overwrite = params.get('overwrite', False)
+
+                print(f"🚀 Job {job_id} ({JOB_REGENERATE_TAGS}) iniciado: cliente {client_id}, lotes de {chunk_size}")
+
+                while True:
+                    # Re-leer el job cada lote (cancelación desde la API / sesión limpia)
+                    job = BatchJob.query.get(job_id)
+                    if job.status == BatchJob.STATUS_CANCELLING:
+                        job.status = BatchJob.STATUS_CANCELLED
+                        job.finished_at = datetime.utcnow()
+                        db.session.commit()
+                        print(f"⏹️ Job {job_id} cancelado en {job.processed}/{job.total}")
+                        return
+
+                    query = products_with_images_query(client_id)
+                    if job.last_product_id:
+                        query = query.filter(Product.id > job.last_product_id)
+                    chunk = query.order_by(Product.id).limit(chunk_size).all()
+
+                    if not chunk:
+                        job.status = BatchJob.STATUS_COMPLETED
+                        job.finished_at = datetime.utcnow()
+                        job.heartbeat_at = job.finished_at
+                        db.session.commit()
+                        print(f"✅ Job {job_id} completado: {job.updated} actualizados, {job.failed} fallidos")
+                        return
+
+                    last_id = chunk[-1].id
+                    try:
+                        results = AttributeAutofillService.autofill_products_batch(chunk, overwrite=overwrite)
+
+                        updated = 0
+                        for product in chunk:
+                            result = results.get(product.id)
+                            if result and result['success'] and result['tags']:
+                                # Siempre sobrescribimos tags para obtener los nuevos contextuales
+                                product.tags = result['tags']
+                                if overwrite and result['attributes']:
+                                    product.attributes = dict(product.attributes or {}, **result['attributes'])
+                                updated += 1
+
+                        job.processed += len(chunk)
+                        job.updated += updated
+                        job.failed += len(chunk) - updated
+                        job.last_product_id = last_id
+                        job.heartbeat_at = datetime.utcnow()
+                        db.session.commit()
+                    except Exception as e:
+                        # Se pierde solo este lote: se registra como fallido y el cursor avanza
+                        db.session.rollback()
+                        print(f"❌ Job {job_id}: error en lote que termina en {last_id}: {e}")
+                        job = BatchJob.query.get(job_id)
+                        job.processed += len(chunk)
+                        job.failed += len(chunk)
+                        job.last_product_id = last_id
+                        job.error_message = str(e)[:1000]
+                        job.heartbeat_at = datetime.utcnow()
+                        db.session.commit()
+
+                    print(f"📦 Job {job_id}: {job.processed}/{job.total} ({job.progress}%)")
+
+                    # Liberar objetos del lote antes del siguiente
+                    db.session.expunge_all()
+
+                    if throttle:
+                        time.sleep(throttle)
+
+            except Exception as e:
+                traceback.print_exc()
+                db.session.rollback()
+                try:
+                    job = BatchJob.query.get(job_id)
+                    if job:
+                        job.status = BatchJob.STATUS_FAILED
+                        job.error_message = str(e)[:1000]
+                        job.finished_at = datetime.utcnow()
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+            finally:
+                db.session.remove()
+                with cls._threads_lock:
+                    cls._threads.pop(job_id, None)
+
+    @classmethod
+    def _run_shadow_reindex(cls, app, job_id: str):
+        """Loop del índice sombra: keyset por products.id, vectores del modelo nuevo en shadow_embeddings"""
+        from app.blueprints.embeddings import generate_clip_embedding
+        from app.core.model_versions import cutover, missing_shadow_images, shadow_coverage
+        from app.models.shadow_embedding import ShadowEmbedding
+
+        with app.app_context():
+            try:
+                job = BatchJob.query.get(job_id)
+                job.status = BatchJob.STATUS_RUNNING
+                job.started_at = job.started_at or datetime.utcnow()
+                job.heartbeat_at = datetime.utcnow()
+                db.session.commit()
+
+                client_id = job.client_id
+                params = job.params or {}
+                model_name = params['model_name']
+                chunk_size = params.get('chunk_size', DEFAULT_CHUNK_SIZE)
+                throttle = params.get('throttle_ms', DEFAULT_THROTTLE_MS) / 1000.0
+
+                print(f"🚀 Job {job_id} ({JOB_SHADOW_REINDEX}) iniciado: cliente {client_id}, modelo {model_name}")
+
+                while True:
+                    job = BatchJob.query.get(job_id)
+                    if job.status == BatchJob.STATUS_CANCELLING:
+                        job.status = BatchJob.STATUS_CANCELLED
+                        job.finished_at = datetime.utcnow()
+                        db.session.commit()
+                        print(f"⏹️ Job {job_id} cancelado en {job.processed}/{job.total}")
+                        return
+
+                    query = products_with_images_query(client_id)
+                    if job.last_product_id:
+                        query = query.filter(Product.id > job.last_product_id)
+                    chunk = query.order_by(Product.id).limit(chunk_size).all()
+
+                    if not chunk:
+                        coverage = shadow_coverage(client_id, model_name)
+                        passes = (job.params or {}).get('passes', 1)
+                        if not coverage['ready'] and passes < MAX_SHADOW_PASSES:
+                            # Imágenes procesadas durante la pasada (productos ya recorridos): otra vuelta
+                            job.params = dict(job.params or {}, passes=passes + 1)
+                            job.last_product_id = None
+                            job.heartbeat_at = datetime.utcnow()
+                            db.session.commit()
+                            print(f"🔁 Job {job_id}: cobertura {coverage['percent']}%, pasada {passes + 1}")
+                            continue
+
+                        result = None
+                        if coverage['ready'] and (job.params or {}).get('auto_cutover'):
+                            result = cutover(client_id, model_name)
+                            job = BatchJob.query.get(job_id)
+
+                        job.params = dict(job.params or {}, coverage=coverage, cutover=result)
+                        job.status = BatchJob.STATUS_COMPLETED
+                        job.finished_at = datetime.utcnow()
+                        job.heartbeat_at = job.finished_at
+                        db.session.commit()
+                        print(f"✅ Job {job_id} completado: cobertura {coverage['percent']}% de {model_name}"
+                              f"{', cutover hecho' if result else ''}")
+                        return
+
+                    last_id = chunk[-1].id
+                    try:
+                        images = missing_shadow_images(client_id, model_name).filter(
+                            Image.product_id.in_([product.id for product in chunk])
+                        ).all()
+
+                        updated = 0
+                        for image in images:
+                            if not image.cloudinary_url:
+                                continue
+                            embedding, metadata = generate_clip_embedding(
+                                image.cloudinary_url, image, model_name=model_name, store_components=False
+                            )
+                            if not embedding:
+                                continue
+                            db.session.merge(ShadowEmbedding(
+                                image_id=image.id,
+                                model_name=model_name,
+                                client_id=client_id,
+                                clip_embedding=json.dumps(embedding),
+                                image_features=json.dumps(metadata['image_features'].tolist()),
+                                embedding_recipe=metadata['recipe']
+                            ))
+                            updated += 1
+
+                        job.processed += len(chunk)
+                        job.updated += updated
+                        job.failed += len(images) - updated
+                        job.last_product_id = last_id
+                        job.heartbeat_at = datetime.utcnow()
+                        db.session.commit()
+                    except Exception as e:
+                        # Se pierde solo este lote; la pasada siguiente reintenta sus imágenes
+                        db.session.rollback()
+                        print(f"❌ Job {job_id}: error en lote que termina en {last_id}: {e}")
+                        job = BatchJob.query.get(job_id)
+                        job.processed += len(chunk)
+                        job.last_product_id = last_id
+                        job.error_message = str(e)[:1000]
+                        job.heartbeat_at = datetime.utcnow()
+                        db.session.commit()
+
+                    print(f"📦 Job {job_id}: {job.processed}/{job.total} productos ({model_name})")
+
+                    db.session.expunge_all()
+
+                    if throttle:
+                        time.sleep(throttle)
+
+            except Exception as e:
+                traceback.print_exc()
+                db.session.rollback()
+                try:
+                    job = BatchJob.query.get(job_id)
+                    if job:
+                        job.status = BatchJob.STATUS_FAILED
+                        job.error_message = str(e)[:1000]
+                        job.finished_at = datetime.utcnow()
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+            finally:
+                db.session.remove()
+                with cls._threads_lock:
+                    cls._threads.pop(job_id, None)
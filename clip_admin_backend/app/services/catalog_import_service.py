@@ -0,0 +1,632 @@
+"""
+Servicio de importación masiva de catálogo (CSV / JSONL)
+
+Flujo de un import:
+1. Parseo en streaming del archivo (nunca se carga completo en memoria)
+2. Validación de cada fila contra ProductAttributeConfig del cliente
+3. Upsert por SKU en lotes (INSERT ... ON CONFLICT (client_id, sku), un commit por lote)
+4. Imágenes: descarga + subida a Cloudinary en paralelo y embeddings CLIP por lotes
+5. Centroides recalculados UNA vez por categoría afectada al final
+6. Reporte CSV de errores por fila (línea, sku, error)
+
+Formato de filas:
+    CSV:   sku,name,category,description,brand,price,stock,tags,image_urls,attr_<key>...
+           (image_urls separadas por '|', atributos list múltiples separados por '|')
+    JSONL: {"sku": "...", "name": "...", "category": "...", "attributes": {...},
+            "image_urls": ["https://..."], "tags": ["a", "b"], ...}
+
+El progreso se guarda en batch_jobs (job_type='catalog_import'), consultable con
+GET /products/api/batch-jobs/<job_id>. Hay como máximo un import activo por cliente;
+el upsert es atómico contra el índice único uq_products_client_sku, así que un
+import que corre junto a products.create (o a un script) no duplica SKUs.
+"""
+import os
+import csv
+import json
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import db
+from app.models.batch_job import BatchJob
+from app.models.category import Category
+from app.models.image import Image
+from app.models.product import Product
+from app.models.product_attribute_config import ProductAttributeConfig
+from app.services.batch_job_service import BatchJobService
+
+JOB_CATALOG_IMPORT = 'catalog_import'
+
+ROW_CHUNK_SIZE = 500        # Filas por upsert/commit
+IMAGE_BATCH_SIZE = 32       # Imágenes por lote de descarga/subida/embedding
+IMAGE_WORKERS = 8           # Descargas/subidas concurrentes
+MAX_IMAGES_PER_ROW = 10
+
+MULTI_VALUE_SEPARATOR = '|'
+
+# Raíz del proyecto (misma convención que SystemConfig)
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+IMPORT_DIR = _PROJECT_ROOT / 'imports'
+
+_PRODUCT_FIELDS = ('name', 'description', 'brand', 'price', 'stock', 'tags', 'attributes', 'category_id')
+
+
+class RowError(ValueError):
+    """Error de validación de una fila del archivo"""
+
+
+def detect_format(filename: str) -> str:
+    """'csv' o 'jsonl' según la extensión"""
+    ext = os.path.splitext(filename.lower())[1]
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if ext == '.csv':
+        return 'csv'
+    raise ValueError(f"Formato no soportado: {ext or filename} (usar .csv o .jsonl)")
+
+
+def iter_rows(path: str, fmt: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Itera las filas del archivo en streaming
+
+    Yields:
+        Tupla (número_de_línea, fila_dict); filas JSON inválidas devuelven {'__error__': msg}
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("la línea no es un objeto JSON")
+                yield line_no, row
+            except ValueError as e:
+                yield line_no, {'__error__': f"JSON inválido: {e}"}
+
+
+def count_rows(path: str, fmt: str) -> int:
+    """Cuenta filas de datos (para el progreso) sin parsearlas"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        lines = sum(1 for line in f if line.strip())
+    return max(0, lines - 1) if fmt == 'csv' else lines
+
+
+class CatalogImportService:
+    """Importación masiva de productos por SKU con progreso en batch_jobs"""
+
+    # ------------------------------------------------------------------
+    # Lanzamiento
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def create_job(cls, client_id: str, file_path: str, original_filename: str,
+                   user_id: Optional[str] = None, with_images: bool = True) -> BatchJob:
+        """
+        Registra el job de importación (sin ejecutarlo)
+
+        Args:
+            client_id: Cliente destino
+            file_path: Ruta del archivo ya guardado en disco
+            original_filename: Nombre original (para detectar formato)
+            user_id: Usuario que lanza el import
+            with_images: Si False solo importa datos (sin descargar imágenes)
+        """
+        fmt = detect_format(original_filename)
+        job = BatchJob(
+            client_id=client_id,
+            job_type=JOB_CATALOG_IMPORT,
+            status=BatchJob.STATUS_PENDING,
+            params={
+                'file_path': str(file_path),
+                'filename': original_filename,
+                'format': fmt,
+                'with_images': with_images,
+                'report_path': str(IMPORT_DIR / f"{Path(file_path).stem}_errors.csv"),
+            },
+            total=count_rows(file_path, fmt),
+            created_by=user_id
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    @classmethod
+    def active_job(cls, client_id: str) -> Optional[BatchJob]:
+        """Import en curso del cliente (un job activo sin worker queda como fallido)"""
+        active, _ = BatchJobService._latest_job_state(client_id, JOB_CATALOG_IMPORT)
+        return active
+
+    @classmethod
+    def start_import(cls, app, client_id: str, file_path: str, original_filename: str,
+                     user_id: Optional[str] = None, with_images: bool = True) -> Tuple[BatchJob, bool]:
+        """
+        Registra el job y lo ejecuta en un thread daemon (app: instancia Flask para el app_context)
+
+        Returns:
+            Tupla (job, lanzado) - lanzado=False si ya había un import activo para el cliente
+        """
+        active = cls.active_job(client_id)
+        if active:
+            return active, False
+
+        job = cls.create_job(client_id, file_path, original_filename, user_id=user_id, with_images=with_images)
+
+        thread = threading.Thread(
+            target=cls._run_in_context, args=(app, job.id),
+            name=f"catalog-import-{job.id[:8]}", daemon=True
+        )
+        # Registrado junto a los demás jobs para que cancel()/_is_stale() lo vean vivo
+        with BatchJobService._threads_lock:
+            BatchJobService._threads[job.id] = thread
+        thread.start()
+        return job, True
+
+    @classmethod
+    def save_upload(cls, file_storage) -> str:
+        """Guarda el archivo subido en imports/ (streaming a disco) y devuelve la ruta"""
+        IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+        fmt = detect_format(file_storage.filename)
+        path = IMPORT_DIR / f"{datetime.utcnow():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}.{fmt}"
+        file_storage.save(str(path))
+        return str(path)
+
+    @classmethod
+    def _run_in_context(cls, app, job_id: str):
+        with app.app_context():
+            try:
+                cls.run_import(job_id)
+            except Exception as e:
+                traceback.print_exc()
+                db.session.rollback()
+                job = BatchJob.query.get(job_id)
+                if job:
+                    job.status = BatchJob.STATUS_FAILED
+                    job.error_message = str(e)[:1000]
+                    job.finished_at = datetime.utcnow()
+                    db.session.commit()
+            finally:
+                db.session.remove()
+                with BatchJobService._threads_lock:
+                    BatchJobService._threads.pop(job_id, None)
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def run_import(cls, job_id: str):
+        """Ejecuta el import completo de un job (se puede llamar sincrónicamente desde un script)"""
+        job = BatchJob.query.get(job_id)
+        params = job.params or {}
+        client_id = job.client_id
+
+        job.status = BatchJob.STATUS_RUNNING
+        job.started_at = datetime.utcnow()
+        job.heartbeat_at = job.started_at
+        db.session.commit()
+
+        attribute_configs = ProductAttributeConfig.query.filter_by(client_id=client_id).all()
+        categories = cls._category_lookup(client_id)
+
+        report_path = Path(params['report_path'])
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+
+        affected_categories = set()
+        pending_image_ids = []
+        stats = {'inserted': 0, 'updated': 0, 'images': 0}
+
+        print(f"📥 Import {job_id}: {params.get('filename')} ({job.total} filas) para cliente {client_id}")
+
+        with open(report_path, 'w', encoding='utf-8', newline='') as report_file:
+            report = csv.writer(report_file)
+            report.writerow(['line', 'sku', 'error'])
+
+            chunk, invalid = [], 0
+            for line_no, raw in iter_rows(params['file_path'], params['format']):
+                try:
+                    chunk.append(cls._parse_row(line_no, raw, attribute_configs, categories))
+                except RowError as e:
+                    report.writerow([line_no, str(raw.get('sku') or '').strip(), str(e)])
+                    invalid += 1
+
+                if len(chunk) + invalid >= ROW_CHUNK_SIZE:
+                    cls._flush_chunk(job_id, client_id, chunk, invalid, report, affected_categories, pending_image_ids, stats)
+                    chunk, invalid = [], 0
+                    # Cancelación: se revisa entre lotes
+                    if BatchJob.query.get(job_id).status == BatchJob.STATUS_CANCELLING:
+                        break
+            else:
+                if chunk or invalid:
+                    cls._flush_chunk(job_id, client_id, chunk, invalid, report, affected_categories, pending_image_ids, stats)
+
+        job = BatchJob.query.get(job_id)
+        if job.status == BatchJob.STATUS_CANCELLING:
+            job.status = BatchJob.STATUS_CANCELLED
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return
+
+        # Imágenes y embeddings por lotes
+        if params.get('with_images', True) and pending_image_ids:
+            stats['images'] = cls._process_images(job_id, client_id, pending_image_ids)
+
+        # Centroides: una vez por categoría afectada
+        cls._update_centroids(affected_categories)
+
+        job = BatchJob.query.get(job_id)
+        job.status = BatchJob.STATUS_COMPLETED
+        job.finished_at = datetime.utcnow()
+        job.heartbeat_at = job.finished_at
+        job.params = dict(job.params or {}, **stats, categories_updated=len(affected_categories))
+        db.session.commit()
+        print(f"✅ Import {job_id} completado: {stats['inserted']} nuevos, {stats['updated']} actualizados, "
+              f"{job.failed} filas con error, {stats['images']} imágenes con embedding")
+
+    @classmethod
+    def _count(cls, job_id: str, processed: int = 0, inserted: int = 0, updated: int = 0, failed: int = 0):
+        """Suma progreso: job.updated = productos existentes actualizados, params['inserted'] = nuevos"""
+        job = BatchJob.query.get(job_id)
+        job.processed += processed
+        job.updated += updated
+        job.failed += failed
+        if inserted:
+            params = job.params or {}
+            job.params = dict(params, inserted=params.get('inserted', 0) + inserted)
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+    # ------------------------------------------------------------------
+    # Validación
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _category_lookup(client_id: str) -> Dict[str, str]:
+        """{id | nombre en minúsculas | name_en en minúsculas | slug: category_id}"""
+        lookup = {}
+        for category in Category.query.filter_by(client_id=client_id).all():
+            lookup[category.id] = category.id
+            for key in (category.name, category.name_en, category.slug):
+                if key:
+                    lookup[key.strip().lower()] = category.id
+        return lookup
+
+    @staticmethod
+    def _split_multi(value) -> List[str]:
+        if value is None:
+            return []
+        if isinstance(value, list):
+            return [str(v).strip() for v in value if str(v).strip()]
+        return [v.strip() for v in str(value).split(MULTI_VALUE_SEPARATOR) if v.strip()]
+
+    @classmethod
+    def normalize_attributes(cls, raw_attributes: dict, attribute_configs) -> dict:
+        """
+        Valida y normaliza atributos de una fila (mismas reglas que el formulario de productos)
+
+        Raises:
+            RowError si falta un requerido, un número/fecha es inválido o un valor de lista no está permitido
+        """
+        attributes = {}
+
+        for config in attribute_configs:
+            value = raw_attributes.get(config.key)
+            options = config.options if isinstance(config.options, dict) else {}
+            allowed = options.get('values', []) if config.type == 'list' else []
+
+            if config.type == 'list' and options.get('multiple', False):
+                values = cls._split_multi(value)
+                if config.required and not values:
+                    raise RowError(f"El campo '{config.label}' es obligatorio")
+                invalid = [v for v in values if allowed and v not in allowed]
+                if invalid:
+                    raise RowError(f"Valor(es) no válidos para '{config.label}': {', '.join(invalid)}")
+                if values:
+                    attributes[config.key] = values
+                continue
+
+            value = '' if value is None else str(value).strip()
+            if config.required and not value:
+                raise RowError(f"El campo '{config.label}' es obligatorio")
+            if not value:
+                continue
+
+            if config.type == 'number':
+                try:
+                    attributes[config.key] = float(value)
+                except ValueError:
+                    raise RowError(f"El campo '{config.label}' debe ser un número válido")
+            elif config.type == 'date':
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except ValueError:
+                    raise RowError(f"El campo '{config.label}' debe tener formato de fecha válido (YYYY-MM-DD)")
+                attributes[config.key] = value
+            else:
+                if allowed and value not in allowed:
+                    raise RowError(f"El valor '{value}' no es válido para '{config.label}'")
+                attributes[config.key] = value
+
+        return attributes
+
+    @classmethod
+    def _parse_row(cls, line_no: int, raw: dict, attribute_configs, categories: Dict[str, str]) -> dict:
+        """Convierte una fila cruda en valores de producto validados"""
+        if '__error__' in raw:
+            raise RowError(raw['__error__'])
+
+        sku = str(raw.get('sku') or '').strip()
+        name = str(raw.get('name') or '').strip()
+        if not sku:
+            raise RowError("Falta 'sku'")
+        if not name:
+            raise RowError("Falta 'name'")
+        if len(sku) > 100 or len(name) > 200:
+            raise RowError("'sku' (máx 100) o 'name' (máx 200) demasiado largo")
+
+        category_key = str(raw.get('category') or raw.get('category_id') or '').strip()
+        category_id = categories.get(category_key) or categories.get(category_key.lower())
+        if not category_id:
+            raise RowError(f"Categoría no encontrada: '{category_key}'")
+
+        # Atributos: dict 'attributes' (JSONL) o columnas attr_<key> (CSV)
+        raw_attributes = raw.get('attributes') if isinstance(raw.get('attributes'), dict) else {}
+        for key, value in raw.items():
+            if isinstance(key, str) and key.startswith('attr_'):
+                raw_attributes[key[5:]] = value
+        attributes = cls.normalize_attributes(raw_attributes, attribute_configs)
+
+        try:
+            price = raw.get('price')
+            price = float(price) if price not in (None, '') else None
+            stock = raw.get('stock')
+            stock = int(float(stock)) if stock not in (None, '') else 0
+        except (TypeError, ValueError):
+            raise RowError("'price' o 'stock' no numérico")
+
+        tags = raw.get('tags')
+        tags = ', '.join(cls._split_multi(tags) if isinstance(tags, list) else
+                         [t.strip() for t in str(tags or '').split(',') if t.strip()])
+
+        image_urls = cls._split_multi(raw.get('image_urls') or raw.get('images'))
+        for url in image_urls:
+            if not url.startswith(('http://', 'https://')):
+                raise RowError(f"URL de imagen inválida: '{url}'")
+
+        return {
+            'line': line_no,
+            'sku': sku,
+            'name': name,
+            'description': str(raw.get('description') or '').strip() or None,
+            'brand': str(raw.get('brand') or '').strip() or None,
+            'price': price,
+            'stock': stock,
+            'tags': tags or None,
+            'attributes': attributes or None,
+            'category_id': category_id,
+            'image_urls': image_urls[:MAX_IMAGES_PER_ROW],
+        }
+
+    # ------------------------------------------------------------------
+    # Upsert por lotes
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _flush_chunk(cls, job_id, client_id, rows, invalid, report, affected_categories, pending_image_ids, stats):
+        """Upsert de un lote por SKU (INSERT ... ON CONFLICT) + registros Image pendientes; un commit"""
+        if not rows:
+            cls._count(job_id, processed=invalid, failed=invalid)
+            return
+
+        # Si el SKU se repite dentro del lote, gana la última fila
+        received = len(rows)
+        by_sku = {}
+        for row in rows:
+            by_sku[row['sku']] = row
+        rows = list(by_sku.values())
+
+        try:
+            # Categoría actual de los SKUs que ya existen (para recalcular el centroide si se mueven)
+            previous_categories = dict(
+                db.session.query(Product.sku, Product.category_id)
+                .filter(Product.client_id == client_id, Product.sku.in_(list(by_sku.keys())))
+                .all()
+            )
+
+            now = datetime.utcnow()
+            values = [
+                dict({f: row[f] for f in _PRODUCT_FIELDS},
+                     id=str(uuid.uuid4()), client_id=client_id, sku=row['sku'],
+                     is_active=True, created_at=now, updated_at=now)
+                for row in rows
+            ]
+
+            # Upsert atómico: si otro import o products.create insertó el SKU en el medio,
+            # la fila se actualiza en lugar de duplicarse. xmax = 0 -> fila recién insertada
+            table = Product.__table__
+            statement = pg_insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.client_id, table.c.sku],
+                set_={f: statement.excluded[f] for f in _PRODUCT_FIELDS + ('updated_at',)}
+            ).returning(table.c.id, table.c.sku, literal_column('xmax = 0').label('inserted'))
+            upserted = {r.sku: (r.id, r.inserted) for r in db.session.execute(statement, values)}
+
+            inserts, updates = [], []
+            for row in rows:
+                row['product_id'], inserted = upserted[row['sku']]
+                if inserted:
+                    inserts.append(row)
+                else:
+                    row['previous_category_id'] = previous_categories.get(row['sku'])
+                    updates.append(row)
+
+            image_rows = cls._new_image_rows(client_id, rows)
+            if image_rows:
+                db.session.execute(Image.__table__.insert(), image_rows)
+
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Import {job_id}: error en lote de {len(rows)} filas: {e}")
+            for row in rows:
+                report.writerow([row['line'], row['sku'], f"Error de base de datos: {e}"])
+            cls._count(job_id, processed=received + invalid, failed=received + invalid)
+            return
+
+        # Categoría nueva y, si el producto se movió, también la anterior
+        for row in rows:
+            affected_categories.add(row['category_id'])
+            if row.get('previous_category_id'):
+                affected_categories.add(row['previous_category_id'])
+        pending_image_ids.extend(r['id'] for r in image_rows)
+        stats['inserted'] += len(inserts)
+        stats['updated'] += len(updates)
+        cls._count(job_id, processed=received + invalid, inserted=len(inserts), updated=len(updates), failed=invalid)
+        print(f"📦 Import {job_id}: lote de {len(rows)} filas ({len(inserts)} nuevas, {len(updates)} actualizadas, {len(image_rows)} imágenes encoladas)")
+
+    @staticmethod
+    def _new_image_rows(client_id: str, rows: List[dict]) -> List[dict]:
+        """Registros Image pendientes para URLs que el producto todavía no tiene"""
+        product_ids = [row['product_id'] for row in rows if row['image_urls']]
+        if not product_ids:
+            return []
+
+        known = set(
+            db.session.query(Image.product_id, Image.original_filename)
+            .filter(Image.product_id.in_(product_ids))
+            .all()
+        )
+        has_images = {product_id for product_id, _ in known}
+
+        now = datetime.utcnow()
+        image_rows = []
+        for row in rows:
+            for position, url in enumerate(row['image_urls']):
+                if (row['product_id'], url) in known:
+                    continue
+                image_rows.append({
+                    'id': str(uuid.uuid4()),
+                    'client_id': client_id,
+                    'product_id': row['product_id'],
+                    'filename': os.path.basename(url.split('?')[0])[:255] or 'import',
+                    'original_filename': url[:500],  # URL de origen (para no duplicar en re-imports)
+                    'display_order': position,
+                    'is_primary': position == 0 and row['product_id'] not in has_images,
+                    'is_processed': False,
+                    'upload_status': 'pending',
+                    'created_at': now,
+                    'updated_at': now,
+                })
+        return image_rows
+
+    # ------------------------------------------------------------------
+    # Imágenes y embeddings
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _fetch_and_upload(cls, source_url: str, public_id: str, folder: str) -> Tuple[Optional[dict], Optional[bytes], Optional[str]]:
+        """Descarga la imagen de origen y la sube a Cloudinary (en thread, sin BD)"""
+        from app.services.image_cache import image_cache
+        from app.services.image_manager import ImageManager
+
+        try:
+            data = image_cache.get_bytes(source_url, timeout=30)
+            result = ImageManager._upload_bytes_to_cloudinary(data, public_id, folder)
+            return result, data, None
+        except Exception as e:
+            return None, None, str(e)
+
+    @classmethod
+    def _process_images(cls, job_id: str, client_id: str, image_ids: List[str]) -> int:
+        """Descarga/sube imágenes y genera embeddings por lotes; devuelve cuántas quedaron procesadas"""
+        from PIL import Image as PILImage
+        from app.blueprints.embeddings import generate_clip_embedding
+        from app.models.client import Client
+        from app.services.image_cache import image_cache
+        from app.services.image_manager import image_manager
+
+        client = Client.query.get(client_id)
+        client_slug = client.slug if client else 'demo_fashion_store'
+        folder = f"{client_slug}/products"
+        image_manager._configure_cloudinary()
+
+        processed = 0
+        print(f"🖼️ Import {job_id}: procesando {len(image_ids)} imágenes en lotes de {IMAGE_BATCH_SIZE}")
+
+        for start in range(0, len(image_ids), IMAGE_BATCH_SIZE):
+            batch = Image.query.filter(Image.id.in_(image_ids[start:start + IMAGE_BATCH_SIZE])).all()
+
+            with ThreadPoolExecutor(max_workers=IMAGE_WORKERS) as executor:
+                futures = [
+                    (image, executor.submit(
+                        cls._fetch_and_upload, image.original_filename,
+                        f"{client_slug}/products/{image.product_id}/{image.id}", folder
+                    ))
+                    for image in batch
+                ]
+                fetched = [(image, future.result()) for image, future in futures]
+
+            for image, (result, data, error) in fetched:
+                if error or not result:
+                    image.upload_status = 'failed'
+                    image.error_message = f"Descarga/subida fallida: {error}"[:1000]
+                    continue
+
+                image.cloudinary_url = result.get('secure_url')
+                image.cloudinary_public_id = result.get('public_id')
+                image.file_size = len(data)
+                image_cache.put_bytes(image_cache.key_for(image.cloudinary_public_id), data)
+
+                try:
+                    pil_image = PILImage.open(BytesIO(data)).convert('RGB')
+                    image.width, image.height = pil_image.size
+                    embedding, _ = generate_clip_embedding(pil_image, image)
+                    if not embedding:
+                        raise ValueError('No se generó el embedding')
+                    image.clip_embedding = json.dumps(embedding)
+                    image.is_processed = True
+                    image.upload_status = 'completed'
+                    image.error_message = None
+                    processed += 1
+                except Exception as e:
+                    image.upload_status = 'failed'
+                    image.error_message = str(e)[:1000]
+
+            job = BatchJob.query.get(job_id)
+            job.heartbeat_at = datetime.utcnow()
+            job.params = dict(job.params or {}, images_done=min(start + IMAGE_BATCH_SIZE, len(image_ids)),
+                              images_total=len(image_ids))
+            db.session.commit()
+            db.session.expunge_all()
+
+        return processed
+
+    @staticmethod
+    def _update_centroids(category_ids):
+        """Recalcula el centroide de cada categoría afectada una sola vez"""
+        for category_id in category_ids:
+            category = Category.query.get(category_id)
+            if not category:
+                continue
+            try:
+                if category.update_centroid_embedding(force_recalculate=True):
+                    db.session.commit()
+                    print(f"📊 Centroide actualizado para categoría: {category.name}")
+            except Exception as e:
+                db.session.rollback()
+                print(f"⚠️ Error actualizando centroide de {category.name}: {e}")
@@ -0,0 +1,306 @@
+"""
+Cache local en disco de imágenes de Cloudinary
+Evita descargar la misma imagen varias veces (embedding, autofill, enrichment, re-indexado)
+
+- Clave: cloudinary_public_id + transformación (ej: 'c_fill,g_auto,w_800,h_800')
+- Archivos direccionados por hash de la clave: <dir>/<ab>/<sha256>.img
+- Eviction LRU por tamaño total (mtime se actualiza en cada hit)
+- Sesión HTTP compartida con keep-alive, pool de conexiones y reintentos
+- Store opcional de miniaturas pre-decodificadas (lado corto 224px, .npy uint8)
+
+Configuración en system_config.json (todas opcionales):
+    "image_cache": {"enabled": true, "dir": "cache/images", "max_size_mb": 2048, "thumbnails": true}
+"""
+import os
+import re
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image as PILImage
+
+logger = logging.getLogger("image_cache")
+
+THUMBNAIL_SIZE = 224  # Resolución de entrada de CLIP
+
+# Componente de transformación Cloudinary: c_fill,g_auto,w_800 / e_sharpen:100 / f_auto ...
+_TRANSFORM_SEGMENT = re.compile(r'^([a-z]{1,3}_[^/]+)(,[a-z]{1,3}_[^/]+)*$')
+_VERSION_SEGMENT = re.compile(r'^v\d+$')
+
+# Raíz del proyecto (misma convención que SystemConfig)
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent.parent
+
+
+def parse_cloudinary_url(url: str) -> Optional[Tuple[str, str]]:
+    """
+    Extrae (public_id, transformación) de una URL de Cloudinary
+
+    Ejemplo:
+        https://res.cloudinary.com/demo/image/upload/c_fill,w_800/v1712/clients/x/abc.jpg
+        -> ('clients/x/abc', 'c_fill,w_800')
+
+    Returns:
+        Tupla (public_id, transform) o None si no es una URL de Cloudinary
+    """
+    parsed = urlparse(url)
+    if 'cloudinary.com' not in parsed.netloc or '/upload/' not in parsed.path:
+        return None
+
+    segments = [s for s in parsed.path.split('/upload/', 1)[1].split('/') if s]
+    transforms = []
+    while segments and _TRANSFORM_SEGMENT.match(segments[0]):
+        transforms.append(segments.pop(0))
+    if segments and _VERSION_SEGMENT.match(segments[0]):
+        segments.pop(0)
+    if not segments:
+        return None
+
+    public_id = '/'.join(segments)
+    public_id = os.path.splitext(public_id)[0]
+    return public_id, '/'.join(transforms)
+
+
+class ImageCache:
+    """Cache LRU en disco de bytes de imagen + miniaturas pre-decodificadas"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_size_mb: Optional[int] = None,
+                 thumbnails: Optional[bool] = None, enabled: Optional[bool] = None):
+        config = self._read_config()
+
+        cache_dir = cache_dir or os.getenv('IMAGE_CACHE_DIR') or config.get('dir', 'cache/images')
+        path = Path(cache_dir)
+        self.cache_dir = path if path.is_absolute() else _PROJECT_ROOT / path
+        self.max_size_bytes = int(max_size_mb if max_size_mb is not None else config.get('max_size_mb', 2048)) * 1024 * 1024
+        self.thumbnails_enabled = config.get('thumbnails', True) if thumbnails is None else thumbnails
+        self.enabled = config.get('enabled', True) if enabled is None else enabled
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._total_bytes = None  # Se calcula perezosamente al primer write
+
+        # Estadísticas (para diagnóstico/métricas)
+        self.hits = 0
+        self.misses = 0
+        self.thumbnail_hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _read_config() -> dict:
+        try:
+            from app.utils.system_config import system_config
+            return system_config.get_section('image_cache') or {}
+        except Exception:
+            return {}
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    @property
+    def session(self) -> requests.Session:
+        """Sesión HTTP compartida (keep-alive + reintentos con backoff)"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    retry = Retry(
+                        total=3,
+                        backoff_factor=0.5,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=frozenset(['GET', 'HEAD'])
+                    )
+                    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retry)
+                    session = requests.Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    # ------------------------------------------------------------------
+    # Claves y rutas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def cache_key(url: str) -> str:
+        """Clave estable: public_id + transformación para Cloudinary, URL completa para el resto"""
+        parsed = parse_cloudinary_url(url)
+        if parsed:
+            public_id, transform = parsed
+            return f"cld:{public_id}|{transform}"
+        return f"url:{url}"
+
+    @staticmethod
+    def key_for(public_id: str, transform: str = '') -> str:
+        """Clave para un public_id + transformación (para precargar la cache tras un upload)"""
+        return f"cld:{public_id}|{transform}"
+
+    def _path_for(self, key: str, suffix: str) -> Path:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}{suffix}"
+
+    # ------------------------------------------------------------------
+    # LRU
+    # ------------------------------------------------------------------
+
+    def _scan_size(self) -> int:
+        total = 0
+        if self.cache_dir.exists():
+            for file in self.cache_dir.rglob('*'):
+                if file.is_file():
+                    total += file.stat().st_size
+        return total
+
+    def _account(self, added_bytes: int):
+        """Suma bytes escritos y desaloja los archivos menos usados si se supera el límite"""
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += added_bytes
+
+            if self._total_bytes <= self.max_size_bytes:
+                return
+
+            files = []
+            for file in self.cache_dir.rglob('*'):
+                if file.is_file() and not file.name.endswith('.tmp'):
+                    stat = file.stat()
+                    files.append((stat.st_mtime, stat.st_size, file))
+            files.sort()
+
+            # Desalojar hasta quedar en el 90% del límite
+            target = int(self.max_size_bytes * 0.9)
+            for _, size, file in files:
+                if self._total_bytes <= target:
+                    break
+                try:
+                    file.unlink()
+                    self._total_bytes -= size
+                    self.evictions += 1
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _touch(path: Path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _write_atomic(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._account(len(data))
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def get_bytes(self, url: str, timeout: int = 30) -> bytes:
+        """
+        Bytes de la imagen, desde disco si existe o descargando (y guardando) si no
+
+        Raises:
+            requests.RequestException si la descarga falla
+        """
+        if not self.enabled:
+            response = self.session.get(url, timeout=timeout)
+            response.raise_for_status()
+            return response.content
+
+        path = self._path_for(self.cache_key(url), '.img')
+        if path.exists():
+            try:
+                data = path.read_bytes()
+                self._touch(path)
+                self.hits += 1
+                return data
+            except OSError:
+                pass
+
+        self.misses += 1
+        response = self.session.get(url, timeout=timeout)
+        response.raise_for_status()
+        data = response.content
+
+        try:
+            self._write_atomic(path, data)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo escribir cache de imagen: {e}")
+        return data
+
+    def put_bytes(self, key: str, data: bytes):
+        """Guarda bytes bajo una clave (ej: original recién subido a Cloudinary)"""
+        if not self.enabled or not data:
+            return
+        try:
+            self._write_atomic(self._path_for(key, '.img'), data)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo escribir cache de imagen: {e}")
+
+    def get_image(self, url: str, timeout: int = 30) -> PILImage.Image:
+        """Imagen PIL RGB (cacheada en disco)"""
+        return PILImage.open(BytesIO(self.get_bytes(url, timeout=timeout))).convert('RGB')
+
+    def get_thumbnail(self, url: str, timeout: int = 30) -> PILImage.Image:
+        """
+        Miniatura pre-decodificada (lado corto = 224px) lista para el preprocesado de CLIP
+
+        Evita decodificar el JPEG completo en cada re-embedding. Si las miniaturas
+        están deshabilitadas devuelve la imagen completa.
+        """
+        if not (self.enabled and self.thumbnails_enabled):
+            return self.get_image(url, timeout=timeout)
+
+        import numpy as np
+
+        path = self._path_for(self.cache_key(url), f'.t{THUMBNAIL_SIZE}.npy')
+        if path.exists():
+            try:
+                array = np.load(path)
+                self._touch(path)
+                self.thumbnail_hits += 1
+                return PILImage.fromarray(array, 'RGB')
+            except Exception:
+                pass
+
+        image = self.get_image(url, timeout=timeout)
+        width, height = image.size
+        scale = THUMBNAIL_SIZE / float(min(width, height))
+        if scale < 1.0:
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), PILImage.BICUBIC)
+
+        try:
+            buffer = BytesIO()
+            np.save(buffer, np.asarray(image, dtype=np.uint8))
+            self._write_atomic(path, buffer.getvalue())
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo escribir miniatura: {e}")
+        return image
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'dir': str(self.cache_dir),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'thumbnail_hits': self.thumbnail_hits,
+            'evictions': self.evictions,
+            'size_bytes': self._total_bytes,
+            'max_size_bytes': self.max_size_bytes,
+        }
+
+
+# Instancia global
+image_cache = ImageCache()
@@ -7,6 +7,8 @@ import os
 import uuid
 import base64
 import warnings
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Tuple
 from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
@@ -14,6 +16,9 @@ from flask import current_app
 from PIL import Image as PILImage
 from app.models.image import Image
 
+# Subidas concurrentes a Cloudinary por request
+UPLOAD_WORKERS = 4
+
 
 class ImageManager:
     """
@@ -253,6 +258,167 @@ class ImageManager:
                     pass
             raise e
 
+    def _configure_cloudinary(self):
+        """Configura Cloudinary desde la app Flask si aún no está configurado"""
+        import cloudinary
+
+        if not cloudinary.config().cloud_name:
+            cloudinary.config(
+                cloud_name=current_app.config.get('CLOUDINARY_CLOUD_NAME', 'dgtsan81n'),
+                api_key=current_app.config.get('CLOUDINARY_API_KEY'),
+                api_secret=current_app.config.get('CLOUDINARY_API_SECRET')
+            )
+
+    @staticmethod
+    def _upload_bytes_to_cloudinary(data: bytes, public_id: str, folder: str) -> dict:
+        """Sube bytes a Cloudinary (se ejecuta en threads: sin acceso a BD ni a current_app)"""
+        import cloudinary.uploader
+
+        return cloudinary.uploader.upload(
+            BytesIO(data),
+            public_id=public_id,
+            folder=folder,
+            resource_type="image",
+            overwrite=True
+        )
+
+    def upload_images(self,
+                      files: List[FileStorage],
+                      product_id: str,
+                      client_id: str,
+                      client_slug: str = None,
+                      primary_index: Optional[int] = None,
+                      max_workers: int = UPLOAD_WORKERS) -> Tuple[List[Tuple[Image, bytes]], List[str]]:
+        """
+        Sube varias imágenes en paralelo y crea sus registros en una sola transacción
+
+        - Las subidas a Cloudinary corren en un pool de threads acotado
+        - Los registros Image se agregan juntos a la sesión (el caller hace UN commit)
+        - Los bytes originales se devuelven (y se guardan en la cache local) para que
+          la etapa de embeddings no vuelva a descargar lo que se acaba de subir
+
+        Args:
+            files: Archivos subidos
+            product_id: ID del producto
+            client_id: ID del cliente
+            client_slug: Slug del cliente (auto-detectado si no se proporciona)
+            primary_index: Índice del archivo que será imagen principal (None = ninguno)
+            max_workers: Subidas concurrentes
+
+        Returns:
+            Tupla ([(Image, bytes_originales)], [errores])
+        """
+        from app import db
+        from app.services.image_cache import image_cache
+
+        if client_slug is None:
+            try:
+                from app.models.client import Client
+                client = Client.query.get(client_id)
+                client_slug = client.slug if client else "demo_fashion_store"
+            except Exception:
+                client_slug = "demo_fashion_store"
+
+        errors = []
+        prepared = []  # dicts con bytes y metadatos de cada archivo válido
+
+        # 1. Validar y leer archivos en memoria (en el thread del request)
+        for index, file in enumerate(files):
+            if not file or not file.filename:
+                continue
+            if not self._is_allowed_file(file.filename):
+                errors.append(f"{file.filename}: Tipo de archivo no permitido. Permitidos: {', '.join(self.allowed_extensions)}")
+                continue
+
+            data = file.read()
+            if len(data) > self.max_file_size:
+                errors.append(f"{file.filename}: Archivo demasiado grande. Máximo: {self.max_file_size / (1024*1024)}MB")
+                continue
+
+            try:
+                with PILImage.open(BytesIO(data)) as img:
+                    width, height = img.size
+            except Exception:
+                width, height = (0, 0)
+
+            unique_filename = self._generate_unique_filename(file.filename)
+            prepared.append({
+                'index': index,
+                'file': file,
+                'data': data,
+                'width': width,
+                'height': height,
+                'unique_filename': unique_filename,
+                'public_id': f"{client_slug}/products/{product_id}/{unique_filename.split('.')[0]}",
+            })
+
+        if not prepared:
+            return [], errors
+
+        # 2. Subidas a Cloudinary en paralelo
+        try:
+            self._configure_cloudinary()
+        except Exception as e:
+            print(f"⚠️ Error configurando Cloudinary: {e}")
+
+        folder = f"{client_slug}/products"
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prepared)))) as executor:
+            futures = {
+                executor.submit(self._upload_bytes_to_cloudinary, item['data'], item['public_id'], folder): item
+                for item in prepared
+            }
+            for future, item in futures.items():
+                try:
+                    item['cloudinary_result'] = future.result()
+                except Exception as e:
+                    print(f"⚠️ Error en Cloudinary ({item['file'].filename}): {e}, manteniendo archivo local")
+                    item['cloudinary_result'] = None
+
+        # 3. Registros Image (una sola transacción, sin commit aquí)
+        uploaded = []
+        for item in prepared:
+            file = item['file']
+            result = item['cloudinary_result'] or {}
+            cloudinary_url = result.get('secure_url')
+            cloudinary_public_id = result.get('public_id')
+            mime_type = file.mimetype or "image/jpeg"
+
+            base64_data = None
+            if cloudinary_url:
+                base64_data = f"data:{mime_type};base64,{base64.b64encode(item['data']).decode('utf-8')}"
+                # Precargar cache local: la URL original de Cloudinary ya no se descarga
+                image_cache.put_bytes(image_cache.key_for(cloudinary_public_id), item['data'])
+                print(f"✅ Imagen subida a Cloudinary: {cloudinary_url}")
+            else:
+                # Fallback: mantener archivo local como en upload_image
+                try:
+                    file_path = os.path.join(self._get_upload_directory(client_slug), item['unique_filename'])
+                    with open(file_path, 'wb') as f:
+                        f.write(item['data'])
+                except Exception as e:
+                    errors.append(f"{file.filename}: {str(e)}")
+                    continue
+
+            image = Image(
+                product_id=product_id,
+                client_id=client_id,
+                filename=item['unique_filename'],
+                original_filename=file.filename,
+                cloudinary_url=cloudinary_url,
+                cloudinary_public_id=cloudinary_public_id,
+                base64_data=base64_data,
+                file_size=len(item['data']),
+                width=item['width'],
+                height=item['height'],
+                mime_type=file.mimetype,
+                display_order=item['index'],
+                is_primary=(item['index'] == primary_index)
+            )
+            uploaded.append((image, item['data']))
+
+        db.session.add_all([image for image, _ in uploaded])
+        return uploaded, errors
+
     def delete_image(self, image: Image, client_slug: str = None) -> bool:
         """
         Elimina una imagen del sistema de archivos y base de datos
@@ -368,11 +534,8 @@ class ImageManager:
 
             # 🌐 FALLBACK: Si no hay base64 en BD, generar desde Cloudinary
             if image.cloudinary_url:
-                import requests
-                response = requests.get(image.cloudinary_url, timeout=30)
-                response.raise_for_status()
-
-                img_data = response.content
+                from app.services.image_cache import image_cache
+                img_data = image_cache.get_bytes(image.cloudinary_url, timeout=30)
                 img_base64 = base64.b64encode(img_data).decode('utf-8')
 
                 # Determinar el tipo MIME
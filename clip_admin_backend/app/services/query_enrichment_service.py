@@ -2,15 +2,17 @@
 Servicio para enriquecer queries de búsqueda con tags inferidos usando CLIP
 Genera embeddings fusionados y tags semánticos desde texto e imagen opcional
 """
-import torch
 from PIL import Image
-import requests
-from io import BytesIO
 import hashlib
 import json
 from typing import Dict, List, Tuple, Optional
 from functools import lru_cache
 from app.blueprints.embeddings import get_clip_model  # Reutilizar modelo compartido
+from app.utils.lazy_imports import lazy_import
+from app.services.image_cache import image_cache
+from app.core.metrics import CACHE_REQUESTS
+
+torch = lazy_import('torch')
 
 # Tags genéricos detectables por contexto visual/textual
 INFERENCE_TAG_OPTIONS = [
@@ -44,10 +46,7 @@ class QueryEnrichmentService:
     def _download_image(cls, url: str) -> Optional[Image.Image]:
         """Descarga una imagen desde URL y la convierte a PIL Image"""
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            image = Image.open(BytesIO(response.content)).convert('RGB')
-            return image
+            return image_cache.get_thumbnail(url, timeout=10)
         except Exception as e:
             print(f"⚠️ Error descargando imagen para enrichment: {e}")
             return None
@@ -140,8 +139,11 @@ class QueryEnrichmentService:
             # Verificar cache
             cache_key = cls._generate_cache_key(query_text, image_url, client_id)
             if use_cache and cache_key in cls._cache:
+                CACHE_REQUESTS.inc('query_enrichment', 'hit')
                 print(f"💾 CACHE HIT: enrichment para query '{query_text[:30]}...'")
                 return cls._cache[cache_key]
+            if use_cache:
+                CACHE_REQUESTS.inc('query_enrichment', 'miss')
 
             category_ctx = detected_category or "product"
             tag_phrases = []
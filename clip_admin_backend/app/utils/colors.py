@@ -9,6 +9,8 @@ import re
 import unicodedata
 import numpy as np
 
+from app.core.metrics import CACHE_REQUESTS
+
 # Caché en memoria para colores ya normalizados por LLM (evita llamadas repetidas)
 _llm_color_cache: dict[str, Optional[str]] = {}
 
@@ -79,7 +81,9 @@ def _normalize_color_llm(color_str: str) -> Optional[str]:
     # Revisar caché primero
     cache_key = color_str.lower().strip()
     if cache_key in _llm_color_cache:
+        CACHE_REQUESTS.inc('llm_color', 'hit')
         return _llm_color_cache[cache_key]
+    CACHE_REQUESTS.inc('llm_color', 'miss')
 
     try:
         from app.utils.llm_query_normalizer import normalize_query
@@ -101,7 +105,7 @@ def _normalize_color_llm(color_str: str) -> Optional[str]:
         return None
 
 
-def normalize_color(color_str: Optional[str]) -> Optional[str]:
+def normalize_color(color_str: Optional[str], use_llm: bool = True) -> Optional[str]:
     """
     Normaliza nombres de colores a una forma canónica en MAYÚSCULAS.
 
@@ -115,6 +119,10 @@ def normalize_color(color_str: Optional[str]) -> Optional[str]:
     - "Fucsia vibrante" → "ROSA"
     - "Coral" → (LLM) → cached result
 
+    Args:
+        color_str: Color tal como viene (producto, query, ColorMapping)
+        use_llm: False = solo el mapping hardcoded (camino caliente, sin cargar encoders)
+
     Returns:
         Color canónico en MAYÚSCULAS o None si no puede normalizar.
     """
@@ -137,7 +145,7 @@ def normalize_color(color_str: Optional[str]) -> Optional[str]:
 
     # PASO 2: Fallback con LLM (para colores raros/nuevos)
     # Solo si el color tiene contenido significativo
-    if len(s) >= 3:
+    if use_llm and len(s) >= 3:
         return _normalize_color_llm(s)
 
     return None
@@ -161,15 +169,29 @@ def _get_color_embedding(color_str: str) -> Optional[np.ndarray]:
     if not color_str:
         return None
 
-    cache_key = color_str.lower().strip()
+    try:
+        from app.utils.llm_query_normalizer import get_query_encoder
+        encoder = get_query_encoder()
+    except Exception:
+        encoder = None
+
+    # El encoder es parte de la clave: MiniLM y CLIP no son comparables entre sí
+    # (con CLIP, tampoco dos modelos distintos)
+    encoder_key = encoder
+    if encoder == 'clip':
+        from app.core.model_versions import active_model_name
+        encoder_key = f"clip/{active_model_name()}"
+    cache_key = f"{encoder_key}:{color_str.lower().strip()}"
     if cache_key in _color_embedding_cache:
+        CACHE_REQUESTS.inc('color_embedding', 'hit')
         return _color_embedding_cache[cache_key]
+    CACHE_REQUESTS.inc('color_embedding', 'miss')
 
     try:
         from app.utils.llm_query_normalizer import normalize_query
 
         # El LLM normalizer devuelve embedding en result['embedding']
-        result = normalize_query(color_str)
+        result = normalize_query(color_str, encoder=encoder)
         embedding = result.get('embedding')
 
         if embedding:
@@ -182,7 +204,7 @@ def _get_color_embedding(color_str: str) -> Optional[np.ndarray]:
     return None
 
 
-def colors_are_similar(color1: str, color2: str, threshold: float = 0.85) -> bool:
+def colors_are_similar(color1: str, color2: str, threshold: Optional[float] = None) -> bool:
     """
     Determina si dos colores son semánticamente similares.
 
@@ -194,7 +216,8 @@ def colors_are_similar(color1: str, color2: str, threshold: float = 0.85) -> boo
     Args:
         color1: Primer color (ej: "beige", "BEIGE")
         color2: Segundo color (ej: "marrón chocolate", "MARRON")
-        threshold: Umbral de similitud coseno para LLM fallback (0.85 = muy estricto)
+        threshold: Umbral de similitud coseno para LLM fallback (None = el del encoder:
+                   0.85 con MiniLM, muy estricto; ver DEFAULT_THRESHOLDS en llm_query_normalizer)
 
     Returns:
         True si los colores son similares
@@ -234,6 +257,9 @@ def colors_are_similar(color1: str, color2: str, threshold: float = 0.85) -> boo
     emb2 = _get_color_embedding(color2)
 
     if emb1 is not None and emb2 is not None:
+        if threshold is None:
+            from app.utils.llm_query_normalizer import get_thresholds
+            threshold = get_thresholds()['color_similarity']
         similarity = float(np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2)))
         result = similarity >= threshold
 
@@ -0,0 +1,97 @@
+"""
+Imports diferidos de dependencias pesadas (torch, transformers, sentence_transformers, googletrans)
+
+El módulo real se importa en el primer acceso a un atributo, no al importar el
+blueprint/servicio. Así el arranque de la app (health checks de Railway) y los
+tools de CLI no pagan varios segundos de import de los stacks de ML.
+
+Uso:
+    from app.utils.lazy_imports import lazy_import
+    torch = lazy_import('torch')
+
+    with torch.no_grad():   # acá recién se importa torch
+        ...
+
+Modo admin-only (APP_MODE=admin): la app levanta sin stacks de ML; cualquier
+intento de cargar CLIP o MiniLM levanta MLDisabledError.
+"""
+import os
+import sys
+import importlib
+import threading
+
+APP_MODE_FULL = 'full'
+APP_MODE_ADMIN = 'admin'
+
+# Dependencias que nunca deben importarse al arrancar (ver tools/diagnostics/check_import_time.py)
+HEAVY_MODULES = ('torch', 'transformers', 'sentence_transformers', 'sklearn', 'googletrans', 'onnxruntime')
+
+
+class MLDisabledError(RuntimeError):
+    """Se pidió un modelo de ML con la app en modo admin-only"""
+
+
+def get_app_mode() -> str:
+    """Modo de la app: 'full' (default) o 'admin' (sin CLIP ni MiniLM)"""
+    mode = (os.getenv('APP_MODE') or APP_MODE_FULL).strip().lower()
+    return APP_MODE_ADMIN if mode in (APP_MODE_ADMIN, 'admin-only', 'admin_only') else APP_MODE_FULL
+
+
+def is_admin_only() -> bool:
+    return get_app_mode() == APP_MODE_ADMIN
+
+
+def require_ml(feature: str = 'ML'):
+    """Levanta MLDisabledError si la app corre en modo admin-only"""
+    if is_admin_only():
+        raise MLDisabledError(f"{feature} no disponible: la app corre con APP_MODE=admin")
+
+
+class LazyModule:
+    """Proxy de un módulo que se importa en el primer acceso a un atributo"""
+
+    def __init__(self, name: str):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'cargado' if self._module is not None else 'diferido'
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    Devuelve un proxy del módulo (sin importarlo)
+
+    Args:
+        name: Nombre del módulo (ej: 'torch')
+
+    Returns:
+        LazyModule que importa el módulo real en el primer acceso
+    """
+    return LazyModule(name)
+
+
+def loaded_heavy_modules() -> list:
+    """Dependencias pesadas ya importadas en el proceso (diagnóstico)"""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
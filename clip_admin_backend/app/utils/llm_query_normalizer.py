@@ -1,22 +1,219 @@
 """
-Normalizador semántico de queries usando Sentence Transformers (MiniLM)
+Normalizador semántico de queries
 Extrae color, tipo y contexto de la consulta del usuario DINÁMICAMENTE desde BD del cliente.
 USA EMBEDDINGS SEMÁNTICOS para matching flexible.
+
+Encoders (search.query_encoder en system_config.json, o env QUERY_ENCODER):
+- minilm: Sentence Transformers paraphrase-multilingual-MiniLM-L12-v2 (histórico)
+- clip: torre de texto del CLIP ya cargado para la búsqueda; no carga
+  sentence-transformers y ahorra la RSS del segundo modelo en cada worker
+
+Los embeddings del vocabulario del cliente se calculan una vez por encoder y se
+reutilizan (matrices normalizadas en memoria). El vocabulario extraído de la BD se
+cachea por cliente y se invalida con los cambios de catálogo/categorías de cualquier
+worker (app/core/change_notifier.py). La precisión de ambos encoders sobre
+el vocabulario real se compara con tools/diagnostics/compare_query_encoders.py.
 """
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+import os
 import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.metrics import CACHE_REQUESTS
+from app.core.single_flight import SingleFlight
+from app.core.change_notifier import (
+    ALL_CLIENTS, KIND_CATALOG, KIND_CATEGORY, cache_ttl, client_version, register_invalidator
+)
+
+logger = logging.getLogger("query_normalizer")
+
+ENCODER_MINILM = 'minilm'
+ENCODER_CLIP = 'clip'
+QUERY_ENCODERS = (ENCODER_MINILM, ENCODER_CLIP)
 
 # Modelo liviano multilingüe
 MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
-_model = None
 
-def get_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(MODEL_NAME)
-    return _model
+# Umbrales de similitud por encoder (CLIP texto-texto da cosenos más altos que MiniLM).
+# Se pueden ajustar en system_config: "search": {"query_encoder_thresholds": {"clip": {"color": 0.88}}}
+DEFAULT_THRESHOLDS = {
+    ENCODER_MINILM: {'color': 0.65, 'tipo': 0.60, 'contexto': 0.45, 'color_similarity': 0.85},
+    ENCODER_CLIP: {'color': 0.86, 'tipo': 0.84, 'contexto': 0.80, 'color_similarity': 0.93},
+}
+
+# Matrices de vocabulario cacheadas (encoder, términos) -> embeddings normalizados
+VOCAB_CACHE_MAX = 256
+
+_models = {}
+_vocab_matrices = OrderedDict()
+_vocab_lock = threading.Lock()
+
+# Cargas y cómputos concurrentes de la misma clave se hacen una sola vez
+_model_flight = SingleFlight('query_encoder_load')
+_vocab_matrix_flight = SingleFlight('query_vocab')
+_client_vocabulary_flight = SingleFlight('client_vocabulary')
+
+# Vocabulario extraído de la BD por cliente: {client_id: (expira_monotonic, vocabulario)}
+_client_vocabularies = {}
+
+
+def get_query_encoder() -> str:
+    """
+    Encoder configurado para normalizar queries.
+
+    Prioridad: variable de entorno QUERY_ENCODER > system_config['search']['query_encoder'] > 'minilm'
+    """
+    encoder = os.getenv('QUERY_ENCODER')
+    if not encoder:
+        try:
+            from app.utils.system_config import system_config
+            encoder = system_config.get_section('search').get('query_encoder', ENCODER_MINILM)
+        except Exception:
+            encoder = ENCODER_MINILM
+
+    encoder = (encoder or ENCODER_MINILM).strip().lower()
+    if encoder not in QUERY_ENCODERS:
+        logger.warning(f"⚠️ Query encoder desconocido '{encoder}', usando '{ENCODER_MINILM}'")
+        return ENCODER_MINILM
+    return encoder
+
+
+def get_thresholds(encoder: str = None) -> dict:
+    """Umbrales de matching (color, tipo, contexto, color_similarity) del encoder"""
+    encoder = encoder or get_query_encoder()
+    thresholds = dict(DEFAULT_THRESHOLDS[encoder])
+    try:
+        from app.utils.system_config import system_config
+        overrides = (system_config.get_section('search').get('query_encoder_thresholds') or {}).get(encoder) or {}
+        thresholds.update({k: float(v) for k, v in overrides.items()})
+    except Exception:
+        pass
+    return thresholds
+
+
+class ClipTextEncoder:
+    """Encoder con la interfaz de SentenceTransformer.encode sobre la torre de texto de CLIP"""
+
+    def __init__(self, batch_size: int = 64):
+        self.batch_size = batch_size
+
+    def encode(self, sentences, **kwargs):
+        import torch
+        from app.blueprints.embeddings import get_clip_model
+
+        single = isinstance(sentences, str)
+        items = [sentences] if single else list(sentences)
+        model, processor = get_clip_model()
+
+        chunks = []
+        with torch.no_grad():
+            for start in range(0, len(items), self.batch_size):
+                inputs = processor(text=items[start:start + self.batch_size],
+                                   return_tensors="pt", padding=True, truncation=True)
+                features = model.get_text_features(**inputs)
+                features = features / features.norm(dim=-1, keepdim=True)
+                chunks.append(features.cpu().numpy().astype(np.float32))
+
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        vectors = np.concatenate(chunks)
+        return vectors[0] if single else vectors
+
+
+def get_model(encoder: str = None):
+    """
+    Modelo de texto del encoder (se carga una sola vez por proceso)
+
+    Args:
+        encoder: 'minilm' | 'clip' (None = configurado)
+    """
+    encoder = encoder or get_query_encoder()
+    model = _models.get(encoder)
+    if model is not None:
+        return model
+
+    from app.utils.lazy_imports import require_ml
+    require_ml('CLIP' if encoder == ENCODER_CLIP else 'MiniLM')
+
+    model, _ = _model_flight.do(encoder, lambda: _load_model(encoder))
+    return model
+
+
+def _load_model(encoder: str):
+    model = _models.get(encoder)
+    if model is None:
+        from app.core.clip_backends import is_stub_backend
+        if encoder == ENCODER_CLIP:
+            # Reutiliza el CLIP de la búsqueda (incluido el backend stub)
+            model = ClipTextEncoder()
+        elif is_stub_backend():
+            # Mismo switch que CLIP: CLIP_BACKEND=stub reemplaza también MiniLM
+            from app.core.stub_encoders import StubSentenceModel
+            model = StubSentenceModel()
+        else:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(MODEL_NAME)
+        _models[encoder] = model
+    return model
+
+
+def cosine_similarity(a, b):
+    """Similitud coseno entre filas de a y b (equivalente a sklearn, sin importar sklearn)"""
+    return _normalize_rows(a) @ _normalize_rows(b).T
+
+
+def _normalize_rows(matrix) -> np.ndarray:
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def encode_query(query: str, encoder: str = None) -> np.ndarray:
+    """Embedding normalizado (1D) de la query con el encoder indicado"""
+    return _normalize_rows(get_model(encoder).encode(query.lower()))[0]
+
+
+def _vocab_matrix(vocabulary: list, encoder: str):
+    """
+    Términos (ordenados, sin duplicados) y su matriz de embeddings normalizada
+
+    Se calcula una vez por (encoder, vocabulario) y queda en un LRU en memoria. Con
+    el encoder clip la clave incluye el modelo del cliente (dimensiones distintas).
+    """
+    terms = tuple(sorted({v.lower() for v in vocabulary if v}))
+    model_name = None
+    if encoder == ENCODER_CLIP:
+        from app.core.model_versions import active_model_name
+        model_name = active_model_name()
+    key = (encoder, model_name, terms)
+    with _vocab_lock:
+        matrix = _vocab_matrices.get(key)
+        if matrix is not None:
+            _vocab_matrices.move_to_end(key)
+    if matrix is not None:
+        CACHE_REQUESTS.inc('query_vocab', 'hit')
+        return terms, matrix
+
+    CACHE_REQUESTS.inc('query_vocab', 'miss')
+    matrix, _ = _vocab_matrix_flight.do(key, lambda: _encode_vocabulary(key))
+    return terms, matrix
+
+
+def _encode_vocabulary(key) -> np.ndarray:
+    from app.core.model_versions import model_scope
+
+    encoder, model_name, terms = key
+    # Codificar con el modelo de la clave aunque el thread tenga otro contexto
+    with model_scope(model_name):
+        matrix = _normalize_rows(get_model(encoder).encode(list(terms))) if terms else np.zeros((0, 0), np.float32)
+    with _vocab_lock:
+        _vocab_matrices[key] = matrix
+        while len(_vocab_matrices) > VOCAB_CACHE_MAX:
+            _vocab_matrices.popitem(last=False)
+    return matrix
 
 
 def _extract_client_vocabulary(client_id: int) -> dict:
@@ -111,7 +308,40 @@ def _extract_client_vocabulary(client_id: int) -> dict:
     }
 
 
-def _semantic_match(query: str, vocabulary: list, threshold: float = 0.5) -> str:
+def get_client_vocabulary(client_id) -> dict:
+    """
+    Vocabulario del cliente cacheado (TTL largo con LISTEN/NOTIFY activo, corto si no)
+
+    Se invalida cuando cualquier worker commitea cambios en productos, imágenes o
+    categorías del cliente.
+    """
+    key = str(client_id)
+    entry = _client_vocabularies.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        CACHE_REQUESTS.inc('client_vocabulary', 'hit')
+        return entry[1]
+
+    CACHE_REQUESTS.inc('client_vocabulary', 'miss')
+    version = client_version(key)
+    vocabulary, _ = _client_vocabulary_flight.do((key, version), lambda: _extract_client_vocabulary(client_id))
+    # Si llegó una invalidación mientras se extraía, no guardar un vocabulario viejo
+    if client_version(key) == version:
+        _client_vocabularies[key] = (time.monotonic() + cache_ttl(), vocabulary)
+    return vocabulary
+
+
+def _invalidate_client_vocabulary(client_id: str, kind: str):
+    if client_id == ALL_CLIENTS:
+        _client_vocabularies.clear()
+    else:
+        _client_vocabularies.pop(client_id, None)
+
+
+register_invalidator(_invalidate_client_vocabulary, kinds=(KIND_CATALOG, KIND_CATEGORY))
+
+
+def _semantic_match(query: str, vocabulary: list, threshold: float = 0.5,
+                    query_emb: np.ndarray = None, encoder: str = None) -> str:
     """
     Encuentra la mejor coincidencia semántica usando embeddings del LLM.
 
@@ -119,6 +349,8 @@ def _semantic_match(query: str, vocabulary: list, threshold: float = 0.5) -> str
         query: Texto de búsqueda
         vocabulary: Lista de términos candidatos del cliente
         threshold: Similitud mínima para considerar match (0-1)
+        query_emb: Embedding normalizado de la query (evita re-encodear)
+        encoder: 'minilm' | 'clip' (None = configurado)
 
     Returns:
         Mejor match o None si no supera threshold
@@ -126,27 +358,29 @@ def _semantic_match(query: str, vocabulary: list, threshold: float = 0.5) -> str
     if not vocabulary:
         return None
 
-    model = get_model()
-
-    # Encodear query y vocabulario
-    query_emb = model.encode([query.lower()])
-    vocab_embs = model.encode([v.lower() for v in vocabulary])
+    encoder = encoder or get_query_encoder()
+    if query_emb is None:
+        query_emb = encode_query(query, encoder)
+    terms, vocab_embs = _vocab_matrix(vocabulary, encoder)
+    if not terms:
+        return None
 
-    # Calcular similitudes coseno
-    similarities = cosine_similarity(query_emb, vocab_embs)[0]
+    # Similitudes coseno (ambos lados ya normalizados)
+    similarities = vocab_embs @ query_emb
 
     # Encontrar el mejor match
-    max_idx = np.argmax(similarities)
-    max_sim = similarities[max_idx]
+    max_idx = int(np.argmax(similarities))
+    max_sim = float(similarities[max_idx])
 
     if max_sim >= threshold:
-        print(f"  🎯 Match: '{query}' → '{vocabulary[max_idx]}' (sim={max_sim:.3f})")
-        return vocabulary[max_idx]
+        logger.debug("Match: %r -> %r (sim=%.3f)", query, terms[max_idx], max_sim)
+        return terms[max_idx]
 
     return None
 
 
-def _semantic_match_multiple(query: str, vocabulary: list, threshold: float = 0.4, top_k: int = 3) -> list:
+def _semantic_match_multiple(query: str, vocabulary: list, threshold: float = 0.4, top_k: int = 3,
+                             query_emb: np.ndarray = None, encoder: str = None) -> list:
     """
     Encuentra múltiples coincidencias semánticas.
 
@@ -155,6 +389,8 @@ def _semantic_match_multiple(query: str, vocabulary: list, threshold: float = 0.
         vocabulary: Lista de términos candidatos
         threshold: Similitud mínima
         top_k: Máximo de matches a retornar
+        query_emb: Embedding normalizado de la query (evita re-encodear)
+        encoder: 'minilm' | 'clip' (None = configurado)
 
     Returns:
         Lista de matches ordenados por similitud
@@ -162,26 +398,22 @@ def _semantic_match_multiple(query: str, vocabulary: list, threshold: float = 0.
     if not vocabulary:
         return []
 
-    model = get_model()
-
-    # Encodear query y vocabulario
-    query_emb = model.encode([query.lower()])
-    vocab_embs = model.encode([v.lower() for v in vocabulary])
-
-    # Calcular similitudes
-    similarities = cosine_similarity(query_emb, vocab_embs)[0]
+    encoder = encoder or get_query_encoder()
+    if query_emb is None:
+        query_emb = encode_query(query, encoder)
+    terms, vocab_embs = _vocab_matrix(vocabulary, encoder)
+    if not terms:
+        return []
 
     # Filtrar por threshold y ordenar
-    matches = []
-    for idx, sim in enumerate(similarities):
-        if sim >= threshold:
-            matches.append((vocabulary[idx], sim))
+    similarities = vocab_embs @ query_emb
+    matches = [(terms[idx], float(sim)) for idx, sim in enumerate(similarities) if sim >= threshold]
 
     # Ordenar por similitud descendente y tomar top_k
     matches.sort(key=lambda x: x[1], reverse=True)
 
     if matches:
-        print(f"  🎯 Matches contextos: {[(m[0], f'{m[1]:.3f}') for m in matches[:top_k]]}")
+        logger.debug("Matches contextos: %s", matches[:top_k])
 
     return [match[0] for match in matches[:top_k]]
 
@@ -228,7 +460,7 @@ def _detect_ambiguous_terms(query: str, vocabulary: dict) -> dict:
     return suggestions
 
 
-def normalize_query(query: str, client_id: int = None) -> dict:
+def normalize_query(query: str, client_id: int = None, encoder: str = None, vocabulary: dict = None) -> dict:
     """
     Extrae color, tipo y contexto de la consulta usando:
     - Vocabulario dinámico del cliente (desde BD)
@@ -237,22 +469,26 @@ def normalize_query(query: str, client_id: int = None) -> dict:
     Args:
         query: Texto de búsqueda del usuario
         client_id: ID del cliente para extraer vocabulario específico
+        encoder: 'minilm' | 'clip' (None = configurado)
+        vocabulary: Vocabulario ya extraído (evita releerlo de la BD; lo usa la comparación de encoders)
 
     Returns:
-        dict: {'tipo': ..., 'color': ..., 'contexto': [...], 'query': ..., 'embedding': [...]}
+        dict: {'tipo': ..., 'color': ..., 'contexto': [...], 'query': ..., 'embedding': [...], 'encoder': ...}
     """
-    query_lower = query.lower()
-    model = get_model()
-    emb = model.encode(query_lower)
+    encoder = encoder or get_query_encoder()
+    thresholds = get_thresholds(encoder)
+    emb = encode_query(query, encoder)
 
     # Obtener vocabulario dinámico del cliente
-    if client_id:
-        vocab = _extract_client_vocabulary(client_id)
+    vocab = vocabulary
+    if vocab is None and client_id:
+        vocab = get_client_vocabulary(client_id)
+    if vocab is not None:
         colores = vocab['colores']
         tipos = vocab['tipos']
         contextos = vocab['contextos']
 
-        print(f"📚 VOCAB: {len(colores)} colores, {len(tipos)} tipos, {len(contextos)} contextos")
+        logger.debug("Vocabulario: %d colores, %d tipos, %d contextos", len(colores), len(tipos), len(contextos))
     else:
         # Fallback a listas mínimas si no hay client_id
         colores = ['negro', 'blanco', 'azul', 'rojo', 'verde', 'amarillo', 'gris']
@@ -260,23 +496,27 @@ def normalize_query(query: str, client_id: int = None) -> dict:
         contextos = ['casual', 'formal', 'deportivo']
 
     # MATCHING SEMÁNTICO con LLM (no substring!)
-    # Thresholds más estrictos para evitar falsos positivos:
+    # Thresholds más estrictos para evitar falsos positivos (valores MiniLM; CLIP en DEFAULT_THRESHOLDS):
     # - Color: 0.65 (solo si el color está explícito: "gorra roja", "azul marino")
     # - Tipo: 0.60 (categoría debe estar clara en la query)
     # - Contexto: 0.45 (más flexible para estilos/ocasiones)
-    color = _semantic_match(query, colores, threshold=0.65) if colores else None
-    tipo = _semantic_match(query, tipos, threshold=0.60) if tipos else None
-    contexto = _semantic_match_multiple(query, contextos, threshold=0.45, top_k=2) if contextos else []
+    match_args = {'query_emb': emb, 'encoder': encoder}
+    color = _semantic_match(query, colores, threshold=thresholds['color'], **match_args) if colores else None
+    tipo = _semantic_match(query, tipos, threshold=thresholds['tipo'], **match_args) if tipos else None
+    contexto = _semantic_match_multiple(
+        query, contextos, threshold=thresholds['contexto'], top_k=2, **match_args
+    ) if contextos else []
 
     # Detectar queries ambiguas y generar sugerencias
-    ambiguity_check = _detect_ambiguous_terms(query, vocab if client_id else {})
+    ambiguity_check = _detect_ambiguous_terms(query, vocab or {})
 
     result = {
         'tipo': tipo,
         'color': color,
         'contexto': contexto,
         'query': query,
-        'embedding': emb.tolist()
+        'embedding': emb.tolist(),
+        'encoder': encoder
     }
 
     # Agregar sugerencias si la query es ambigua
@@ -284,8 +524,8 @@ def normalize_query(query: str, client_id: int = None) -> dict:
         result['needs_refinement'] = True
         result['ambiguous_terms'] = ambiguity_check['ambiguous_terms']
         result['suggestions'] = ambiguity_check['suggestions']
-        print(f"💡 QUERY AMBIGUA detectada: {ambiguity_check['ambiguous_terms']}")
-        print(f"   Sugerencias: {list(ambiguity_check['suggestions'].keys())}")
+        logger.debug("Query ambigua: %s (sugerencias: %s)",
+                     ambiguity_check['ambiguous_terms'], list(ambiguity_check['suggestions'].keys()))
     else:
         result['needs_refinement'] = False
 
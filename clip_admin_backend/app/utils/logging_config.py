@@ -0,0 +1,189 @@
+"""
+Configuración de logging de la app: niveles por módulo, formato JSON y detalle por request
+
+- Nivel raíz: LOG_LEVEL (ver app.config.get_log_level)
+- Niveles por módulo: LOG_LEVELS="search=DEBUG,sqlalchemy.engine=WARNING"
+  o system_config.json -> "logging": {"levels": {"search": "DEBUG"}}
+- Formato: LOG_FORMAT=json|text (o "logging": {"format": "json"})
+- Detalle por candidato/producto (get_logger(...).detail): apagado salvo que
+  * la request traiga `X-Search-Debug: 1` con una API Key de admin, o
+  * la request caiga en el muestreo "logging": {"detail_sample_rate": 0.01}, o
+  * el logger esté en DEBUG
+
+Uso:
+    from app.utils.logging_config import get_logger
+    log = get_logger("search")
+
+    log.info("Categoría detectada %s (%.3f)", name, confidence)   # formateo perezoso
+    if log.detail_enabled:
+        for row in rows:
+            log.detail("candidato %s sim=%.4f", row.id, sim)
+"""
+import os
+import json
+import random
+import logging
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+DEBUG_HEADER = 'X-Search-Debug'
+
+# Librerías ruidosas en DEBUG (se pueden sobreescribir con LOG_LEVELS)
+DEFAULT_MODULE_LEVELS = {
+    'PIL': 'WARNING',
+    'urllib3': 'WARNING',
+    'sqlalchemy.engine': 'WARNING',
+}
+
+_configured = False
+
+# Atributos estándar de LogRecord (el resto se considera 'extra' y va al JSON)
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _client_id(client):
+    if client is None:
+        return None
+    try:
+        from sqlalchemy import inspect
+        identity = inspect(client).identity  # Sin refrescar la instancia desde la BD
+        return str(identity[0]) if identity else None
+    except Exception:
+        return None
+
+
+class RequestContextFilter(logging.Filter):
+    """Agrega endpoint y cliente de la request en curso a cada registro"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.endpoint = request.endpoint
+            record.client_id = _client_id(getattr(request, 'client', None))
+        else:
+            record.endpoint = None
+            record.client_id = None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro (ts, level, logger, msg, contexto de request y extras)"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def _logging_section() -> dict:
+    try:
+        from app.utils.system_config import system_config
+        return system_config.get_section('logging') or {}
+    except Exception:
+        return {}
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(level: str = None):
+    """
+    Configura el logging raíz una sola vez (idempotente)
+
+    Args:
+        level: Nivel raíz (None = LOG_LEVEL / get_log_level())
+    """
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    section = _logging_section()
+    if level is None:
+        try:
+            from app.config import get_log_level
+            level = get_log_level()
+        except Exception:
+            level = os.getenv('LOG_LEVEL', 'INFO')
+
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestContextFilter())
+    if (os.getenv('LOG_FORMAT') or section.get('format', 'text')).lower() == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+    levels = dict(DEFAULT_MODULE_LEVELS)
+    levels.update(section.get('levels') or {})
+    levels.update(_parse_levels(os.getenv('LOG_LEVELS', '')))
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(str(module_level).upper())
+
+
+def request_detail_enabled() -> bool:
+    """Decide (una vez por request) si se emiten logs de detalle"""
+    if not has_request_context():
+        return False
+    decision = g.get('_log_detail')
+    if decision is None:
+        decision = False
+        if request.headers.get(DEBUG_HEADER, '').lower() in ('1', 'true', 'yes'):
+            from app.core.stage_profiler import is_admin_api_key
+            decision = is_admin_api_key(request.headers.get('X-API-Key'))
+        if not decision:
+            try:
+                sample_rate = float(_logging_section().get('detail_sample_rate', 0.0) or 0.0)
+            except (TypeError, ValueError):
+                sample_rate = 0.0
+            decision = sample_rate > 0 and random.random() < sample_rate
+        g._log_detail = decision
+    return decision
+
+
+class RequestLogger(logging.LoggerAdapter):
+    """Logger con nivel extra 'detail' para el camino caliente (por candidato, por producto)"""
+
+    def __init__(self, logger):
+        super().__init__(logger, {})
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+    @property
+    def detail_enabled(self) -> bool:
+        return self.logger.isEnabledFor(logging.DEBUG) or request_detail_enabled()
+
+    def detail(self, msg, *args, **kwargs):
+        """
+        Log de detalle: solo si el logger está en DEBUG o la request pidió/cayó en el muestreo.
+        Con el flag de request se emite como INFO (marcado detail=True) para que salga
+        aunque el nivel global sea INFO.
+        """
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(msg, *args, **kwargs)
+        elif request_detail_enabled():
+            kwargs.setdefault('extra', {})['detail'] = True
+            self.logger.info(msg, *args, **kwargs)
+
+
+def get_logger(name: str) -> RequestLogger:
+    return RequestLogger(logging.getLogger(name))
@@ -37,7 +37,8 @@ class SystemConfig:
                 "clip": {
                     "preload": False,
                     "idle_timeout_minutes": 30,
-                    "model_name": "openai/clip-vit-base-patch16"
+                    "model_name": "openai/clip-vit-base-patch16",
+                    "backend": "pytorch"
                 },
                 "search": {
                     "max_results": 3,
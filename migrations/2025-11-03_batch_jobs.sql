@@ -0,0 +1,31 @@
+-- Migración: Crear tabla batch_jobs para trabajos batch reanudables
+-- Guarda progreso y checkpoint (cursor keyset por products.id) de la regeneración de tags,
+-- para que un fallo o reinicio del worker solo pierda el lote en curso.
+CREATE TABLE IF NOT EXISTS batch_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    client_id VARCHAR(36) NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+    job_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    params JSON DEFAULT '{}',
+    total INTEGER DEFAULT 0,
+    processed INTEGER DEFAULT 0,
+    updated INTEGER DEFAULT 0,
+    failed INTEGER DEFAULT 0,
+    last_product_id VARCHAR(36),
+    error_message TEXT,
+    created_by VARCHAR(36),
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Índice para buscar el último job de un cliente por tipo
+CREATE INDEX IF NOT EXISTS idx_batch_jobs_client_type ON batch_jobs(client_id, job_type, created_at);
+
+-- Comentarios para documentación
+COMMENT ON TABLE batch_jobs IS 'Trabajos batch en segundo plano con checkpoint para reanudar';
+COMMENT ON COLUMN batch_jobs.status IS 'pending | running | cancelling | cancelled | completed | failed';
+COMMENT ON COLUMN batch_jobs.last_product_id IS 'Último products.id procesado (cursor keyset para reanudar)';
+COMMENT ON COLUMN batch_jobs.heartbeat_at IS 'Último lote confirmado; sin heartbeat reciente el job se considera interrumpido';
@@ -0,0 +1,40 @@
+-- Migración: Índices para las queries calientes (búsqueda, API externa, dashboards)
+-- Verificar planes después de aplicar con:
+--   python tools/diagnostics/check_query_plans.py --seed 20000
+--
+-- Ya cubiertos por constraints existentes (no se duplican):
+--   clients(api_key)                     -> UNIQUE clients_api_key_key (require_api_key / verify_api_key)
+--   color_mappings(client_id, raw_color) -> UNIQUE uq_client_raw_color
+
+-- Búsqueda visual: scan de embeddings del cliente (solo filas buscables)
+CREATE INDEX IF NOT EXISTS idx_images_client_searchable
+    ON images(client_id, product_id)
+    WHERE is_processed = TRUE AND clip_embedding IS NOT NULL;
+
+-- Dashboards y estadísticas de embeddings: conteos por cliente/estado
+CREATE INDEX IF NOT EXISTS idx_images_client_processed ON images(client_id, is_processed);
+
+-- Imagen primaria de un producto (resultados de búsqueda, JOIN de text_search)
+CREATE INDEX IF NOT EXISTS idx_images_product_primary ON images(product_id, is_primary);
+
+-- serve_image: lookup por nombre de archivo
+CREATE INDEX IF NOT EXISTS idx_images_filename ON images(filename);
+
+-- Búsqueda filtrada por categoría detectada, colores por categoría, centroides
+CREATE INDEX IF NOT EXISTS idx_products_client_category ON products(client_id, category_id);
+
+-- bulk_check_stock / import masivo: lookup por SKU dentro del cliente
+CREATE INDEX IF NOT EXISTS idx_products_client_sku ON products(client_id, sku);
+
+-- Analytics: búsquedas de un cliente por rango de fechas
+CREATE INDEX IF NOT EXISTS idx_search_logs_client_created ON search_logs(client_id, created_at);
+
+-- Estadísticas frescas para que el planner use los índices nuevos
+ANALYZE images;
+ANALYZE products;
+ANALYZE search_logs;
+
+-- Comentarios para documentación
+COMMENT ON INDEX idx_images_client_searchable IS 'Scan de búsqueda visual: imágenes procesadas con embedding por cliente';
+COMMENT ON INDEX idx_images_product_primary IS 'Imagen primaria por producto (resultados de búsqueda)';
+COMMENT ON INDEX idx_products_client_sku IS 'Lookup por SKU (API de inventario e importación masiva)';
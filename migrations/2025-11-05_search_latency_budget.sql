@@ -0,0 +1,8 @@
+-- Migración: Presupuesto de latencia por tienda para la búsqueda visual
+-- NULL = usar latency_budget.default_ms de system_config.json (ver app/core/latency_budget.py)
+
+ALTER TABLE store_search_config
+    ADD COLUMN IF NOT EXISTS latency_budget_ms INTEGER;
+
+COMMENT ON COLUMN store_search_config.latency_budget_ms IS
+    'Presupuesto de latencia de la búsqueda visual en ms (NULL = default del sistema)';
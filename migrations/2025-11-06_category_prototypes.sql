@@ -0,0 +1,9 @@
+-- Migración: Sub-centroides por categoría para el índice multi-prototipo
+-- Se completan al recalcular centroides (tools/maintenance/recalculate_centroids.py)
+-- NULL = la categoría se representa solo con su centroide (ver app/core/category_index.py)
+
+ALTER TABLE categories
+    ADD COLUMN IF NOT EXISTS prototype_embeddings TEXT;
+
+COMMENT ON COLUMN categories.prototype_embeddings IS
+    'JSON [[...], ...] con los sub-centroides k-means de las imágenes de la categoría';
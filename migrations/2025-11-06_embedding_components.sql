@@ -0,0 +1,17 @@
+-- Migración: Componentes crudos y receta de los embeddings de imagen
+-- image_features: features de imagen sin normalizar (JSON), para recalcular la fusión
+--                 con tools/maintenance/refuse_embeddings.py sin volver a codificar
+-- embedding_recipe: receta con la que se armó clip_embedding (ver app/core/embedding_recipe.py)
+--                   NULL = embedding anterior a esta migración (requiere re-encode para tener componentes)
+
+ALTER TABLE images
+    ADD COLUMN IF NOT EXISTS image_features TEXT,
+    ADD COLUMN IF NOT EXISTS embedding_recipe VARCHAR(50);
+
+COMMENT ON COLUMN images.image_features IS
+    'Features CLIP crudas de la imagen (JSON, sin normalizar)';
+COMMENT ON COLUMN images.embedding_recipe IS
+    'Receta del embedding fusionado, p.ej. contextual_fusion/2';
+
+-- Embeddings viejos por cliente (refuse_embeddings.py --stale-only)
+CREATE INDEX IF NOT EXISTS idx_images_client_recipe ON images(client_id, embedding_recipe);
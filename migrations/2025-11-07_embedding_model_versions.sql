@@ -0,0 +1,49 @@
+-- Migración: Versionado del modelo CLIP de los embeddings e índice sombra
+-- Ver app/core/model_versions.py y tools/maintenance/model_index_tool.py
+--
+-- IMPORTANTE: los UPDATE de abajo fijan el modelo actual de cada cliente con el
+-- nombre amigable (claves de CLIP_MODEL_MAP). Si clip.model_name en system_config.json
+-- no es ViT-B/16 (ni openai/clip-vit-base-patch16), reemplazarlo antes de correr.
+
+-- Modelo del índice activo de cada cliente (las búsquedas codifican con este modelo)
+ALTER TABLE clients
+    ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(50);
+
+-- Modelo que generó cada embedding y cada centroide
+ALTER TABLE images
+    ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(50);
+
+ALTER TABLE categories
+    ADD COLUMN IF NOT EXISTS centroid_model VARCHAR(50);
+
+-- Vectores del índice sombra (modelo nuevo, todavía no activo)
+CREATE TABLE IF NOT EXISTS shadow_embeddings (
+    image_id VARCHAR(36) NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    model_name VARCHAR(50) NOT NULL,
+    client_id VARCHAR(36) NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+    clip_embedding TEXT NOT NULL,
+    image_features TEXT,
+    embedding_recipe VARCHAR(50),
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (image_id, model_name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_shadow_embeddings_client_model ON shadow_embeddings(client_id, model_name);
+
+-- Fijar el modelo vigente (cambiar de modelo queda en manos del cutover)
+UPDATE clients SET embedding_model = 'ViT-B/16' WHERE embedding_model IS NULL;
+
+UPDATE images AS i
+SET embedding_model = c.embedding_model
+FROM clients AS c
+WHERE i.client_id = c.id AND i.clip_embedding IS NOT NULL AND i.embedding_model IS NULL;
+
+UPDATE categories AS cat
+SET centroid_model = c.embedding_model
+FROM clients AS c
+WHERE cat.client_id = c.id AND cat.centroid_embedding IS NOT NULL AND cat.centroid_model IS NULL;
+
+COMMENT ON COLUMN clients.embedding_model IS 'Modelo CLIP del índice activo (NULL = clip.model_name)';
+COMMENT ON COLUMN images.embedding_model IS 'Modelo CLIP que generó clip_embedding';
+COMMENT ON COLUMN categories.centroid_model IS 'Modelo CLIP del centroide y los prototipos';
+COMMENT ON TABLE shadow_embeddings IS 'Embeddings con un modelo en prueba; el cutover los copia a images';
@@ -0,0 +1,31 @@
+-- Migración: SKU único por cliente
+-- La importación masiva hace upsert con INSERT ... ON CONFLICT (client_id, sku)
+-- (app/services/catalog_import_service.py), que necesita este índice único. También
+-- evita que un import y products.create en paralelo dupliquen un SKU.
+--
+-- IMPORTANTE: si ya hay SKUs duplicados dentro de un cliente la migración se detiene.
+-- Listarlos y resolverlos (borrar o renombrar) antes de volver a correrla:
+--   SELECT client_id, sku, COUNT(*) FROM products
+--   WHERE sku IS NOT NULL GROUP BY client_id, sku HAVING COUNT(*) > 1;
+
+-- SKU vacío = sin SKU (igual que el formulario de productos); NULL no choca en el índice
+UPDATE products SET sku = NULL WHERE sku = '';
+
+DO $$
+DECLARE
+    duplicates INTEGER;
+BEGIN
+    SELECT COUNT(*) INTO duplicates FROM (
+        SELECT 1 FROM products WHERE sku IS NOT NULL
+        GROUP BY client_id, sku HAVING COUNT(*) > 1
+    ) d;
+    IF duplicates > 0 THEN
+        RAISE EXCEPTION 'Hay % SKU(s) duplicados dentro de un cliente: resolverlos antes de crear uq_products_client_sku', duplicates;
+    END IF;
+END $$;
+
+-- Reemplaza a idx_products_client_sku (2025-11-04_hot_query_indexes.sql): mismo lookup, ahora único
+CREATE UNIQUE INDEX IF NOT EXISTS uq_products_client_sku ON products(client_id, sku);
+DROP INDEX IF EXISTS idx_products_client_sku;
+
+COMMENT ON INDEX uq_products_client_sku IS 'SKU único por cliente: lookup de inventario y upsert de la importación masiva';
@@ -0,0 +1,310 @@
+"""
+Benchmark end-to-end de /api/search y /api/search/text
+
+Corre las requests con el test client de Flask y el backend CLIP 'stub'
+(encoders deterministas, sin descargar modelos), sobre tenants sintéticos. Reporta percentiles de
+latencia por etapa y totales, throughput y pico de RSS, en JSON para comparar
+entre commits.
+
+Uso:
+    # Generar tenant, medir y borrarlo
+    python tools/benchmarks/search_benchmark.py --products 5000 --images-per-product 2 --requests 200 --cleanup
+
+    # Reusar un tenant existente y guardar resultados
+    python tools/benchmarks/search_benchmark.py --api-key <key> --requests 500 --out bench/results.json
+
+    # Comparar dos corridas
+    python tools/benchmarks/search_benchmark.py --compare bench/before.json bench/after.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import platform
+import functools
+import contextlib
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+# Encoders stub (CLIP y MiniLM) vía el backend 'stub' de app.core.clip_backends
+os.environ['CLIP_BACKEND'] = 'stub'
+
+from synthetic_catalog import (  # noqa: E402
+    load_flask_app, generate_catalog, delete_tenants, query_image, COLORS, CATEGORY_NAMES, MATERIALS
+)
+
+# Etapas instrumentadas: (módulo, atributo, nombre de etapa)
+STAGES = [
+    ('app.blueprints.api', 'verify_api_key', 'api_key'),
+    ('app.blueprints.api', 'detect_image_category_with_centroids', 'category_detection'),
+    ('app.blueprints.api', 'detect_dominant_color_from_palette', 'color_detection'),
+    ('app.blueprints.api', '_generate_query_embedding', 'embedding'),
+    ('app.blueprints.api', '_find_similar_products_in_category', 'candidates'),
+    ('app.blueprints.api', '_hydrate_best_matches', 'hydration'),
+    ('app.blueprints.api', '_build_search_results', 'serialization'),
+    ('app.blueprints.api', 'normalize_query', 'query_normalization'),
+    ('app.blueprints.api', 'expand_color_modifiers', 'color_expansion'),
+    ('app.core.search_optimizer', 'SearchOptimizer.rank_results', 'optimizer'),
+    ('app.services.query_enrichment_service', 'QueryEnrichmentService.enrich_query', 'query_enrichment'),
+]
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class StageRecorder:
+    """Acumula tiempos por etapa de la request en curso"""
+
+    def __init__(self):
+        self.current = defaultdict(float)
+        self.samples = defaultdict(lambda: defaultdict(list))  # {endpoint: {stage: [ms]}}
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.current[name] += (time.perf_counter() - started) * 1000.0
+        return timed
+
+    def flush(self, endpoint, total_ms):
+        for name, value in self.current.items():
+            self.samples[endpoint][name].append(value)
+        self.samples[endpoint]['total'].append(total_ms)
+        self.current = defaultdict(float)
+
+
+def instrument(recorder):
+    """Envuelve las funciones de STAGES (atributos de módulo o métodos de clase)"""
+    import importlib
+
+    for module_name, attr, stage in STAGES:
+        module = importlib.import_module(module_name)
+        owner, name = module, attr
+        if '.' in attr:
+            class_name, name = attr.split('.')
+            owner = getattr(module, class_name)
+        original = getattr(owner, name, None)
+        if original is None:
+            print(f"⚠️ Etapa {stage}: {module_name}.{attr} no existe, se omite")
+            continue
+        if isinstance(owner, type) and isinstance(owner.__dict__.get(name), (classmethod, staticmethod)):
+            descriptor = type(owner.__dict__[name])
+            setattr(owner, name, descriptor(recorder.wrap(stage, owner.__dict__[name].__func__)))
+        else:
+            setattr(owner, name, recorder.wrap(stage, original))
+
+
+def summarize(values):
+    array = np.asarray(values, dtype=np.float64)
+    summary = {f"p{p}": round(float(np.percentile(array, p)), 3) for p in PERCENTILES}
+    summary.update(mean=round(float(array.mean()), 3), max=round(float(array.max()), 3), count=int(array.size))
+    return summary
+
+
+def peak_rss_mb():
+    # ru_maxrss: KB en Linux, bytes en macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if platform.system() == 'Darwin' else rss / 1024, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def text_queries(rng, count):
+    queries = []
+    for _ in range(count):
+        name, _ = rng.choice(CATEGORY_NAMES)
+        parts = [name.lower().rstrip('s'), rng.choice(COLORS).lower()]
+        if rng.random() < 0.3:
+            parts.append(rng.choice(MATERIALS))
+        queries.append(' '.join(parts))
+    return queries
+
+
+@contextlib.contextmanager
+def quiet(enabled):
+    """Silencia los print de depuración de la app durante la medición"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run(client, tenant, args, recorder):
+    rng = random.Random(args.seed)
+    images = [query_image(c) for c in range(tenant['categories'])]
+    queries = text_queries(rng, args.requests)
+    headers = {'X-API-Key': tenant['api_key']}
+    errors = defaultdict(int)
+    wall = {}
+
+    endpoints = []
+    if args.endpoint in ('both', 'visual'):
+        endpoints.append('visual')
+    if args.endpoint in ('both', 'text'):
+        endpoints.append('text')
+
+    for endpoint in endpoints:
+        # Warmup (caches, primera compilación de queries)
+        for i in range(args.warmup + args.requests):
+            if endpoint == 'visual':
+                from io import BytesIO
+                data = {'image': (BytesIO(images[i % len(images)]), 'query.png'), 'limit': str(args.limit)}
+                call = functools.partial(client.post, '/api/search', data=data, headers=headers,
+                                         content_type='multipart/form-data')
+            else:
+                call = functools.partial(client.post, '/api/search/text', headers=headers,
+                                         json={'query': queries[i % len(queries)], 'limit': args.limit})
+
+            if i == args.warmup:
+                recorder.samples[endpoint].clear()
+                wall[endpoint] = time.perf_counter()
+            recorder.current.clear()
+
+            started = time.perf_counter()
+            with quiet(not args.verbose):
+                response = call()
+            elapsed = (time.perf_counter() - started) * 1000.0
+
+            if response.status_code != 200:
+                errors[f"{endpoint}:{response.status_code}"] += 1
+            recorder.flush(endpoint, elapsed)
+        wall[endpoint] = time.perf_counter() - wall[endpoint]
+
+    return {
+        endpoint: {
+            'requests': args.requests,
+            'throughput_rps': round(args.requests / wall[endpoint], 2) if wall[endpoint] else None,
+            'stages_ms': {stage: summarize(values) for stage, values in sorted(recorder.samples[endpoint].items())},
+        }
+        for endpoint in endpoints
+    }, dict(errors)
+
+
+def compare(before_path, after_path):
+    """Imprime la diferencia de p50/p95 por etapa entre dos corridas"""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"📊 {before.get('commit')} → {after.get('commit')}")
+    for endpoint, data in after['results'].items():
+        old = before['results'].get(endpoint, {})
+        print(f"\n{endpoint}: {old.get('throughput_rps')} → {data.get('throughput_rps')} req/s")
+        for stage, stats in data['stages_ms'].items():
+            old_stats = old.get('stages_ms', {}).get(stage)
+            if not old_stats:
+                print(f"   {stage:22s} p50 {stats['p50']:9.2f}ms  p95 {stats['p95']:9.2f}ms  (nueva)")
+                continue
+            delta = (stats['p50'] - old_stats['p50']) / old_stats['p50'] * 100 if old_stats['p50'] else 0.0
+            print(f"   {stage:22s} p50 {old_stats['p50']:9.2f} → {stats['p50']:9.2f}ms ({delta:+.1f}%)  "
+                  f"p95 {old_stats['p95']:9.2f} → {stats['p95']:9.2f}ms")
+    print(f"\nPico RSS: {before.get('peak_rss_mb')} → {after.get('peak_rss_mb')} MB")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark end-to-end de búsqueda")
+    p.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Comparar dos archivos de resultados")
+    p.add_argument("--api-key", help="Usar un tenant existente en lugar de generar uno")
+    p.add_argument("--categories", type=int, default=10)
+    p.add_argument("--products", type=int, default=2000)
+    p.add_argument("--images-per-product", type=int, default=2)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--endpoint", choices=["both", "visual", "text"], default="both")
+    p.add_argument("--requests", type=int, default=100, help="Requests medidas por endpoint")
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--out", help="Archivo JSON de salida (default: stdout)")
+    p.add_argument("--cleanup", action="store_true", help="Borrar el tenant sintético al terminar")
+    p.add_argument("--verbose", action="store_true", help="No silenciar los logs de la app")
+    args = p.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+
+    app = load_flask_app()
+    with app.app_context():
+        from app import db
+        from app.models.category import Category
+        from app.models.client import Client
+
+        recorder = StageRecorder()
+        instrument(recorder)
+
+        if args.api_key:
+            client_row = Client.query.filter_by(api_key=args.api_key).first()
+            if not client_row:
+                print("❌ API Key no encontrada")
+                sys.exit(1)
+            tenant = {
+                'client_id': client_row.id,
+                'api_key': args.api_key,
+                'categories': Category.query.filter_by(client_id=client_row.id).count(),
+            }
+        else:
+            tenant = generate_catalog(
+                db, clients=1, categories=args.categories, products=args.products,
+                images_per_product=args.images_per_product, seed=args.seed
+            )[0]
+
+        try:
+            with app.test_client() as client:
+                results, errors = run(client, tenant, args, recorder)
+        finally:
+            if args.cleanup and not args.api_key:
+                delete_tenants(db, [tenant['client_id']])
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'config': {
+            'categories': tenant.get('categories'),
+            'products': tenant.get('products'),
+            'images': tenant.get('images'),
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'limit': args.limit,
+            'seed': args.seed,
+        },
+        'results': results,
+        'errors': errors,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            f.write(output)
+        print(f"💾 Resultados guardados en {args.out}")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Recall del snapshot cuantizado (float16 / int8) contra la búsqueda exacta float32
+
+Construye snapshots del mismo catálogo con cada storage en una carpeta temporal
+(no toca los snapshots publicados) y corre las mismas queries por
+_snapshot_best_matches (el camino real de /api/search) con cada uno. Reporta por storage:
+    - recall@k de productos contra float32
+    - recall del conjunto sobre el umbral y productos de más (deben ser 1 y 0: la
+      decisión sobre el umbral es la misma que con float32)
+    - diferencia máxima de similitud en productos comunes (> 0 solo en filas fuera
+      de las rerank_candidates, que conservan el score aproximado)
+    - recall@k de imágenes con el score aproximado solo (sin re-rank)
+    - filas re-puntuadas por query, latencia y bytes recorridos por búsqueda
+
+Sale con código 1 si algún storage queda con recall@k por debajo de --min-recall,
+pierde productos sobre el umbral o devuelve productos que la búsqueda exacta no devuelve.
+
+Uso:
+    # Tenant sintético, medir y borrarlo
+    python tools/benchmarks/snapshot_recall.py --products 5000 --images-per-product 2 --cleanup
+
+    # Tenant existente
+    python tools/benchmarks/snapshot_recall.py --client-id <uuid> --threshold 0.3 --out bench/recall.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+# Encoders stub (CLIP y MiniLM) vía el backend 'stub' de app.core.clip_backends
+os.environ['CLIP_BACKEND'] = 'stub'
+
+from synthetic_catalog import (  # noqa: E402
+    load_flask_app, generate_catalog, delete_tenants, category_prototype, _perturb
+)
+
+# Ruido de las queries armadas a partir de imágenes del catálogo
+QUERY_NOISE = 0.4
+
+
+def build_queries(snapshot, categories: int, count: int, seed: int) -> list:
+    """Prototipos de categoría + imágenes del catálogo con ruido"""
+    rng = np.random.default_rng(seed)
+    queries = [category_prototype(c) for c in range(categories)]
+    rows = rng.integers(0, len(snapshot), size=max(0, count - len(queries)))
+    queries.extend(_perturb(rng, np.asarray(snapshot.embeddings[row]), QUERY_NOISE) for row in rows)
+    return queries[:count]
+
+
+def top_products(matches: dict, k: int) -> list:
+    ranked = sorted(matches.items(), key=lambda item: item[1]['similarity'], reverse=True)
+    return [product_id for product_id, _ in ranked[:k]]
+
+
+def measure(snapshot, exact, queries, exact_matches, args, category_names):
+    from app.blueprints.api import _snapshot_best_matches
+
+    topk_recall, threshold_recall, extras, max_diff = [], [], 0, 0.0
+    approx_recall, reranked, latencies = [], [], []
+    for query, expected in zip(queries, exact_matches):
+        started = time.perf_counter()
+        matches, _ = _snapshot_best_matches(snapshot, query, args.threshold, category_names,
+                                            collect_categories=False)
+        latencies.append((time.perf_counter() - started) * 1000.0)
+
+        expected_top = top_products(expected, args.k)
+        if expected_top:
+            topk_recall.append(len(set(expected_top) & set(top_products(matches, args.k))) / len(expected_top))
+        if expected:
+            threshold_recall.append(len(expected.keys() & matches.keys()) / len(expected))
+        extras += len(matches.keys() - expected.keys())
+        for product_id in expected.keys() & matches.keys():
+            max_diff = max(max_diff, abs(expected[product_id]['similarity'] - matches[product_id]['similarity']))
+
+        # Sin re-rank: top-k de imágenes por score aproximado vs exacto
+        approx = snapshot.scores(query)
+        exact_scores = exact.scores(query)
+        k = min(args.k, len(snapshot))
+        approx_top = set(np.argpartition(approx, -k)[-k:].tolist())
+        exact_top = set(np.argpartition(exact_scores, -k)[-k:].tolist())
+        approx_recall.append(len(approx_top & exact_top) / k)
+        if snapshot.quantized:
+            reranked.append(snapshot.rerank(approx, query, args.threshold)[1])
+
+    def mean(values):
+        return round(float(np.mean(values)), 4) if values else None
+
+    return {
+        'storage': snapshot.storage,
+        'scan_mb': round(snapshot.scan_bytes / (1024 * 1024), 2),
+        f'recall_at_{args.k}': mean(topk_recall),
+        'threshold_recall': mean(threshold_recall),
+        'extra_products': extras,
+        'max_similarity_diff': round(max_diff, 6),
+        f'approx_only_image_recall_at_{args.k}': mean(approx_recall),
+        'reranked_rows_mean': mean(reranked) if reranked else 0,
+        'latency_ms_p50': round(float(np.percentile(latencies, 50)), 3),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Recall de snapshots cuantizados contra float32")
+    p.add_argument("--client-id", help="Usar un cliente existente en lugar de generar un tenant")
+    p.add_argument("--categories", type=int, default=10)
+    p.add_argument("--products", type=int, default=2000)
+    p.add_argument("--images-per-product", type=int, default=2)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--threshold", type=float, default=0.3, help="Umbral de similitud (default: 0.3)")
+    p.add_argument("--k", type=int, default=10, help="Productos top para recall@k (default: 10)")
+    p.add_argument("--min-recall", type=float, default=0.99, help="Recall mínimo aceptado (default: 0.99)")
+    p.add_argument("--out", help="Archivo JSON de salida (default: stdout)")
+    p.add_argument("--cleanup", action="store_true", help="Borrar el tenant sintético al terminar")
+    args = p.parse_args()
+
+    logging.disable(logging.WARNING)
+    # Snapshots en una carpeta temporal: no reemplaza el CURRENT publicado
+    snapshot_dir = tempfile.mkdtemp(prefix='snapshot-recall-')
+    os.environ['INDEX_SNAPSHOT_DIR'] = snapshot_dir
+
+    app = load_flask_app()
+    with app.app_context():
+        from app import db
+        from app.models.category import Category
+        from app.blueprints.api import _category_names, _snapshot_best_matches
+        from app.core.index_snapshots import STORAGES, STORAGE_FLOAT32, IndexSnapshot, build_snapshot
+
+        if args.client_id:
+            tenant = {'client_id': args.client_id,
+                      'categories': Category.query.filter_by(client_id=args.client_id).count()}
+        else:
+            tenant = generate_catalog(
+                db, clients=1, categories=args.categories, products=args.products,
+                images_per_product=args.images_per_product, seed=args.seed
+            )[0]
+
+        try:
+            snapshots = {}
+            for storage in STORAGES:
+                path = build_snapshot(tenant['client_id'], storage=storage)
+                if path is None:
+                    print("❌ El cliente no tiene embeddings")
+                    sys.exit(1)
+                snapshots[storage] = IndexSnapshot(path)
+            exact = snapshots[STORAGE_FLOAT32]
+            print(f"📦 {len(exact)} imágenes, {exact.manifest['dim']} dimensiones")
+
+            category_names = _category_names(tenant['client_id'])
+            queries = build_queries(exact, tenant['categories'], args.queries, args.seed)
+            exact_matches = [
+                _snapshot_best_matches(exact, query, args.threshold, category_names, collect_categories=False)[0]
+                for query in queries
+            ]
+            results = [measure(snapshots[storage], exact, queries, exact_matches, args, category_names)
+                       for storage in STORAGES]
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+            if args.cleanup and not args.client_id:
+                delete_tenants(db, [tenant['client_id']])
+
+    failed = False
+    for result in results:
+        recall = result[f'recall_at_{args.k}']
+        ok = ((recall is None or recall >= args.min_recall) and result['extra_products'] == 0
+              and result['threshold_recall'] in (None, 1.0))
+        failed = failed or not ok
+        print(f"   {'✅' if ok else '❌'} {result['storage']:8s} recall@{args.k} {result[f'recall_at_{args.k}']}  "
+              f"umbral {result['threshold_recall']}  {result['scan_mb']} MB  "
+              f"p50 {result['latency_ms_p50']} ms  re-puntuadas {result['reranked_rows_mean']}")
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'config': {'images': len(exact), 'queries': len(queries), 'threshold': args.threshold,
+                   'k': args.k, 'seed': args.seed},
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            f.write(output)
+        print(f"💾 Resultados guardados en {args.out}")
+    print(output)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
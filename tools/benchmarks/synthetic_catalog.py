@@ -0,0 +1,299 @@
+"""
+Generador de catálogos sintéticos para benchmarks
+
+Crea tenants (clientes) completos a escala configurable:
+clientes × categorías × productos × imágenes, con embeddings unitarios,
+centroides de categoría, atributos JSONB realistas, tags, config de atributos
+y config del SearchOptimizer.
+
+Los embeddings se arman alrededor de un prototipo por categoría que es el vector
+del encoder stub para la "imagen de consulta" de esa categoría (query_image),
+así una búsqueda con esa imagen detecta la categoría y encuentra candidatos
+como en un catálogo real.
+
+Uso:
+    python tools/benchmarks/synthetic_catalog.py --clients 1 --categories 20 --products 5000 --images-per-product 2
+    python tools/benchmarks/synthetic_catalog.py --delete
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import importlib.util
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(__file__))
+
+from app.core.stub_encoders import CLIP_DIM, seeded_unit_vector, content_seed  # noqa: E402
+
+SLUG_PREFIX = 'bench-'
+INSERT_CHUNK = 1000
+
+# Ruido alrededor del prototipo de categoría (cos esperado ~0.8 producto, ~0.95 imagen)
+PRODUCT_NOISE = 0.75
+IMAGE_NOISE = 0.3
+
+CATEGORY_NAMES = [
+    ('Remeras', 't-shirt'), ('Camisas', 'shirt'), ('Pantalones', 'pants'), ('Buzos', 'sweatshirt'),
+    ('Camperas', 'jacket'), ('Gorras', 'cap'), ('Delantales', 'apron'), ('Zapatillas', 'sneakers'),
+    ('Vestidos', 'dress'), ('Polleras', 'skirt'), ('Shorts', 'shorts'), ('Chalecos', 'vest'),
+    ('Bolsos', 'bag'), ('Mochilas', 'backpack'), ('Medias', 'socks'), ('Bufandas', 'scarf'),
+    ('Guantes', 'gloves'), ('Cinturones', 'belt'), ('Sombreros', 'hat'), ('Ambos', 'scrubs'),
+]
+COLORS = ['NEGRO', 'BLANCO', 'AZUL', 'ROJO', 'VERDE', 'GRIS', 'BEIGE', 'MARRON', 'ROSA', 'AMARILLO']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+MATERIALS = ['algodón', 'poliéster', 'lino', 'jean', 'gabardina', 'cuero', 'lana']
+GENDERS = ['hombre', 'mujer', 'unisex']
+BRANDS = ['Acme', 'Norte', 'Urbana', 'Patagonia Sur', 'Delta']
+TAG_WORDS = ['casual', 'formal', 'deportivo', 'verano', 'invierno', 'liso', 'estampado', 'rayado',
+             'oversize', 'slim', 'clásico', 'moderno', 'trabajo', 'uniforme', 'básico']
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def query_image(category_index: int, size: int = 256) -> bytes:
+    """
+    Imagen de consulta determinista de una categoría (PNG)
+
+    Su vector en el encoder stub es el prototipo de la categoría en el catálogo sintético.
+    """
+    from PIL import Image as PILImage
+
+    rng = np.random.default_rng(1000 + category_index)
+    pixels = rng.integers(0, 256, size=(16, 16, 3), dtype=np.uint8)
+    image = PILImage.fromarray(pixels, 'RGB').resize((size, size), PILImage.NEAREST)
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def category_prototype(category_index: int) -> np.ndarray:
+    """Vector stub de query_image(category_index)"""
+    from PIL import Image as PILImage
+
+    image = PILImage.open(BytesIO(query_image(category_index))).convert('RGB')
+    return seeded_unit_vector(content_seed(image.resize((16, 16)).tobytes()), CLIP_DIM)
+
+
+def _perturb(rng, base: np.ndarray, noise: float) -> np.ndarray:
+    direction = rng.standard_normal(base.shape[0]).astype(np.float32)
+    vector = base + noise * direction / np.linalg.norm(direction)
+    return vector / np.linalg.norm(vector)
+
+
+def _embedding_json(vector: np.ndarray) -> str:
+    return json.dumps([round(float(v), 6) for v in vector])
+
+
+def _insert(db, table, rows):
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(table.insert(), rows[start:start + INSERT_CHUNK])
+
+
+def generate_tenant(db, index: int = 0, categories: int = 10, products: int = 1000,
+                    images_per_product: int = 2, seed: int = 42) -> dict:
+    """
+    Crea un tenant sintético completo
+
+    Args:
+        db: Instancia SQLAlchemy de la app
+        index: Número de tenant (para nombres y semilla)
+        categories: Categorías por tenant (máx len(CATEGORY_NAMES))
+        products: Productos por tenant
+        images_per_product: Imágenes por producto
+        seed: Semilla base (misma semilla -> mismo catálogo)
+
+    Returns:
+        dict con client_id, api_key, category_ids y conteos
+    """
+    from app.models.category import Category
+    from app.models.client import Client
+    from app.models.image import Image
+    from app.models.product import Product
+    from app.models.product_attribute_config import ProductAttributeConfig
+    from app.models.store_search_config import StoreSearchConfig
+
+    started = time.time()
+    rng = np.random.default_rng(seed + index)
+    pick = random.Random(seed + index)
+    now = datetime.utcnow()
+    categories = min(categories, len(CATEGORY_NAMES))
+
+    client_id = str(uuid.uuid4())
+    api_key = f"clip_bench{uuid.uuid4().hex[:16]}"
+    db.session.execute(Client.__table__.insert(), [{
+        'id': client_id, 'name': f"Bench Store {index}", 'slug': f"{SLUG_PREFIX}{index}-{client_id[:8]}",
+        'email': f"bench{index}-{client_id[:8]}@bench.local", 'industry': 'fashion', 'is_active': True,
+        'api_key': api_key, 'api_settings': '{}',
+        # Umbrales bajos: el encoder stub da similitudes menores que CLIP real
+        'category_confidence_threshold': 10, 'product_similarity_threshold': 30,
+        'created_at': now, 'updated_at': now,
+    }])
+
+    # Config de atributos (valida/expone en búsqueda como un cliente real)
+    attribute_configs = [
+        ('color', 'Color', 'list', {'multiple': False, 'values': COLORS}),
+        ('talle', 'Talle', 'list', {'multiple': True, 'values': SIZES}),
+        ('material', 'Material', 'text', None),
+        ('genero', 'Género', 'list', {'multiple': False, 'values': GENDERS}),
+    ]
+    _insert(db, ProductAttributeConfig.__table__, [
+        {'client_id': client_id, 'key': key, 'label': label, 'type': type_, 'required': False,
+         'options': options, 'field_order': order, 'expose_in_search': True}
+        for order, (key, label, type_, options) in enumerate(attribute_configs)
+    ])
+
+    db.session.execute(StoreSearchConfig.__table__.insert(), [{
+        'store_id': client_id, 'visual_weight': 0.6, 'metadata_weight': 0.3, 'business_weight': 0.1,
+    }])
+
+    # Categorías con prototipo = vector stub de su imagen de consulta
+    category_rows, prototypes = [], []
+    for c in range(categories):
+        name, name_en = CATEGORY_NAMES[c]
+        category_rows.append({
+            'id': str(uuid.uuid4()), 'client_id': client_id, 'slug': f"{name.lower()}-{c}",
+            'name': name, 'name_en': name_en, 'alternative_terms': name_en,
+            'clip_prompt': f"a photo of a {name_en}", 'confidence_threshold': 0.2,
+            'is_active': True, 'created_at': now, 'updated_at': now,
+        })
+        prototypes.append(category_prototype(c))
+
+    product_rows, image_rows = [], []
+    centroid_sums = [np.zeros(CLIP_DIM, dtype=np.float64) for _ in range(categories)]
+    centroid_counts = [0] * categories
+
+    for p in range(products):
+        c = p % categories
+        category = category_rows[c]
+        product_id = str(uuid.uuid4())
+        color = pick.choice(COLORS)
+        product_rows.append({
+            'id': product_id, 'client_id': client_id, 'category_id': category['id'],
+            'name': f"{category['name'][:-1]} {color.lower()} {p}", 'description': f"{category['name']} sintético {p}",
+            'brand': pick.choice(BRANDS), 'sku': f"B{index}-{p:07d}",
+            'price': round(pick.uniform(1000, 90000), 2), 'stock': pick.randint(0, 100),
+            'tags': ', '.join(pick.sample(TAG_WORDS, 4)), 'is_active': True,
+            'attributes': {
+                'color': color,
+                'talle': pick.sample(SIZES, pick.randint(1, 4)),
+                'material': pick.choice(MATERIALS),
+                'genero': pick.choice(GENDERS),
+                'url_producto': f"https://bench.local/p/{p}",
+            },
+            'created_at': now, 'updated_at': now,
+        })
+
+        product_vector = _perturb(rng, prototypes[c], PRODUCT_NOISE)
+        for i in range(images_per_product):
+            vector = _perturb(rng, product_vector, IMAGE_NOISE)
+            centroid_sums[c] += vector
+            centroid_counts[c] += 1
+            image_id = str(uuid.uuid4())
+            image_rows.append({
+                'id': image_id, 'client_id': client_id, 'product_id': product_id,
+                'filename': f"{image_id}.jpg", 'original_filename': f"bench_{p}_{i}.jpg",
+                'cloudinary_url': f"https://res.cloudinary.com/bench/image/upload/bench/{image_id}.jpg",
+                'cloudinary_public_id': f"bench/{image_id}", 'width': 800, 'height': 800,
+                'file_size': 120000, 'mime_type': 'image/jpeg', 'display_order': i,
+                'is_primary': i == 0, 'is_processed': True, 'clip_embedding': _embedding_json(vector),
+                'upload_status': 'completed', 'created_at': now, 'updated_at': now,
+            })
+
+    for c, category in enumerate(category_rows):
+        if centroid_counts[c]:
+            centroid = centroid_sums[c] / centroid_counts[c]
+            category['centroid_embedding'] = _embedding_json(centroid / np.linalg.norm(centroid))
+            category['centroid_image_count'] = centroid_counts[c]
+            category['centroid_updated_at'] = now
+
+    _insert(db, Category.__table__, category_rows)
+    _insert(db, Product.__table__, product_rows)
+    _insert(db, Image.__table__, image_rows)
+    db.session.commit()
+
+    print(f"🌱 Tenant {index}: {categories} categorías, {len(product_rows)} productos, "
+          f"{len(image_rows)} imágenes en {time.time() - started:.1f}s")
+    return {
+        'client_id': client_id,
+        'api_key': api_key,
+        'category_ids': [c['id'] for c in category_rows],
+        'categories': categories,
+        'products': len(product_rows),
+        'images': len(image_rows),
+    }
+
+
+def generate_catalog(db, clients: int = 1, **kwargs) -> list:
+    """Crea varios tenants sintéticos; kwargs se pasan a generate_tenant"""
+    return [generate_tenant(db, index=i, **kwargs) for i in range(clients)]
+
+
+def delete_tenants(db, client_ids=None):
+    """Borra tenants sintéticos (los indicados o todos los de slug bench-*)"""
+    from sqlalchemy import text
+
+    if client_ids is None:
+        client_ids = [r[0] for r in db.session.execute(
+            text("SELECT id FROM clients WHERE slug LIKE :prefix"), {'prefix': f"{SLUG_PREFIX}%"}
+        ).fetchall()]
+
+    for client_id in client_ids:
+        params = {'client_id': client_id}
+        db.session.execute(text("DELETE FROM images WHERE client_id = :client_id"), params)
+        db.session.execute(text("DELETE FROM products WHERE client_id = :client_id"), params)
+        db.session.execute(text("DELETE FROM categories WHERE client_id = :client_id"), params)
+        db.session.execute(text("DELETE FROM product_attribute_config WHERE client_id = :client_id"), params)
+        db.session.execute(text("DELETE FROM store_search_config WHERE store_id = :client_id"), params)
+        db.session.execute(text("DELETE FROM search_logs WHERE client_id = :client_id"), params)
+        db.session.execute(text("DELETE FROM clients WHERE id = :client_id"), params)
+    db.session.commit()
+    print(f"🧹 {len(client_ids)} tenant(s) sintético(s) eliminados")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Generador de catálogos sintéticos")
+    p.add_argument("--clients", type=int, default=1)
+    p.add_argument("--categories", type=int, default=10)
+    p.add_argument("--products", type=int, default=1000, help="Productos por cliente")
+    p.add_argument("--images-per-product", type=int, default=2)
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--delete", action="store_true", help="Borrar todos los tenants bench-*")
+    args = p.parse_args()
+
+    app = load_flask_app()
+    with app.app_context():
+        from app import db
+
+        if args.delete:
+            delete_tenants(db)
+            return
+
+        tenants = generate_catalog(
+            db, clients=args.clients, categories=args.categories, products=args.products,
+            images_per_product=args.images_per_product, seed=args.seed
+        )
+        print(json.dumps(tenants, indent=2))
+
+
+if __name__ == "__main__":
+    main()
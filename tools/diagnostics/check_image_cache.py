@@ -0,0 +1,274 @@
+"""
+Chequeo de la cache de imágenes (app/services/image_cache.py) contra un stub HTTP local
+
+Levanta un http.server en 127.0.0.1 que sirve JPEGs y blobs de tamaño fijo, cuenta
+los requests por ruta y puede responder 503 las primeras N veces. Las URLs de
+Cloudinary (res.cloudinary.com) se resuelven contra el mismo stub usándolo como
+proxy HTTP, así que no sale nada a la red. Verifica:
+    1. hit/miss: la segunda lectura sale de disco sin pedir al servidor
+    2. clave por transformación: misma transformación con otra versión es hit,
+       otra transformación es miss; key_for() coincide con cache_key()
+    3. eviction LRU: al superar max_size_mb se desalojan los menos usados hasta el 90%
+       y una entrada leída recientemente sobrevive
+    4. reintentos: un 5xx transitorio se reintenta; uno persistente falla sin cachear nada
+    5. miniaturas: se generan a partir del original cacheado y se reusan sin re-descargar
+
+Carga el módulo por ruta: no requiere Flask ni la base de datos. Sale con código 1
+si algún chequeo falla.
+
+Uso:
+    python tools/diagnostics/check_image_cache.py
+    python tools/diagnostics/check_image_cache.py --keep   # conservar la carpeta de cache
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import importlib.util
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+MODULE_PATH = os.path.join(APP_DIR, 'app', 'services', 'image_cache.py')
+
+CLOUDINARY_BASE = 'http://res.cloudinary.com/demo/image/upload'
+BLOB_KB = 320  # 3 blobs (960 KB) entran en 1 MB pero superan el 90%
+
+
+def load_image_cache_module():
+    """Importa image_cache.py sin pasar por app/__init__.py (Flask, SQLAlchemy)"""
+    spec = importlib.util.spec_from_file_location('image_cache', MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_jpeg(width: int = 640, height: int = 480) -> bytes:
+    from PIL import Image as PILImage
+
+    image = PILImage.new('RGB', (width, height))
+    for x in range(0, width, 40):
+        image.paste((x % 256, (x * 3) % 256, 128), (x, 0, min(width, x + 40), height))
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class StubState:
+    """Contadores por ruta y fallos pendientes (compartidos entre threads del server)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.failures = {}
+        self.jpeg = make_jpeg()
+
+    def count(self, path: str) -> int:
+        with self.lock:
+            return self.requests.get(path, 0)
+
+
+def make_handler(state: StubState):
+    class StubHandler(BaseHTTPRequestHandler):
+        """
+        Rutas (también como proxy: self.path puede ser una URL absoluta):
+            /blob/<nombre>?kb=N       N KB de bytes
+            /flaky/<nombre>?fail=N    503 las primeras N veces, después un JPEG
+            cualquier otra            JPEG de 640x480
+        """
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            path, query = parsed.path, parse_qs(parsed.query)
+            with state.lock:
+                state.requests[path] = state.requests.get(path, 0) + 1
+                if path.startswith('/flaky/'):
+                    remaining = state.failures.setdefault(path, int(query.get('fail', ['0'])[0]))
+                    if remaining > 0:
+                        state.failures[path] = remaining - 1
+                        self._send(503, b'unavailable', 'text/plain')
+                        return
+
+            if path.startswith('/blob/'):
+                kb = int(query.get('kb', [str(BLOB_KB)])[0])
+                self._send(200, path.encode('utf-8').ljust(kb * 1024, b'.'), 'application/octet-stream')
+            else:
+                self._send(200, state.jpeg, 'image/jpeg')
+
+        def _send(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, ok: bool, message: str):
+        print(f"   {'✅' if ok else '❌'} {message}")
+        if not ok:
+            self.failures += 1
+
+
+def new_cache(module, cache_dir: str, base_url: str, **kwargs):
+    """ImageCache con parámetros explícitos (ignora system_config) y el stub como proxy"""
+    cache = module.ImageCache(cache_dir=cache_dir, enabled=True, **kwargs)
+    cache.session.trust_env = False  # Sin proxies del entorno: todo va al stub
+    cache.session.proxies = {'http': base_url}
+    return cache
+
+
+def check_hit_miss(c, module, state, cache_dir, base_url):
+    print("\n1️⃣  Hit / miss")
+    cache = new_cache(module, cache_dir, base_url, max_size_mb=64, thumbnails=False)
+    url = f"{base_url}/plain/product.jpg"
+
+    first = cache.get_bytes(url)
+    second = cache.get_bytes(url)
+    c.check(first == second == state.jpeg, "mismos bytes en miss y en hit")
+    c.check((cache.misses, cache.hits) == (1, 1), f"1 miss + 1 hit (misses={cache.misses}, hits={cache.hits})")
+    c.check(state.count('/plain/product.jpg') == 1, f"1 request al servidor ({state.count('/plain/product.jpg')})")
+
+
+def check_key_by_transform(c, module, state, cache_dir, base_url):
+    print("\n2️⃣  Clave por public_id + transformación")
+    cache = new_cache(module, cache_dir, base_url, max_size_mb=64, thumbnails=False)
+    url_w200 = f"{CLOUDINARY_BASE}/c_fill,w_200/v1/clients/demo/abc.jpg"
+    url_w200_v2 = f"{CLOUDINARY_BASE}/c_fill,w_200/v2/clients/demo/abc.jpg"
+    url_w400 = f"{CLOUDINARY_BASE}/c_fill,w_400/v1/clients/demo/abc.jpg"
+
+    c.check(cache.cache_key(url_w200) == cache.cache_key(url_w200_v2),
+            "otra versión, misma transformación: misma clave")
+    c.check(cache.cache_key(url_w200) != cache.cache_key(url_w400), "otra transformación: otra clave")
+    c.check(cache.key_for('clients/demo/abc', 'c_fill,w_200') == cache.cache_key(url_w200),
+            "key_for() coincide con la clave de la URL (precarga tras upload)")
+
+    for url in (url_w200, url_w200_v2, url_w400):
+        cache.get_bytes(url)
+    served = sum(count for path, count in state.requests.items() if path.endswith('/clients/demo/abc.jpg'))
+    c.check((cache.misses, cache.hits) == (2, 1), f"2 misses + 1 hit (misses={cache.misses}, hits={cache.hits})")
+    c.check(served == 2, f"2 requests al servidor vía proxy ({served})")
+
+
+def check_lru_eviction(c, module, state, cache_dir, base_url):
+    print("\n3️⃣  Eviction LRU")
+    cache = new_cache(module, cache_dir, base_url, max_size_mb=1, thumbnails=False)
+    urls = [f"{base_url}/blob/{i}?kb={BLOB_KB}" for i in range(4)]
+
+    def cached(url):
+        return cache._path_for(cache.cache_key(url), '.img').exists()
+
+    for url in urls[:3]:
+        cache.get_bytes(url)
+        time.sleep(0.02)  # mtime distinto entre entradas
+    c.check(cache.evictions == 0, f"3 blobs ({3 * BLOB_KB} KB) entran en 1 MB sin desalojar ({cache.evictions})")
+    cache.get_bytes(urls[0])  # hit: blob 0 pasa a ser el más reciente
+    time.sleep(0.02)
+
+    cache.get_bytes(urls[3])  # supera el límite
+    stats = cache.stats()
+    target = int(stats['max_size_bytes'] * 0.9)
+    c.check(cache.evictions == 2, f"al superar el límite se desalojan 2 entradas ({cache.evictions})")
+    c.check(stats['size_bytes'] <= target,
+            f"tamaño {stats['size_bytes'] // 1024} KB <= 90% del límite ({target // 1024} KB)")
+    c.check(stats['size_bytes'] == cache._scan_size(), "el contador coincide con el tamaño en disco")
+    c.check(cached(urls[0]), "blob 0 (leído recientemente) sobrevive")
+    c.check(not cached(urls[1]) and not cached(urls[2]), "blobs 1 y 2 (menos usados) desalojados")
+    c.check(cached(urls[3]), "blob 3 (recién descargado) en cache")
+
+
+def check_retries(c, module, state, cache_dir, base_url):
+    import requests
+
+    print("\n4️⃣  Reintentos ante 5xx")
+    cache = new_cache(module, cache_dir, base_url, max_size_mb=64, thumbnails=False)
+
+    transient = f"{base_url}/flaky/transient.jpg?fail=2"
+    try:
+        data = cache.get_bytes(transient)
+        c.check(data == state.jpeg, "503 x2 y después 200: la descarga termina bien")
+    except requests.RequestException as e:
+        c.check(False, f"503 transitorio no se reintentó: {e}")
+    c.check(state.count('/flaky/transient.jpg') == 3, f"3 requests al servidor ({state.count('/flaky/transient.jpg')})")
+
+    persistent = f"{base_url}/flaky/persistent.jpg?fail=100"
+    try:
+        cache.get_bytes(persistent)
+        c.check(False, "503 persistente debería fallar")
+    except requests.RequestException:
+        c.check(True, "503 persistente: RequestException tras agotar los reintentos")
+    c.check(state.count('/flaky/persistent.jpg') == 4, f"1 intento + 3 reintentos ({state.count('/flaky/persistent.jpg')})")
+    c.check(not cache._path_for(cache.cache_key(persistent), '.img').exists(), "la falla no deja nada en cache")
+
+
+def check_thumbnails(c, module, state, cache_dir, base_url):
+    print("\n5️⃣  Miniaturas pre-decodificadas")
+    cache = new_cache(module, cache_dir, base_url, max_size_mb=64, thumbnails=True)
+    url = f"{base_url}/thumb/product.jpg"
+
+    first = cache.get_thumbnail(url)
+    c.check(min(first.size) == module.THUMBNAIL_SIZE,
+            f"lado corto = {module.THUMBNAIL_SIZE}px ({first.size[0]}x{first.size[1]})")
+    c.check(cache._path_for(cache.cache_key(url), f'.t{module.THUMBNAIL_SIZE}.npy').exists(),
+            "miniatura guardada en disco")
+
+    second = cache.get_thumbnail(url)
+    c.check(cache.thumbnail_hits == 1, f"segunda lectura desde la miniatura ({cache.thumbnail_hits} hit)")
+    c.check(second.size == first.size and second.tobytes() == first.tobytes(), "misma miniatura")
+    c.check(cache.get_bytes(url) == state.jpeg and cache.hits == 1, "el original también quedó cacheado")
+    c.check(state.count('/thumb/product.jpg') == 1, f"1 request al servidor ({state.count('/thumb/product.jpg')})")
+
+
+CHECKS = (check_hit_miss, check_key_by_transform, check_lru_eviction, check_retries, check_thumbnails)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Chequeo de la cache de imágenes contra un stub HTTP local")
+    p.add_argument("--keep", action="store_true", help="No borrar la carpeta temporal de cache")
+    args = p.parse_args()
+
+    logging.disable(logging.WARNING)
+    module = load_image_cache_module()
+
+    state = StubState()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    work_dir = tempfile.mkdtemp(prefix='image-cache-check-')
+    print(f"🌐 Stub HTTP en {base_url}")
+    print(f"📁 Cache en {work_dir}")
+
+    c = Checker()
+    try:
+        for check in CHECKS:
+            check(c, module, state, os.path.join(work_dir, check.__name__), base_url)
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if c.failures:
+        print(f"\n❌ {c.failures} chequeo(s) fallaron")
+        sys.exit(1)
+    print("\n✅ Cache de imágenes OK")
+
+
+if __name__ == "__main__":
+    main()
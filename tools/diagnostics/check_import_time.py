@@ -0,0 +1,171 @@
+"""
+Presupuesto de tiempo de import del arranque
+
+Importa en un proceso aparte (python -X importtime) los módulos que carga
+create_app() y falla (exit 1) si:
+    1. Se importa alguna dependencia pesada (torch, transformers, sentence_transformers,
+       sklearn, googletrans, onnxruntime): deben quedar diferidas hasta el primer uso
+    2. El tiempo acumulado de import supera el presupuesto (--budget-ms)
+    3. Algún módulo que las rutas importan bajo demanda (DEFERRED_MODULES) importa
+       una dependencia pesada al cargarse (ej: una anotación torch.Tensor sin comillas
+       sobre el proxy de lazy_import)
+
+Uso:
+    python tools/diagnostics/check_import_time.py
+    python tools/diagnostics/check_import_time.py --budget-ms 2000 --top 25
+    python tools/diagnostics/check_import_time.py --module app.blueprints.api
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+DEFAULT_BUDGET_MS = 2500
+
+# Módulos que importa register_blueprints() en app.py
+STARTUP_MODULES = (
+    'app.blueprints.main',
+    'app.blueprints.auth',
+    'app.blueprints.dashboard',
+    'app.blueprints.clients',
+    'app.blueprints.users',
+    'app.blueprints.categories',
+    'app.blueprints.products',
+    'app.blueprints.images',
+    'app.blueprints.analytics',
+    'app.blueprints.api',
+    'app.blueprints.metrics',
+    'app.blueprints.embeddings',
+    'app.blueprints.attributes',
+    'app.blueprints.search_config',
+    'app.blueprints.inventory',
+    'app.blueprints.external_inventory',
+    'app.blueprints.system_config_admin',
+)
+
+# Importados dentro de funciones (rutas de productos, búsqueda, jobs): no cuentan para
+# el presupuesto del arranque, pero tampoco deben importar dependencias pesadas
+DEFERRED_MODULES = (
+    'app.services.attribute_autofill_service',
+    'app.services.query_enrichment_service',
+    'app.services.catalog_import_service',
+    'app.core.category_index',
+    'app.core.color_detection',
+    'app.core.embedding_recipe',
+)
+
+# import time:       self [us] |  cumulative | imported package
+LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def run_importtime(modules):
+    """Importa los módulos con -X importtime; devuelve (returncode, stderr)"""
+    code = 'import sys; sys.path.insert(0, %r)\n' % APP_DIR
+    code += ''.join(f'import {name}\n' for name in modules)
+    env = dict(os.environ)
+    env.setdefault('APP_MODE', 'admin')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    return proc.returncode, proc.stderr
+
+
+def parse_importtime(stderr):
+    """
+    Parsea la salida de -X importtime
+
+    Returns:
+        Lista de (modulo, self_us, cumulative_us, profundidad)
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def load_heavy_modules():
+    """HEAVY_MODULES de app/utils/lazy_imports.py sin importar el paquete app (ni Flask)"""
+    path = os.path.join(APP_DIR, 'app', 'utils', 'lazy_imports.py')
+    spec = importlib.util.spec_from_file_location('lazy_imports', path)
+    module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(module)
+    return module.HEAVY_MODULES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de import del arranque")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"Tiempo máximo de import acumulado (default {DEFAULT_BUDGET_MS} ms)")
+    parser.add_argument('--module', action='append',
+                        help="Módulo a medir (repetible; default: blueprints de create_app)")
+    parser.add_argument('--top', type=int, default=15, help="Cantidad de módulos más lentos a mostrar")
+    args = parser.parse_args()
+
+    heavy_modules = load_heavy_modules()
+
+    modules = args.module or list(STARTUP_MODULES)
+    print(f"⏱️ Midiendo import de {len(modules)} módulos (python -X importtime)...")
+    returncode, stderr = run_importtime(modules)
+    entries = parse_importtime(stderr)
+
+    if returncode != 0:
+        errors = [line for line in stderr.splitlines() if not line.startswith('import time:')]
+        print("❌ El import falló:")
+        print('\n'.join(errors[-20:]))
+        return 1
+
+    total_ms = sum(cumulative for _, _, cumulative, depth in entries if depth == 0) / 1000.0
+    heavy = sorted({name for name, _, _, _ in entries if name.split('.')[0] in heavy_modules})
+
+    print(f"\n🐢 Top {args.top} por tiempo acumulado:")
+    for name, _, cumulative, depth in sorted(entries, key=lambda e: e[2], reverse=True)[:args.top]:
+        print(f"   {cumulative / 1000.0:8.1f} ms  {'  ' * depth}{name}")
+
+    print(f"\n📊 Total: {total_ms:.1f} ms (presupuesto {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if heavy:
+        failed = True
+        roots = sorted({name.split('.')[0] for name in heavy})
+        print(f"❌ Dependencias pesadas importadas al arrancar: {', '.join(roots)}")
+        print("   Importarlas dentro de la función que las usa o con app.utils.lazy_imports.lazy_import")
+    if total_ms > args.budget_ms:
+        failed = True
+        print(f"❌ Import por encima del presupuesto ({total_ms:.1f} ms > {args.budget_ms:.0f} ms)")
+
+    if not args.module:
+        returncode, stderr = run_importtime(list(DEFERRED_MODULES))
+        deferred_heavy = sorted({name.split('.')[0] for name, _, _, _ in parse_importtime(stderr)
+                                 if name.split('.')[0] in heavy_modules})
+        if returncode != 0:
+            failed = True
+            errors = [line for line in stderr.splitlines() if not line.startswith('import time:')]
+            print("❌ El import de los módulos diferidos falló:")
+            print('\n'.join(errors[-20:]))
+        elif deferred_heavy:
+            failed = True
+            print(f"❌ Módulos diferidos importan dependencias pesadas al cargarse: {', '.join(deferred_heavy)}")
+            print("   Revisar anotaciones y defaults que accedan al proxy de lazy_import (usar \"torch.Tensor\")")
+        else:
+            print(f"✅ {len(DEFERRED_MODULES)} módulos diferidos sin dependencias pesadas al importarse")
+
+    if not failed:
+        print("✅ Arranque dentro del presupuesto y sin dependencias pesadas")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
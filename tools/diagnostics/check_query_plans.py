@@ -0,0 +1,248 @@
+"""
+Chequeo de regresiones en planes de queries calientes (EXPLAIN FORMAT JSON)
+
+Ejecuta EXPLAIN sobre las queries que emiten visual_search, text_search,
+require_api_key, bulk_check_stock, serve_image y los dashboards, y falla
+(exit 1) si alguna hace Seq Scan sobre más de --max-seq-rows filas estimadas.
+
+Pensado para correr contra una Postgres LOCAL sembrada antes de desplegar:
+
+Uso:
+    # Sembrar un cliente sintético con 20k imágenes, chequear y limpiar
+    python tools/diagnostics/check_query_plans.py --seed 20000 --cleanup
+
+    # Chequear contra un cliente existente
+    python tools/diagnostics/check_query_plans.py --client-id <client_id>
+
+    # Ver el plan completo de cada query
+    python tools/diagnostics/check_query_plans.py --client-id <client_id> --verbose
+"""
+import os
+import sys
+import json
+import uuid
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+SEED_SLUG = 'plan-check-seed'
+DEFAULT_MAX_SEQ_ROWS = 1000
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+# ----------------------------------------------------------------------
+# Datos sintéticos
+# ----------------------------------------------------------------------
+
+def seed(db, images_count):
+    """Crea un cliente sintético con categorías, productos, imágenes y búsquedas (SQL set-based)"""
+    from sqlalchemy import text
+
+    client_id = str(uuid.uuid4())
+    products_count = max(1, images_count // 2)
+    print(f"🌱 Sembrando cliente {client_id}: {products_count} productos, {images_count} imágenes")
+
+    statements = [
+        ("""INSERT INTO clients (id, name, slug, email, api_key, is_active, created_at, updated_at)
+            VALUES (:client_id, 'Plan Check', :slug, :email, :api_key, TRUE, NOW(), NOW())""", {}),
+        ("""INSERT INTO categories (id, client_id, slug, name, name_en, is_active, created_at, updated_at)
+            SELECT :client_id || '-c' || g, :client_id, 'cat-' || g, 'Categoría ' || g, 'category ' || g, TRUE, NOW(), NOW()
+            FROM generate_series(1, 20) g""", {}),
+        ("""INSERT INTO products (id, client_id, category_id, name, sku, price, stock, is_active, attributes, created_at, updated_at)
+            SELECT :client_id || '-p' || g, :client_id, :client_id || '-c' || (1 + g % 20), 'Producto ' || g,
+                   'SKU-' || g, 100 + g % 900, g % 50, TRUE,
+                   json_build_object('color', (ARRAY['NEGRO','BLANCO','AZUL','ROJO'])[1 + g % 4]),
+                   NOW(), NOW()
+            FROM generate_series(1, :products) g""", {'products': products_count}),
+        ("""INSERT INTO images (id, client_id, product_id, filename, cloudinary_url, is_primary, is_processed,
+                               clip_embedding, upload_status, display_order, created_at, updated_at)
+            SELECT :client_id || '-i' || g, :client_id, :client_id || '-p' || (1 + g % :products),
+                   'seed_' || g || '.jpg', 'https://res.cloudinary.com/demo/image/upload/seed_' || g || '.jpg',
+                   g <= :products, g % 10 <> 0,
+                   CASE WHEN g % 10 <> 0 THEN '[0.1, 0.2, 0.3]' END,
+                   'completed', 0, NOW(), NOW()
+            FROM generate_series(1, :images) g""", {'products': products_count, 'images': images_count}),
+        ("""INSERT INTO search_logs (id, client_id, query_type, results_count, response_time, created_at)
+            SELECT :client_id || '-s' || g, :client_id, 'image', 10, 0.5, NOW() - (g % 90) * INTERVAL '1 day'
+            FROM generate_series(1, :images) g""", {'images': images_count}),
+    ]
+
+    base = {
+        'client_id': client_id,
+        'slug': f"{SEED_SLUG}-{client_id[:8]}",
+        'email': f"{client_id[:8]}@plan-check.local",
+        'api_key': f"clip_seed{client_id.replace('-', '')[:16]}",
+    }
+    for sql, params in statements:
+        db.session.execute(text(sql), dict(base, **params))
+    db.session.commit()
+
+    for table in ('clients', 'categories', 'products', 'images', 'search_logs'):
+        db.session.execute(text(f"ANALYZE {table}"))
+    db.session.commit()
+    return client_id
+
+
+def cleanup(db, client_id):
+    from sqlalchemy import text
+
+    for table in ('search_logs', 'images', 'products', 'categories'):
+        db.session.execute(text(f"DELETE FROM {table} WHERE client_id = :client_id"), {'client_id': client_id})
+    db.session.execute(text("DELETE FROM clients WHERE id = :client_id"), {'client_id': client_id})
+    db.session.commit()
+    print(f"🧹 Cliente sintético {client_id} eliminado")
+
+
+# ----------------------------------------------------------------------
+# Queries calientes (mismas formas que emite la app)
+# ----------------------------------------------------------------------
+
+def hot_queries(db, client_id):
+    """
+    Lista de (nombre, statement) con las queries calientes parametrizadas para un cliente
+
+    Las queries ORM se construyen con los mismos modelos/filtros que el código de la app;
+    las SQL crudas son copia de las que ejecuta api.py.
+    """
+    from sqlalchemy import select, func, text
+    from app.blueprints import api
+    from app.models.category import Category
+    from app.models.client import Client
+    from app.models.image import Image
+    from app.models.product import Product
+    from app.models.search_log import SearchLog
+
+    client = db.session.get(Client, client_id)
+    category_id = db.session.query(Category.id).filter(Category.client_id == client_id).limit(1).scalar()
+    sample = db.session.query(Product.id, Product.sku).filter(Product.client_id == client_id).limit(1).first()
+    product_id, sku = sample if sample else ('missing', 'missing')
+    filename = db.session.query(Image.filename).filter(Image.client_id == client_id).limit(1).scalar() or 'missing.jpg'
+
+    return [
+        # require_api_key / verify_api_key
+        ("require_api_key", select(Client).where(Client.api_key == client.api_key, Client.is_active == True).limit(1)),
+
+        # serve_image
+        ("serve_image", select(Image).where(Image.filename == filename).limit(1)),
+
+        # visual_search
+        ("visual_search.scan", api._search_rows_query(client_id).statement),
+        ("visual_search.scan_category", api._search_rows_query(client_id, category_id=category_id).statement),
+        ("visual_search.category_names", select(Category.id, Category.name).where(Category.client_id == client_id)),
+        ("visual_search.primary_image", select(Image).where(Image.product_id == product_id, Image.is_primary == True).limit(1)),
+        ("visual_search.category_colors", text(
+            """
+            SELECT DISTINCT UPPER(TRIM(attributes->>'color')) AS color
+            FROM products
+            WHERE client_id = :client_id AND category_id = :category_id
+              AND attributes::jsonb ? 'color'
+            """
+        ).bindparams(client_id=client_id, category_id=category_id)),
+
+        # text_search (productos + imagen primaria con embedding)
+        ("text_search.products", select(
+            Product.id, Product.name, Product.sku, Product.price, Product.attributes, Product.tags,
+            Category.name, Image.clip_embedding, Image.cloudinary_url
+        ).join(Category, Product.category_id == Category.id)
+         .join(Image, (Product.id == Image.product_id) & (Image.is_primary == True))
+         .where(Product.client_id == client_id, Image.clip_embedding.isnot(None))),
+
+        # bulk_check_stock
+        ("bulk_check_stock.by_id", select(Product).where(Product.client_id == client_id, Product.id == product_id).limit(1)),
+        ("bulk_check_stock.by_sku", select(Product).where(Product.client_id == client_id, Product.sku == sku).limit(1)),
+
+        # Dashboards
+        ("dashboard.images_processed", select(func.count(Image.id)).where(Image.client_id == client_id, Image.is_processed == True)),
+        ("dashboard.products", select(func.count(Product.id)).where(Product.client_id == client_id)),
+        ("analytics.searches_by_day", select(func.date(SearchLog.created_at), func.count(SearchLog.id))
+         .where(SearchLog.client_id == client_id, SearchLog.created_at >= func.now() - text("INTERVAL '30 days'"))
+         .group_by(func.date(SearchLog.created_at))),
+    ]
+
+
+# ----------------------------------------------------------------------
+# EXPLAIN
+# ----------------------------------------------------------------------
+
+def explain(db, statement):
+    """Plan JSON (raíz) de un statement SQLAlchemy"""
+    from sqlalchemy import text
+    from sqlalchemy.dialects import postgresql
+
+    compiled = statement.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+    row = db.session.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    plan = json.loads(row) if isinstance(row, str) else row
+    return plan[0]['Plan']
+
+
+def iter_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from iter_nodes(child)
+
+
+def check_plan(plan, max_seq_rows):
+    """Seq Scans con más filas estimadas que el umbral"""
+    return [
+        f"Seq Scan en {node.get('Relation Name')} (~{int(node.get('Plan Rows', 0))} filas)"
+        for node in iter_nodes(plan)
+        if node.get('Node Type') == 'Seq Scan' and node.get('Plan Rows', 0) > max_seq_rows
+    ]
+
+
+def main():
+    p = argparse.ArgumentParser(description="Chequeo de planes de queries calientes")
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--client-id", help="Cliente existente contra el cual armar las queries")
+    group.add_argument("--seed", type=int, metavar="IMAGES", help="Sembrar un cliente sintético con N imágenes")
+    p.add_argument("--cleanup", action="store_true", help="Borrar el cliente sintético al terminar")
+    p.add_argument("--max-seq-rows", type=int, default=DEFAULT_MAX_SEQ_ROWS,
+                   help=f"Filas estimadas máximas para un Seq Scan (default {DEFAULT_MAX_SEQ_ROWS})")
+    p.add_argument("--verbose", action="store_true", help="Imprimir el plan completo de cada query")
+    args = p.parse_args()
+
+    app = load_flask_app()
+    with app.app_context():
+        from app import db
+
+        client_id = args.client_id or seed(db, args.seed)
+        failures = {}
+        try:
+            for name, statement in hot_queries(db, client_id):
+                plan = explain(db, statement)
+                problems = check_plan(plan, args.max_seq_rows)
+                status = "❌" if problems else "✅"
+                print(f"{status} {name}: {plan['Node Type']} (costo {plan.get('Total Cost')})")
+                for problem in problems:
+                    print(f"      - {problem}")
+                if args.verbose:
+                    print(json.dumps(plan, indent=2))
+                if problems:
+                    failures[name] = problems
+        finally:
+            db.session.rollback()
+            if args.seed and args.cleanup:
+                cleanup(db, client_id)
+
+    if failures:
+        print(f"\n❌ {len(failures)} query(s) con Seq Scan sobre más de {args.max_seq_rows} filas")
+        sys.exit(1)
+    print("\n✅ Sin Seq Scans grandes en las queries calientes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Lint de la proyección de búsqueda visual
+
+Falla (exit 1) si las queries de búsqueda vuelven a materializar filas completas
+o seleccionan columnas pesadas (base64_data, error_message, description, ...).
+
+Chequeos:
+    1. Estático (sin dependencias): las funciones de búsqueda de app/blueprints/api.py
+       no usan Image.query / Product.query ni nombran columnas prohibidas
+    2. Runtime (carga la app): la query compilada de _search_rows_query solo selecciona
+       columnas permitidas y las columnas pesadas están mapeadas como diferidas
+
+Uso:
+    python tools/diagnostics/check_search_projection.py
+    python tools/diagnostics/check_search_projection.py --static-only
+"""
+import os
+import ast
+import sys
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+API_PY = os.path.join(APP_DIR, 'app', 'blueprints', 'api.py')
+sys.path.insert(0, APP_DIR)
+
+# Funciones del camino caliente de búsqueda
+SEARCH_FUNCTIONS = ('_search_rows_query', '_find_similar_products', '_find_similar_products_in_category')
+
+# Entidades que no se deben cargar completas dentro de esas funciones
+FULL_ENTITY_QUERIES = ('Image.query', 'Product.query')
+
+FORBIDDEN_NAMES = ('base64_data', 'error_message', 'cloudinary_url', 'description', 'attributes')
+
+# Columnas que deben estar diferidas en el mapper
+DEFERRED_COLUMNS = (('Image', 'base64_data'), ('Image', 'error_message'), ('Product', 'description'))
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def check_static():
+    """Recorre el AST de api.py; devuelve lista de errores"""
+    with open(API_PY, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=API_PY)
+
+    errors = []
+    found = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.FunctionDef) or node.name not in SEARCH_FUNCTIONS:
+            continue
+        found.add(node.name)
+        for child in ast.walk(node):
+            if isinstance(child, ast.Attribute):
+                dotted = f"{child.value.id}.{child.attr}" if isinstance(child.value, ast.Name) else None
+                if dotted in FULL_ENTITY_QUERIES:
+                    errors.append(f"{node.name} (línea {child.lineno}): usa {dotted} (carga filas completas)")
+                elif child.attr in FORBIDDEN_NAMES:
+                    errors.append(f"{node.name} (línea {child.lineno}): referencia columna pesada '{child.attr}'")
+
+    for name in SEARCH_FUNCTIONS:
+        if name not in found:
+            errors.append(f"No se encontró la función {name} en api.py")
+    return errors
+
+
+def check_runtime():
+    """Compila la query de búsqueda y revisa columnas seleccionadas y diferidas"""
+    from sqlalchemy import inspect
+
+    app = load_flask_app()
+    errors = []
+    with app.app_context():
+        from app.blueprints import api
+        from app.models.image import Image
+        from app.models.product import Product
+
+        models = {'Image': Image, 'Product': Product}
+        for model_name, column in DEFERRED_COLUMNS:
+            prop = inspect(models[model_name]).attrs[column]
+            if not prop.deferred:
+                errors.append(f"{model_name}.{column} no está diferida")
+
+        forbidden = {(c.table.name, c.name) for c in (attr.property.columns[0] for attr in api.SEARCH_FORBIDDEN_COLUMNS)}
+        for category_id in (None, 'category'):
+            statement = api._search_rows_query('client', category_id=category_id).statement
+            for column in statement.selected_columns:
+                table = getattr(getattr(column, 'table', None), 'name', None)
+                if (table, column.name) in forbidden:
+                    errors.append(f"_search_rows_query selecciona {table}.{column.name}")
+            print(f"   SELECT {', '.join(c.name for c in statement.selected_columns)}")
+    return errors
+
+
+def main():
+    p = argparse.ArgumentParser(description="Lint de proyección de búsqueda visual")
+    p.add_argument("--static-only", action="store_true", help="Solo chequeo AST (no carga la app)")
+    args = p.parse_args()
+
+    print("🔍 Chequeo estático de funciones de búsqueda...")
+    errors = check_static()
+
+    if not args.static_only:
+        print("🔍 Chequeo de query compilada y columnas diferidas...")
+        errors += check_runtime()
+
+    if errors:
+        print(f"\n❌ {len(errors)} problema(s):")
+        for error in errors:
+            print(f"   - {error}")
+        sys.exit(1)
+
+    print("\n✅ La búsqueda usa solo la proyección liviana")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Comparación de la detección de color: estadística de píxeles vs CLIP
+
+Sobre imágenes reales del cliente con color cargado (attributes->>'color')
+corre los dos niveles de app/core/color_detection.py por separado y mide:
+    1. Precisión de cada nivel contra el color del producto (mismo canónico = acierto)
+    2. Coincidencia entre niveles
+    3. Latencia por imagen y cuántas imágenes el nivel pixel deja para CLIP (ambiguas)
+
+Sirve para ajustar color_detection.ambiguity_margin / min_coverage en
+system_config.json antes de cambiar el engine.
+
+Uso:
+    python tools/diagnostics/compare_color_detection.py --client-id <uuid>
+    python tools/diagnostics/compare_color_detection.py --client-id <uuid> --max-images 200 --pixel-only
+"""
+import os
+import sys
+import time
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def load_samples(client_id, max_images: int) -> list:
+    """(bytes de la imagen primaria, color del producto) de productos con color cargado"""
+    import requests
+    from app.models.image import Image
+    from app.models.product import Product
+
+    rows = (
+        Image.query.join(Product, Image.product_id == Product.id)
+        .filter(Image.client_id == client_id, Image.is_primary.is_(True))
+        .filter(Product.attributes['color'].as_string() != '')
+        .limit(max_images)
+        .all()
+    )
+    samples = []
+    for image in rows:
+        color = (image.product.attributes or {}).get('color')
+        url = image.display_url
+        if not color or not url:
+            continue
+        try:
+            response = requests.get(url, timeout=15)
+            response.raise_for_status()
+            samples.append((response.content, str(color).strip().upper()))
+        except Exception as e:
+            print(f"   ⚠️ No se pudo descargar {url}: {e}")
+    return samples
+
+
+def main():
+    p = argparse.ArgumentParser(description="Precisión y latencia de la detección de color por nivel")
+    p.add_argument("--client-id", required=True, help="Cliente a evaluar")
+    p.add_argument("--max-images", type=int, default=100, help="Imágenes a evaluar (default: 100)")
+    p.add_argument("--pixel-only", action="store_true", help="No correr CLIP (solo latencia/ambigüedad del nivel 1)")
+    args = p.parse_args()
+
+    app = load_flask_app()
+    with app.app_context():
+        from app.core.color_detection import (
+            get_client_palette, pixel_color_scores, clip_color_scores,
+            DEFAULT_AMBIGUITY_MARGIN, DEFAULT_MIN_COVERAGE, _get_config
+        )
+        from app.utils.colors import normalize_color
+
+        palette = get_client_palette(args.client_id)
+        print(f"🎨 Paleta: {len(palette)} colores, {len(palette.canonical)} canónicos, "
+              f"{len(palette.unmapped)} sin prototipo {palette.unmapped[:10]}")
+        if not palette.canonical:
+            print("❌ Ningún color de la paleta tiene prototipo: todo iría a CLIP")
+            sys.exit(1)
+
+        samples = load_samples(args.client_id, args.max_images)
+        print(f"🖼️ {len(samples)} imágenes descargadas\n")
+        if not samples:
+            sys.exit(1)
+
+        config = _get_config()
+        margin = float(config.get('ambiguity_margin', DEFAULT_AMBIGUITY_MARGIN))
+        min_coverage = float(config.get('min_coverage', DEFAULT_MIN_COVERAGE))
+
+        stats = {'pixel_ok': 0, 'clip_ok': 0, 'agree': 0, 'ambiguous': 0, 'pixel_ms': [], 'clip_ms': []}
+        for image_data, expected in samples:
+            expected_canonical = normalize_color(expected, use_llm=False)
+
+            started = time.perf_counter()
+            scores = pixel_color_scores(image_data, palette.canonical.keys())
+            stats['pixel_ms'].append((time.perf_counter() - started) * 1000)
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            total = sum(score for _, score in ranked) or 1.0
+            pixel_color = ranked[0][0]
+            second = ranked[1][1] / total if len(ranked) > 1 else 0.0
+            if ranked[0][1] / total - second < margin or ranked[0][1] < min_coverage:
+                stats['ambiguous'] += 1
+            stats['pixel_ok'] += int(pixel_color == expected_canonical)
+
+            if args.pixel_only:
+                continue
+            started = time.perf_counter()
+            similarities = clip_color_scores(image_data, palette.colors)
+            stats['clip_ms'].append((time.perf_counter() - started) * 1000)
+            clip_color = normalize_color(max(similarities.items(), key=lambda item: item[1])[0], use_llm=False)
+            stats['clip_ok'] += int(clip_color == expected_canonical)
+            stats['agree'] += int(clip_color == pixel_color)
+
+        n = len(samples)
+
+        def median(values):
+            return sorted(values)[len(values) // 2] if values else 0.0
+
+        print("📊 RESULTADOS")
+        print(f"   Nivel pixel: precisión {stats['pixel_ok'] / n:.1%}, mediana {median(stats['pixel_ms']):.1f} ms, "
+              f"ambiguas {stats['ambiguous'] / n:.1%} (irían a CLIP)")
+        if not args.pixel_only:
+            print(f"   Nivel clip:  precisión {stats['clip_ok'] / n:.1%}, mediana {median(stats['clip_ms']):.1f} ms")
+            print(f"   Coincidencia pixel/clip: {stats['agree'] / n:.1%}")
+
+
+if __name__ == "__main__":
+    main()
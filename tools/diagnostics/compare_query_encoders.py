@@ -0,0 +1,206 @@
+"""
+Comparación de encoders de normalización de queries (MiniLM vs texto de CLIP)
+
+Sobre el vocabulario real de cada cliente (colores, tipos y contextos de la BD)
+arma queries sintéticas etiquetadas ("gorra roja", "delantal negro casual", ...)
+y corre normalize_query con cada encoder para medir:
+    1. Precisión de color y tipo contra la etiqueta esperada
+    2. Coincidencia entre encoders (color, tipo, contexto)
+    3. Latencia por query y RSS agregado al cargar cada modelo
+
+Antes de cambiar search.query_encoder a 'clip' en producción, la precisión
+de CLIP debería quedar a la par de MiniLM. Si no, ajustar
+search.query_encoder_thresholds.clip en system_config.json.
+
+Uso:
+    python tools/diagnostics/compare_query_encoders.py
+    python tools/diagnostics/compare_query_encoders.py --client-id <uuid> --max-queries 300
+    python tools/diagnostics/compare_query_encoders.py --queries queries.txt
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def rss_mb() -> float:
+    """RSS actual del proceso en MB (Linux: /proc; resto: pico de ru_maxrss)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1024.0 * 1024.0) if sys.platform == 'darwin' else usage / 1024.0
+
+
+def build_labeled_queries(vocabulary: dict, max_queries: int, seed: int = 42) -> list:
+    """
+    Queries sintéticas con etiqueta esperada
+
+    Returns:
+        Lista de (query, tipo_esperado, color_esperado)
+    """
+    rng = random.Random(seed)
+    tipos = sorted(vocabulary.get('tipos') or [])
+    colores = sorted(vocabulary.get('colores') or [])
+    contextos = sorted(vocabulary.get('contextos') or [])
+
+    queries = [(tipo, tipo, None) for tipo in tipos]
+    queries += [(f"{tipo} {color}", tipo, color) for tipo in tipos for color in colores]
+    if contextos:
+        queries += [(f"{tipo} {color} {rng.choice(contextos)}", tipo, color)
+                    for tipo in tipos for color in colores]
+
+    rng.shuffle(queries)
+    return queries[:max_queries]
+
+
+def load_queries_file(path: str) -> list:
+    """Una query por línea; opcionalmente 'query|tipo|color' para etiquetarla"""
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [p.strip() or None for p in line.split('|')] + [None, None]
+            queries.append((parts[0], parts[1], parts[2]))
+    return queries
+
+
+def run_encoder(encoder: str, queries: list, vocabulary: dict):
+    """Corre normalize_query con un encoder; devuelve (resultados, latencias_ms, rss_agregado_mb)"""
+    from app.utils.llm_query_normalizer import normalize_query, get_model
+
+    rss_before = rss_mb()
+    get_model(encoder)
+    rss_delta = rss_mb() - rss_before
+
+    # Warm-up: precalcula las matrices de vocabulario
+    normalize_query(queries[0][0], encoder=encoder, vocabulary=vocabulary)
+
+    results, latencies = [], []
+    for query, _, _ in queries:
+        started = time.perf_counter()
+        results.append(normalize_query(query, encoder=encoder, vocabulary=vocabulary))
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    return results, latencies, rss_delta
+
+
+def accuracy(results: list, queries: list, field: str, index: int):
+    labeled = [(r, q) for r, q in zip(results, queries) if q[index] is not None]
+    if not labeled:
+        return None
+    hits = sum(1 for r, q in labeled if (r.get(field) or '').lower() == q[index].lower())
+    return hits / len(labeled)
+
+
+def agreement(results_a: list, results_b: list, field: str) -> float:
+    if not results_a:
+        return 0.0
+    same = 0
+    for a, b in zip(results_a, results_b):
+        value_a, value_b = a.get(field), b.get(field)
+        if isinstance(value_a, list):
+            value_a, value_b = set(value_a), set(value_b or [])
+        same += value_a == value_b
+    return same / len(results_a)
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] if ordered else 0.0
+
+
+def compare_client(client, queries_file: str, max_queries: int, show_diffs: int) -> dict:
+    from app.utils.llm_query_normalizer import QUERY_ENCODERS, _extract_client_vocabulary
+
+    vocabulary = _extract_client_vocabulary(client.id)
+    print(f"\n🏷️ Cliente {client.name} ({client.id}): {len(vocabulary['colores'])} colores, "
+          f"{len(vocabulary['tipos'])} tipos, {len(vocabulary['contextos'])} contextos")
+
+    queries = load_queries_file(queries_file) if queries_file else build_labeled_queries(vocabulary, max_queries)
+    if not queries:
+        print("   ⚠️ Sin vocabulario ni queries para comparar")
+        return {}
+
+    runs = {}
+    for encoder in QUERY_ENCODERS:
+        results, latencies, rss_delta = run_encoder(encoder, queries, vocabulary)
+        runs[encoder] = results
+        tipo_acc = accuracy(results, queries, 'tipo', 1)
+        color_acc = accuracy(results, queries, 'color', 2)
+        print(f"   {encoder:<7} tipo={_fmt_pct(tipo_acc)} color={_fmt_pct(color_acc)} "
+              f"p50={percentile(latencies, 0.5):.1f}ms p95={percentile(latencies, 0.95):.1f}ms "
+              f"RSS +{rss_delta:.0f} MB")
+
+    baseline, candidate = runs[QUERY_ENCODERS[0]], runs[QUERY_ENCODERS[1]]
+    print(f"   🔁 Coincidencia {QUERY_ENCODERS[0]} vs {QUERY_ENCODERS[1]}: "
+          f"tipo={agreement(baseline, candidate, 'tipo'):.0%} "
+          f"color={agreement(baseline, candidate, 'color'):.0%} "
+          f"contexto={agreement(baseline, candidate, 'contexto'):.0%}")
+
+    diffs = [(q[0], a, b) for q, a, b in zip(queries, baseline, candidate)
+             if (a['tipo'], a['color']) != (b['tipo'], b['color'])]
+    for query, a, b in diffs[:show_diffs]:
+        print(f"      '{query}': {a['tipo']}/{a['color']} vs {b['tipo']}/{b['color']}")
+
+    return {encoder: (accuracy(results, queries, 'tipo', 1), accuracy(results, queries, 'color', 2))
+            for encoder, results in runs.items()}
+
+
+def _fmt_pct(value) -> str:
+    return '  n/a' if value is None else f"{value:5.1%}"
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compara MiniLM vs texto de CLIP en normalize_query")
+    p.add_argument("--client-id", help="Cliente a evaluar (default: todos los activos)")
+    p.add_argument("--queries", help="Archivo con una query por línea (opcional 'query|tipo|color')")
+    p.add_argument("--max-queries", type=int, default=200, help="Máximo de queries sintéticas por cliente")
+    p.add_argument("--show-diffs", type=int, default=10, help="Cantidad de diferencias a mostrar por cliente")
+    args = p.parse_args()
+
+    app = load_flask_app()
+    with app.app_context():
+        from app.models.client import Client
+
+        if args.client_id:
+            clients = Client.query.filter_by(id=args.client_id).all()
+        else:
+            clients = Client.query.filter_by(is_active=True).all()
+        if not clients:
+            print("❌ No hay clientes para evaluar")
+            sys.exit(1)
+
+        print(f"📊 Comparando encoders de queries en {len(clients)} cliente(s)")
+        for client in clients:
+            compare_client(client, args.queries, args.max_queries, args.show_diffs)
+
+    print("\n✅ Comparación terminada")
+
+
+if __name__ == "__main__":
+    main()
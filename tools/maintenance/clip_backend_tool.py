@@ -0,0 +1,363 @@
+"""
+Herramienta de backends de inferencia CLIP
+
+Comandos:
+    export  Exporta las torres de visión y texto a ONNX (opcionalmente cuantizadas int8)
+    check   Compara embeddings y overlap top-k de un backend contra fp32 en el catálogo de un cliente
+
+Requiere el extra ONNX (no está en requirements.txt):
+    pip install -r requirements-onnx.txt
+
+Uso:
+    # Exportar ONNX fp32
+    python tools/maintenance/clip_backend_tool.py export
+
+    # Exportar ONNX int8 dinámico
+    python tools/maintenance/clip_backend_tool.py export --int8
+
+    # Exportar ONNX int8 estático calibrado con imágenes del catálogo de un cliente
+    python tools/maintenance/clip_backend_tool.py export --int8 --calibrate-client <client_id> --calibration-images 64
+
+    # Validar precisión de un backend contra fp32
+    python tools/maintenance/clip_backend_tool.py check --client-id <client_id> --backend onnx --sample 200 --top-k 10
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+from datetime import datetime
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def resolve_model_id(model_arg):
+    """Resuelve el id HuggingFace a partir del argumento o de system_config"""
+    from app.blueprints.embeddings import CLIP_MODEL_MAP
+    from app.utils.system_config import system_config
+
+    model_name = model_arg or system_config.get_section('clip').get('model_name', 'ViT-B/16')
+    if '/' in model_name and model_name not in CLIP_MODEL_MAP:
+        return model_name
+    return CLIP_MODEL_MAP.get(model_name, CLIP_MODEL_MAP['ViT-B/16'])
+
+
+def fetch_client_images(client_id, limit):
+    """Imágenes procesadas del cliente (con URL de Cloudinary) para calibración/validación"""
+    from app.models.image import Image
+
+    query = Image.query.filter(
+        Image.client_id == client_id,
+        Image.cloudinary_url.isnot(None)
+    ).order_by(Image.created_at.desc())
+    return query.limit(limit).all()
+
+
+def load_pil_images(images):
+    """Descarga las imágenes; devuelve lista de (image_id, PIL.Image) descartando fallos"""
+    from app.blueprints.embeddings import load_image_from_source
+
+    loaded = []
+    for img in images:
+        try:
+            loaded.append((img.id, load_image_from_source(img.cloudinary_url)))
+        except Exception as e:
+            print(f"⚠️ Imagen {img.id} omitida: {e}")
+    return loaded
+
+
+# ---------------------------------------------------------------------------
+# EXPORT
+# ---------------------------------------------------------------------------
+
+def cmd_export(args):
+    missing = [name for name in ('onnx', 'onnxruntime') if importlib.util.find_spec(name) is None]
+    if missing:
+        print(f"❌ Falta {', '.join(missing)}: pip install -r requirements-onnx.txt")
+        sys.exit(1)
+
+    import torch
+    from transformers import CLIPModel, CLIPProcessor
+    from app.core.clip_backends import get_onnx_dir, ONNX_MANIFEST_NAME
+
+    model_id = resolve_model_id(args.model)
+    out_dir = get_onnx_dir(model_id, args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    print(f"📦 Exportando {model_id} -> {out_dir}")
+
+    model = CLIPModel.from_pretrained(model_id).eval()
+    processor = CLIPProcessor.from_pretrained(model_id)
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, pixel_values):
+            return self.clip.get_image_features(pixel_values=pixel_values)
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, input_ids, attention_mask):
+            return self.clip.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    size = processor.image_processor.crop_size
+    height, width = (size['height'], size['width']) if isinstance(size, dict) else (size, size)
+    dummy_pixels = torch.zeros(1, 3, height, width)
+    dummy_text = processor(text=["a photo of a product"], return_tensors="pt", padding=True)
+
+    vision_path = out_dir / 'vision.onnx'
+    text_path = out_dir / 'text.onnx'
+
+    with torch.no_grad():
+        torch.onnx.export(
+            VisionTower(model), (dummy_pixels,), str(vision_path),
+            input_names=['pixel_values'], output_names=['image_embeds'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+            opset_version=args.opset, do_constant_folding=True
+        )
+        print(f"✅ Torre de visión exportada: {vision_path}")
+
+        torch.onnx.export(
+            TextTower(model), (dummy_text['input_ids'], dummy_text['attention_mask']), str(text_path),
+            input_names=['input_ids', 'attention_mask'], output_names=['text_embeds'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'text_embeds': {0: 'batch'}
+            },
+            opset_version=args.opset, do_constant_folding=True
+        )
+        print(f"✅ Torre de texto exportada: {text_path}")
+
+    manifest = {
+        'model_id': model_id,
+        'created_at': datetime.utcnow().isoformat(),
+        'opset': args.opset,
+        'logit_scale': float(model.logit_scale.exp().item()),
+        'embedding_dim': int(model.config.projection_dim),
+        'vision_file': vision_path.name,
+        'text_file': text_path.name,
+        'quantization': None,
+    }
+
+    if args.int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        text_int8 = out_dir / 'text.int8.onnx'
+        quantize_dynamic(str(text_path), str(text_int8), weight_type=QuantType.QInt8)
+        manifest['text_file'] = text_int8.name
+
+        vision_int8 = out_dir / 'vision.int8.onnx'
+        if args.calibrate_client:
+            _quantize_vision_static(args, processor, vision_path, vision_int8)
+            manifest['quantization'] = {
+                'type': 'static_int8_vision+dynamic_int8_text',
+                'calibration_client': args.calibrate_client,
+                'calibration_images': args.calibration_images,
+            }
+        else:
+            quantize_dynamic(str(vision_path), str(vision_int8), weight_type=QuantType.QInt8)
+            manifest['quantization'] = {'type': 'dynamic_int8'}
+        manifest['vision_file'] = vision_int8.name
+        print(f"✅ Cuantización int8 completada: {manifest['quantization']['type']}")
+
+    with open(out_dir / ONNX_MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"📝 Manifest escrito: {out_dir / ONNX_MANIFEST_NAME}")
+    print("💡 Activar con system_config.json -> \"clip\": {\"backend\": \"onnx\"}")
+
+
+def _quantize_vision_static(args, processor, vision_path, vision_int8):
+    """Cuantización estática de la torre de visión calibrada con imágenes reales del cliente"""
+    import numpy as np
+    from onnxruntime.quantization import quantize_static, CalibrationDataReader, QuantType, QuantFormat
+
+    flask_app = load_flask_app()
+    with flask_app.app_context():
+        images = fetch_client_images(args.calibrate_client, args.calibration_images)
+        loaded = load_pil_images(images)
+
+    if not loaded:
+        raise RuntimeError("No se pudieron cargar imágenes de calibración")
+    print(f"🎯 Calibrando con {len(loaded)} imágenes del cliente {args.calibrate_client}")
+
+    class CatalogReader(CalibrationDataReader):
+        def __init__(self):
+            self._iter = iter([
+                {'pixel_values': processor(images=pil, return_tensors="np")['pixel_values'].astype(np.float32)}
+                for _, pil in loaded
+            ])
+
+        def get_next(self):
+            return next(self._iter, None)
+
+    quantize_static(
+        str(vision_path), str(vision_int8), CatalogReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+
+
+# ---------------------------------------------------------------------------
+# CHECK
+# ---------------------------------------------------------------------------
+
+def _encode_images(model, processor, pil_images, batch_size):
+    """Encodea imágenes en lotes; devuelve (matriz L2-normalizada, segundos)"""
+    import numpy as np
+    import torch
+
+    chunks = []
+    started = time.perf_counter()
+    for i in range(0, len(pil_images), batch_size):
+        inputs = processor(images=pil_images[i:i + batch_size], return_tensors="pt")
+        with torch.no_grad():
+            feats = model.get_image_features(pixel_values=inputs['pixel_values'])
+        chunks.append(feats.detach().cpu().numpy().astype(np.float32))
+    elapsed = time.perf_counter() - started
+    matrix = np.concatenate(chunks, axis=0)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True), elapsed
+
+
+def _encode_texts(model, processor, texts):
+    import numpy as np
+    import torch
+
+    inputs = processor(text=texts, return_tensors="pt", padding=True)
+    with torch.no_grad():
+        feats = model.get_text_features(input_ids=inputs['input_ids'], attention_mask=inputs['attention_mask'])
+    matrix = feats.detach().cpu().numpy().astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def _topk_overlap(ref_scores, cand_scores, k):
+    """Overlap promedio |topk_ref ∩ topk_cand| / k por fila"""
+    import numpy as np
+
+    k = min(k, ref_scores.shape[1])
+    ref_top = np.argsort(-ref_scores, axis=1)[:, :k]
+    cand_top = np.argsort(-cand_scores, axis=1)[:, :k]
+    overlaps = [len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)]
+    return float(np.mean(overlaps)) if overlaps else 0.0
+
+
+def cmd_check(args):
+    import numpy as np
+    from app.core.clip_backends import load_clip_backend, BACKEND_PYTORCH
+    from app.models.category import Category
+
+    flask_app = load_flask_app()
+    with flask_app.app_context():
+        model_id = resolve_model_id(args.model)
+        images = fetch_client_images(args.client_id, args.sample)
+        loaded = load_pil_images(images)
+        categories = Category.query.filter_by(client_id=args.client_id, is_active=True).all()
+        text_queries = [f"a photo of a {c.name_en or c.name}" for c in categories] or ["a photo of a product"]
+
+    if len(loaded) < 2:
+        print("❌ Se necesitan al menos 2 imágenes para validar")
+        sys.exit(1)
+
+    pil_images = [pil for _, pil in loaded]
+    print(f"🔍 Validando backend '{args.backend}' vs fp32 con {len(pil_images)} imágenes y {len(text_queries)} consultas de texto")
+
+    ref_model, ref_processor, _ = load_clip_backend(model_id, BACKEND_PYTORCH)
+    ref_img, ref_secs = _encode_images(ref_model, ref_processor, pil_images, args.batch_size)
+    ref_txt = _encode_texts(ref_model, ref_processor, text_queries)
+    del ref_model
+
+    cand_model, cand_processor, effective = load_clip_backend(model_id, args.backend)
+    if effective != args.backend:
+        print(f"❌ Backend '{args.backend}' no disponible (se cargó '{effective}')")
+        sys.exit(1)
+    cand_img, cand_secs = _encode_images(cand_model, cand_processor, pil_images, args.batch_size)
+    cand_txt = _encode_texts(cand_model, cand_processor, text_queries)
+
+    image_cos = np.sum(ref_img * cand_img, axis=1)
+    text_cos = np.sum(ref_txt * cand_txt, axis=1)
+
+    # Imagen -> imagen (excluyendo la propia imagen) y texto -> imagen
+    ref_ii = ref_img @ ref_img.T
+    cand_ii = cand_img @ cand_img.T
+    np.fill_diagonal(ref_ii, -np.inf)
+    np.fill_diagonal(cand_ii, -np.inf)
+
+    report = {
+        'model_id': model_id,
+        'backend': args.backend,
+        'images': len(pil_images),
+        'text_queries': len(text_queries),
+        'image_cosine': {
+            'mean': float(image_cos.mean()),
+            'min': float(image_cos.min()),
+            'p5': float(np.percentile(image_cos, 5)),
+        },
+        'text_cosine': {
+            'mean': float(text_cos.mean()),
+            'min': float(text_cos.min()),
+        },
+        f'image_to_image_top{args.top_k}_overlap': _topk_overlap(ref_ii, cand_ii, args.top_k),
+        f'text_to_image_top{args.top_k}_overlap': _topk_overlap(ref_txt @ ref_img.T, cand_txt @ cand_img.T, args.top_k),
+        'encode_ms_per_image': {
+            'fp32': round(ref_secs * 1000 / len(pil_images), 2),
+            args.backend: round(cand_secs * 1000 / len(pil_images), 2),
+        },
+    }
+
+    print(json.dumps(report, indent=2))
+
+    passed = report['image_cosine']['min'] >= args.min_cosine
+    print("✅ Backend dentro de tolerancia" if passed else f"❌ Coseno mínimo {report['image_cosine']['min']:.4f} < {args.min_cosine}")
+    sys.exit(0 if passed else 2)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Exportación y validación de backends CLIP")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    p_export = sub.add_parser("export", help="Exportar torres CLIP a ONNX")
+    p_export.add_argument("--model", help="Modelo (default: system_config clip.model_name)")
+    p_export.add_argument("--out", help="Carpeta base (default: system_config clip.onnx_dir)")
+    p_export.add_argument("--opset", type=int, default=14)
+    p_export.add_argument("--int8", action="store_true", help="Cuantizar a int8")
+    p_export.add_argument("--calibrate-client", help="Cliente cuyas imágenes calibran la cuantización estática de visión")
+    p_export.add_argument("--calibration-images", type=int, default=64)
+    p_export.set_defaults(func=cmd_export)
+
+    p_check = sub.add_parser("check", help="Comparar un backend contra fp32")
+    p_check.add_argument("--client-id", required=True)
+    p_check.add_argument("--backend", required=True, choices=["pytorch_int8", "onnx"])
+    p_check.add_argument("--model", help="Modelo (default: system_config clip.model_name)")
+    p_check.add_argument("--sample", type=int, default=200, help="Cantidad de imágenes del catálogo")
+    p_check.add_argument("--top-k", type=int, default=10)
+    p_check.add_argument("--batch-size", type=int, default=16)
+    p_check.add_argument("--min-cosine", type=float, default=0.98, help="Coseno mínimo aceptable por imagen")
+    p_check.set_defaults(func=cmd_check)
+
+    args = p.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Importación masiva de catálogo desde CSV o JSONL (mismo servicio que POST /products/api/import)
+
+Upsert por SKU en lotes, imágenes y embeddings por lotes, centroides recalculados
+una vez por categoría afectada y reporte CSV de errores por fila.
+
+Uso:
+    python tools/maintenance/import_catalog.py --client-id <client_id> --file productos.csv
+    python tools/maintenance/import_catalog.py --client-id <client_id> --file productos.jsonl --no-images
+
+Formato CSV:
+    sku,name,category,description,brand,price,stock,tags,image_urls,attr_color,attr_talle
+    REM-001,Remera básica,Remeras,,Acme,9999,10,"algodón, básica",https://.../a.jpg|https://.../b.jpg,Negro,M|L
+"""
+import os
+import sys
+import time
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Importación masiva de productos (CSV/JSONL)")
+    p.add_argument("--client-id", required=True)
+    p.add_argument("--file", required=True, help="Archivo .csv o .jsonl")
+    p.add_argument("--no-images", action="store_true", help="Importar solo datos, sin descargar imágenes")
+    args = p.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"❌ No existe el archivo: {args.file}")
+        sys.exit(1)
+
+    app = load_flask_app()
+    with app.app_context():
+        from app.models.batch_job import BatchJob
+        from app.models.client import Client
+        from app.services.catalog_import_service import CatalogImportService
+
+        if not Client.query.get(args.client_id):
+            print(f"❌ Cliente no encontrado: {args.client_id}")
+            sys.exit(1)
+
+        active = CatalogImportService.active_job(args.client_id)
+        if active:
+            print(f"❌ Ya hay una importación en curso para el cliente (job {active.id}, {active.status})")
+            sys.exit(1)
+
+        job = CatalogImportService.create_job(
+            args.client_id,
+            os.path.abspath(args.file),
+            os.path.basename(args.file),
+            with_images=not args.no_images
+        )
+
+        job_id = job.id
+        started = time.time()
+        CatalogImportService.run_import(job_id)
+
+        job = BatchJob.query.get(job_id)
+        params = job.params or {}
+        print("\n📊 Resumen")
+        print(f"   Filas:        {job.processed}/{job.total}")
+        print(f"   Nuevos:       {params.get('inserted', 0)}")
+        print(f"   Actualizados: {params.get('updated', 0)}")
+        print(f"   Con error:    {job.failed}")
+        print(f"   Imágenes:     {params.get('images', 0)}")
+        print(f"   Categorías:   {params.get('categories_updated', 0)} centroides recalculados")
+        print(f"   Tiempo:       {time.time() - started:.1f}s")
+        print(f"   Reporte:      {params.get('report_path')}")
+
+        sys.exit(0 if job.failed == 0 else 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Herramienta de snapshots del índice de búsqueda visual
+
+Comandos:
+    build   Construye y publica el snapshot de uno o todos los clientes (warm start antes de un deploy)
+    status  Muestra la versión vigente de cada cliente y si está al día con el catálogo
+
+Uso:
+    python tools/maintenance/index_snapshot_tool.py build
+    python tools/maintenance/index_snapshot_tool.py build --client-id <client_id>
+    python tools/maintenance/index_snapshot_tool.py build --storage int8
+    python tools/maintenance/index_snapshot_tool.py status
+"""
+import os
+import sys
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def _clients(client_id):
+    from app.models.client import Client
+    if client_id:
+        return Client.query.filter_by(id=client_id).all()
+    return Client.query.filter_by(is_active=True).all()
+
+
+def cmd_build(args):
+    app = load_flask_app()
+    with app.app_context():
+        from app.core.index_snapshots import build_snapshot, snapshots_dir
+
+        clients = _clients(args.client_id)
+        print(f"📦 Construyendo snapshots de {len(clients)} cliente(s) en {snapshots_dir()}")
+        failed = 0
+        for client in clients:
+            try:
+                path = build_snapshot(client.id, storage=args.storage)
+                print(f"   ✅ {client.name}: {path.name if path else 'sin embeddings'}")
+            except Exception as e:
+                failed += 1
+                print(f"   ❌ {client.name}: {e}")
+        if failed:
+            sys.exit(1)
+
+
+def cmd_status(args):
+    app = load_flask_app()
+    with app.app_context():
+        from app.core.index_snapshots import (
+            CURRENT_NAME, IndexSnapshot, catalog_version, snapshots_dir
+        )
+        from app.core.model_versions import model_of_client
+
+        base = snapshots_dir()
+        print(f"📁 {base}")
+        for client in _clients(args.client_id):
+            model_name = model_of_client(client)
+            current_file = base / str(client.id) / CURRENT_NAME
+            if not current_file.exists():
+                print(f"   ⚪ {client.name}: sin snapshot")
+                continue
+            version = current_file.read_text(encoding='utf-8').strip()
+            snapshot = IndexSnapshot(base / str(client.id) / version)
+            up_to_date = snapshot.manifest.get('catalog_version') == catalog_version(client.id)
+            same_model = snapshot.manifest.get('model_name') == model_name
+            icon = '✅' if up_to_date and same_model else '⚠️'
+            print(f"   {icon} {client.name}: {version} ({len(snapshot)} imágenes, {snapshot.storage} "
+                  f"{snapshot.scan_bytes / (1024 * 1024):.1f} MB por búsqueda, creado {snapshot.manifest.get('created_at')}, "
+                  f"{'al día' if up_to_date else 'desactualizado'}"
+                  f"{'' if same_model else f', otro modelo (activo: {model_name})'})")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Snapshots en disco del índice de búsqueda visual")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="Construir y publicar snapshots")
+    p_build.add_argument("--client-id", help="Cliente (default: todos los activos)")
+    p_build.add_argument("--storage", choices=["float32", "float16", "int8"],
+                         help="Storage del snapshot (default: index_snapshots.storage)")
+    p_build.set_defaults(func=cmd_build)
+
+    p_status = sub.add_parser("status", help="Versión vigente por cliente")
+    p_status.add_argument("--client-id", help="Cliente (default: todos los activos)")
+    p_status.set_defaults(func=cmd_status)
+
+    args = p.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Herramienta de cambio de modelo CLIP por cliente (índice sombra + cutover)
+
+Comandos:
+    status    Modelo activo de cada cliente y cobertura del índice sombra
+    shadow    Construye el índice sombra con otro modelo (en primer plano, reanudable)
+    cutover   Pasa el cliente al modelo del índice sombra (requiere cobertura 100%)
+    discard   Borra los vectores sombra de un cliente (abandonar la prueba)
+
+Mientras se construye el índice sombra el cliente sigue buscando con su modelo
+activo; el cutover cambia embeddings, centroides y modelo en una sola transacción.
+
+Uso:
+    python tools/maintenance/model_index_tool.py status --model ViT-L/14
+    python tools/maintenance/model_index_tool.py shadow --client-id <uuid> --model ViT-L/14
+    python tools/maintenance/model_index_tool.py shadow --client-id <uuid> --model ViT-L/14 --auto-cutover
+    python tools/maintenance/model_index_tool.py cutover --client-id <uuid> --model ViT-L/14
+    python tools/maintenance/model_index_tool.py discard --client-id <uuid>
+"""
+import os
+import sys
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def _clients(client_id):
+    from app.models.client import Client
+    if client_id:
+        return Client.query.filter_by(id=client_id).all()
+    return Client.query.filter_by(is_active=True).all()
+
+
+def cmd_status(args):
+    app = load_flask_app()
+    with app.app_context():
+        from app.core.model_versions import configured_model_name, model_of_client, shadow_coverage
+
+        print(f"📋 Modelo por defecto (clip.model_name): {configured_model_name()}")
+        for client in _clients(args.client_id):
+            line = f"   {client.name}: {model_of_client(client)}"
+            if args.model:
+                coverage = shadow_coverage(client.id, args.model)
+                icon = '✅' if coverage['ready'] else '⏳'
+                line += f" | sombra {args.model}: {icon} {coverage['covered']}/{coverage['total']} ({coverage['percent']}%)"
+            print(line)
+
+
+def cmd_shadow(args):
+    app = load_flask_app()
+    with app.app_context():
+        from app.services.batch_job_service import BatchJobService
+
+        try:
+            job, started = BatchJobService.start_shadow_reindex(
+                app, args.client_id, args.model,
+                chunk_size=args.chunk_size, throttle_ms=args.throttle_ms,
+                auto_cutover=args.auto_cutover, background=False
+            )
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if not started:
+            print(f"⚠️ Ya hay un índice sombra en curso: job {job.id} ({job.progress}%)")
+            sys.exit(1)
+        params = job.params or {}
+        print(f"📊 Job {job.id}: {job.status}, cobertura {params.get('coverage')}")
+        if params.get('cutover'):
+            print(f"🔀 Cutover: {params['cutover']}")
+        if job.status != 'completed':
+            sys.exit(1)
+
+
+def cmd_cutover(args):
+    app = load_flask_app()
+    with app.app_context():
+        from app.core.model_versions import cutover
+
+        try:
+            result = cutover(args.client_id, args.model)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"🔀 {result['previous_model']} -> {result['model']}: "
+              f"{result['embeddings']} embeddings, {result['categories']} centroides")
+
+
+def cmd_discard(args):
+    app = load_flask_app()
+    with app.app_context():
+        from app.core.model_versions import discard_shadow
+
+        deleted = discard_shadow(args.client_id, args.model)
+        print(f"🗑️ {deleted} vectores sombra borrados")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Índice sombra y cutover de modelo CLIP por cliente")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    p_status = sub.add_parser("status", help="Modelo activo y cobertura del índice sombra")
+    p_status.add_argument("--client-id", help="Cliente (default: todos los activos)")
+    p_status.add_argument("--model", help="Modelo del índice sombra a reportar")
+    p_status.set_defaults(func=cmd_status)
+
+    p_shadow = sub.add_parser("shadow", help="Construir el índice sombra (reanuda si se cortó)")
+    p_shadow.add_argument("--client-id", required=True)
+    p_shadow.add_argument("--model", required=True, help="ViT-B/16 | ViT-B/32 | ViT-L/14")
+    p_shadow.add_argument("--chunk-size", type=int, default=32, help="Productos por lote (default: 32)")
+    p_shadow.add_argument("--throttle-ms", type=int, default=0, help="Pausa entre lotes (default: 0)")
+    p_shadow.add_argument("--auto-cutover", action="store_true", help="Hacer el cutover al llegar a 100%%")
+    p_shadow.set_defaults(func=cmd_shadow)
+
+    p_cutover = sub.add_parser("cutover", help="Pasar el cliente al modelo del índice sombra")
+    p_cutover.add_argument("--client-id", required=True)
+    p_cutover.add_argument("--model", required=True)
+    p_cutover.set_defaults(func=cmd_cutover)
+
+    p_discard = sub.add_parser("discard", help="Borrar vectores sombra")
+    p_discard.add_argument("--client-id", required=True)
+    p_discard.add_argument("--model", help="Solo este modelo (default: todos)")
+    p_discard.set_defaults(func=cmd_discard)
+
+    args = p.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Recalcula los embeddings fusionados del catálogo sin volver a codificar imágenes
+
+Usa las features crudas guardadas (images.image_features) y la receta vigente de
+app/core/embedding_recipe.py: prompts contextuales actuales (industria, clip_prompt
+de la categoría, tags del producto) y pesos de fusión. Cada prompt distinto se
+codifica una sola vez con el text tower; el resto es álgebra de vectores.
+
+Comandos:
+    status  Embeddings por receta (vigente / vieja / sin componentes crudos) por cliente
+    refuse  Recalcula clip_embedding y embedding_recipe; después recalcula centroides
+
+Las imágenes sin image_features (procesadas antes de guardar componentes) se
+informan en status y requieren re-encode (embeddings > Procesar pendientes).
+
+Uso:
+    python tools/maintenance/refuse_embeddings.py status
+    python tools/maintenance/refuse_embeddings.py refuse --client-id <uuid>
+    python tools/maintenance/refuse_embeddings.py refuse --all-recipes --dry-run
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+
+# Base del proyecto
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+APP_DIR = os.path.join(ROOT, 'clip_admin_backend')
+sys.path.insert(0, APP_DIR)
+
+BATCH_SIZE = 500
+
+
+def load_flask_app():
+    """Carga la app Flask desde clip_admin_backend/app.py (mismo patrón que recalculate_centroids.py)"""
+    app_py = os.path.join(APP_DIR, 'app.py')
+    print(f"🔄 Cargando Flask app desde: {app_py}")
+    spec = importlib.util.spec_from_file_location('clip_admin_backend_app', app_py)
+    app_module = importlib.util.module_from_spec(spec)
+    assert spec.loader is not None
+    spec.loader.exec_module(app_module)
+    return app_module.create_app()
+
+
+def cmd_status(args):
+    app = load_flask_app()
+    with app.app_context():
+        from sqlalchemy import func
+        from app import db
+        from app.models.client import Client
+        from app.models.image import Image
+        from app.core.embedding_recipe import RECIPE_VERSION, is_current
+
+        query = (
+            db.session.query(Image.client_id, Image.embedding_recipe,
+                             Image.image_features.isnot(None), func.count(Image.id))
+            .filter(Image.is_processed.is_(True), Image.clip_embedding.isnot(None))
+            .group_by(Image.client_id, Image.embedding_recipe, Image.image_features.isnot(None))
+        )
+        if args.client_id:
+            query = query.filter(Image.client_id == args.client_id)
+
+        names = {client.id: client.name for client in Client.query.all()}
+        totals = {}
+        for client_id, recipe, has_features, count in query.all():
+            stats = totals.setdefault(client_id, {'current': 0, 'stale': 0, 'no_features': 0})
+            if not has_features:
+                stats['no_features'] += count
+            elif is_current(recipe):
+                stats['current'] += count
+            else:
+                stats['stale'] += count
+
+        print(f"📋 Receta vigente: versión {RECIPE_VERSION}")
+        for client_id, stats in sorted(totals.items(), key=lambda item: names.get(item[0], '')):
+            print(f"   {names.get(client_id, client_id)}: {stats['current']} vigentes, "
+                  f"{stats['stale']} a recalcular, {stats['no_features']} sin componentes (re-encode)")
+
+
+def cmd_refuse(args):
+    app = load_flask_app()
+    with app.app_context():
+        import numpy as np
+        from app import db
+        from app.models.category import Category
+        from app.models.client import Client
+        from app.models.image import Image
+        from app.models.product import Product
+        from app.blueprints.embeddings import build_image_context, create_contextual_prompts
+        from app.core.embedding_recipe import (
+            METHOD_CONTEXTUAL, METHOD_SIMPLE, is_current, recipe_id, refuse, text_features
+        )
+        from app.core.model_versions import model_of_client, model_scope
+
+        query = db.session.query(Image.id, Image.embedding_recipe).filter(
+            Image.is_processed.is_(True), Image.image_features.isnot(None))
+        if args.client_id:
+            query = query.filter(Image.client_id == args.client_id)
+        image_ids = [image_id for image_id, recipe in query.all() if args.all_recipes or not is_current(recipe)]
+        print(f"🧮 {len(image_ids)} imágenes a recalcular")
+        if not image_ids:
+            return
+
+        clients = {client.id: client for client in Client.query.all()}
+        categories = {category.id: category for category in Category.query.all()}
+
+        started = time.perf_counter()
+        updated, skipped, touched_categories = 0, 0, set()
+        for start in range(0, len(image_ids), BATCH_SIZE):
+            batch = (
+                Image.query.options(db.undefer(Image.image_features))
+                .filter(Image.id.in_(image_ids[start:start + BATCH_SIZE]))
+                .all()
+            )
+            products = {p.id: p for p in Product.query.filter(
+                Product.id.in_({image.product_id for image in batch})).all()}
+
+            contexts, prompts_by_model = {}, {}
+            for product in products.values():
+                client = clients.get(product.client_id)
+                context = build_image_context(product, client, categories.get(product.category_id))
+                prompts = create_contextual_prompts(context) if context.get('category_name') else []
+                model_name = model_of_client(client)
+                contexts[product.id] = (context, prompts, model_name)
+                prompts_by_model.setdefault(model_name, set()).update(prompts)
+
+            # Todos los prompts nuevos del batch en una pasada del text tower por modelo
+            for model_name, pending_prompts in prompts_by_model.items():
+                if pending_prompts:
+                    with model_scope(model_name):
+                        text_features(list(pending_prompts))
+
+            for image in batch:
+                product = products.get(image.product_id)
+                if product is None:
+                    skipped += 1
+                    continue
+                context, prompts, model_name = contexts[product.id]
+                if image.embedding_model and image.embedding_model != model_name:
+                    # Features de otro modelo: las reemplaza el cutover o un re-encode
+                    skipped += 1
+                    continue
+                image_features = np.asarray(json.loads(image.image_features), dtype=np.float32)
+                try:
+                    with model_scope(model_name):
+                        embedding = refuse(image_features, prompts, context)
+                except ValueError as e:
+                    # Dimensión distinta: features de otro modelo, requiere re-encode
+                    skipped += 1
+                    print(f"   ⚠️ {image.id}: {e}")
+                    continue
+                if not args.dry_run:
+                    image.clip_embedding = json.dumps(embedding.tolist())
+                    image.embedding_recipe = recipe_id(METHOD_CONTEXTUAL if prompts else METHOD_SIMPLE)
+                updated += 1
+                if product.category_id:
+                    touched_categories.add(product.category_id)
+
+            if args.dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+            # Liberar el lote (clientes y categorías quedan en la sesión para el siguiente)
+            for obj in batch + list(products.values()):
+                db.session.expunge(obj)
+            print(f"   ... {min(start + BATCH_SIZE, len(image_ids))}/{len(image_ids)}")
+
+        elapsed = time.perf_counter() - started
+        print(f"✅ {updated} embeddings recalculados, {skipped} omitidos en {elapsed:.1f}s"
+              f"{' (dry-run, sin guardar)' if args.dry_run else ''}")
+
+        if args.dry_run or not touched_categories:
+            return
+        print(f"🔄 Recalculando centroides de {len(touched_categories)} categorías...")
+        for category_id in touched_categories:
+            category = Category.query.get(category_id)
+            if category:
+                category.update_centroid_embedding(force_recalculate=True)
+        db.session.commit()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Recalcular embeddings fusionados desde componentes crudos")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("status", help="Embeddings por receta")
+    s.add_argument("--client-id", help="Solo este cliente")
+    s.set_defaults(func=cmd_status)
+
+    r = sub.add_parser("refuse", help="Recalcular embeddings con la receta vigente")
+    r.add_argument("--client-id", help="Solo este cliente")
+    r.add_argument("--all-recipes", action="store_true", help="Recalcular también los que ya tienen la receta vigente")
+    r.add_argument("--dry-run", action="store_true", help="Calcular sin guardar")
+    r.set_defaults(func=cmd_refuse)
+
+    args = p.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()